@@ -28,6 +28,43 @@ def create_app(test_config=None):
     app.config.from_mapping(
         SECRET_KEY='dev',
         DATABASE=os.path.join(app.instance_path, 'flaskr.sqlite'),
+        DATABASE_BUSY_TIMEOUT=5.0,
+        DATABASE_RETRY_ATTEMPTS=5,
+        DATABASE_RETRY_BASE_DELAY=0.01,
+        DATABASE_RETRY_MAX_DELAY=0.5,
+        AUTH_RATE_LIMIT_ENABLED=True,
+        AUTH_RATE_LIMIT_CAPACITY=10,
+        AUTH_RATE_LIMIT_REFILL_RATE=0.5,
+        AUTH_RATE_LIMIT_DATABASE=None,
+        AUTH_RATE_LIMIT_LOG_INTERVAL=60,
+        SHARD_DIRECTORY=os.path.join(app.instance_path, 'directory.sqlite'),
+        SHARD_DATABASES=[],
+        GROUP_COMMIT_ENABLED=False,
+        GROUP_COMMIT_MAX_BATCH=64,
+        GROUP_COMMIT_MAX_DELAY=0.005,
+        MEMORY_PROFILER_ENABLED=False,
+        MEMORY_PROFILER_FRAMES=1,
+        ASSETS_FOLDER=os.path.join(app.instance_path, 'assets'),
+        ASSETS_BUILD_ON_START=True,
+        COMPRESSION_ENABLED=True,
+        COMPRESSION_LEVEL=6,
+        COMPRESSION_MIN_SIZE=500,
+        COMPRESSION_FLUSH_SIZE=8192,
+        HISTORY_PAGE_SIZE=100,
+        FORECAST_MAX_SESSIONS=520,
+        WORKOUT_SETS_MAX_BATCH=500,
+        WORKOUT_DUPLICATE_WINDOW=60,
+        WORKOUT_IMPORT_MAX_BATCH=1000,
+        ARCHIVE_DATABASE=None,
+        ARCHIVE_AFTER_DAYS=180,
+        MAINTENANCE_STEP_MS=50,
+        MAINTENANCE_MAX_SECONDS=30,
+        BACKUP_DIRECTORY=os.path.join(app.instance_path, 'backups'),
+        BACKUP_PAGES_PER_STEP=256,
+        BACKUP_STEP_PAUSE=0.005,
+        BACKUP_KEEP_LAST=7,
+        BACKUP_KEEP_DAILY=30,
+        BACKUP_MAX_RESTARTS=3,
     )
 
     if test_config is None:
@@ -47,6 +84,38 @@ def create_app(test_config=None):
     from GymApp.flaskr.src.database import db
     db.init_app(app)
 
+    # Initialize the database maintenance command
+    from GymApp.flaskr.src.database import maintenance
+    maintenance.init_app(app)
+
+    # Initialize the backup and restore commands
+    from GymApp.flaskr.src.database import backup
+    backup.init_app(app)
+
+    # Initialize the optional group commit writer
+    from GymApp.flaskr.src.database import group_commit
+    group_commit.init_app(app)
+
+    # Initialize the rate limiter of the auth endpoints
+    from GymApp.flaskr.src.limiter import limiter
+    limiter.init_app(app)
+
+    # Initialize the optional per-request memory profiler
+    from GymApp.flaskr.src.profiler import profiler
+    profiler.init_app(app)
+
+    # Initialize the hashed and precompressed static files
+    from GymApp.flaskr.src.assets import assets
+    assets.init_app(app)
+
+    # Initialize the gzip compression of the responses
+    from GymApp.flaskr.src.compression import compression
+    compression.init_app(app)
+
+    # Initialize the background job queue
+    from GymApp.flaskr.src.jobs import jobs
+    jobs.init_app(app)
+
     # Register the authentication blueprint
     from GymApp.flaskr.src.views import auth
     app.register_blueprint(auth.bp)
@@ -0,0 +1,186 @@
+"""
+Benchmark of the exercise dictionary on a large synthetic workout history.
+
+A database with the legacy layout, which repeats the exercise key and name in every exercise plan and workout row,
+is filled with a synthetic history and then migrated to the current schema. For both databases the file size is
+reported, as well as the page cache hit rate of reading the history of random users with a small page cache.
+The hit rate is read with sqlite3_db_status through ctypes, as the sqlite3 module does not expose it.
+
+Usage:
+    python -m GymApp.flaskr.benchmarks.bench_exercise_dictionary --users 2000 --workouts 150
+"""
+import argparse
+import ctypes
+import ctypes.util
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+from datetime import datetime, timedelta
+
+from GymApp.flaskr.src.database import migrations
+
+SCHEMA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '../src/database/schema.sql')
+
+LEGACY_SCHEMA = """
+CREATE TABLE user (id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT UNIQUE NOT NULL, password TEXT NOT NULL);
+CREATE TABLE gym_logs (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL);
+CREATE INDEX gym_logs_user_id ON gym_logs (user_id);
+CREATE TABLE workout_plans (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, gym_log_id INTEGER NOT NULL);
+CREATE INDEX workout_plans_gym_log_id ON workout_plans (gym_log_id);
+CREATE TABLE exercise_plans (
+  id INTEGER PRIMARY KEY AUTOINCREMENT, workout_plan_id INTEGER NOT NULL, exercise_key TEXT NOT NULL,
+  name TEXT NOT NULL, sets INTEGER NOT NULL, reps INTEGER NOT NULL, initial_weight INTEGER NOT NULL,
+  progression INTEGER NOT NULL
+);
+CREATE INDEX exercise_plans_workout_plan_id ON exercise_plans (workout_plan_id);
+CREATE TABLE workouts (id INTEGER PRIMARY KEY AUTOINCREMENT, gym_log_id INTEGER NOT NULL, date TIMESTAMP NOT NULL);
+CREATE INDEX workouts_gym_log_id_date ON workouts (gym_log_id, date);
+CREATE TABLE workout_exercises (
+  id INTEGER PRIMARY KEY AUTOINCREMENT, workout_id INTEGER NOT NULL, exercise_key TEXT NOT NULL, name TEXT NOT NULL,
+  sets INTEGER NOT NULL, reps INTEGER NOT NULL, weight REAL NOT NULL
+);
+CREATE INDEX workout_exercises_workout_id ON workout_exercises (workout_id);
+"""
+
+EXERCISES = [('barbell_back_squat', 'Barbell Back Squat'), ('flat_barbell_bench_press', 'Flat Barbell Bench Press'),
+             ('conventional_deadlift', 'Conventional Deadlift'), ('standing_overhead_press', 'Standing Overhead Press'),
+             ('bent_over_barbell_row', 'Bent Over Barbell Row'), ('romanian_deadlift', 'Romanian Deadlift'),
+             ('incline_dumbbell_press', 'Incline Dumbbell Press'), ('weighted_pull_up', 'Weighted Pull Up')]
+
+LEGACY_HISTORY_QUERY = ('SELECT workouts.date, workout_exercises.exercise_key, workout_exercises.name, '
+                        'workout_exercises.weight FROM workouts '
+                        'JOIN workout_exercises ON workout_exercises.workout_id = workouts.id '
+                        'WHERE workouts.gym_log_id = ?')
+HISTORY_QUERY = ('SELECT workouts.date, workout_exercises.exercise_id, workout_exercises.weight FROM workouts '
+                 'JOIN workout_exercises ON workout_exercises.workout_id = workouts.id '
+                 'WHERE workouts.gym_log_id = ?')
+
+SQLITE_ROW = 100
+SQLITE_OPEN_READONLY = 1
+SQLITE_DBSTATUS_CACHE_HIT = 7
+SQLITE_DBSTATUS_CACHE_MISS = 8
+
+
+def build_legacy_database(path, users, workouts, seed=0):
+    """Create a database with the legacy layout and a synthetic history at `path`."""
+    rng = random.Random(seed)
+    connection = sqlite3.connect(path)
+    connection.executescript(LEGACY_SCHEMA)
+    start = datetime(2020, 1, 1)
+    for user_id in range(1, users + 1):
+        connection.execute('INSERT INTO user (id, username, password) VALUES (?, ?, ?)',
+                           (user_id, f'user{user_id}', 'x'))
+        connection.execute('INSERT INTO gym_logs (id, user_id) VALUES (?, ?)', (user_id, user_id))
+        connection.execute('INSERT INTO workout_plans (id, name, gym_log_id) VALUES (?, ?, ?)',
+                           (user_id, 'Plan', user_id))
+        exercises = rng.sample(EXERCISES, 5)
+        connection.executemany(
+            'INSERT INTO exercise_plans (workout_plan_id, exercise_key, name, sets, reps, initial_weight, '
+            'progression) VALUES (?, ?, ?, 3, 8, 40, 2)',
+            [(user_id, key, name) for key, name in exercises]
+        )
+        for day in range(workouts):
+            workout_id = connection.execute(
+                'INSERT INTO workouts (gym_log_id, date) VALUES (?, ?)',
+                (user_id, (start + timedelta(days=2 * day)).isoformat(' '))
+            ).lastrowid
+            connection.executemany(
+                'INSERT INTO workout_exercises (workout_id, exercise_key, name, sets, reps, weight) '
+                'VALUES (?, ?, ?, 3, 8, ?)',
+                [(workout_id, key, name, 40 + 2 * day) for key, name in exercises]
+            )
+    connection.commit()
+    connection.close()
+
+
+def database_size(path):
+    """Vacuum the database at `path` and return its file size and the size of the exercise tables and their
+    indexes in bytes. The current schema has additional derived tables, e.g. the search index, so the file
+    sizes are not directly comparable."""
+    connection = sqlite3.connect(path)
+    connection.execute('VACUUM')
+    exercise_tables_size = connection.execute(
+        'SELECT SUM(dbstat.pgsize) FROM dbstat JOIN sqlite_schema AS objects ON objects.name = dbstat.name '
+        "WHERE objects.tbl_name IN ('exercises', 'exercise_plans', 'workout_exercises')"
+    ).fetchone()[0]
+    connection.close()
+    return os.path.getsize(path), exercise_tables_size
+
+
+def cache_hit_rate(path, query, gym_log_ids, cache_kib):
+    """Run `query` for every gym log ID with a page cache of `cache_kib` KiB and return the cache hit rate,
+    or None if the SQLite library cannot be loaded through ctypes."""
+    library_name = ctypes.util.find_library('sqlite3')
+    if library_name is None:
+        return None
+    lib = ctypes.CDLL(library_name)
+    lib.sqlite3_open_v2.argtypes = [ctypes.c_char_p, ctypes.POINTER(ctypes.c_void_p), ctypes.c_int, ctypes.c_char_p]
+    lib.sqlite3_exec.argtypes = [ctypes.c_void_p, ctypes.c_char_p, ctypes.c_void_p, ctypes.c_void_p,
+                                 ctypes.c_void_p]
+    lib.sqlite3_prepare_v2.argtypes = [ctypes.c_void_p, ctypes.c_char_p, ctypes.c_int,
+                                       ctypes.POINTER(ctypes.c_void_p), ctypes.c_void_p]
+    lib.sqlite3_bind_int64.argtypes = [ctypes.c_void_p, ctypes.c_int, ctypes.c_int64]
+    lib.sqlite3_step.argtypes = [ctypes.c_void_p]
+    lib.sqlite3_reset.argtypes = [ctypes.c_void_p]
+    lib.sqlite3_finalize.argtypes = [ctypes.c_void_p]
+    lib.sqlite3_db_status.argtypes = [ctypes.c_void_p, ctypes.c_int, ctypes.POINTER(ctypes.c_int),
+                                      ctypes.POINTER(ctypes.c_int), ctypes.c_int]
+    lib.sqlite3_close.argtypes = [ctypes.c_void_p]
+
+    db = ctypes.c_void_p()
+    lib.sqlite3_open_v2(path.encode(), ctypes.byref(db), SQLITE_OPEN_READONLY, None)
+    lib.sqlite3_exec(db, f'PRAGMA cache_size = -{cache_kib}'.encode(), None, None, None)
+    statement = ctypes.c_void_p()
+    lib.sqlite3_prepare_v2(db, query.encode(), -1, ctypes.byref(statement), None)
+    for gym_log_id in gym_log_ids:
+        lib.sqlite3_bind_int64(statement, 1, gym_log_id)
+        while lib.sqlite3_step(statement) == SQLITE_ROW:
+            pass
+        lib.sqlite3_reset(statement)
+    lib.sqlite3_finalize(statement)
+    hits, misses, highwater = ctypes.c_int(), ctypes.c_int(), ctypes.c_int()
+    lib.sqlite3_db_status(db, SQLITE_DBSTATUS_CACHE_HIT, ctypes.byref(hits), ctypes.byref(highwater), 0)
+    lib.sqlite3_db_status(db, SQLITE_DBSTATUS_CACHE_MISS, ctypes.byref(misses), ctypes.byref(highwater), 0)
+    lib.sqlite3_close(db)
+    total = hits.value + misses.value
+    return hits.value / total if total else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=2000, help='Number of users.')
+    parser.add_argument('--workouts', type=int, default=150, help='Number of workouts per user.')
+    parser.add_argument('--reads', type=int, default=5000, help='Number of history reads.')
+    parser.add_argument('--cache-kib', type=int, default=2048, help='Page cache size of the reader in KiB.')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        legacy_path = os.path.join(directory, 'legacy.sqlite')
+        migrated_path = os.path.join(directory, 'migrated.sqlite')
+        build_legacy_database(legacy_path, args.users, args.workouts)
+        shutil.copyfile(legacy_path, migrated_path)
+        connection = sqlite3.connect(migrated_path)
+        with open(SCHEMA_PATH) as schema_file:
+            migrations.migrate(connection, schema_file.read())
+        connection.close()
+
+        rng = random.Random(1)
+        # Skewed reads, a fifth of the users makes most of the requests
+        gym_log_ids = [rng.randint(1, max(1, args.users // 5)) if rng.random() < 0.8 else rng.randint(1, args.users)
+                       for _ in range(args.reads)]
+        rows = args.users * args.workouts * 5
+        print(f'{args.users} users, {rows} workout exercise rows, {args.reads} history reads, '
+              f'{args.cache_kib} KiB page cache')
+        for label, path, query in (('legacy', legacy_path, LEGACY_HISTORY_QUERY),
+                                   ('dictionary', migrated_path, HISTORY_QUERY)):
+            size, exercise_tables_size = database_size(path)
+            hit_rate = cache_hit_rate(path, query, gym_log_ids, args.cache_kib)
+            hit_rate_text = 'n/a' if hit_rate is None else f'{hit_rate:.1%}'
+            print(f'{label:12} file {size / 2 ** 20:8.1f} MiB  exercise tables {exercise_tables_size / 2 ** 20:8.1f} MiB'
+                  f'  cache hit rate {hit_rate_text}')
+
+
+if __name__ == '__main__':
+    main()
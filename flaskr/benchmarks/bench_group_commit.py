@@ -0,0 +1,115 @@
+"""
+Benchmark of group commit for small concurrent writes.
+
+A number of client threads save one workout per write, like a client logging a session, first with one commit per
+write on a connection per thread and then through a GroupCommitWriter. Both modes use WAL and
+PRAGMA synchronous=FULL, so every acknowledged write is durable. The throughput and the latency percentiles of a
+write are reported for both modes.
+
+Usage:
+    python -m GymApp.flaskr.benchmarks.bench_group_commit --clients 16 --writes 200 --directory /var/tmp
+"""
+import argparse
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from GymApp.flaskr.benchmarks.bench_search import percentile
+from GymApp.flaskr.src.database.db import connect
+from GymApp.flaskr.src.database.group_commit import GroupCommitWriter
+from GymApp.flaskr.src.domain.workout import ExercisePlan, GymLog, Workout, WorkoutPlan
+from GymApp.flaskr.src.repository.repository import SQLiteRepository
+
+SCHEMA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '../src/database/schema.sql')
+
+
+def build_database(path, clients):
+    """Create a database at `path` with one user and gym log per client and return the gym logs."""
+    connection = sqlite3.connect(path)
+    connection.execute('PRAGMA journal_mode=WAL')
+    with open(SCHEMA_PATH) as schema_file:
+        connection.executescript(schema_file.read())
+    repo = SQLiteRepository(connection)
+    gym_logs = []
+    for client in range(clients):
+        connection.execute('INSERT INTO user (id, username, password) VALUES (?, ?, ?)',
+                           (client + 1, f'user{client}', 'x'))
+        gym_log = GymLog(client + 1)
+        gym_log.add_workout_plan(WorkoutPlan('Plan', {'squat': ExercisePlan('Squat', 5, 5, 60, 2.5)}))
+        repo.save_gym_log(gym_log)
+        gym_logs.append(gym_log)
+    repo.commit()
+    connection.close()
+    return gym_logs
+
+
+def workout(index):
+    """Return a small workout."""
+    return Workout({'squat': {'name': 'Squat', 'weight': 60 + index % 20}}, date=datetime(2024, 1, 1))
+
+
+def run_clients(clients, write):
+    """Run `write(client, index)` from every client thread and return the elapsed seconds and the latencies."""
+    latencies = []
+    lock = threading.Lock()
+
+    def client_loop(client):
+        samples = []
+        for index in range(clients[1]):
+            start = time.perf_counter()
+            write(client, index)
+            samples.append((time.perf_counter() - start) * 1000)
+        with lock:
+            latencies.extend(samples)
+
+    threads = [threading.Thread(target=client_loop, args=(client,)) for client in range(clients[0])]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', type=int, default=16, help='Number of concurrent client threads.')
+    parser.add_argument('--writes', type=int, default=200, help='Number of writes per client.')
+    parser.add_argument('--max-batch', type=int, default=64, help='Maximum writes per group commit.')
+    parser.add_argument('--max-delay-ms', type=float, default=5, help='Maximum wait for a group commit.')
+    parser.add_argument('--directory', default=None, help='Directory for the database file.')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.directory) as directory:
+        path = os.path.join(directory, 'bench.sqlite')
+        gym_logs = build_database(path, args.clients)
+        local = threading.local()
+
+        def commit_per_write(client, index):
+            if not hasattr(local, 'repo'):
+                local.repo = SQLiteRepository(connect(path))
+                local.repo.connection.execute('PRAGMA busy_timeout = 30000')
+                local.repo.connection.execute('PRAGMA synchronous=FULL')
+            local.repo.save_workout(workout(index), gym_logs[client])
+            local.repo.commit()
+
+        writer = GroupCommitWriter(path, args.max_batch, args.max_delay_ms / 1000)
+
+        def group_commit(client, index):
+            writer.submit(lambda repo: repo.save_workout(workout(index), gym_logs[client]))
+
+        print(f'{args.clients} clients, {args.writes} writes each')
+        for label, write in (('commit per write', commit_per_write), ('group commit', group_commit)):
+            elapsed, latencies = run_clients((args.clients, args.writes), write)
+            p50, p95, p99 = (percentile(latencies, fraction) for fraction in (0.5, 0.95, 0.99))
+            print(f'{label:18} {len(latencies) / elapsed:8.0f} writes/s  '
+                  f'p50 {p50:6.2f} ms  p95 {p95:6.2f} ms  p99 {p99:6.2f} ms')
+        writer.close()
+        print(f'group commit: {writer.operations} writes in {writer.batches} transactions')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,265 @@
+"""
+End-to-end HTTP load test of the Flask app.
+
+Every virtual user runs a scripted journey in a loop: register, log in, create a workout plan, then fetch the
+next workout from /workout and log it as a session a few times. Unless a --url is given, the app is created with
+create_app on a temporary database and served by a threaded werkzeug server in this process, so every run starts
+from the same state. Config values of the app can be overridden with --set to compare server configurations.
+The throughput of the whole run and the request count, errors and p50/p95/p99 latencies per endpoint are reported.
+
+Usage:
+    python -m GymApp.flaskr.benchmarks.bench_load --vus 16 --iterations 5 --sessions 10
+    python -m GymApp.flaskr.benchmarks.bench_load --vus 16 --set GROUP_COMMIT_ENABLED=true
+"""
+import argparse
+import http.cookiejar
+import json
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from collections import defaultdict
+
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+from GymApp.flaskr import create_app
+from GymApp.flaskr.benchmarks.bench_search import percentile
+from GymApp.flaskr.src.database.db import init_db
+
+WORKOUT_PLAN = {
+    'name': 'Full Body',
+    'exercises': {
+        'squat': {'name': 'Barbell Back Squat', 'sets': 5, 'reps': 5, 'initial_weight': 60, 'progression': 2.5},
+        'bench': {'name': 'Flat Barbell Bench Press', 'sets': 5, 'reps': 5, 'initial_weight': 40, 'progression': 2.5},
+        'row': {'name': 'Bent Over Barbell Row', 'sets': 5, 'reps': 5, 'initial_weight': 40, 'progression': 2.5},
+    },
+}
+
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    """Redirect handler that returns redirects instead of following them, so every request is timed alone."""
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    """Request handler of the local server that does not log every request."""
+
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+class VirtualUser(object):
+    """A virtual user with its own cookie jar, recording the latency of every request."""
+
+    def __init__(self, base_url, results, timeout=30):
+        """Initialize a VirtualUser.
+
+        Args:
+            base_url (str): The URL of the app.
+            results (LoadTestResults): The shared results.
+            timeout (float): The timeout of a request in seconds.
+        """
+        self.base_url = base_url
+        self.results = results
+        self.timeout = timeout
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), NoRedirect
+        )
+
+    def request(self, name, method, path, form=None, json_body=None):
+        """Send a request and record its latency under `name`.
+
+        Args:
+            name (str): The endpoint name in the report.
+            method (str): The HTTP method.
+            path (str): The path of the endpoint.
+            form (Optional[dict]): Form fields of the request.
+            json_body (Optional[dict]): JSON body of the request.
+
+        Returns:
+            Tuple[int, bytes]: The status code and the body of the response.
+        """
+        headers = {'Accept': 'application/json'}
+        data = None
+        if form is not None:
+            data = urllib.parse.urlencode(form).encode()
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        elif json_body is not None:
+            data = json.dumps(json_body).encode()
+            headers['Content-Type'] = 'application/json'
+        request = urllib.request.Request(self.base_url + path, data=data, headers=headers, method=method)
+        start = time.perf_counter()
+        try:
+            with self.opener.open(request, timeout=self.timeout) as response:
+                status, body = response.status, response.read()
+        except urllib.error.HTTPError as error:
+            status, body = error.code, error.read()
+        except OSError:
+            status, body = 0, b''
+        self.results.record(name, (time.perf_counter() - start) * 1000, status < 200 or status >= 400)
+        return status, body
+
+    def journey(self, sessions):
+        """Run one journey: register, log in, create a plan and log `sessions` workouts.
+
+        Args:
+            sessions (int): The number of workouts logged.
+        """
+        credentials = {'username': f'vu-{uuid.uuid4().hex[:12]}', 'password': 'password'}
+        self.request('POST /auth/register', 'POST', '/auth/register', form=credentials)
+        self.request('POST /auth/login', 'POST', '/auth/login', form=credentials)
+        self.request('POST /create_workout_plan', 'POST', '/create_workout_plan', json_body=WORKOUT_PLAN)
+        for _ in range(sessions):
+            status, body = self.request('GET /workout', 'GET', '/workout')
+            if status != 200:
+                continue
+            exercises = json.loads(body)['exercises']
+            self.request('POST /workout', 'POST', '/workout',
+                         json_body={'exercises': {key: exercise['weight'] for key, exercise in exercises.items()}})
+
+
+class LoadTestResults(object):
+    """Latencies and errors per endpoint, shared by all virtual users."""
+
+    def __init__(self):
+        """Initialize empty results."""
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def record(self, name, latency_ms, error):
+        """Record one request.
+
+        Args:
+            name (str): The endpoint name.
+            latency_ms (float): The latency in milliseconds.
+            error (bool): Whether the request failed.
+        """
+        with self._lock:
+            self.latencies[name].append(latency_ms)
+            if error:
+                self.errors[name] += 1
+
+    def report(self, elapsed):
+        """Return the report of the run.
+
+        Args:
+            elapsed (float): The duration of the run in seconds.
+
+        Returns:
+            dict: The total throughput and the statistics per endpoint.
+        """
+        endpoints = {}
+        for name, samples in self.latencies.items():
+            endpoints[name] = {
+                'requests': len(samples),
+                'errors': self.errors[name],
+                'p50_ms': percentile(samples, 0.5),
+                'p95_ms': percentile(samples, 0.95),
+                'p99_ms': percentile(samples, 0.99),
+            }
+        requests = sum(len(samples) for samples in self.latencies.values())
+        return {'requests': requests, 'errors': sum(self.errors.values()), 'seconds': elapsed,
+                'requests_per_second': requests / elapsed if elapsed else 0.0, 'endpoints': endpoints}
+
+
+def run_load_test(base_url, vus, iterations, sessions):
+    """Run `iterations` journeys with each of `vus` concurrent virtual users against `base_url`.
+
+    Args:
+        base_url (str): The URL of the app.
+        vus (int): The number of concurrent virtual users.
+        iterations (int): The number of journeys per virtual user.
+        sessions (int): The number of workouts logged per journey.
+
+    Returns:
+        dict: The report, see LoadTestResults.report.
+    """
+    results = LoadTestResults()
+
+    def run(virtual_user):
+        for _ in range(iterations):
+            virtual_user.journey(sessions)
+
+    threads = [threading.Thread(target=run, args=(VirtualUser(base_url, results),)) for _ in range(vus)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results.report(time.perf_counter() - start)
+
+
+def serve_app(config):
+    """Create the app on a new database and serve it on a free local port in a background thread.
+
+    Args:
+        config (dict): The config of the app.
+
+    Returns:
+        Tuple[str, werkzeug.serving.BaseWSGIServer]: The base URL and the server; call `shutdown` when done.
+    """
+    app = create_app(config)
+    with app.app_context():
+        init_db()
+    server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=QuietRequestHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f'http://127.0.0.1:{server.server_port}', server
+
+
+def parse_setting(setting):
+    """Parse a KEY=VALUE config override, reading the value as JSON if possible."""
+    key, _, value = setting.partition('=')
+    try:
+        return key, json.loads(value)
+    except json.JSONDecodeError:
+        return key, value
+
+
+def print_report(report):
+    """Print a report as a table."""
+    print(f'{report["requests"]} requests in {report["seconds"]:.1f} s, {report["requests_per_second"]:.0f} req/s, '
+          f'{report["errors"]} errors')
+    print(f'{"endpoint":28} {"requests":>8} {"errors":>6} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8}')
+    for name, stats in report['endpoints'].items():
+        print(f'{name:28} {stats["requests"]:8} {stats["errors"]:6} {stats["p50_ms"]:8.1f} {stats["p95_ms"]:8.1f} '
+              f'{stats["p99_ms"]:8.1f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--vus', type=int, default=8, help='Number of concurrent virtual users.')
+    parser.add_argument('--iterations', type=int, default=3, help='Number of journeys per virtual user.')
+    parser.add_argument('--sessions', type=int, default=5, help='Number of workouts logged per journey.')
+    parser.add_argument('--url', default=None, help='URL of a running app. Defaults to a local app.')
+    parser.add_argument('--set', dest='settings', action='append', default=[], metavar='KEY=VALUE',
+                        help='Override a config value of the local app, the value is parsed as JSON if possible.')
+    parser.add_argument('--json', action='store_true', help='Print the report as JSON.')
+    args = parser.parse_args()
+
+    server = None
+    with tempfile.TemporaryDirectory() as directory:
+        base_url = args.url
+        if base_url is None:
+            # All virtual users share one IP address, so the auth rate limit is off unless set explicitly
+            config = {'DATABASE': f'{directory}/load_test.sqlite', 'AUTH_RATE_LIMIT_ENABLED': False}
+            config.update(parse_setting(setting) for setting in args.settings)
+            base_url, server = serve_app(config)
+        try:
+            report = run_load_test(base_url, args.vus, args.iterations, args.sessions)
+        finally:
+            if server is not None:
+                server.shutdown()
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+
+if __name__ == '__main__':
+    main()
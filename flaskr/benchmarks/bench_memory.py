@@ -0,0 +1,101 @@
+"""
+Benchmark of the memory held by a hydrated GymLog.
+
+For every combination of workout and exercise count a gym log with that history is saved into an in-memory
+database and loaded again with SQLiteRepository.load_gym_log while tracemalloc traces the allocations. The memory
+still allocated once the gym log is loaded, i.e. the size of the object graph, is reported together with the bytes
+per workout and per logged exercise. The thresholds are checked by tests/test_memory.py, so a regression of the
+bytes per workout fails the CI.
+
+Usage:
+    python -m GymApp.flaskr.benchmarks.bench_memory --workouts 100 1000 5000 --exercises 5 10 20
+"""
+import argparse
+import gc
+import os
+import sqlite3
+import tracemalloc
+from datetime import datetime, timedelta
+
+from GymApp.flaskr.src.domain.user import User
+from GymApp.flaskr.src.domain.workout import ExercisePlan, GymLog, Workout, WorkoutPlan
+from GymApp.flaskr.src.repository.repository import SQLiteRepository
+
+SCHEMA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '../src/database/schema.sql')
+
+# Upper bounds checked in CI, about 20% over the values measured with Python 3.11: 1390 bytes per workout of five
+# exercises and 250 bytes per additional logged exercise
+MAX_BYTES_PER_WORKOUT = 1700
+MAX_BYTES_PER_EXERCISE = 300
+
+
+def build_repository(workouts, exercises):
+    """Return a repository on an in-memory database and the user of a gym log with `workouts` workouts of
+    `exercises` exercises each."""
+    connection = sqlite3.connect(':memory:', detect_types=sqlite3.PARSE_DECLTYPES)
+    with open(SCHEMA_PATH) as schema_file:
+        connection.executescript(schema_file.read())
+    repo = SQLiteRepository(connection)
+    user = User('user', 'password')
+    repo.register_user(user)
+    gym_log = GymLog(user.id)
+    gym_log.add_workout_plan(WorkoutPlan('Plan', {f'exercise{index}': ExercisePlan(f'Exercise {index}', 3, 8, 20, 2)
+                                                  for index in range(exercises)}))
+    repo.save_gym_log(gym_log)
+    start = datetime(2020, 1, 1)
+    for day in range(workouts):
+        workout = Workout({f'exercise{index}': {'name': f'Exercise {index}', 'weight': 20 + day}
+                           for index in range(exercises)}, date=start + timedelta(days=day))
+        repo.save_workout(workout, gym_log)
+    repo.commit()
+    return repo, user
+
+
+def measure_gym_log(workouts, exercises):
+    """Return the bytes allocated by a GymLog with `workouts` workouts of `exercises` exercises each, as loaded by
+    SQLiteRepository.load_gym_log."""
+    repo, user = build_repository(workouts, exercises)
+    # Warm the exercise cache and the statement cache, so they are not part of the measurement
+    repo.load_gym_log(user)
+    gc.collect()
+    tracing = tracemalloc.is_tracing()
+    if not tracing:
+        tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        gym_log = repo.load_gym_log(user)
+        gc.collect()
+        size = tracemalloc.get_traced_memory()[0] - before
+    finally:
+        if not tracing:
+            tracemalloc.stop()
+    assert len(gym_log.workout_list) == workouts
+    repo.connection.close()
+    return size
+
+
+def bytes_per_workout(exercises, workouts=(200, 400)):
+    """Return the marginal bytes per workout of `exercises` exercises, measured between two history lengths."""
+    small, large = (measure_gym_log(count, exercises) for count in workouts)
+    return (large - small) / (workouts[1] - workouts[0])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workouts', type=int, nargs='+', default=[100, 1000, 5000], help='Workout counts.')
+    parser.add_argument('--exercises', type=int, nargs='+', default=[5, 10, 20], help='Exercises per workout.')
+    args = parser.parse_args()
+
+    print(f'{"workouts":>8} {"exercises":>9} {"bytes":>12} {"B/workout":>10} {"B/exercise":>10}')
+    for exercises in args.exercises:
+        for workouts in args.workouts:
+            size = measure_gym_log(workouts, exercises)
+            print(f'{workouts:8} {exercises:9} {size:12} {size / workouts:10.0f} {size / workouts / exercises:10.0f}')
+    for exercises in args.exercises:
+        marginal = bytes_per_workout(exercises)
+        print(f'marginal bytes per workout with {exercises} exercises: {marginal:.0f} '
+              f'({marginal / exercises:.0f} per exercise)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""
+Benchmark of SQLiteRepository.search on a synthetic catalog.
+
+The catalog is filled with distinct exercise names built from common modifiers, equipment and movements, then a mix
+of prefix, multi word and misspelled queries is run and the latency percentiles are compared with the budget.
+
+Usage:
+    python -m GymApp.flaskr.benchmarks.bench_search --rows 1000000 --budget-ms 50
+"""
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+
+from GymApp.flaskr.src.repository.repository import SQLiteRepository
+
+SCHEMA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '../src/database/schema.sql')
+
+MODIFIERS = ['Incline', 'Decline', 'Seated', 'Standing', 'Single Arm', 'Close Grip', 'Wide Grip', 'Paused',
+             'Tempo', 'Deficit', 'Banded', 'Kneeling', 'Reverse', 'Sumo', 'Front', 'Overhead']
+EQUIPMENT = ['Barbell', 'Dumbbell', 'Cable', 'Machine', 'Kettlebell', 'Smith Machine', 'Landmine', 'Trap Bar']
+MOVEMENTS = ['Bench Press', 'Squat', 'Deadlift', 'Row', 'Curl', 'Lunge', 'Shoulder Press', 'Fly', 'Pullover',
+             'Extension', 'Shrug', 'Raise', 'Hip Thrust', 'Good Morning', 'Pulldown', 'Split Squat']
+QUERIES = ['bench', 'squ', 'incline dumb', 'romanian', 'cable fly', 'sumo dead', 'trap bar dead', 'hip thr',
+           'benhc press', 'sqaut', 'dedlift', 'kettlebel swing']
+
+
+def synthetic_names(rows, seed=0):
+    """Yield `rows` distinct synthetic exercise names."""
+    rng = random.Random(seed)
+    for i in range(rows):
+        yield f'{rng.choice(MODIFIERS)} {rng.choice(EQUIPMENT)} {rng.choice(MOVEMENTS)} V{i}'
+
+
+def build_catalog(path, rows, batch_size=50000):
+    """Create a database at `path` and fill its search catalog with `rows` documents."""
+    connection = sqlite3.connect(path)
+    with open(SCHEMA_PATH) as schema_file:
+        connection.executescript(schema_file.read())
+    names = synthetic_names(rows)
+    inserted = 0
+    while inserted < rows:
+        batch = [('exercise', f'synthetic-{inserted + i}', name)
+                 for i, name in zip(range(min(batch_size, rows - inserted)), names)]
+        connection.executemany('INSERT INTO search_documents (kind, ref, name) VALUES (?, ?, ?)', batch)
+        inserted += len(batch)
+    connection.execute("INSERT INTO search_index (search_index) VALUES ('optimize')")
+    connection.commit()
+    return connection
+
+
+def percentile(samples, fraction):
+    """Return the `fraction` percentile of `samples`."""
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1000000, help='Number of catalog documents.')
+    parser.add_argument('--repeat', type=int, default=20, help='Number of runs of every query.')
+    parser.add_argument('--budget-ms', type=float, default=50, help='Latency budget of one search.')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        connection = build_catalog(os.path.join(directory, 'search.sqlite'), args.rows)
+        print(f'Built catalog of {args.rows} rows in {time.perf_counter() - start:.1f} s')
+        repo = SQLiteRepository(connection)
+
+        samples = []
+        for query in QUERIES:
+            query_samples = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                results = repo.search(query, budget_ms=args.budget_ms)
+                query_samples.append((time.perf_counter() - start) * 1000)
+            samples.extend(query_samples)
+            print(f'{query!r:20} {len(results):3} results  median {statistics.median(query_samples):7.2f} ms')
+
+        p50, p95, p99 = (percentile(samples, fraction) for fraction in (0.5, 0.95, 0.99))
+        print(f'p50 {p50:.2f} ms  p95 {p95:.2f} ms  p99 {p99:.2f} ms  budget {args.budget_ms:.0f} ms')
+        print('within budget' if p99 <= args.budget_ms else 'OVER BUDGET')
+        connection.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""
+Benchmark of the write throughput of ShardedRepository as the number of shards grows.
+
+For every shard count a fresh set of shards is created and filled with users. Then a number of writer processes,
+each with its own connections, save workouts of random users and commit after every workout for a fixed time.
+Processes are used rather than threads, so the measurement is bounded by the SQLite write locks and not by the GIL.
+The committed workouts per second are reported for every shard count. On a RAM disk fsync is free and the write
+lock is held only briefly, so run it on the disk of the deployment to see the effect of sharding.
+
+Usage:
+    python -m GymApp.flaskr.benchmarks.bench_sharding --shards 1 2 4 8 --writers 8 --seconds 5 --directory /var/tmp
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from GymApp.flaskr.src.domain.user import User
+from GymApp.flaskr.src.domain.workout import ExercisePlan, GymLog, Workout, WorkoutPlan
+from GymApp.flaskr.src.repository.sharded_repository import ShardedRepository
+
+SCHEMA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '../src/database/schema.sql')
+
+EXERCISE_PLANS = {'squat': ExercisePlan('Squat', 5, 5, 60, 2.5), 'bench': ExercisePlan('Bench Press', 5, 5, 40, 2.5),
+                  'row': ExercisePlan('Row', 5, 5, 40, 2.5)}
+
+
+def connect(path, synchronous):
+    """Open a WAL connection to `path` with a busy timeout large enough for the writers."""
+    connection = sqlite3.connect(path, timeout=30, detect_types=sqlite3.PARSE_DECLTYPES)
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.execute(f'PRAGMA synchronous={synchronous}')
+    return connection
+
+
+def open_repository(directory, shard_count, synchronous):
+    """Return a ShardedRepository with new connections to the shards in `directory`."""
+    return ShardedRepository(
+        connect(os.path.join(directory, 'directory.sqlite'), synchronous),
+        [connect(os.path.join(directory, f'shard{index}.sqlite'), synchronous) for index in range(shard_count)]
+    )
+
+
+def build_shards(directory, shard_count, users, synchronous):
+    """Create `shard_count` shards in `directory` and register `users` users with a gym log on them."""
+    with open(SCHEMA_PATH) as schema_file:
+        schema_sql = schema_file.read()
+    repo = open_repository(directory, shard_count, synchronous)
+    for shard in repo.shards:
+        shard.connection.executescript(schema_sql)
+    for index in range(users):
+        user = User(username=f'user{index}', password='password')
+        repo.register_user(user)
+        gym_log = GymLog(user.id)
+        gym_log.add_workout_plan(WorkoutPlan('Plan', EXERCISE_PLANS))
+        repo.save_gym_log(gym_log)
+    repo.commit()
+    return repo
+
+
+def writer(directory, shard_count, users, synchronous, deadline, seed, results):
+    """Save workouts of random users until `deadline` and put the number of commits into the `results` queue."""
+    rng = random.Random(seed)
+    repo = open_repository(directory, shard_count, synchronous)
+    gym_logs = {}
+    commits = 0
+    while time.time() < deadline:
+        user = User(username=None, password=None, id=rng.randint(1, users))
+        gym_log = gym_logs.get(user.id)
+        if gym_log is None:
+            gym_log = gym_logs[user.id] = repo.load_gym_log(user)
+        workout = Workout({key: {'name': plan.name, 'weight': plan.initial_weight + rng.randint(0, 20)}
+                           for key, plan in EXERCISE_PLANS.items()},
+                          date=datetime(2024, 1, 1) + timedelta(minutes=rng.randint(0, 10 ** 6)))
+        repo.shard_of(user.id).save_workout(workout, gym_log)
+        repo.commit()
+        commits += 1
+    results.put(commits)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--shards', type=int, nargs='+', default=[1, 2, 4, 8], help='Shard counts to measure.')
+    parser.add_argument('--writers', type=int, default=8, help='Number of writer processes.')
+    parser.add_argument('--users', type=int, default=1000, help='Number of users.')
+    parser.add_argument('--seconds', type=float, default=5, help='Duration of every measurement.')
+    parser.add_argument('--synchronous', default='FULL', choices=['OFF', 'NORMAL', 'FULL'],
+                        help='PRAGMA synchronous of the connections.')
+    parser.add_argument('--directory', default=None, help='Directory for the shard files.')
+    args = parser.parse_args()
+
+    print(f'{args.writers} writers, {args.users} users, {args.seconds:.0f} s per shard count, '
+          f'synchronous={args.synchronous}')
+    baseline = None
+    for shard_count in args.shards:
+        with tempfile.TemporaryDirectory(dir=args.directory) as directory:
+            build_shards(directory, shard_count, args.users, args.synchronous)
+            results = multiprocessing.Queue()
+            deadline = time.time() + args.seconds
+            processes = [multiprocessing.Process(target=writer, args=(directory, shard_count, args.users,
+                                                                      args.synchronous, deadline, seed, results))
+                         for seed in range(args.writers)]
+            for process in processes:
+                process.start()
+            commits = sum(results.get() for _ in processes)
+            for process in processes:
+                process.join()
+            throughput = commits / args.seconds
+            baseline = baseline or throughput
+            print(f'{shard_count:3} shards  {throughput:9.0f} workouts/s  {throughput / baseline:5.2f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+"""
+Benchmark of the streamed workout history page.
+
+For every history length a user with that many workouts is created in a temporary database and /history is
+requested through the full WSGI stack, including the gzip middleware, while the response is consumed chunk by chunk.
+The time to the first byte, the total time and the peak memory allocated during the request are compared with
+rendering the same page fully in memory with render_template and compressing it in one piece, as the page would be
+without streaming. The streamed page should keep its time to first byte and peak memory flat as the history grows,
+while both grow linearly for the buffered page.
+
+Usage:
+    python -m GymApp.flaskr.benchmarks.bench_streaming --workouts 100 1000 10000 --exercises 5
+"""
+import argparse
+import gc
+import gzip
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from flask import g, render_template
+
+from GymApp.flaskr import create_app
+from GymApp.flaskr.src.database.db import get_db, init_db
+from GymApp.flaskr.src.domain.user import User
+from GymApp.flaskr.src.domain.workout import ExercisePlan, GymLog, Workout, WorkoutPlan
+from GymApp.flaskr.src.repository.repository import SQLiteRepository
+
+
+def build_app(directory, workouts, exercises):
+    """Return an app on a database in `directory` and a user with `workouts` workouts of `exercises` exercises."""
+    app = create_app({'DATABASE': f'{directory}/history.sqlite', 'ASSETS_FOLDER': f'{directory}/assets',
+                      'AUTH_RATE_LIMIT_ENABLED': False})
+    with app.app_context():
+        init_db()
+        repo = SQLiteRepository(get_db())
+        user = User('user', 'password')
+        repo.register_user(user)
+        gym_log = GymLog(user.id)
+        gym_log.add_workout_plan(WorkoutPlan('Plan', {
+            f'exercise{index}': ExercisePlan(f'Exercise {index}', 3, 8, 20, 2) for index in range(exercises)
+        }))
+        repo.save_gym_log(gym_log)
+        start = datetime(2000, 1, 1)
+        for day in range(workouts):
+            workout = Workout({f'exercise{index}': {'name': f'Exercise {index}', 'weight': 20 + day % 50}
+                               for index in range(exercises)}, date=start + timedelta(hours=day))
+            repo.save_workout(workout, gym_log, refresh_next_workout=False)
+        repo.commit()
+    return app, user
+
+
+def streamed(app, user):
+    """Request the streamed history page and consume it.
+
+    Returns:
+        Tuple[float, float, int]: The time to the first byte and the total time in milliseconds, and the size.
+    """
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = user.id
+    start = time.perf_counter()
+    response = client.get('/history', headers={'Accept-Encoding': 'gzip'}, buffered=False)
+    first_byte = None
+    size = 0
+    for chunk in response.response:
+        if chunk and first_byte is None:
+            first_byte = time.perf_counter()
+        size += len(chunk)
+    response.close()
+    end = time.perf_counter()
+    return (first_byte - start) * 1000, (end - start) * 1000, size
+
+
+def buffered(app, user):
+    """Render the history page in memory and compress it in one piece, like a page rendered with render_template.
+
+    Returns:
+        Tuple[float, float, int]: The time to the first byte and the total time in milliseconds, and the size.
+    """
+    start = time.perf_counter()
+    with app.test_request_context('/history'):
+        g.user = user
+        repo = SQLiteRepository(get_db())
+        workouts = list(repo.iter_workouts(repo.gym_log_id(user)))
+        body = gzip.compress(render_template('workout/History.html', workouts=workouts).encode(), 6)
+    elapsed = (time.perf_counter() - start) * 1000
+    return elapsed, elapsed, len(body)
+
+
+def peak_memory(function, app, user):
+    """Return the peak memory in bytes allocated while running `function(app, user)`."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        function(app, user)
+        return tracemalloc.get_traced_memory()[1] - before
+    finally:
+        tracemalloc.stop()
+
+
+def measure(function, app, user, repeat):
+    """Return the median time to first byte and total time, the size and the peak memory of `function`."""
+    # Warm the template and statement caches
+    function(app, user)
+    runs = sorted(function(app, user) for _ in range(repeat))
+    first_byte, total, size = runs[len(runs) // 2]
+    return first_byte, total, size, peak_memory(function, app, user)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workouts', type=int, nargs='+', default=[100, 1000, 10000], help='History lengths.')
+    parser.add_argument('--exercises', type=int, default=5, help='Exercises per workout.')
+    parser.add_argument('--repeat', type=int, default=5, help='Requests per measurement.')
+    args = parser.parse_args()
+
+    print(f'{"workouts":>8} {"mode":>8} {"ttfb ms":>8} {"total ms":>9} {"gzip KB":>8} {"peak KB":>9}')
+    for workouts in args.workouts:
+        with tempfile.TemporaryDirectory() as directory:
+            app, user = build_app(directory, workouts, args.exercises)
+            for mode, function in (('stream', streamed), ('buffered', buffered)):
+                first_byte, total, size, peak = measure(function, app, user, args.repeat)
+                print(f'{workouts:8} {mode:>8} {first_byte:8.1f} {total:9.1f} {size / 1024:8.1f} {peak / 1024:9.0f}')
+
+
+if __name__ == '__main__':
+    main()
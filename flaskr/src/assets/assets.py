@@ -0,0 +1,224 @@
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+
+import click
+from flask import current_app, request, send_from_directory
+from flask.cli import with_appcontext
+
+try:
+    import brotli
+except ImportError:  # brotli is an optional dependency
+    brotli = None
+
+MANIFEST_NAME = 'manifest.json'
+HASH_LENGTH = 12
+# Hashed files never change, so they may be cached for a year without revalidation
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+COMPRESSIBLE_EXTENSIONS = {'.css', '.js', '.json', '.svg', '.html', '.txt', '.xml', '.map'}
+# Encodings in order of preference, with the suffix of their precompressed variant
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+def write_file(path, data):
+    """Write a file atomically, so a concurrently served file is never read half written.
+
+    Args:
+        path (str): The path of the file.
+        data (bytes): The content of the file.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary_path = f'{path}.{os.getpid()}.tmp'
+    with open(temporary_path, 'wb') as file:
+        file.write(data)
+    os.replace(temporary_path, path)
+
+
+def compress(data, encoding):
+    """Compress data with the maximum compression level of an encoding.
+
+    Args:
+        data (bytes): The data.
+        encoding (str): 'gzip' or 'br'.
+
+    Returns:
+        Optional[bytes]: The compressed data, or None if the encoding is not available.
+    """
+    if encoding == 'gzip':
+        # A fixed mtime keeps the output deterministic across builds
+        return gzip.compress(data, compresslevel=9, mtime=0)
+    if encoding == 'br' and brotli is not None:
+        return brotli.compress(data, quality=11)
+    return None
+
+
+def build_assets(static_folder, assets_folder):
+    """Content-hash the static files and write them, with their precompressed variants, to the assets folder.
+
+    Every file is written as `<name>.<hash><extension>`, so its URL changes whenever its content does. Text files
+    are also written gzip compressed and, if the brotli package is installed, brotli compressed, unless compressing
+    does not make them smaller. Files of previous builds are left in place for clients still holding old pages.
+
+    Args:
+        static_folder (str): The folder of the static files.
+        assets_folder (str): The folder the hashed files and the manifest are written to.
+
+    Returns:
+        dict: The manifest, mapping every static file to its hashed path and available encodings.
+    """
+    manifest = {}
+    for root, _, filenames in os.walk(static_folder):
+        for filename in sorted(filenames):
+            source = os.path.join(root, filename)
+            name = os.path.relpath(source, static_folder).replace(os.sep, '/')
+            with open(source, 'rb') as file:
+                data = file.read()
+            stem, extension = os.path.splitext(name)
+            path = f'{stem}.{hashlib.sha256(data).hexdigest()[:HASH_LENGTH]}{extension}'
+            destination = os.path.join(assets_folder, path)
+            encodings = []
+            if not os.path.exists(destination):
+                write_file(destination, data)
+            if extension in COMPRESSIBLE_EXTENSIONS:
+                for encoding, suffix in ENCODINGS:
+                    if os.path.exists(destination + suffix):
+                        encodings.append(encoding)
+                        continue
+                    compressed = compress(data, encoding)
+                    if compressed is not None and len(compressed) < len(data):
+                        write_file(destination + suffix, compressed)
+                        encodings.append(encoding)
+            manifest[name] = {'path': path, 'encodings': encodings}
+    write_file(os.path.join(assets_folder, MANIFEST_NAME), json.dumps(manifest, indent=2, sort_keys=True).encode())
+    return manifest
+
+
+def load_manifest(assets_folder):
+    """Load the manifest of the last build.
+
+    Args:
+        assets_folder (str): The assets folder.
+
+    Returns:
+        dict: The manifest, empty if the assets were never built.
+    """
+    try:
+        with open(os.path.join(assets_folder, MANIFEST_NAME)) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+class AssetManifest(object):
+    """The hashed static files of the application.
+
+    Attributes:
+        folder (str): The assets folder.
+        files (dict): The manifest, mapping every static file to its hashed path and available encodings.
+        encodings (dict): The available encodings per hashed path.
+    """
+
+    def __init__(self, folder, files):
+        """Initialize an AssetManifest.
+
+        Args:
+            folder (str): The assets folder.
+            files (dict): The manifest, see build_assets.
+        """
+        self.folder = folder
+        self.files = files
+        self.encodings = {entry['path']: entry['encodings'] for entry in files.values()}
+
+    def hashed_path(self, filename):
+        """Return the hashed path of a static file, or the filename itself if it was not built."""
+        entry = self.files.get(filename)
+        return filename if entry is None else entry['path']
+
+    def negotiate(self, path, accept_encodings):
+        """Choose the encoding of a hashed file for a request.
+
+        Args:
+            path (str): The hashed path.
+            accept_encodings: The Accept-Encoding header of the request, as parsed by werkzeug.
+
+        Returns:
+            Optional[Tuple[str, str]]: The encoding and the suffix of its file, or None for the identity encoding.
+        """
+        available = self.encodings.get(path, ())
+        for encoding, suffix in ENCODINGS:
+            if encoding in available and accept_encodings[encoding] > 0:
+                return encoding, suffix
+        return None
+
+
+def get_assets():
+    """Get the asset manifest of the current application.
+
+    Returns:
+        AssetManifest: The manifest.
+    """
+    return current_app.extensions['assets']
+
+
+def url_defaults(endpoint, values):
+    """Rewrite the filename of `url_for('static', ...)` to the hashed path of the file."""
+    if endpoint == 'static' and 'filename' in values:
+        values['filename'] = get_assets().hashed_path(values['filename'])
+
+
+def serve_static(filename):
+    """Serve a static file.
+
+    Hashed files are served from the assets folder, precompressed in the best encoding the client accepts, with an
+    immutable far-future Cache-Control header. Other files are served from the static folder as usual.
+
+    Args:
+        filename (str): The path of the file.
+
+    Returns:
+        The response with the file.
+    """
+    assets = get_assets()
+    if filename not in assets.encodings:
+        return current_app.send_static_file(filename)
+    negotiated = assets.negotiate(filename, request.accept_encodings)
+    suffix = '' if negotiated is None else negotiated[1]
+    response = send_from_directory(assets.folder, filename + suffix, mimetype=mimetypes.guess_type(filename)[0])
+    if negotiated is not None:
+        response.headers['Content-Encoding'] = negotiated[0]
+    response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+@click.command('build-assets')
+@with_appcontext
+def build_assets_command():
+    """
+    Flask command content-hashing and precompressing the static files.
+    """
+    folder = current_app.config['ASSETS_FOLDER']
+    manifest = build_assets(current_app.static_folder, folder)
+    current_app.extensions['assets'] = AssetManifest(folder, manifest)
+    click.echo(f'Built {len(manifest)} assets.')
+
+
+def init_app(app):
+    """
+    Initialize the Flask application with the hashed static files. The assets are built at start if
+    ASSETS_BUILD_ON_START is set, otherwise the manifest of the last `flask build-assets` is used.
+
+    Args:
+        app: The Flask application instance.
+    """
+    folder = app.config['ASSETS_FOLDER']
+    if app.config['ASSETS_BUILD_ON_START']:
+        manifest = build_assets(app.static_folder, folder)
+    else:
+        manifest = load_manifest(folder)
+    app.extensions['assets'] = AssetManifest(folder, manifest)
+    app.url_defaults(url_defaults)
+    app.view_functions['static'] = serve_static
+    app.cli.add_command(build_assets_command)
@@ -0,0 +1,112 @@
+import zlib
+
+from werkzeug.http import parse_accept_header
+
+COMPRESSIBLE_MIMETYPES = {'application/json', 'application/javascript', 'image/svg+xml', 'application/xml'}
+
+
+class GzipMiddleware(object):
+    """WSGI middleware compressing responses with gzip as they stream.
+
+    Every chunk of the response is passed through one compressor. The compressor is flushed after the first chunk,
+    so the client gets the first bytes as soon as the application produces them, and then whenever `flush_size`
+    bytes were passed in since the last flush, so a streamed page arrives in pieces of bounded size instead of
+    being held back by the compressor. Responses that are already encoded, are not text, or have a Content-Length
+    below `min_size` are passed through unchanged.
+    """
+
+    def __init__(self, app, level=6, min_size=500, flush_size=8192):
+        """Initialize a GzipMiddleware.
+
+        Args:
+            app: The WSGI application.
+            level (int): The compression level from 1 to 9.
+            min_size (int): The minimum Content-Length of a compressed response.
+            flush_size (int): The number of uncompressed bytes after which the compressed output is flushed.
+        """
+        self.app = app
+        self.level = level
+        self.min_size = min_size
+        self.flush_size = flush_size
+
+    def __call__(self, environ, start_response):
+        if environ.get('REQUEST_METHOD') == 'HEAD' or \
+                parse_accept_header(environ.get('HTTP_ACCEPT_ENCODING'))['gzip'] <= 0:
+            return self.app(environ, start_response)
+        compressed = []
+
+        def gzip_start_response(status, headers, exc_info=None):
+            if self.should_compress(status, headers):
+                headers = [(name, value) for name, value in headers if name.lower() != 'content-length']
+                headers.append(('Content-Encoding', 'gzip'))
+                vary = [value for name, value in headers if name.lower() == 'vary']
+                headers = [(name, value) for name, value in headers if name.lower() != 'vary']
+                headers.append(('Vary', ', '.join(vary + ['Accept-Encoding'])))
+                compressed.append(True)
+            return start_response(status, headers, exc_info)
+
+        app_iter = self.app(environ, gzip_start_response)
+        if not compressed:
+            return app_iter
+        return self.compress(app_iter)
+
+    def should_compress(self, status, headers):
+        """Decide whether a response is compressed.
+
+        Args:
+            status (str): The status line of the response.
+            headers (List[Tuple[str, str]]): The headers of the response.
+
+        Returns:
+            bool: True if the response is compressed.
+        """
+        if status[:3] in ('204', '304'):
+            return False
+        headers = {name.lower(): value for name, value in headers}
+        if 'content-encoding' in headers:
+            return False
+        mimetype = headers.get('content-type', '').split(';')[0].strip()
+        if not mimetype.startswith('text/') and mimetype not in COMPRESSIBLE_MIMETYPES:
+            return False
+        length = headers.get('content-length')
+        return length is None or int(length) >= self.min_size
+
+    def compress(self, app_iter):
+        """Compress the chunks of a response.
+
+        Args:
+            app_iter (Iterable[bytes]): The chunks of the response.
+
+        Yields:
+            bytes: The compressed chunks.
+        """
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+        # Flushing as soon as the first chunk arrives sends it out without waiting for more
+        pending = self.flush_size
+        try:
+            for chunk in app_iter:
+                if not chunk:
+                    continue
+                data = compressor.compress(chunk)
+                pending += len(chunk)
+                if pending >= self.flush_size:
+                    data += compressor.flush(zlib.Z_SYNC_FLUSH)
+                    pending = 0
+                if data:
+                    yield data
+            yield compressor.flush()
+        finally:
+            if hasattr(app_iter, 'close'):
+                app_iter.close()
+
+
+def init_app(app):
+    """
+    Initialize the Flask application with the gzip middleware, if COMPRESSION_ENABLED is set.
+
+    Args:
+        app: The Flask application instance.
+    """
+    if app.config.get('COMPRESSION_ENABLED'):
+        app.wsgi_app = GzipMiddleware(app.wsgi_app, app.config['COMPRESSION_LEVEL'],
+                                      app.config['COMPRESSION_MIN_SIZE'], app.config['COMPRESSION_FLUSH_SIZE'])
@@ -0,0 +1,497 @@
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import time
+from datetime import datetime, timedelta, timezone
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from GymApp.flaskr.src.database import migrations
+from GymApp.flaskr.src.database.db import archive_path, connect, renew_generation
+from GymApp.flaskr.src.repository.repository import clear_exercise_caches
+
+# Size of the chunks snapshots are compressed, hashed and decompressed in, and their gzip level. Level 6 compresses
+# about as well as the default level 9 at a fraction of its cost.
+CHUNK_SIZE = 1024 * 1024
+COMPRESSION_LEVEL = 6
+
+SNAPSHOT_SUFFIX = '.sqlite.gz'
+ARCHIVE_SNAPSHOT_SUFFIX = '.archive.sqlite.gz'
+CHECKSUM_SUFFIX = '.sha256'
+TIMESTAMP_FORMAT = '%Y%m%dT%H%M%S%fZ'
+
+
+class SnapshotError(Exception):
+    """Exception raised when a snapshot fails its checksum or integrity check and cannot be restored."""
+
+    pass
+
+
+def snapshot_name(database, created):
+    """
+    Get the file name of a snapshot of a database, e.g. `flaskr-20240101T120000000000Z.sqlite.gz`.
+
+    Args:
+        database (str): The path of the database.
+        created (datetime): The UTC time of the snapshot.
+
+    Returns:
+        str: The file name.
+    """
+    stem = os.path.splitext(os.path.basename(database))[0]
+    return f'{stem}-{created.strftime(TIMESTAMP_FORMAT)}{SNAPSHOT_SUFFIX}'
+
+
+def list_snapshots(directory, database):
+    """
+    List the snapshots of a database in a directory, newest first.
+
+    Args:
+        directory (str): The snapshot directory.
+        database (str): The path of the database.
+
+    Returns:
+        List[Tuple[datetime, str]]: The UTC time and the path of each snapshot.
+    """
+    prefix = f'{os.path.splitext(os.path.basename(database))[0]}-'
+    snapshots = []
+    for name in os.listdir(directory) if os.path.isdir(directory) else []:
+        if not (name.startswith(prefix) and name.endswith(SNAPSHOT_SUFFIX)):
+            continue
+        try:
+            created = datetime.strptime(name[len(prefix):-len(SNAPSHOT_SUFFIX)], TIMESTAMP_FORMAT)
+        except ValueError:
+            continue
+        snapshots.append((created.replace(tzinfo=timezone.utc), os.path.join(directory, name)))
+    return sorted(snapshots, reverse=True)
+
+
+def file_checksum(path):
+    """Return the SHA-256 hex digest of a file, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def read_checksum(snapshot):
+    """
+    Read the checksum file written next to a snapshot, in the format of `sha256sum`.
+
+    Raises:
+        SnapshotError: If the checksum file is missing.
+    """
+    try:
+        with open(snapshot + CHECKSUM_SUFFIX) as file:
+            return file.read().split()[0]
+    except (OSError, IndexError):
+        raise SnapshotError(f'Missing checksum of {snapshot}')
+
+
+class _TooManyRestarts(Exception):
+    """Raised from the progress callback of a backup to abort a copy that keeps being restarted by writers."""
+
+    pass
+
+
+class _HashingWriter(object):
+    """Binary file wrapper hashing the bytes written to it."""
+
+    def __init__(self, file):
+        self.file = file
+        self.digest = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data):
+        self.digest.update(data)
+        self.size += len(data)
+        return self.file.write(data)
+
+    def flush(self):
+        self.file.flush()
+
+
+def prune_snapshots(directory, database, keep_last, keep_daily, now=None):
+    """
+    Delete the snapshots of a database that no retention rule keeps. The `keep_last` newest snapshots are kept, and
+    so is the newest snapshot of each of the last `keep_daily` days. The newest snapshot is always kept. Archive
+    snapshots are deleted with the snapshot they were written with.
+
+    Args:
+        directory (str): The snapshot directory.
+        database (str): The path of the database.
+        keep_last (int): The number of newest snapshots to keep.
+        keep_daily (int): The number of days to keep one snapshot of.
+        now (Optional[datetime]): The current UTC time. Defaults to now.
+
+    Returns:
+        List[str]: The paths of the deleted snapshots.
+    """
+    now = now or datetime.now(timezone.utc)
+    oldest_day = (now - timedelta(days=keep_daily)).date()
+    days = set()
+    pruned = []
+    for index, (created, path) in enumerate(list_snapshots(directory, database)):
+        day = created.date()
+        if index < max(keep_last, 1) or (day > oldest_day and day not in days):
+            days.add(day)
+            continue
+        archive = archive_snapshot_path(path)
+        for file in (path, path + CHECKSUM_SUFFIX, archive, archive + CHECKSUM_SUFFIX):
+            if os.path.exists(file):
+                os.remove(file)
+        pruned.append(path)
+    return pruned
+
+
+def copy_database(source, target, pages, pause, max_restarts):
+    """
+    Copy a live database with the online backup API, `pages` at a time. The source is only locked while a step
+    runs, so writers make progress in the pauses between steps. A write by another connection restarts the copy
+    from the first page. Under steady write traffic that can go on forever, so after `max_restarts` restarts the
+    copy falls back to a single step, which reads the whole database in one read transaction. In WAL mode that
+    does not block writers; in rollback journal mode writers wait for the copy.
+
+    Args:
+        source (sqlite3.Connection): A connection to the database.
+        target (sqlite3.Connection): A connection to the copy.
+        pages (int): The number of pages copied per step.
+        pause (float): The seconds to wait between two steps.
+        max_restarts (int): The number of restarts after which the copy falls back to a single step.
+
+    Returns:
+        dict: The copy method, 'stepped' or 'read_transaction', and the number of steps and of restarts.
+    """
+    progress = {'method': 'stepped', 'steps': 0, 'restarts': 0, 'remaining': None}
+
+    def step(status, remaining, total):
+        if progress['remaining'] is not None and remaining > progress['remaining']:
+            progress['restarts'] += 1
+            if progress['restarts'] > max_restarts:
+                raise _TooManyRestarts
+        progress['steps'] += 1
+        progress['remaining'] = remaining
+
+    try:
+        source.backup(target, pages=pages, progress=step, sleep=pause)
+    except _TooManyRestarts:
+        progress['method'] = 'read_transaction'
+        source.backup(target)
+        progress['steps'] += 1
+    del progress['remaining']
+    return progress
+
+
+def copy_with_archive(source, target, archive_target):
+    """
+    Copy a live database and its attached archive database inside one read transaction, so the copies agree on
+    which workouts were archived. In WAL mode that does not block writers; in rollback journal mode writers wait
+    for the copy.
+
+    Args:
+        source (sqlite3.Connection): A connection to the database with the archive attached as `archive`.
+        target (sqlite3.Connection): A connection to the copy of the database.
+        archive_target (sqlite3.Connection): A connection to the copy of the archive.
+
+    Returns:
+        dict: The copy method, steps and restarts, like `copy_database`.
+    """
+    source.execute('BEGIN')
+    try:
+        # Reading both schemas starts the read transaction on both databases before the first page is copied
+        source.execute('SELECT COUNT(*) FROM main.sqlite_schema').fetchone()
+        source.execute('SELECT COUNT(*) FROM archive.sqlite_schema').fetchone()
+        source.backup(target)
+        source.backup(archive_target, name='archive')
+    finally:
+        source.rollback()
+    return {'method': 'read_transaction', 'steps': 2, 'restarts': 0}
+
+
+def archive_snapshot_path(snapshot):
+    """Get the path of the snapshot of the archive database written next to a snapshot of the database."""
+    return snapshot[:-len(SNAPSHOT_SUFFIX)] + ARCHIVE_SNAPSHOT_SUFFIX
+
+
+def compress_snapshot(copy, snapshot):
+    """
+    Compress a copy of a database in chunks into a snapshot and write its checksum file. The snapshot is written
+    under a temporary name and renamed when it is complete.
+
+    Args:
+        copy (str): The path of the copy.
+        snapshot (str): The path of the snapshot.
+
+    Returns:
+        Tuple[str, int]: The SHA-256 hex digest and the size of the snapshot.
+    """
+    with open(copy, 'rb') as raw, open(snapshot + '.part', 'wb') as file:
+        writer = _HashingWriter(file)
+        with gzip.GzipFile(fileobj=writer, mode='wb', compresslevel=COMPRESSION_LEVEL, mtime=0) as compressed:
+            shutil.copyfileobj(raw, compressed, CHUNK_SIZE)
+        file.flush()
+        os.fsync(file.fileno())
+    with open(snapshot + CHECKSUM_SUFFIX, 'w') as file:
+        file.write(f'{writer.digest.hexdigest()}  {os.path.basename(snapshot)}\n')
+    os.replace(snapshot + '.part', snapshot)
+    return writer.digest.hexdigest(), writer.size
+
+
+def backup(database, directory, pages=256, pause=0.005, keep_last=7, keep_daily=30, max_restarts=3, archive=None):
+    """
+    Write a compressed, checksummed snapshot of a live database and prune the old snapshots.
+
+    The database is copied in steps so writers keep making progress, see `copy_database`. If the database has an
+    archive, both are copied in one read transaction instead, see `copy_with_archive`, and the archive is written
+    to a second snapshot next to the first one, see `archive_snapshot_path`. The copies are compressed in chunks
+    and written under a temporary name, so an interrupted backup never leaves a truncated snapshot behind. The
+    SHA-256 of each compressed snapshot is written next to it, like `sha256sum` does.
+
+    Args:
+        database (str): The path of the database.
+        directory (str): The snapshot directory. It is created if it does not exist.
+        pages (int): The number of pages copied per step.
+        pause (float): The seconds to wait between two steps.
+        keep_last (int): See `prune_snapshots`.
+        keep_daily (int): See `prune_snapshots`.
+        max_restarts (int): See `copy_database`.
+        archive (Optional[str]): The path of the archive database. It is only backed up if it exists.
+
+    Returns:
+        dict: The report, JSON serializable.
+    """
+    start = time.perf_counter()
+    os.makedirs(directory, exist_ok=True)
+    snapshot = os.path.join(directory, snapshot_name(database, datetime.now(timezone.utc)))
+    if archive is not None and not os.path.exists(archive):
+        archive = None
+    copy = snapshot + '.part.sqlite'
+    archive_copy = snapshot + '.archive.part.sqlite'
+    archive_snapshot = archive_snapshot_path(snapshot)
+    try:
+        source = connect(database, archive=archive)
+        target = sqlite3.connect(copy)
+        archive_target = sqlite3.connect(archive_copy) if archive else None
+        try:
+            if archive:
+                progress = copy_with_archive(source, target, archive_target)
+                archive_target.execute('PRAGMA journal_mode = DELETE')
+            else:
+                progress = copy_database(source, target, pages, pause, max_restarts)
+            target.execute('PRAGMA journal_mode = DELETE')
+        finally:
+            target.close()
+            if archive_target is not None:
+                archive_target.close()
+            source.close()
+        copied = time.perf_counter()
+        if archive:
+            archive_checksum, archive_snapshot_bytes = compress_snapshot(archive_copy, archive_snapshot)
+            archive_bytes = os.path.getsize(archive_copy)
+        else:
+            archive_checksum, archive_snapshot_bytes, archive_bytes = None, 0, 0
+        checksum, snapshot_bytes = compress_snapshot(copy, snapshot)
+        database_bytes = os.path.getsize(copy)
+    finally:
+        for file in (copy, snapshot + '.part', archive_copy, archive_snapshot + '.part'):
+            if os.path.exists(file):
+                os.remove(file)
+    seconds = time.perf_counter() - start
+    return {
+        'snapshot': snapshot,
+        'checksum': checksum,
+        'database_bytes': database_bytes,
+        'snapshot_bytes': snapshot_bytes,
+        'archive_snapshot': archive_snapshot if archive else None,
+        'archive_checksum': archive_checksum,
+        'archive_bytes': archive_bytes,
+        'archive_snapshot_bytes': archive_snapshot_bytes,
+        'copy_method': progress['method'],
+        'steps': progress['steps'],
+        'restarts': progress['restarts'],
+        'copy_seconds': round(copied - start, 3),
+        'seconds': round(seconds, 3),
+        'mb_per_s': round((database_bytes + archive_bytes) / 1e6 / max(seconds, 1e-6), 2),
+        'pruned': prune_snapshots(directory, database, keep_last, keep_daily),
+    }
+
+
+def unpack_snapshot(snapshot, copy):
+    """
+    Verify the checksum of a snapshot, decompress it in chunks and check the integrity of the decompressed copy.
+
+    Args:
+        snapshot (str): The path of the snapshot.
+        copy (str): The path to decompress the snapshot to.
+
+    Returns:
+        sqlite3.Connection: A connection to the copy.
+
+    Raises:
+        SnapshotError: If the snapshot fails its checksum or integrity check.
+    """
+    checksum = read_checksum(snapshot)
+    if file_checksum(snapshot) != checksum:
+        raise SnapshotError(f'Checksum mismatch of {snapshot}')
+    with gzip.open(snapshot, 'rb') as compressed, open(copy, 'wb') as raw:
+        shutil.copyfileobj(compressed, raw, CHUNK_SIZE)
+    connection = sqlite3.connect(copy)
+    if connection.execute('PRAGMA quick_check').fetchone()[0] != 'ok':
+        connection.close()
+        raise SnapshotError(f'Integrity check of {snapshot} failed')
+    return connection
+
+
+def has_archived_workouts(archive):
+    """Check whether the archive database at `archive` exists and holds workouts."""
+    if not os.path.exists(archive):
+        return False
+    connection = sqlite3.connect(archive)
+    try:
+        return connection.execute('SELECT 1 FROM workouts LIMIT 1').fetchone() is not None
+    except sqlite3.OperationalError:
+        return False
+    finally:
+        connection.close()
+
+
+def restore(snapshot, database, timeout=5.0, archive=None):
+    """
+    Replace the content of a database and of its archive with a snapshot written by `backup`.
+
+    The checksums of the snapshot and of its archive snapshot are verified and the snapshots are decompressed in
+    chunks into temporary databases next to the targets, which have to pass `PRAGMA quick_check`. Their pages are
+    then copied into the database and the archive with the backup API in one step each. The database files are
+    kept, so open connections see the restored content with their next transaction instead of a deleted file. The
+    generation of the database is renewed, so the ChangeTracker of every process clears its caches on its next
+    poll, see `renew_generation`.
+
+    A snapshot without an archive snapshot is not restored over an archive holding workouts, because the archived
+    workouts would then also be in the restored database.
+
+    Args:
+        snapshot (str): The path of the snapshot.
+        database (str): The path of the database.
+        timeout (float): The seconds to wait for the write lock of the database.
+        archive (Optional[str]): The path of the archive database.
+
+    Returns:
+        dict: The report, JSON serializable.
+
+    Raises:
+        SnapshotError: If a snapshot fails its checksum or integrity check, has a newer schema than the
+            application, or has no archive snapshot while the archive holds workouts.
+    """
+    start = time.perf_counter()
+    archive_snapshot = archive_snapshot_path(snapshot)
+    if archive is not None and not os.path.exists(archive_snapshot) and has_archived_workouts(archive):
+        raise SnapshotError(f'{snapshot} has no archive snapshot and the archive {archive} is not empty')
+    copy = f'{database}.restore.sqlite'
+    archive_copy = f'{database}.restore.archive.sqlite'
+    archive_source = None
+    try:
+        source = unpack_snapshot(snapshot, copy)
+        try:
+            version = source.execute('PRAGMA user_version').fetchone()[0]
+            if version > migrations.SCHEMA_VERSION:
+                raise SnapshotError(f'Schema version {version} of {snapshot} is newer than '
+                                    f'{migrations.SCHEMA_VERSION}')
+            if archive is not None and os.path.exists(archive_snapshot):
+                archive_source = unpack_snapshot(archive_snapshot, archive_copy)
+            target = connect(database, timeout=timeout)
+            try:
+                source.backup(target)
+                renew_generation(target)
+                target.commit()
+            finally:
+                target.close()
+            if archive_source is not None:
+                archive_target = sqlite3.connect(archive, timeout=timeout)
+                try:
+                    archive_source.backup(archive_target)
+                finally:
+                    archive_target.close()
+        finally:
+            source.close()
+            if archive_source is not None:
+                archive_source.close()
+        database_bytes = os.path.getsize(copy)
+        archive_bytes = os.path.getsize(archive_copy) if archive_source is not None else 0
+    finally:
+        for file in (copy, archive_copy):
+            if os.path.exists(file):
+                os.remove(file)
+    seconds = time.perf_counter() - start
+    return {
+        'snapshot': snapshot,
+        'database_bytes': database_bytes,
+        'archive_bytes': archive_bytes,
+        'schema_version': version,
+        'seconds': round(seconds, 3),
+        'mb_per_s': round((database_bytes + archive_bytes) / 1e6 / max(seconds, 1e-6), 2),
+    }
+
+
+@click.command('backup')
+@with_appcontext
+@click.option('--directory', default=None, help='Snapshot directory. Defaults to BACKUP_DIRECTORY.')
+@click.option('--pages', default=None, type=int, help='Pages copied per step. Defaults to BACKUP_PAGES_PER_STEP.')
+def backup_command(directory, pages):
+    """
+    Flask command writing a compressed, checksummed snapshot of the live database and printing its report as JSON.
+    """
+    config = current_app.config
+    report = backup(
+        config['DATABASE'],
+        directory or config['BACKUP_DIRECTORY'],
+        config['BACKUP_PAGES_PER_STEP'] if pages is None else pages,
+        config['BACKUP_STEP_PAUSE'],
+        config['BACKUP_KEEP_LAST'],
+        config['BACKUP_KEEP_DAILY'],
+        config['BACKUP_MAX_RESTARTS'],
+        archive_path(config)
+    )
+    click.echo(json.dumps(report))
+
+
+@click.command('restore')
+@with_appcontext
+@click.argument('snapshot', required=False)
+@click.option('--directory', default=None, help='Snapshot directory to take the newest snapshot from. '
+              'Defaults to BACKUP_DIRECTORY.')
+@click.confirmation_option(prompt='Replace the content of the database with the snapshot?')
+def restore_command(snapshot, directory):
+    """
+    Flask command replacing the content of the database with a snapshot, by default the newest one, and printing
+    its report as JSON. Snapshots of an older schema version need `flask migrate-db` afterwards.
+    """
+    database = current_app.config['DATABASE']
+    if snapshot is None:
+        snapshots = list_snapshots(directory or current_app.config['BACKUP_DIRECTORY'], database)
+        if not snapshots:
+            raise click.ClickException('No snapshot found.')
+        snapshot = snapshots[0][1]
+    try:
+        report = restore(snapshot, database, current_app.config['DATABASE_BUSY_TIMEOUT'],
+                         archive_path(current_app.config))
+    except SnapshotError as error:
+        raise click.ClickException(str(error))
+    clear_exercise_caches()
+    click.echo(json.dumps(report))
+
+
+def init_app(app):
+    """
+    Initialize the Flask application with the backup and restore commands.
+
+    Args:
+        app: The Flask application instance.
+    """
+    app.cli.add_command(backup_command)
+    app.cli.add_command(restore_command)
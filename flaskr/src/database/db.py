@@ -1,28 +1,350 @@
+import hashlib
+import json
+import os
 import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+
 import click
 from flask import current_app, g
+from flask.cli import with_appcontext
+from werkzeug.security import generate_password_hash
+
+from GymApp.flaskr.src.database import migrations
+from GymApp.flaskr.src.domain.workout import ExercisePlan, GymLog, WorkoutPlan
+from GymApp.flaskr.src.repository.repository import SQLiteRepository, clear_exercise_caches, get_file_exercise_cache
+from GymApp.flaskr.src.repository.sharded_repository import ShardedRepository
+from GymApp.flaskr.src.repository.transactions import RetryPolicy
+
+
+# Tables of the archive database. They have the layout of the hot tables they are moved out of and keep the IDs of
+# the rows, see SQLiteRepository.archive_workouts.
+ARCHIVE_SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS archive.workouts (id INTEGER PRIMARY KEY, gym_log_id INTEGER NOT NULL, '
+    'date TIMESTAMP NOT NULL, content_hash INTEGER)',
+    'CREATE INDEX IF NOT EXISTS archive.workouts_gym_log_id_date ON workouts (gym_log_id, date)',
+    'CREATE INDEX IF NOT EXISTS archive.workouts_gym_log_id_content_hash ON workouts (gym_log_id, content_hash, date)',
+    'CREATE TABLE IF NOT EXISTS archive.workout_exercises (id INTEGER PRIMARY KEY, workout_id INTEGER NOT NULL, '
+    'exercise_id INTEGER NOT NULL, sets INTEGER NOT NULL, reps INTEGER NOT NULL, weight REAL NOT NULL)',
+    'CREATE INDEX IF NOT EXISTS archive.workout_exercises_workout_id ON workout_exercises (workout_id)',
+    'CREATE TABLE IF NOT EXISTS archive.workout_sets (id INTEGER PRIMARY KEY, workout_id INTEGER NOT NULL, '
+    'exercise_id INTEGER NOT NULL, event_id TEXT NOT NULL, reps INTEGER NOT NULL, weight REAL NOT NULL, '
+    'performed_at TIMESTAMP NOT NULL, UNIQUE (workout_id, event_id))',
+)
+
+
+# Archive files whose schema was checked by this process, by path and inode, so later connections skip the check
+_checked_archives = set()
+_checked_archives_lock = threading.Lock()
+
+
+def attach_archive(connection, archive):
+    """
+    Attach the archive database of old workouts to a connection as the schema `archive`, creating its tables if
+    they do not exist yet. The schema of an archive file is only checked by the first connection of a process. The
+    connection must not be in a transaction.
+
+    Args:
+        connection (sqlite3.Connection): The connection.
+        archive (str): The path of the archive database.
+    """
+    connection.execute('ATTACH DATABASE ? AS archive', (archive,))
+    path = next(row[2] for row in connection.execute('PRAGMA database_list') if row[1] == 'archive')
+    # In-memory archives have no path and are checked every time
+    key = (path, os.stat(path).st_ino) if path else None
+    with _checked_archives_lock:
+        if key in _checked_archives:
+            return
+    if connection.execute("SELECT 1 FROM pragma_table_info('workouts', 'archive') "
+                          "WHERE name = 'content_hash'").fetchone() is None:
+        # Archives created before the content hash have a workouts table without it
+        if connection.execute("SELECT 1 FROM archive.sqlite_schema WHERE name = 'workouts'").fetchone():
+            connection.execute('ALTER TABLE archive.workouts ADD COLUMN content_hash INTEGER')
+        for statement in ARCHIVE_SCHEMA:
+            connection.execute(statement)
+        connection.commit()
+    if key is not None:
+        with _checked_archives_lock:
+            _checked_archives.add(key)
+
+
+def connect(database, timeout=5.0, archive=None):
+    """
+    Open a connection to a SQLite database, configured like the connections of the application.
+
+    Args:
+        database (str): The path of the database.
+        timeout (float): The seconds SQLite waits for a lock held by another connection before it fails with
+            SQLITE_BUSY.
+        archive (Optional[str]): The path of the archive database to attach, see `attach_archive`.
+
+    Returns:
+        sqlite3.Connection: A connection to the SQLite database.
+    """
+    connection = sqlite3.connect(
+        database,
+        timeout=timeout,
+        detect_types=sqlite3.PARSE_DECLTYPES
+    )
+    connection.row_factory = sqlite3.Row
+    if archive is not None:
+        attach_archive(connection, archive)
+    return connection
+
+
+def archive_path(config):
+    """
+    Get the path of the archive database of an application config: ARCHIVE_DATABASE, or a file next to DATABASE
+    if it is not set.
+
+    Args:
+        config (dict): The application config.
+
+    Returns:
+        str: The path of the archive database.
+    """
+    return config['ARCHIVE_DATABASE'] or f'{os.path.splitext(config["DATABASE"])[0]}.archive.sqlite'
+
+
+def used_archive_path(config):
+    """
+    Get the path of the archive database of an application config if the archive is in use: ARCHIVE_DATABASE is
+    set or the default archive file was created by `archive-workouts`.
+
+    Args:
+        config (dict): The application config.
+
+    Returns:
+        Optional[str]: The path of the archive database, or None if workouts were never archived.
+    """
+    path = archive_path(config)
+    return path if config['ARCHIVE_DATABASE'] or os.path.exists(path) else None
 
 
 def get_db():
     """
-    Get a connection to the SQLite database.
+    Get a connection to the SQLite database, with the archive database attached if it is in use, see
+    `used_archive_path`.
 
     Returns:
         sqlite3.Connection: A connection to the SQLite database.
     """
     if 'db' not in g:
-        g.db = sqlite3.connect(
-            current_app.config['DATABASE'],
-            detect_types=sqlite3.PARSE_DECLTYPES
-        )
-        g.db.row_factory = sqlite3.Row
+        g.db = connect(current_app.config['DATABASE'], current_app.config['DATABASE_BUSY_TIMEOUT'],
+                       used_archive_path(current_app.config))
 
     return g.db
 
 
+class TableCache(object):
+    """In-process cache whose entries are derived from a set of tables.
+
+    All entries are evicted by the ChangeTracker the cache is registered with as soon as one of its tables was
+    written, by any process.
+    """
+
+    def __init__(self, tables):
+        """Initialize an empty TableCache.
+
+        Args:
+            tables (Iterable[str]): The tables the entries are derived from.
+        """
+        self.tables = frozenset(tables)
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """Return the cached value of `key`, or `default`."""
+        return self._entries.get(key, default)
+
+    def set(self, key, value):
+        """Cache `value` under `key`."""
+        with self._lock:
+            self._entries[key] = value
+
+    def clear(self):
+        """Evict all entries."""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class ChangeTracker(object):
+    """Keeps the in-process caches of a worker coherent with writes of all processes to the same SQLite file.
+
+    `poll` is cheap enough to run on every request: it reads `PRAGMA data_version` on a connection of its own, which
+    only changes after another connection committed a write. Only then the counters in the `table_changes` table,
+    which triggers increment on every write, are read and compared with the counters seen on the previous poll, and
+    the caches that depend on a changed table are cleared. A new `generation` and counters that went backwards or
+    appeared or disappeared mean the database was recreated or restored, e.g. by `init-db` or `restore` in another
+    process, and clear every cache. The connection is opened on the first poll, so a tracker created before the
+    server forks its workers gets one connection per worker.
+
+    Attributes:
+        counters (dict): The number of polls, of polls that found a write and of cleared caches.
+    """
+
+    def __init__(self, database, timeout=5.0):
+        """Initialize a ChangeTracker.
+
+        Args:
+            database (str): The path of the database.
+            timeout (float): The busy timeout of the connection in seconds.
+        """
+        self.database = database
+        self.timeout = timeout
+        self.counters = {'polls': 0, 'changes': 0, 'evictions': 0}
+        self._caches = {}
+        self._connection = None
+        self._data_version = None
+        self._table_counters = {}
+        self._lock = threading.Lock()
+
+    def cache(self, name, tables):
+        """Return the cache named `name`, registering it on first use.
+
+        Args:
+            name (str): The name of the cache.
+            tables (Iterable[str]): The tables the entries of the cache are derived from.
+
+        Returns:
+            TableCache: The cache.
+        """
+        with self._lock:
+            return self._caches.setdefault(name, TableCache(tables))
+
+    def register(self, name, cache):
+        """Register a cache that is kept outside of the tracker, e.g. the process-wide exercise cache.
+
+        Args:
+            name (str): The name of the cache.
+            cache: The cache. Like a TableCache it has the attribute `tables` and the method `clear`.
+
+        Returns:
+            The cache.
+        """
+        with self._lock:
+            return self._caches.setdefault(name, cache)
+
+    def poll(self):
+        """Evict the caches that depend on a table written since the previous poll.
+
+        Returns:
+            Set[str]: The tables written since the previous poll, all tables known to the tracker on the first poll
+            and after the database was recreated or restored.
+        """
+        with self._lock:
+            self.counters['polls'] += 1
+            try:
+                if self._connection is None:
+                    self._connection = sqlite3.connect(self.database, timeout=self.timeout,
+                                                       check_same_thread=False)
+                data_version = self._connection.execute('PRAGMA data_version').fetchone()[0]
+                if data_version == self._data_version:
+                    return set()
+                table_counters = dict(self._connection.execute(
+                    'SELECT table_name, counter FROM table_changes').fetchall())
+            except sqlite3.OperationalError:
+                # The database is not initialized yet, so nothing may be cached
+                data_version, table_counters = None, {}
+            changed = {table for table in set(table_counters) | set(self._table_counters)
+                       if table_counters.get(table) != self._table_counters.get(table)}
+            recreated = self._table_counters and (
+                set(table_counters) != set(self._table_counters) or
+                table_counters.get('generation') != self._table_counters.get('generation') or
+                any(counter < self._table_counters[table] for table, counter in table_counters.items()))
+            if data_version is None or recreated:
+                changed.update(table for cache in self._caches.values() for table in cache.tables)
+            self._data_version = data_version
+            self._table_counters = table_counters
+            self.counters['changes'] += 1
+            caches = [cache for cache in self._caches.values() if cache.tables & changed]
+            self.counters['evictions'] += len(caches)
+        for cache in caches:
+            cache.clear()
+        return changed
+
+    def stats(self):
+        """Return a copy of the counters."""
+        with self._lock:
+            return dict(self.counters)
+
+
+def renew_generation(connection: sqlite3.Connection):
+    """
+    Mark a database as recreated, so the ChangeTracker of every process clears all of its caches on its next poll.
+    The change is completed by `commit`.
+
+    Args:
+        connection (sqlite3.Connection): A connection to the database.
+    """
+    connection.execute("UPDATE table_changes SET counter = abs(random()) WHERE table_name = 'generation'")
+
+
+def get_change_tracker():
+    """
+    Get the change tracker of the caches of the current application.
+
+    Returns:
+        ChangeTracker: The change tracker.
+    """
+    return current_app.extensions['change_tracker']
+
+
+def get_cache(name, tables):
+    """
+    Get a cache of the current application that is evicted when one of `tables` is written.
+
+    Args:
+        name (str): The name of the cache.
+        tables (Iterable[str]): The tables the entries of the cache are derived from.
+
+    Returns:
+        TableCache: The cache.
+    """
+    return get_change_tracker().cache(name, tables)
+
+
+def poll_changes():
+    """
+    Evict the caches of the current application whose tables were written since the previous request.
+    """
+    get_change_tracker().poll()
+
+
+def get_retry_policy():
+    """
+    Get the retry policy of the transactions of the current application.
+
+    Returns:
+        RetryPolicy: The retry policy.
+    """
+    return current_app.extensions['retry_policy']
+
+
+def get_sharded_repository():
+    """
+    Get a repository over the shard databases configured in SHARD_DATABASES, with the username directory
+    stored in SHARD_DIRECTORY.
+
+    Returns:
+        ShardedRepository: The repository of the shards.
+    """
+    if 'sharded_repository' not in g:
+        g.sharded_repository = ShardedRepository(
+            connect(current_app.config['SHARD_DIRECTORY']),
+            [connect(path) for path in current_app.config['SHARD_DATABASES']]
+        )
+
+    return g.sharded_repository
+
+
 def close_db(e=None):
     """
-    Close the database connection.
+    Close the database connections.
 
     Args:
         e: The exception passed to the teardown function (default: None).
@@ -32,26 +354,352 @@ def close_db(e=None):
     if db is not None:
         db.close()
 
+    sharded_repository = g.pop('sharded_repository', None)
+
+    if sharded_repository is not None:
+        sharded_repository.directory.close()
+        for shard in sharded_repository.shards:
+            shard.connection.close()
+
+
+def seed_database(connection, users, workouts, exercises=5):
+    """
+    Fill a database with synthetic data, e.g. for benchmarks. User `n` is called `user<n>` and has the password
+    `password`, a workout plan of `exercises` exercises and `workouts` daily workouts that follow the plan.
+
+    Args:
+        connection (sqlite3.Connection): A connection to a database with the current schema.
+        users (int): The number of users.
+        workouts (int): The number of workouts per user.
+        exercises (int): The number of exercises of the workout plans.
+    """
+    repo = SQLiteRepository(connection)
+    # Hashing is slow on purpose, so all users share one hash
+    password = generate_password_hash('password')
+    start = datetime(2024, 1, 1)
+    for index in range(users):
+        user_id = connection.execute('INSERT INTO user (username, password) VALUES (?, ?)',
+                                     (f'user{index}', password)).lastrowid
+        gym_log = GymLog(user_id)
+        gym_log.add_workout_plan(WorkoutPlan('Plan', {
+            f'exercise{number}': ExercisePlan(f'Exercise {number}', 3, 8, 20, 2.5) for number in range(exercises)
+        }))
+        repo.save_gym_log(gym_log)
+        workout = None
+        for day in range(workouts):
+            workout = gym_log.workout_plan.create_workout(workout)
+            workout.date = start + timedelta(days=day)
+            repo.save_workout(workout, gym_log, refresh_next_workout=False)
+        repo.refresh_next_workout(gym_log.id)
+        repo.refresh_gym_log_snapshot(gym_log.id)
+    connection.commit()
+
+
+# In-memory template databases by schema script and seed, built once per process
+_templates = {}
+_templates_lock = threading.RLock()
+
+
+def template_database(schema_script, seed_users=0, seed_workouts=0):
+    """
+    Get the template database of a schema script, building it on first use. Templates are keyed on the content of
+    the script, so a new schema version gets a new template.
+
+    Args:
+        schema_script (str): The content of schema.sql.
+        seed_users (int): The number of synthetic users, see `seed_database`.
+        seed_workouts (int): The number of workouts per synthetic user.
+
+    Returns:
+        sqlite3.Connection: A connection to the in-memory template database.
+    """
+    key = (hashlib.sha256(schema_script.encode()).hexdigest(), seed_users, seed_workouts)
+    with _templates_lock:
+        template = _templates.get(key)
+        if template is None:
+            template = sqlite3.connect(':memory:', check_same_thread=False)
+            template.row_factory = sqlite3.Row
+            # Only takes effect before the first table is created. Clones inherit it, so freed pages can be
+            # returned to the file system in small steps by db-maintain.
+            template.execute('PRAGMA auto_vacuum = INCREMENTAL')
+            template.executescript(schema_script)
+            if seed_users:
+                seed_database(template, seed_users, seed_workouts)
+            _templates[key] = template
+        return template
+
+
+def clone_database(destination, schema_script, seed_users=0, seed_workouts=0):
+    """
+    Replace the content of a database, in memory or on disk, with a copy of a template database. Copying the pages
+    of the template with the backup API is much faster than running the schema script and the seeding again.
+
+    Args:
+        destination (sqlite3.Connection): A connection to the database. It must not be in a transaction.
+        schema_script (str): The content of schema.sql.
+        seed_users (int): The number of synthetic users, see `seed_database`.
+        seed_workouts (int): The number of workouts per synthetic user.
+    """
+    with _templates_lock:
+        template_database(schema_script, seed_users, seed_workouts).backup(destination)
+    renew_generation(destination)
+    destination.commit()
+
 
-def init_db():
+def init_db(seed_users=0, seed_workouts=0):
     """
-    Initialize the database by executing the SQL statements in the schema file.
+    Initialize the database as a copy of the template database of the schema file.
+
+    Args:
+        seed_users (int): The number of synthetic users, see `seed_database`.
+        seed_workouts (int): The number of workouts per synthetic user.
     """
     db = get_db()
 
     with current_app.open_resource('src/database/schema.sql') as f:
-        db.executescript(f.read().decode('utf8'))
+        clone_database(db, f.read().decode('utf8'), seed_users, seed_workouts)
+    SQLiteRepository(db).clear_archive()
+    db.commit()
+    clear_exercise_caches()
+
+
+def migrate_db():
+    """
+    Migrate the database to the current schema version, keeping its data.
+
+    Returns:
+        bool: True if the database was migrated, False if it was up to date.
+    """
+    with current_app.open_resource('src/database/schema.sql') as f:
+        return migrations.migrate(get_db(), f.read().decode('utf8'))
 
 
 @click.command('init-db')
-def init_db_command():
+@with_appcontext
+@click.option('--seed-users', default=0, show_default=True, help='Synthetic users to create, e.g. for benchmarks.')
+@click.option('--seed-workouts', default=0, show_default=True, help='Workouts per synthetic user.')
+def init_db_command(seed_users, seed_workouts):
     """
     Flask command to initialize the database by executing the 'init_db' function.
     """
-    init_db()
+    init_db(seed_users, seed_workouts)
     click.echo('Initialized the database.')
 
 
+def purge_orphans(batch_size=500, pause=0.05):
+    """
+    Delete orphaned rows in bounded batches. Every batch is committed on its own and followed by a short
+    pause, so the write lock is only held for a short time and live requests keep being served.
+
+    Args:
+        batch_size (int): The maximum number of rows deleted per table and batch.
+        pause (float): The seconds to wait between two batches.
+
+    Returns:
+        int: The total number of deleted rows.
+    """
+    repo = SQLiteRepository(get_db())
+    total = 0
+    while True:
+        deleted = repo.purge_orphans(batch_size)
+        repo.commit()
+        total += deleted
+        if deleted == 0:
+            return total
+        time.sleep(pause)
+
+
+def init_shards():
+    """
+    Create the schema on new shard databases and migrate existing shards to the current schema version.
+    Shards that already hold data are kept, so shards can be added to SHARD_DATABASES at any time.
+    """
+    with current_app.open_resource('src/database/schema.sql') as f:
+        schema_script = f.read().decode('utf8')
+    repo = get_sharded_repository()
+    for shard in repo.shards:
+        if migrations.schema_version(shard.connection) == 0 and not shard.connection.execute(
+                "SELECT 1 FROM sqlite_schema WHERE type = 'table'").fetchone():
+            shard.connection.execute('PRAGMA auto_vacuum = INCREMENTAL')
+            shard.connection.executescript(schema_script)
+        else:
+            migrations.migrate(shard.connection, schema_script)
+    repo.commit()
+    clear_exercise_caches()
+
+
+def archive_workouts(older_than_days, batch_size=500, pause=0.05):
+    """
+    Move the workouts older than `older_than_days` days into the archive database in bounded batches, like
+    `purge_orphans`.
+
+    Args:
+        older_than_days (float): The age in days after which workouts are archived.
+        batch_size (int): The maximum number of workouts moved per batch.
+        pause (float): The seconds to wait between two batches.
+
+    Returns:
+        int: The total number of archived workouts.
+    """
+    db = get_db()
+    if not SQLiteRepository(db).has_archive():
+        # The first archiving run creates the archive
+        attach_archive(db, archive_path(current_app.config))
+    repo = SQLiteRepository(db)
+    before = datetime.now() - timedelta(days=older_than_days)
+    total = 0
+    while True:
+        archived = repo.archive_workouts(before, batch_size)
+        repo.commit()
+        total += archived
+        if archived < batch_size:
+            return total
+        time.sleep(pause)
+
+
+def dedupe_workouts(window_seconds=0, batch_size=500, pause=0.05):
+    """
+    Collapse duplicate workouts in bounded batches, like `purge_orphans`. Workouts without a content hash are
+    hashed first. If workouts were deleted, the leaderboard aggregates and rollups are rebuilt at the end.
+
+    Args:
+        window_seconds (float): The maximum seconds between the dates of duplicates.
+        batch_size (int): The maximum number of workouts hashed and of groups of equal workouts visited per batch.
+        pause (float): The seconds to wait between two batches.
+
+    Returns:
+        int: The number of deleted workouts.
+    """
+    repo = SQLiteRepository(get_db())
+    while repo.hash_workouts(batch_size):
+        repo.commit()
+        time.sleep(pause)
+    total = 0
+    after = None
+    while True:
+        deleted, after = repo.collapse_duplicate_workouts(timedelta(seconds=window_seconds), batch_size, after)
+        repo.commit()
+        total += deleted
+        if after is None:
+            break
+        time.sleep(pause)
+    if total:
+        repo.rebuild_leaderboards()
+        repo.rebuild_rollups()
+        repo.commit()
+    return total
+
+
+@click.command('migrate-db')
+@with_appcontext
+def migrate_db_command():
+    """
+    Flask command to migrate the database to the current schema version.
+    """
+    if migrate_db():
+        click.echo(f'Migrated the database to schema version {migrations.SCHEMA_VERSION}.')
+    else:
+        click.echo('The database is up to date.')
+
+
+@click.command('purge-orphans')
+@with_appcontext
+@click.option('--batch-size', default=500, show_default=True, help='Maximum rows deleted per table and batch.')
+@click.option('--pause', default=0.05, show_default=True, help='Seconds to wait between batches.')
+def purge_orphans_command(batch_size, pause):
+    """
+    Flask command to delete rows left behind by deleted users.
+    """
+    total = purge_orphans(batch_size, pause)
+    click.echo(f'Purged {total} orphaned rows.')
+
+
+@click.command('archive-workouts')
+@with_appcontext
+@click.option('--older-than-days', default=None, type=float, help='Age in days after which workouts are archived. '
+              'Defaults to ARCHIVE_AFTER_DAYS.')
+@click.option('--batch-size', default=500, show_default=True, help='Maximum workouts moved per batch.')
+@click.option('--pause', default=0.05, show_default=True, help='Seconds to wait between batches.')
+def archive_workouts_command(older_than_days, batch_size, pause):
+    """
+    Flask command to move old workouts out of the hot tables into the archive database.
+    """
+    if older_than_days is None:
+        older_than_days = current_app.config['ARCHIVE_AFTER_DAYS']
+    total = archive_workouts(older_than_days, batch_size, pause)
+    click.echo(f'Archived {total} workouts.')
+
+
+@click.command('dedupe-workouts')
+@with_appcontext
+@click.option('--window-seconds', default=None, type=float, help='Maximum seconds between the dates of duplicates. '
+              'Defaults to WORKOUT_DUPLICATE_WINDOW.')
+@click.option('--batch-size', default=500, show_default=True, help='Maximum groups of equal workouts per batch.')
+@click.option('--pause', default=0.05, show_default=True, help='Seconds to wait between batches.')
+def dedupe_workouts_command(window_seconds, batch_size, pause):
+    """
+    Flask command to collapse duplicate workouts in batches.
+    """
+    if window_seconds is None:
+        window_seconds = current_app.config['WORKOUT_DUPLICATE_WINDOW']
+    deleted = dedupe_workouts(window_seconds, batch_size, pause)
+    click.echo(f'Collapsed {deleted} duplicate workouts.')
+
+
+@click.command('rebuild-leaderboards')
+@with_appcontext
+def rebuild_leaderboards_command():
+    """
+    Flask command to recompute the leaderboard aggregates from all saved workouts.
+    """
+    repo = SQLiteRepository(get_db())
+    repo.rebuild_leaderboards()
+    repo.commit()
+    click.echo('Rebuilt the leaderboards.')
+
+
+@click.command('rebuild-rollups')
+@with_appcontext
+def rebuild_rollups_command():
+    """
+    Flask command to recompute the progress chart rollups from all saved workouts.
+    """
+    repo = SQLiteRepository(get_db())
+    repo.rebuild_rollups()
+    repo.commit()
+    click.echo('Rebuilt the rollups.')
+
+
+@click.command('transaction-stats')
+@with_appcontext
+def transaction_stats_command():
+    """
+    Flask command printing the transaction and SQLITE_BUSY retry counters of this process as JSON.
+    """
+    click.echo(json.dumps(get_retry_policy().stats()))
+
+
+@click.command('init-shards')
+@with_appcontext
+def init_shards_command():
+    """
+    Flask command to create or migrate the configured shard databases.
+    """
+    init_shards()
+    click.echo(f'Initialized {len(current_app.config["SHARD_DATABASES"])} shards.')
+
+
+@click.command('rebalance-shards')
+@with_appcontext
+@click.option('--limit', default=None, type=int, help='Maximum number of users to move.')
+def rebalance_shards_command(limit):
+    """
+    Flask command to move users to the shard they belong on after the number of shards changed.
+    """
+    moved = get_sharded_repository().rebalance(limit)
+    click.echo(f'Moved {moved} users.')
+
+
 def init_app(app):
     """
     Initialize the Flask application with database-related functionality.
@@ -59,5 +707,21 @@ def init_app(app):
     Args:
         app: The Flask application instance.
     """
+    app.extensions['retry_policy'] = RetryPolicy(
+        app.config['DATABASE_RETRY_ATTEMPTS'], app.config['DATABASE_RETRY_BASE_DELAY'],
+        app.config['DATABASE_RETRY_MAX_DELAY']
+    )
+    app.extensions['change_tracker'] = ChangeTracker(app.config['DATABASE'], app.config['DATABASE_BUSY_TIMEOUT'])
+    app.extensions['change_tracker'].register('exercises', get_file_exercise_cache(app.config['DATABASE']))
+    app.before_request(poll_changes)
     app.teardown_appcontext(close_db)
     app.cli.add_command(init_db_command)
+    app.cli.add_command(migrate_db_command)
+    app.cli.add_command(purge_orphans_command)
+    app.cli.add_command(archive_workouts_command)
+    app.cli.add_command(dedupe_workouts_command)
+    app.cli.add_command(rebuild_leaderboards_command)
+    app.cli.add_command(rebuild_rollups_command)
+    app.cli.add_command(transaction_stats_command)
+    app.cli.add_command(init_shards_command)
+    app.cli.add_command(rebalance_shards_command)
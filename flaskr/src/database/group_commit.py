@@ -0,0 +1,235 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+from flask import current_app
+
+from GymApp.flaskr.src.database.db import archive_path, attach_archive, connect, get_db, get_retry_policy
+from GymApp.flaskr.src.repository.repository import SQLiteRepository
+from GymApp.flaskr.src.repository.transactions import DEFAULT_RETRY_POLICY, is_busy
+
+
+class GroupCommitWriter(object):
+    """Writer thread applying the write units of concurrent requests in shared transactions.
+
+    A write unit is a function taking a SQLiteRepository; it must not commit. The writer collects units until
+    `max_batch` units are pending, `max_delay` seconds passed since the first one or every caller currently waiting
+    in `submit` has joined the batch, runs every unit in a savepoint of one transaction and commits once. Units
+    submitted while a transaction is committed form the next batch, so under load the batches grow with the cost
+    of a commit, while a single caller is not delayed at all. A unit that raises is rolled back alone. `submit`
+    returns only after the transaction holding the unit was committed, so with `PRAGMA synchronous=FULL` the data
+    is durable when the caller is acknowledged, while the fsync is shared by the whole batch.
+
+    Attributes:
+        batches (int): The number of committed transactions.
+        operations (int): The number of applied write units.
+    """
+
+    def __init__(self, database, max_batch=64, max_delay=0.005, retry_policy=None, timeout=5.0, archive=None):
+        """Initialize a GroupCommitWriter. The writer thread is started by the first `submit`.
+
+        Args:
+            database (str): The path of the application database.
+            max_batch (int): The maximum number of write units per transaction.
+            max_delay (float): The maximum seconds a write unit waits for other units to join its transaction.
+            retry_policy (Optional[RetryPolicy]): The retry policy of batches that hit a busy database. Defaults to
+                DEFAULT_RETRY_POLICY.
+            timeout (float): The busy timeout of the connection of the writer thread in seconds.
+            archive (Optional[str]): The path of the archive database, attached to the connection once it exists.
+        """
+        self.database = database
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.retry_policy = retry_policy or DEFAULT_RETRY_POLICY
+        self.timeout = timeout
+        self.archive = archive
+        self.batches = 0
+        self.operations = 0
+        self._queue = queue.Queue()
+        self._waiting = 0
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, unit):
+        """Apply a write unit in the next transaction and wait until it is committed.
+
+        Args:
+            unit (Callable[[SQLiteRepository], Any]): The write unit.
+
+        Returns:
+            Any: The return value of the unit.
+
+        Raises:
+            Exception: The exception raised by the unit, or by the commit of its transaction.
+        """
+        self._start()
+        future = Future()
+        with self._lock:
+            self._waiting += 1
+        try:
+            self._queue.put((unit, future))
+            return future.result()
+        finally:
+            with self._lock:
+                self._waiting -= 1
+
+    def close(self):
+        """Apply the pending write units and stop the writer thread."""
+        with self._lock:
+            if self._thread is None:
+                return
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def _start(self):
+        """Start the writer thread if it is not running."""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='group-commit-writer', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        """Take batches of write units from the queue and apply them until `close` is called."""
+        connection = connect(self.database, self.timeout)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=FULL')
+        try:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    return
+                batch = [item]
+                deadline = time.monotonic() + self.max_delay
+                stop = False
+                while len(batch) < min(self.max_batch, self._waiting):
+                    try:
+                        item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                    except queue.Empty:
+                        break
+                    if item is None:
+                        stop = True
+                        break
+                    batch.append(item)
+                if self.archive is not None and os.path.exists(self.archive) and \
+                        not SQLiteRepository(connection).has_archive():
+                    attach_archive(connection, self.archive)
+                self._apply(connection, batch)
+                if stop:
+                    return
+        finally:
+            connection.close()
+
+    def _apply(self, connection: sqlite3.Connection, batch):
+        """Apply a batch of write units in one transaction and resolve their futures after the commit. A batch that
+        fails because the database is busy is rolled back and applied again as the retry policy allows.
+
+        Args:
+            connection (sqlite3.Connection): The connection of the writer thread.
+            batch (List[Tuple[Callable, Future]]): The write units and their futures.
+        """
+        retries = 0
+        while True:
+            try:
+                outcomes = self._run_batch(connection, batch)
+            except Exception as error:
+                if connection.in_transaction:
+                    connection.rollback()
+                busy = is_busy(error)
+                if busy and retries < self.retry_policy.attempts:
+                    time.sleep(self.retry_policy.delay(retries))
+                    retries += 1
+                    continue
+                self.retry_policy.record(retries, busy)
+                for _, future in batch:
+                    future.set_exception(error)
+                return
+            break
+        self.retry_policy.record(retries, False)
+        self.batches += 1
+        self.operations += len(batch)
+        for future, result, error in outcomes:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    def _run_batch(self, connection: sqlite3.Connection, batch):
+        """Run a batch of write units in one transaction and commit it.
+
+        Args:
+            connection (sqlite3.Connection): The connection of the writer thread.
+            batch (List[Tuple[Callable, Future]]): The write units and their futures.
+
+        Returns:
+            List[Tuple[Future, Any, Optional[Exception]]]: The future, the result and the error of every unit.
+        """
+        outcomes = []
+        connection.execute('BEGIN IMMEDIATE')
+        for unit, future in batch:
+            connection.execute('SAVEPOINT unit')
+            try:
+                # Exercises added by a unit are not put into the shared cache, as the repository is not
+                # committed; they are cached when they are first read back.
+                result = unit(SQLiteRepository(connection))
+            except Exception as error:
+                connection.execute('ROLLBACK TO unit')
+                connection.execute('RELEASE unit')
+                outcomes.append((future, None, error))
+            else:
+                connection.execute('RELEASE unit')
+                outcomes.append((future, result, None))
+        connection.commit()
+        return outcomes
+
+
+def run_write(unit):
+    """
+    Apply a write unit to the application database and commit it. With GROUP_COMMIT_ENABLED the unit is handed to
+    the group commit writer and shares its transaction with the units of concurrent requests, otherwise it runs on
+    the connection of the request in a BEGIN IMMEDIATE transaction. Either way the transaction is retried while
+    the database is busy.
+
+    Args:
+        unit (Callable[[SQLiteRepository], Any]): The write unit, taking a repository; it must not commit.
+
+    Returns:
+        Any: The return value of the unit.
+    """
+    writer = current_app.extensions.get('group_commit')
+    if writer is not None:
+        return writer.submit(unit)
+    return SQLiteRepository(get_db()).run_transaction(unit, retry_policy=get_retry_policy())
+
+
+def run_read(unit):
+    """
+    Run a read unit on the application database in one deferred read transaction, so all its statements see the
+    same state of the database. The transaction is retried while the database is busy.
+
+    Args:
+        unit (Callable[[SQLiteRepository], Any]): The read unit, taking a repository.
+
+    Returns:
+        Any: The return value of the unit.
+    """
+    return SQLiteRepository(get_db()).run_transaction(unit, write=False, retry_policy=get_retry_policy())
+
+
+def init_app(app):
+    """
+    Initialize the Flask application with the group commit writer, if GROUP_COMMIT_ENABLED is set.
+
+    Args:
+        app: The Flask application instance.
+    """
+    if app.config.get('GROUP_COMMIT_ENABLED'):
+        app.extensions['group_commit'] = GroupCommitWriter(
+            app.config['DATABASE'], app.config['GROUP_COMMIT_MAX_BATCH'], app.config['GROUP_COMMIT_MAX_DELAY'],
+            app.extensions['retry_policy'], app.config['DATABASE_BUSY_TIMEOUT'], archive_path(app.config)
+        )
+    else:
+        app.extensions['group_commit'] = None
@@ -0,0 +1,284 @@
+import json
+import os
+import sqlite3
+import time
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from GymApp.flaskr.src.database.db import connect
+from GymApp.flaskr.src.repository.transactions import is_busy
+
+AUTO_VACUUM_MODES = {0: 'none', 1: 'full', 2: 'incremental'}
+
+# Upper bound of the rows ANALYZE samples per index, so `PRAGMA optimize` stays fast on large tables
+ANALYSIS_LIMIT = 400
+
+
+def database_stats(connection: sqlite3.Connection, database=None):
+    """
+    Collect size and health statistics of the main database of a connection.
+
+    Table and index sizes are read from the `dbstat` virtual table. Fragmentation is the share of the file that
+    holds no data: free pages plus the unused bytes inside the pages of tables and indexes. SQLite builds without
+    `dbstat` report `dbstat` as False and no sizes or fragmentation.
+
+    Args:
+        connection (sqlite3.Connection): The connection.
+        database (Optional[str]): The path of the database, to measure its WAL file.
+
+    Returns:
+        dict: The statistics, JSON serializable.
+    """
+    page_size = connection.execute('PRAGMA page_size').fetchone()[0]
+    page_count = connection.execute('PRAGMA page_count').fetchone()[0]
+    freelist_pages = connection.execute('PRAGMA freelist_count').fetchone()[0]
+    objects = {'table': {}, 'index': {}}
+    unused = 0
+    try:
+        rows = connection.execute(
+            "SELECT dbstat.name, COALESCE(schema.type, 'table') AS type, COUNT(*) AS pages, "
+            'SUM(dbstat.pgsize) AS bytes, SUM(dbstat.unused) AS unused FROM dbstat '
+            'LEFT JOIN sqlite_schema AS schema ON schema.name = dbstat.name '
+            'GROUP BY dbstat.name ORDER BY bytes DESC').fetchall()
+    except sqlite3.OperationalError as error:
+        if 'no such table' not in str(error):
+            raise
+        rows = None
+    for row in rows or []:
+        objects['index' if row['type'] == 'index' else 'table'][row['name']] = {
+            'pages': row['pages'], 'bytes': row['bytes'], 'unused_bytes': row['unused']
+        }
+        unused += row['unused']
+    if rows is None:
+        fragmentation = None
+    else:
+        fragmentation = round((freelist_pages * page_size + unused) / (page_size * page_count), 4) if page_count else 0.0
+    wal = f'{database}-wal' if database else None
+    return {
+        'page_size': page_size,
+        'page_count': page_count,
+        'file_bytes': page_size * page_count,
+        'freelist_pages': freelist_pages,
+        'dbstat': rows is not None,
+        'fragmentation': fragmentation,
+        'auto_vacuum': AUTO_VACUUM_MODES[connection.execute('PRAGMA auto_vacuum').fetchone()[0]],
+        'journal_mode': connection.execute('PRAGMA journal_mode').fetchone()[0],
+        'wal_bytes': os.path.getsize(wal) if wal and os.path.exists(wal) else 0,
+        'tables': objects['table'] if rows is not None else None,
+        'indexes': objects['index'] if rows is not None else None,
+    }
+
+
+def incremental_vacuum(connection: sqlite3.Connection, step_ms, deadline, pause=0.01):
+    """
+    Return the free pages of a database in `auto_vacuum=INCREMENTAL` mode to the file system in short write
+    transactions. The number of pages per transaction is adapted so a step holds the write lock for about half of
+    `step_ms`. Steps that find the database busy are skipped.
+
+    Args:
+        connection (sqlite3.Connection): The connection. Its busy timeout should not exceed `step_ms`.
+        step_ms (float): The maximum milliseconds a step may block other writers.
+        deadline (float): The `time.monotonic` time after which no step is started.
+        pause (float): The seconds to wait between two steps, so waiting writers get the lock.
+
+    Returns:
+        dict: The number of vacuumed pages and of steps and the longest step in milliseconds.
+    """
+    report = {'pages': 0, 'steps': 0, 'max_step_ms': 0.0}
+    pages = 16
+    while time.monotonic() < deadline:
+        free = connection.execute('PRAGMA freelist_count').fetchone()[0]
+        if free == 0:
+            break
+        start = time.perf_counter()
+        try:
+            # The pragma frees one page per step of the statement, and only executescript steps it to completion
+            connection.executescript(f'BEGIN IMMEDIATE; PRAGMA incremental_vacuum({min(pages, free)}); COMMIT;')
+        except sqlite3.OperationalError as error:
+            if connection.in_transaction:
+                connection.rollback()
+            if not is_busy(error):
+                raise
+            time.sleep(pause)
+            continue
+        elapsed = (time.perf_counter() - start) * 1000
+        report['pages'] += min(pages, free)
+        report['steps'] += 1
+        report['max_step_ms'] = round(max(report['max_step_ms'], elapsed), 3)
+        pages = max(1, min(pages * 2, int(pages * step_ms / 2 / max(elapsed, 0.001))))
+        time.sleep(pause)
+    return report
+
+
+def analyze_tables(connection: sqlite3.Connection, step_ms, deadline):
+    """
+    Refresh the query planner statistics with one ANALYZE per table, each in its own write transaction. A step that
+    runs longer than `step_ms` is interrupted and rolled back, so large tables are skipped rather than blocking
+    other writers. Steps that find the database busy and tables left when the deadline passes are skipped too.
+
+    Args:
+        connection (sqlite3.Connection): The connection. Its busy timeout should not exceed `step_ms`.
+        step_ms (float): The maximum milliseconds a step may block other writers.
+        deadline (float): The `time.monotonic` time after which no step is started.
+
+    Returns:
+        dict: The number of analyzed tables, the skipped tables and the longest step in milliseconds.
+    """
+    report = {'tables': 0, 'skipped': [], 'max_step_ms': 0.0}
+    tables = [row[0] for row in connection.execute(
+        "SELECT name FROM sqlite_schema WHERE type = 'table' AND name NOT LIKE 'sqlite_%' "
+        "AND sql NOT LIKE 'CREATE VIRTUAL%' ORDER BY name")]
+    for table in tables:
+        if time.monotonic() >= deadline:
+            report['skipped'].append(table)
+            continue
+        start = time.perf_counter()
+        step_deadline = start + step_ms / 1000
+
+        def interrupt():
+            return time.perf_counter() > step_deadline
+
+        connection.set_progress_handler(interrupt, 1000)
+        try:
+            connection.execute(f'ANALYZE "{table}"')
+        except sqlite3.OperationalError as error:
+            if not is_busy(error) and 'interrupted' not in str(error):
+                raise
+            report['skipped'].append(table)
+            continue
+        finally:
+            connection.set_progress_handler(None, 0)
+        report['tables'] += 1
+        report['max_step_ms'] = round(max(report['max_step_ms'], (time.perf_counter() - start) * 1000), 3)
+    return report
+
+
+def checkpoint(connection: sqlite3.Connection):
+    """
+    Checkpoint the WAL of a database in WAL mode and truncate the WAL file if no reader needs it. The truncation
+    waits for readers at most for the busy timeout of the connection.
+
+    Args:
+        connection (sqlite3.Connection): The connection.
+
+    Returns:
+        Optional[dict]: Whether the checkpoint was blocked, the frames in the WAL and the checkpointed frames, or
+        None if the database is not in WAL mode.
+    """
+    if connection.execute('PRAGMA journal_mode').fetchone()[0] != 'wal':
+        return None
+    busy, log, checkpointed = connection.execute('PRAGMA wal_checkpoint(PASSIVE)').fetchone()
+    if not busy and log == checkpointed:
+        busy, log, checkpointed = connection.execute('PRAGMA wal_checkpoint(TRUNCATE)').fetchone()
+    return {'busy': bool(busy), 'log_frames': log, 'checkpointed_frames': checkpointed}
+
+
+def convert_to_incremental(connection: sqlite3.Connection, timeout=5.0):
+    """
+    Switch a database to `auto_vacuum=INCREMENTAL`, which only takes effect when the whole file is rebuilt with
+    VACUUM. The rebuild holds the write lock for as long as it takes to copy the database, so it is run once,
+    explicitly, e.g. in a maintenance window.
+
+    Args:
+        connection (sqlite3.Connection): The connection. It must not be in a transaction.
+        timeout (float): The seconds to wait for the locks of other connections.
+
+    Returns:
+        dict: The freed pages and the milliseconds the rebuild took.
+    """
+    start = time.perf_counter()
+    free = connection.execute('PRAGMA freelist_count').fetchone()[0]
+    connection.execute(f'PRAGMA busy_timeout = {int(timeout * 1000)}')
+    connection.execute('PRAGMA auto_vacuum = INCREMENTAL')
+    connection.execute('VACUUM')
+    return {'pages': free, 'duration_ms': round((time.perf_counter() - start) * 1000, 3)}
+
+
+def maintain(database, step_ms=50, max_seconds=30.0, analyze=False, stats=True, convert=False):
+    """
+    Run the maintenance of a database: refresh the query planner statistics, vacuum free pages incrementally and
+    checkpoint the WAL. Every operation that takes the write lock is kept short, and waits for locks of other
+    connections at most `step_ms`, so live requests are never blocked for much longer than that. No ANALYZE or
+    vacuum step is started after `max_seconds`.
+
+    Free pages can only be vacuumed incrementally in `auto_vacuum=INCREMENTAL` mode, which new databases are created
+    in. Older databases are reported with `conversion_needed` until they are converted once with `convert`, which
+    blocks the database for a full VACUUM, see `convert_to_incremental`.
+
+    Args:
+        database (str): The path of the database.
+        step_ms (float): The maximum milliseconds a maintenance step may block live traffic.
+        max_seconds (float): The time budget of the ANALYZE and the vacuum.
+        analyze (bool): Run ANALYZE table by table, see `analyze_tables`, instead of `PRAGMA optimize`.
+        stats (bool): Add the statistics of `database_stats` to the report.
+        convert (bool): Convert a database that is not in `auto_vacuum=INCREMENTAL` mode.
+
+    Returns:
+        dict: The report, JSON serializable.
+    """
+    start = time.monotonic()
+    connection = connect(database, timeout=step_ms / 1000)
+    try:
+        connection.execute(f'PRAGMA analysis_limit = {ANALYSIS_LIMIT}')
+        optimize_start = time.perf_counter()
+        if analyze:
+            report = {'analyze': analyze_tables(connection, step_ms, start + max_seconds)}
+        else:
+            connection.execute('PRAGMA optimize')
+            connection.commit()
+            report = {'analyze': None}
+        report['optimize_ms'] = round((time.perf_counter() - optimize_start) * 1000, 3)
+        auto_vacuum = connection.execute('PRAGMA auto_vacuum').fetchone()[0]
+        report['conversion'] = None
+        if auto_vacuum != 2 and convert:
+            report['conversion'] = convert_to_incremental(connection)
+            auto_vacuum = connection.execute('PRAGMA auto_vacuum').fetchone()[0]
+        if auto_vacuum == 2:
+            report['vacuum'] = incremental_vacuum(connection, step_ms, start + max_seconds)
+        else:
+            report['vacuum'] = {
+                'conversion_needed': True, 'auto_vacuum': AUTO_VACUUM_MODES[auto_vacuum],
+                'freelist_pages': connection.execute('PRAGMA freelist_count').fetchone()[0],
+            }
+        report['checkpoint'] = checkpoint(connection)
+        if stats:
+            report['stats'] = database_stats(connection, database)
+        report['duration_ms'] = round((time.monotonic() - start) * 1000, 3)
+        return report
+    finally:
+        connection.close()
+
+
+@click.command('db-maintain')
+@with_appcontext
+@click.option('--step-ms', default=None, type=float, help='Maximum milliseconds a step may block live traffic. '
+              'Defaults to MAINTENANCE_STEP_MS.')
+@click.option('--max-seconds', default=None, type=float, help='Time budget of the vacuum. '
+              'Defaults to MAINTENANCE_MAX_SECONDS.')
+@click.option('--analyze', is_flag=True, help='Run ANALYZE table by table instead of PRAGMA optimize.')
+@click.option('--convert', is_flag=True, help='Convert the database to auto_vacuum=INCREMENTAL once. The VACUUM '
+              'this takes blocks the database until it is done.')
+def db_maintain_command(step_ms, max_seconds, analyze, convert):
+    """
+    Flask command running the database maintenance and printing its report and the database statistics as JSON.
+    """
+    report = maintain(
+        current_app.config['DATABASE'],
+        current_app.config['MAINTENANCE_STEP_MS'] if step_ms is None else step_ms,
+        current_app.config['MAINTENANCE_MAX_SECONDS'] if max_seconds is None else max_seconds,
+        analyze,
+        convert=convert
+    )
+    click.echo(json.dumps(report))
+
+
+def init_app(app):
+    """
+    Initialize the Flask application with the database maintenance command.
+
+    Args:
+        app: The Flask application instance.
+    """
+    app.cli.add_command(db_maintain_command)
@@ -0,0 +1,189 @@
+import re
+import sqlite3
+
+from GymApp.flaskr.src.repository.repository import SQLiteRepository, clear_exercise_caches
+
+# The version of schema.sql, stored in PRAGMA user_version of every database
+SCHEMA_VERSION = 8
+
+# Tables that are derived from other tables. They are not copied by a migration but rebuilt from the copied data.
+DERIVED_TABLES = ('search_documents', 'user_exercise_weekly_stats', 'user_weekly_stats', 'user_exercise_stats',
+                  'workout_rollups', 'next_workouts', 'gym_log_snapshots', 'table_changes')
+
+# Before version 1 the exercise overrides only stored the exercise key. The exercise is looked up in the template of
+# the overridden workout plan.
+LEGACY_OVERRIDE_EXERCISE_ID = (
+    '(SELECT template.exercise_id FROM workout_plans '
+    'JOIN plan_template_exercises AS template ON template.template_id = workout_plans.template_id '
+    'JOIN exercises ON exercises.id = template.exercise_id '
+    'WHERE workout_plans.id = legacy.workout_plan_id AND exercises.exercise_key = legacy.exercise_key)'
+)
+
+
+def schema_version(connection: sqlite3.Connection):
+    """
+    Get the schema version of a database.
+
+    Args:
+        connection (sqlite3.Connection): A connection to the database.
+
+    Returns:
+        int: The schema version, 0 for databases created before versions were recorded.
+    """
+    return connection.execute('PRAGMA user_version').fetchone()[0]
+
+
+def split_script(script):
+    """
+    Split an SQL script into its statements, keeping trigger bodies together.
+
+    Args:
+        script (str): The SQL script.
+
+    Returns:
+        List[str]: The statements of the script.
+    """
+    statements = []
+    statement = ''
+    for line in script.splitlines(keepends=True):
+        if not statement and line.lstrip().startswith('--'):
+            continue
+        statement += line
+        if sqlite3.complete_statement(statement):
+            statements.append(statement.strip())
+            statement = ''
+    return statements
+
+
+def columns(connection: sqlite3.Connection, table):
+    """
+    Get the stored columns of a table, leaving out generated columns.
+
+    Args:
+        connection (sqlite3.Connection): A connection to the database.
+        table (str): The name of the table.
+
+    Returns:
+        List[str]: The column names.
+    """
+    return [row[1] for row in connection.execute(f'PRAGMA table_xinfo({table})').fetchall() if row[6] == 0]
+
+
+def migrate(connection: sqlite3.Connection, schema_script):
+    """
+    Migrate a database created with an older schema to SCHEMA_VERSION in one transaction.
+
+    All tables of the old schema are renamed, the current schema is created and the data is copied over column by
+    column. Columns that were normalized are converted on the way, e.g. the exercise key and name of exercise plans
+    and workouts are replaced by a reference to the exercise dictionary. Derived tables are rebuilt and missing
+    content hashes of workouts are computed.
+
+    Args:
+        connection (sqlite3.Connection): A connection to the database.
+        schema_script (str): The content of schema.sql.
+
+    Returns:
+        bool: True if the database was migrated, False if it already had the current schema.
+    """
+    if schema_version(connection) >= SCHEMA_VERSION:
+        return False
+
+    if connection.in_transaction:
+        connection.commit()
+    connection.execute('BEGIN IMMEDIATE')
+    try:
+        old_tables = rename_legacy_tables(connection)
+
+        for statement in split_script(schema_script):
+            # The tables of main were renamed, so an unqualified DROP would find the tables of an attached archive
+            connection.execute(re.sub(r'^DROP TABLE IF EXISTS (\w+)', r'DROP TABLE IF EXISTS main.\1', statement))
+
+        new_tables = [row[0] for row in connection.execute(
+            "SELECT name FROM sqlite_schema WHERE type = 'table' AND name NOT LIKE 'sqlite_%' "
+            "AND sql NOT LIKE 'CREATE VIRTUAL TABLE%' AND name NOT LIKE 'search_index_%' ORDER BY rowid"
+        ).fetchall()]
+        for table in new_tables:
+            if table in DERIVED_TABLES or table not in old_tables:
+                continue
+            copy_table(connection, table)
+
+        for table in old_tables:
+            connection.execute(f'DROP TABLE legacy_{table}')
+        rebuild_derived_tables(connection)
+        connection.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    clear_exercise_caches()
+    return True
+
+
+def rename_legacy_tables(connection: sqlite3.Connection):
+    """
+    Drop all indexes and triggers and rename every table of the old schema to `legacy_<table>`.
+
+    Args:
+        connection (sqlite3.Connection): A connection to the database inside the migration transaction.
+
+    Returns:
+        list[str]: The names of the renamed tables without the legacy prefix.
+    """
+    old_tables = [row[0] for row in connection.execute(
+        "SELECT name FROM sqlite_schema WHERE type = 'table' AND name NOT LIKE 'sqlite_%' "
+        "AND sql NOT LIKE 'CREATE VIRTUAL TABLE%' AND name NOT LIKE 'search_index_%'"
+    ).fetchall()]
+    for kind, name in connection.execute(
+        "SELECT type, name FROM sqlite_schema WHERE type IN ('index', 'trigger') AND sql IS NOT NULL"
+    ).fetchall():
+        connection.execute(f'DROP {kind.upper()} {name}')
+    for table in old_tables:
+        connection.execute(f'ALTER TABLE {table} RENAME TO legacy_{table}')
+    return old_tables
+
+
+def rebuild_derived_tables(connection: sqlite3.Connection):
+    """
+    Compute missing content hashes of workouts and rebuild the leaderboards, rollups and gym log snapshots.
+
+    Args:
+        connection (sqlite3.Connection): A connection to the database inside the migration transaction.
+    """
+    repo = SQLiteRepository(connection)
+    while repo.hash_workouts(1000):
+        pass
+    repo.rebuild_leaderboards()
+    repo.rebuild_rollups()
+    repo.rebuild_gym_log_snapshots()
+
+
+def copy_table(connection: sqlite3.Connection, table):
+    """
+    Copy the rows of `legacy_<table>` into `table`, converting exercise keys and names into exercise IDs.
+
+    Args:
+        connection (sqlite3.Connection): A connection to the database.
+        table (str): The name of the table in the current schema.
+    """
+    legacy_columns = columns(connection, f'legacy_{table}')
+    target_columns = []
+    expressions = []
+    for column in columns(connection, table):
+        if column in legacy_columns:
+            target_columns.append(column)
+            expressions.append(f'legacy.{column}')
+        elif column == 'exercise_id' and {'exercise_key', 'name'} <= set(legacy_columns):
+            connection.execute(
+                f'INSERT OR IGNORE INTO exercises (exercise_key, name) '
+                f'SELECT DISTINCT exercise_key, name FROM legacy_{table}'
+            )
+            target_columns.append(column)
+            expressions.append('(SELECT id FROM exercises WHERE exercise_key = legacy.exercise_key '
+                               'AND name = legacy.name)')
+        elif column == 'exercise_id' and 'exercise_key' in legacy_columns:
+            target_columns.append(column)
+            expressions.append(LEGACY_OVERRIDE_EXERCISE_ID)
+    connection.execute(
+        f'INSERT INTO {table} ({", ".join(target_columns)}) '
+        f'SELECT {", ".join(expressions)} FROM legacy_{table} AS legacy'
+    )
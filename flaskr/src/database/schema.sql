@@ -1,7 +1,28 @@
+-- Bump SCHEMA_VERSION in migrations.py together with this version
+PRAGMA user_version = 8;
+
 DROP TABLE IF EXISTS user;
 DROP TABLE IF EXISTS gym_logs;
 DROP TABLE IF EXISTS workout_plans;
+DROP TABLE IF EXISTS exercises;
 DROP TABLE IF EXISTS exercise_plans;
+DROP TABLE IF EXISTS workouts;
+DROP TABLE IF EXISTS workout_exercises;
+DROP TABLE IF EXISTS workout_sets;
+DROP TABLE IF EXISTS user_exercise_weekly_stats;
+DROP TABLE IF EXISTS user_weekly_stats;
+DROP TABLE IF EXISTS user_exercise_stats;
+DROP TABLE IF EXISTS plan_templates;
+DROP TABLE IF EXISTS plan_template_exercises;
+DROP TABLE IF EXISTS exercise_plan_overrides;
+DROP TABLE IF EXISTS search_vocabulary;
+DROP TABLE IF EXISTS search_index;
+DROP TABLE IF EXISTS search_documents;
+DROP TABLE IF EXISTS jobs;
+DROP TABLE IF EXISTS workout_rollups;
+DROP TABLE IF EXISTS next_workouts;
+DROP TABLE IF EXISTS gym_log_snapshots;
+DROP TABLE IF EXISTS table_changes;
 
 CREATE TABLE user (
   id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -9,28 +30,513 @@ CREATE TABLE user (
   password TEXT NOT NULL
 );
 
+-- version is incremented by the triggers at the end of this file whenever the plan or the workouts of the gym log
+-- change, which marks its snapshot as stale
 CREATE TABLE gym_logs (
   id INTEGER PRIMARY KEY AUTOINCREMENT,
   user_id INTEGER NOT NULL,
+  version INTEGER NOT NULL DEFAULT 0,
   FOREIGN KEY (user_id) REFERENCES user (id)
 );
 
+CREATE INDEX gym_logs_user_id ON gym_logs (user_id);
+
 CREATE TABLE workout_plans (
   id INTEGER PRIMARY KEY AUTOINCREMENT,
   name TEXT NOT NULL,
   gym_log_id INTEGER NOT NULL,
-  FOREIGN KEY (gym_log_id) REFERENCES gym_logs (id)
+  template_id INTEGER,
+  FOREIGN KEY (gym_log_id) REFERENCES gym_logs (id),
+  FOREIGN KEY (template_id) REFERENCES plan_templates (id)
+);
+
+CREATE INDEX workout_plans_gym_log_id ON workout_plans (gym_log_id);
+
+-- Dictionary of exercises. Every distinct pair of exercise key and name is stored once and referenced by its id.
+CREATE TABLE exercises (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  exercise_key TEXT NOT NULL,
+  name TEXT NOT NULL,
+  UNIQUE (exercise_key, name)
 );
 
 CREATE TABLE exercise_plans (
   id INTEGER PRIMARY KEY AUTOINCREMENT,
   workout_plan_id INTEGER NOT NULL,
-  exercise_key TEXT Not NULL,
-  name TEXT NOT NULL,
+  exercise_id INTEGER NOT NULL,
   sets INTEGER Not NULL,
   reps INTEGER Not NULL,
   initial_weight INTEGER Not NULL,
   progression INTEGER NOT NULL,
 
-  FOREIGN KEY (workout_plan_id) REFERENCES workout_plans (id)
+  FOREIGN KEY (workout_plan_id) REFERENCES workout_plans (id),
+  FOREIGN KEY (exercise_id) REFERENCES exercises (id)
+);
+
+CREATE INDEX exercise_plans_workout_plan_id ON exercise_plans (workout_plan_id);
+
+-- content_hash is Workout.content_hash of the exercises of the workout, so duplicate workouts of a gym log are found
+-- with one index lookup
+CREATE TABLE workouts (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  gym_log_id INTEGER NOT NULL,
+  date TIMESTAMP NOT NULL,
+  content_hash INTEGER,
+  FOREIGN KEY (gym_log_id) REFERENCES gym_logs (id)
+);
+
+CREATE INDEX workouts_gym_log_id_date ON workouts (gym_log_id, date);
+CREATE INDEX workouts_gym_log_id_content_hash ON workouts (gym_log_id, content_hash, date);
+
+CREATE TABLE workout_exercises (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  workout_id INTEGER NOT NULL,
+  exercise_id INTEGER NOT NULL,
+  sets INTEGER NOT NULL,
+  reps INTEGER NOT NULL,
+  weight REAL NOT NULL,
+  FOREIGN KEY (workout_id) REFERENCES workouts (id),
+  FOREIGN KEY (exercise_id) REFERENCES exercises (id)
+);
+
+CREATE INDEX workout_exercises_workout_id ON workout_exercises (workout_id);
+
+-- Sets recorded live during a workout. event_id is generated by the client, so a batch of sets that is sent again
+-- after a lost response is stored once.
+CREATE TABLE workout_sets (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  workout_id INTEGER NOT NULL,
+  exercise_id INTEGER NOT NULL,
+  event_id TEXT NOT NULL,
+  reps INTEGER NOT NULL,
+  weight REAL NOT NULL,
+  performed_at TIMESTAMP NOT NULL,
+  UNIQUE (workout_id, event_id),
+  FOREIGN KEY (workout_id) REFERENCES workouts (id),
+  FOREIGN KEY (exercise_id) REFERENCES exercises (id)
+);
+
+-- Leaderboard aggregates, maintained incrementally by SQLiteRepository.save_workout
+CREATE TABLE user_exercise_weekly_stats (
+  user_id INTEGER NOT NULL,
+  exercise_name TEXT NOT NULL,
+  week TEXT NOT NULL,
+  volume REAL NOT NULL,
+  max_weight REAL NOT NULL,
+  session_count INTEGER NOT NULL,
+  PRIMARY KEY (user_id, exercise_name, week)
+);
+
+CREATE INDEX user_exercise_weekly_stats_volume ON user_exercise_weekly_stats (exercise_name, week, volume DESC);
+
+CREATE TABLE user_weekly_stats (
+  user_id INTEGER NOT NULL,
+  week TEXT NOT NULL,
+  volume REAL NOT NULL,
+  session_count INTEGER NOT NULL,
+  PRIMARY KEY (user_id, week)
+);
+
+CREATE INDEX user_weekly_stats_volume ON user_weekly_stats (week, volume DESC);
+
+CREATE TABLE user_exercise_stats (
+  user_id INTEGER NOT NULL,
+  exercise_name TEXT NOT NULL,
+  first_date TIMESTAMP NOT NULL,
+  first_weight REAL NOT NULL,
+  max_weight REAL NOT NULL,
+  progression REAL GENERATED ALWAYS AS (max_weight - first_weight) VIRTUAL,
+  session_count INTEGER NOT NULL,
+  PRIMARY KEY (user_id, exercise_name)
+);
+
+CREATE INDEX user_exercise_stats_progression ON user_exercise_stats (exercise_name, progression DESC);
+
+-- Catalog of immutable, shared workout plans. Users adopting a template reference it from workout_plans.template_id
+-- and only store the fields they changed in exercise_plan_overrides (NULL means the template value).
+CREATE TABLE plan_templates (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  content_hash TEXT UNIQUE NOT NULL,
+  name TEXT NOT NULL
+);
+
+CREATE TABLE plan_template_exercises (
+  template_id INTEGER NOT NULL,
+  exercise_id INTEGER NOT NULL,
+  sets INTEGER NOT NULL,
+  reps INTEGER NOT NULL,
+  initial_weight INTEGER NOT NULL,
+  progression INTEGER NOT NULL,
+  PRIMARY KEY (template_id, exercise_id),
+  FOREIGN KEY (template_id) REFERENCES plan_templates (id),
+  FOREIGN KEY (exercise_id) REFERENCES exercises (id)
+);
+
+CREATE TABLE exercise_plan_overrides (
+  workout_plan_id INTEGER NOT NULL,
+  exercise_id INTEGER NOT NULL,
+  sets INTEGER,
+  reps INTEGER,
+  initial_weight INTEGER,
+  progression INTEGER,
+  PRIMARY KEY (workout_plan_id, exercise_id),
+  FOREIGN KEY (workout_plan_id) REFERENCES workout_plans (id),
+  FOREIGN KEY (exercise_id) REFERENCES exercises (id)
+);
+
+-- Full text search over exercise names and plan templates. search_documents holds one row per distinct exercise name
+-- and per plan template and is filled by triggers on exercises and plan_templates, search_index is an external content FTS5 index over it.
+CREATE TABLE search_documents (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  kind TEXT NOT NULL,
+  ref TEXT NOT NULL,
+  name TEXT NOT NULL,
+  UNIQUE (kind, ref)
+);
+
+CREATE VIRTUAL TABLE search_index USING fts5(
+  name,
+  content='search_documents',
+  content_rowid='id',
+  tokenize='unicode61 remove_diacritics 2',
+  prefix='2 3'
+);
+
+CREATE VIRTUAL TABLE search_vocabulary USING fts5vocab(search_index, 'row');
+
+CREATE TRIGGER search_documents_insert AFTER INSERT ON search_documents BEGIN
+  INSERT INTO search_index (rowid, name) VALUES (new.id, new.name);
+END;
+
+CREATE TRIGGER search_documents_delete AFTER DELETE ON search_documents BEGIN
+  INSERT INTO search_index (search_index, rowid, name) VALUES ('delete', old.id, old.name);
+END;
+
+CREATE TRIGGER exercises_search AFTER INSERT ON exercises BEGIN
+  INSERT OR IGNORE INTO search_documents (kind, ref, name) VALUES ('exercise', lower(new.name), new.name);
+END;
+
+CREATE TRIGGER plan_templates_search AFTER INSERT ON plan_templates BEGIN
+  INSERT OR IGNORE INTO search_documents (kind, ref, name) VALUES ('plan', new.id, new.name);
+END;
+
+-- Background jobs. A job is visible to workers once run_at has passed. Claiming a job sets it to running and moves
+-- run_at to the end of its visibility timeout, so jobs of crashed workers become visible again.
+CREATE TABLE jobs (
+  id INTEGER PRIMARY KEY AUTOINCREMENT,
+  type TEXT NOT NULL,
+  payload TEXT NOT NULL,
+  status TEXT NOT NULL,
+  attempts INTEGER NOT NULL DEFAULT 0,
+  max_attempts INTEGER NOT NULL,
+  run_at REAL NOT NULL,
+  last_error TEXT,
+  created REAL NOT NULL
+);
+
+CREATE INDEX jobs_status_run_at ON jobs (status, run_at);
+
+-- Daily, weekly and monthly rollups of the workouts per user and exercise for progress charts, maintained
+-- incrementally by SQLiteRepository.save_workout. period_start is the first day of the period.
+CREATE TABLE workout_rollups (
+  user_id INTEGER NOT NULL,
+  exercise_id INTEGER NOT NULL,
+  bucket TEXT NOT NULL,
+  period_start TEXT NOT NULL,
+  min_weight REAL NOT NULL,
+  max_weight REAL NOT NULL,
+  last_weight REAL NOT NULL,
+  last_date TIMESTAMP NOT NULL,
+  volume REAL NOT NULL,
+  count INTEGER NOT NULL,
+  PRIMARY KEY (user_id, exercise_id, bucket, period_start)
+) WITHOUT ROWID;
+
+-- The next workout of every user, computed from the workout plan and the latest workout whenever a workout is logged
+-- or the plan changes, so /workout is served by one primary key read. The triggers delete the row when its inputs
+-- change behind the back of the repository; a missing row is recomputed on the next read.
+CREATE TABLE next_workouts (
+  user_id INTEGER PRIMARY KEY,
+  gym_log_id INTEGER NOT NULL,
+  workout TEXT NOT NULL
+);
+
+CREATE INDEX next_workouts_gym_log_id ON next_workouts (gym_log_id);
+
+CREATE TRIGGER workouts_insert_next_workout AFTER INSERT ON workouts BEGIN
+  DELETE FROM next_workouts WHERE gym_log_id = new.gym_log_id;
+END;
+
+-- A changed date can make another workout the latest one
+CREATE TRIGGER workouts_update_next_workout AFTER UPDATE ON workouts BEGIN
+  DELETE FROM next_workouts WHERE gym_log_id IN (old.gym_log_id, new.gym_log_id);
+END;
+
+CREATE TRIGGER workouts_delete_next_workout AFTER DELETE ON workouts BEGIN
+  DELETE FROM next_workouts WHERE gym_log_id = old.gym_log_id;
+END;
+
+CREATE TRIGGER workout_exercises_insert_next_workout AFTER INSERT ON workout_exercises BEGIN
+  DELETE FROM next_workouts WHERE gym_log_id = (SELECT gym_log_id FROM workouts WHERE id = new.workout_id);
+END;
+
+CREATE TRIGGER workout_exercises_update_next_workout AFTER UPDATE ON workout_exercises BEGIN
+  DELETE FROM next_workouts WHERE gym_log_id = (SELECT gym_log_id FROM workouts WHERE id = new.workout_id);
+END;
+
+CREATE TRIGGER workout_exercises_delete_next_workout AFTER DELETE ON workout_exercises BEGIN
+  DELETE FROM next_workouts WHERE gym_log_id = (SELECT gym_log_id FROM workouts WHERE id = old.workout_id);
+END;
+
+CREATE TRIGGER workout_plans_insert_next_workout AFTER INSERT ON workout_plans BEGIN
+  DELETE FROM next_workouts WHERE gym_log_id = new.gym_log_id;
+END;
+
+CREATE TRIGGER workout_plans_update_next_workout AFTER UPDATE ON workout_plans BEGIN
+  DELETE FROM next_workouts WHERE gym_log_id IN (old.gym_log_id, new.gym_log_id);
+END;
+
+CREATE TRIGGER workout_plans_delete_next_workout AFTER DELETE ON workout_plans BEGIN
+  DELETE FROM next_workouts WHERE gym_log_id = old.gym_log_id;
+END;
+
+CREATE TRIGGER exercise_plans_insert_next_workout AFTER INSERT ON exercise_plans BEGIN
+  DELETE FROM next_workouts WHERE gym_log_id = (SELECT gym_log_id FROM workout_plans WHERE id = new.workout_plan_id);
+END;
+
+CREATE TRIGGER exercise_plans_update_next_workout AFTER UPDATE ON exercise_plans BEGIN
+  DELETE FROM next_workouts WHERE gym_log_id = (SELECT gym_log_id FROM workout_plans WHERE id = new.workout_plan_id);
+END;
+
+CREATE TRIGGER exercise_plans_delete_next_workout AFTER DELETE ON exercise_plans BEGIN
+  DELETE FROM next_workouts WHERE gym_log_id = (SELECT gym_log_id FROM workout_plans WHERE id = old.workout_plan_id);
+END;
+
+CREATE TRIGGER overrides_insert_next_workout AFTER INSERT ON exercise_plan_overrides BEGIN
+  DELETE FROM next_workouts WHERE gym_log_id = (SELECT gym_log_id FROM workout_plans WHERE id = new.workout_plan_id);
+END;
+
+CREATE TRIGGER overrides_update_next_workout AFTER UPDATE ON exercise_plan_overrides BEGIN
+  DELETE FROM next_workouts WHERE gym_log_id = (SELECT gym_log_id FROM workout_plans WHERE id = new.workout_plan_id);
+END;
+
+CREATE TRIGGER overrides_delete_next_workout AFTER DELETE ON exercise_plan_overrides BEGIN
+  DELETE FROM next_workouts WHERE gym_log_id = (SELECT gym_log_id FROM workout_plans WHERE id = old.workout_plan_id);
+END;
+
+-- Serialized GymLog with the workout plan and the most recent workouts, rewritten by the repository after every
+-- change so load_gym_log reads one row. The snapshot is only used while its version equals the version of the gym log.
+CREATE TABLE gym_log_snapshots (
+  gym_log_id INTEGER PRIMARY KEY,
+  version INTEGER NOT NULL,
+  snapshot TEXT NOT NULL
 );
+
+CREATE TRIGGER workouts_insert_gym_log_version AFTER INSERT ON workouts BEGIN
+  UPDATE gym_logs SET version = version + 1 WHERE id = new.gym_log_id;
+END;
+
+CREATE TRIGGER workouts_update_gym_log_version AFTER UPDATE ON workouts BEGIN
+  UPDATE gym_logs SET version = version + 1 WHERE id IN (old.gym_log_id, new.gym_log_id);
+END;
+
+CREATE TRIGGER workouts_delete_gym_log_version AFTER DELETE ON workouts BEGIN
+  UPDATE gym_logs SET version = version + 1 WHERE id = old.gym_log_id;
+END;
+
+CREATE TRIGGER workout_exercises_insert_gym_log_version AFTER INSERT ON workout_exercises BEGIN
+  UPDATE gym_logs SET version = version + 1 WHERE id = (SELECT gym_log_id FROM workouts WHERE id = new.workout_id);
+END;
+
+CREATE TRIGGER workout_exercises_update_gym_log_version AFTER UPDATE ON workout_exercises BEGIN
+  UPDATE gym_logs SET version = version + 1 WHERE id = (SELECT gym_log_id FROM workouts WHERE id = new.workout_id);
+END;
+
+CREATE TRIGGER workout_exercises_delete_gym_log_version AFTER DELETE ON workout_exercises BEGIN
+  UPDATE gym_logs SET version = version + 1 WHERE id = (SELECT gym_log_id FROM workouts WHERE id = old.workout_id);
+END;
+
+CREATE TRIGGER workout_plans_insert_gym_log_version AFTER INSERT ON workout_plans BEGIN
+  UPDATE gym_logs SET version = version + 1 WHERE id = new.gym_log_id;
+END;
+
+CREATE TRIGGER workout_plans_update_gym_log_version AFTER UPDATE ON workout_plans BEGIN
+  UPDATE gym_logs SET version = version + 1 WHERE id IN (old.gym_log_id, new.gym_log_id);
+END;
+
+CREATE TRIGGER workout_plans_delete_gym_log_version AFTER DELETE ON workout_plans BEGIN
+  UPDATE gym_logs SET version = version + 1 WHERE id = old.gym_log_id;
+END;
+
+CREATE TRIGGER exercise_plans_insert_gym_log_version AFTER INSERT ON exercise_plans BEGIN
+  UPDATE gym_logs SET version = version + 1
+  WHERE id = (SELECT gym_log_id FROM workout_plans WHERE id = new.workout_plan_id);
+END;
+
+CREATE TRIGGER exercise_plans_update_gym_log_version AFTER UPDATE ON exercise_plans BEGIN
+  UPDATE gym_logs SET version = version + 1
+  WHERE id = (SELECT gym_log_id FROM workout_plans WHERE id = new.workout_plan_id);
+END;
+
+CREATE TRIGGER exercise_plans_delete_gym_log_version AFTER DELETE ON exercise_plans BEGIN
+  UPDATE gym_logs SET version = version + 1
+  WHERE id = (SELECT gym_log_id FROM workout_plans WHERE id = old.workout_plan_id);
+END;
+
+CREATE TRIGGER overrides_insert_gym_log_version AFTER INSERT ON exercise_plan_overrides BEGIN
+  UPDATE gym_logs SET version = version + 1
+  WHERE id = (SELECT gym_log_id FROM workout_plans WHERE id = new.workout_plan_id);
+END;
+
+CREATE TRIGGER overrides_update_gym_log_version AFTER UPDATE ON exercise_plan_overrides BEGIN
+  UPDATE gym_logs SET version = version + 1
+  WHERE id = (SELECT gym_log_id FROM workout_plans WHERE id = new.workout_plan_id);
+END;
+
+CREATE TRIGGER overrides_delete_gym_log_version AFTER DELETE ON exercise_plan_overrides BEGIN
+  UPDATE gym_logs SET version = version + 1
+  WHERE id = (SELECT gym_log_id FROM workout_plans WHERE id = old.workout_plan_id);
+END;
+
+-- Change counters of the tables that in-process caches depend on, incremented by the triggers below on every write.
+-- A worker compares them with the counters it saw last to evict only the cache entries of the changed tables, see
+-- ChangeTracker in db.py. The random `generation` row is renewed whenever the database is recreated or restored,
+-- which evicts every cache.
+CREATE TABLE table_changes (
+  table_name TEXT PRIMARY KEY,
+  counter INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+
+INSERT INTO table_changes (table_name) VALUES
+  ('user'),
+  ('gym_logs'),
+  ('workout_plans'),
+  ('exercise_plans'),
+  ('exercise_plan_overrides'),
+  ('workouts'),
+  ('workout_exercises'),
+  ('plan_templates'),
+  ('plan_template_exercises'),
+  ('exercises');
+
+INSERT INTO table_changes (table_name, counter) VALUES ('generation', abs(random()));
+
+CREATE TRIGGER user_insert_table_changes AFTER INSERT ON user BEGIN
+  UPDATE table_changes SET counter = counter + 1 WHERE table_name = 'user';
+END;
+
+CREATE TRIGGER user_update_table_changes AFTER UPDATE ON user BEGIN
+  UPDATE table_changes SET counter = counter + 1 WHERE table_name = 'user';
+END;
+
+CREATE TRIGGER user_delete_table_changes AFTER DELETE ON user BEGIN
+  UPDATE table_changes SET counter = counter + 1 WHERE table_name = 'user';
+END;
+
+CREATE TRIGGER gym_logs_insert_table_changes AFTER INSERT ON gym_logs BEGIN
+  UPDATE table_changes SET counter = counter + 1 WHERE table_name = 'gym_logs';
+END;
+
+CREATE TRIGGER gym_logs_update_table_changes AFTER UPDATE ON gym_logs BEGIN
+  UPDATE table_changes SET counter = counter + 1 WHERE table_name = 'gym_logs';
+END;
+
+CREATE TRIGGER gym_logs_delete_table_changes AFTER DELETE ON gym_logs BEGIN
+  UPDATE table_changes SET counter = counter + 1 WHERE table_name = 'gym_logs';
+END;
+
+CREATE TRIGGER workout_plans_insert_table_changes AFTER INSERT ON workout_plans BEGIN
+  UPDATE table_changes SET counter = counter + 1 WHERE table_name = 'workout_plans';
+END;
+
+CREATE TRIGGER workout_plans_update_table_changes AFTER UPDATE ON workout_plans BEGIN
+  UPDATE table_changes SET counter = counter + 1 WHERE table_name = 'workout_plans';
+END;
+
+CREATE TRIGGER workout_plans_delete_table_changes AFTER DELETE ON workout_plans BEGIN
+  UPDATE table_changes SET counter = counter + 1 WHERE table_name = 'workout_plans';
+END;
+
+CREATE TRIGGER exercise_plans_insert_table_changes AFTER INSERT ON exercise_plans BEGIN
+  UPDATE table_changes SET counter = counter + 1 WHERE table_name = 'exercise_plans';
+END;
+
+CREATE TRIGGER exercise_plans_update_table_changes AFTER UPDATE ON exercise_plans BEGIN
+  UPDATE table_changes SET counter = counter + 1 WHERE table_name = 'exercise_plans';
+END;
+
+CREATE TRIGGER exercise_plans_delete_table_changes AFTER DELETE ON exercise_plans BEGIN
+  UPDATE table_changes SET counter = counter + 1 WHERE table_name = 'exercise_plans';
+END;
+
+CREATE TRIGGER exercise_plan_overrides_insert_table_changes AFTER INSERT ON exercise_plan_overrides BEGIN
+  UPDATE table_changes SET counter = counter + 1 WHERE table_name = 'exercise_plan_overrides';
+END;
+
+CREATE TRIGGER exercise_plan_overrides_update_table_changes AFTER UPDATE ON exercise_plan_overrides BEGIN
+  UPDATE table_changes SET counter = counter + 1 WHERE table_name = 'exercise_plan_overrides';
+END;
+
+CREATE TRIGGER exercise_plan_overrides_delete_table_changes AFTER DELETE ON exercise_plan_overrides BEGIN
+  UPDATE table_changes SET counter = counter + 1 WHERE table_name = 'exercise_plan_overrides';
+END;
+
+CREATE TRIGGER workouts_insert_table_changes AFTER INSERT ON workouts BEGIN
+  UPDATE table_changes SET counter = counter + 1 WHERE table_name = 'workouts';
+END;
+
+CREATE TRIGGER workouts_update_table_changes AFTER UPDATE ON workouts BEGIN
+  UPDATE table_changes SET counter = counter + 1 WHERE table_name = 'workouts';
+END;
+
+CREATE TRIGGER workouts_delete_table_changes AFTER DELETE ON workouts BEGIN
+  UPDATE table_changes SET counter = counter + 1 WHERE table_name = 'workouts';
+END;
+
+CREATE TRIGGER workout_exercises_insert_table_changes AFTER INSERT ON workout_exercises BEGIN
+  UPDATE table_changes SET counter = counter + 1 WHERE table_name = 'workout_exercises';
+END;
+
+CREATE TRIGGER workout_exercises_update_table_changes AFTER UPDATE ON workout_exercises BEGIN
+  UPDATE table_changes SET counter = counter + 1 WHERE table_name = 'workout_exercises';
+END;
+
+CREATE TRIGGER workout_exercises_delete_table_changes AFTER DELETE ON workout_exercises BEGIN
+  UPDATE table_changes SET counter = counter + 1 WHERE table_name = 'workout_exercises';
+END;
+
+CREATE TRIGGER plan_templates_insert_table_changes AFTER INSERT ON plan_templates BEGIN
+  UPDATE table_changes SET counter = counter + 1 WHERE table_name = 'plan_templates';
+END;
+
+CREATE TRIGGER plan_templates_update_table_changes AFTER UPDATE ON plan_templates BEGIN
+  UPDATE table_changes SET counter = counter + 1 WHERE table_name = 'plan_templates';
+END;
+
+CREATE TRIGGER plan_templates_delete_table_changes AFTER DELETE ON plan_templates BEGIN
+  UPDATE table_changes SET counter = counter + 1 WHERE table_name = 'plan_templates';
+END;
+
+CREATE TRIGGER plan_template_exercises_insert_table_changes AFTER INSERT ON plan_template_exercises BEGIN
+  UPDATE table_changes SET counter = counter + 1 WHERE table_name = 'plan_template_exercises';
+END;
+
+CREATE TRIGGER plan_template_exercises_update_table_changes AFTER UPDATE ON plan_template_exercises BEGIN
+  UPDATE table_changes SET counter = counter + 1 WHERE table_name = 'plan_template_exercises';
+END;
+
+CREATE TRIGGER plan_template_exercises_delete_table_changes AFTER DELETE ON plan_template_exercises BEGIN
+  UPDATE table_changes SET counter = counter + 1 WHERE table_name = 'plan_template_exercises';
+END;
+
+CREATE TRIGGER exercises_insert_table_changes AFTER INSERT ON exercises BEGIN
+  UPDATE table_changes SET counter = counter + 1 WHERE table_name = 'exercises';
+END;
+
+CREATE TRIGGER exercises_update_table_changes AFTER UPDATE ON exercises BEGIN
+  UPDATE table_changes SET counter = counter + 1 WHERE table_name = 'exercises';
+END;
+
+CREATE TRIGGER exercises_delete_table_changes AFTER DELETE ON exercises BEGIN
+  UPDATE table_changes SET counter = counter + 1 WHERE table_name = 'exercises';
+END;
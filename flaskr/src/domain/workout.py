@@ -1,3 +1,7 @@
+import functools
+import hashlib
+import json
+import math
 from datetime import datetime
 from typing import Dict, Optional, List
 
@@ -43,6 +47,31 @@ class ExercisePlan:
         self.initial_weight = initial_weight
         self.progression = progression
 
+    def to_dict(self):
+        """
+        Convert the exercise plan into a JSON serializable dictionary.
+
+        Returns:
+            dict: The name, sets, reps, initial weight and progression.
+
+        """
+        return {'name': self.name, 'sets': self.sets, 'reps': self.reps, 'initial_weight': self.initial_weight,
+                'progression': self.progression}
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Create an exercise plan from a dictionary created by `to_dict`.
+
+        Args:
+            data (dict): The dictionary.
+
+        Returns:
+            ExercisePlan: The exercise plan.
+
+        """
+        return cls(data['name'], data['sets'], data['reps'], data['initial_weight'], data['progression'])
+
     def __eq__(self, other):
         """
         Check if two ExercisePlan objects are equal. The method checks whether name, sets, reps initial weight
@@ -126,7 +155,8 @@ class WorkoutPlan:
     def create_workout_from_prior_workout(self, last_workout):
         """
         Create a workout based on the prior workout.  A previous workout exists,thus the weight
-        is the sum of the previous workouts weight + progression.
+        is the sum of the previous workouts weight + progression. Exercises that were not part of the previous
+        workout start with their initial weight.
 
         Args:
             last_workout (Workout): The previous workout.
@@ -136,16 +166,107 @@ class WorkoutPlan:
 
         """
         exercise_session_dict = {}
-        for key in self.exercise_plan_dict:
-            # New weight is weight from old workout + progression
+        for key, weight in self.next_weights(last_workout).items():
             exercise_dict = {
                 'name': self.exercise_plan_dict[key].name,
-                'weight': last_workout.exercise_session_dict.get(key)['weight'] +
-                          self.exercise_plan_dict.get(key).progression
+                'weight': weight
             }
             exercise_session_dict[key] = exercise_dict
         return Workout(exercise_session_dict)
 
+    def next_weights(self, last_workout=None):
+        """
+        Compute the weights of the next workout. Without a previous workout, or for exercises that were not part of
+        it, the initial weight is used, otherwise the weight of the previous workout plus the progression.
+
+        Args:
+            last_workout (Workout, optional): The previous workout. Defaults to None.
+
+        Returns:
+            Dict[str, float]: The weight per exercise key.
+
+        """
+        weights = {}
+        for key, exercise_plan in self.exercise_plan_dict.items():
+            last_exercise = last_workout.exercise_session_dict.get(key) if last_workout is not None else None
+            if last_exercise is None:
+                weights[key] = exercise_plan.initial_weight
+            else:
+                # New weight is weight from old workout + progression
+                weights[key] = last_exercise['weight'] + exercise_plan.progression
+        return weights
+
+    def forecast(self, sessions, last_workout=None, deload_every=None, deload_ratio=0.9, max_weight=None):
+        """
+        Forecast the weights of the next `sessions` workouts of every exercise, without creating the workouts one
+        by one. The first session starts from the weights of `create_workout`, every further session adds the
+        progression. Weights are capped at `max_weight`, and every `deload_every`-th session is a deload at
+        `deload_ratio` of the weight it replaces; the progression continues from the weight before the deload.
+
+        The forecast is memoized on the exercise plans, the starting weights and the rules, so it is computed
+        again only after the plan or the last workout changed.
+
+        Args:
+            sessions (int): The number of forecast sessions.
+            last_workout (Workout, optional): The last workout. Defaults to None.
+            deload_every (int, optional): The interval of deload sessions. Defaults to no deloads.
+            deload_ratio (float): The fraction of the weight lifted in a deload session.
+            max_weight (float, optional): The maximum weight of every exercise. Defaults to no cap.
+
+        Returns:
+            Dict[str, List[float]]: The forecast weights of the sessions per exercise key.
+
+        """
+        starts = self.next_weights(last_workout)
+        keys = tuple(self.exercise_plan_dict)
+        weights = forecast_weights(tuple((starts[key], self.exercise_plan_dict[key].progression) for key in keys),
+                                   sessions, deload_every, deload_ratio, max_weight)
+        return {key: list(exercise_weights) for key, exercise_weights in zip(keys, weights)}
+
+    def content_hash(self):
+        """
+        Compute a stable hash of the content of the workout plan, i.e. its name and exercise plans. Two plans with
+        the same content have the same hash, independent of their IDs and of the order of the exercises.
+
+        Returns:
+            str: The hex digest of the SHA-256 hash.
+
+        """
+        content = {
+            'name': self.name,
+            'exercises': {
+                key: [exercise.name, exercise.sets, exercise.reps, exercise.initial_weight, exercise.progression]
+                for key, exercise in self.exercise_plan_dict.items()
+            },
+        }
+        return hashlib.sha256(json.dumps(content, sort_keys=True).encode('utf8')).hexdigest()
+
+    def to_dict(self):
+        """
+        Convert the workout plan into a JSON serializable dictionary.
+
+        Returns:
+            dict: The ID, the name and the exercise plans by exercise key.
+
+        """
+        return {'id': self.id, 'name': self.name,
+                'exercises': {key: exercise.to_dict() for key, exercise in self.exercise_plan_dict.items()}}
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Create a workout plan from a dictionary created by `to_dict`.
+
+        Args:
+            data (dict): The dictionary.
+
+        Returns:
+            WorkoutPlan: The workout plan.
+
+        """
+        return cls(data['name'], {key: ExercisePlan.from_dict(exercise) for key, exercise in data['exercises'].items()},
+                   data['id'])
+
     def add_id(self, id):
         """
         Add an ID to the workout plan.
@@ -175,17 +296,82 @@ class WorkoutPlan:
         return True
 
 
+@functools.lru_cache(maxsize=1024)
+def forecast_weights(exercises, sessions, deload_every=None, deload_ratio=0.9, max_weight=None):
+    """
+    Compute the forecast weights of exercises, see `WorkoutPlan.forecast`. The weight of every session is computed
+    in closed form from its index, so the cost is one multiply-add per session and exercise.
+
+    Args:
+        exercises (Tuple[Tuple[float, float], ...]): The weight of the first session and the progression of every
+            exercise.
+        sessions (int): The number of forecast sessions.
+        deload_every (int, optional): The interval of deload sessions.
+        deload_ratio (float): The fraction of the weight lifted in a deload session.
+        max_weight (float, optional): The maximum weight.
+
+    Returns:
+        Tuple[Tuple[float, ...], ...]: The weights of the sessions of every exercise.
+
+    """
+    cap = math.inf if max_weight is None else max_weight
+    factors = [deload_ratio if deload_every and (index + 1) % deload_every == 0 else 1 for index in range(sessions)]
+    return tuple(
+        tuple(round(min(start + index * progression, cap) * factor, 2) for index, factor in enumerate(factors))
+        for start, progression in exercises
+    )
+
+
 class Workout:
-    def __init__(self, exercise_session_dict):
+    def __init__(self, exercise_session_dict, date=None, id=None):
         """
         Initialize a Workout object.
 
         Args:
             exercise_session_dict: The dictionary of exercise sessions.
+            date (datetime, optional): The date of the workout. Defaults to now.
+            id (optional): The ID of the workout.
 
         """
-        self.date = datetime.now()
+        self.date = date if date else datetime.now()
         self.exercise_session_dict = exercise_session_dict
+        self.id = None
+        if id:
+            self.id = id
+
+    def to_dict(self):
+        """
+        Convert the workout into a JSON serializable dictionary.
+
+        Returns:
+            dict: The ID, the date in ISO format and the exercise sessions.
+
+        """
+        return {'id': self.id, 'date': self.date.isoformat(' '), 'exercises': self.exercise_session_dict}
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Create a workout from a dictionary created by `to_dict`.
+
+        Args:
+            data (dict): The dictionary.
+
+        Returns:
+            Workout: The workout.
+
+        """
+        return cls(data['exercises'], datetime.fromisoformat(data['date']), data['id'])
+
+    def add_id(self, id):
+        """
+        Add an ID to the workout.
+
+        Args:
+            id: The ID to be added.
+
+        """
+        self.id = id
 
     def __gt__(self, other):
         """
@@ -204,18 +390,101 @@ class Workout:
             return True
         return self.date > other.date
 
+    def content_hash(self):
+        """
+        Compute a stable hash of the exercise sessions of the workout. It does not depend on the order of the
+        exercises or on whether a weight is an int or a float, so equal sessions always get the same hash, in every
+        process.
+
+        Returns:
+            int: The first 8 bytes of the SHA-256 of the exercise sessions as a signed 64-bit integer, which fits
+            an SQLite INTEGER column.
+
+        """
+        content = json.dumps(sorted([key, exercise['name'], float(exercise['weight'])]
+                                    for key, exercise in self.exercise_session_dict.items()), separators=(',', ':'))
+        return int.from_bytes(hashlib.sha256(content.encode()).digest()[:8], 'big', signed=True)
+
     def is_equal(self, other):
         """
-        Check if two Workout objects are equal based on their exercise session dictionaries.
+        Check if two Workout objects are equal based on the hashes of their exercise sessions.
 
         Args:
             other (Workout): The other Workout object to compare.
 
         Returns:
-            bool: True if the exercise session dictionaries are equal, False otherwise.
+            bool: True if the exercise sessions are equal, False otherwise.
 
         """
-        return self.exercise_session_dict == other.exercise_session_dict
+        return self.content_hash() == other.content_hash()
+
+
+class WorkoutSet:
+    """
+    One set of an exercise of a workout, recorded while the workout is performed. The event ID is generated by the
+    client when the set is done, so a set that is sent again after a lost response is recognized and stored once.
+    """
+
+    def __init__(self, event_id, exercise_key, reps, weight, performed_at=None):
+        """
+        Initialize a WorkoutSet object.
+
+        Args:
+            event_id (str): The client-generated ID of the set.
+            exercise_key (str): The key of the exercise in the workout.
+            reps (int): The number of reps.
+            weight (int or float): The weight.
+            performed_at (datetime, optional): The time the set was done. Defaults to now.
+
+        Raises:
+            ValueError: If the event ID is empty or the reps or the weight are not numbers.
+
+        """
+        if not isinstance(event_id, str) or not 0 < len(event_id) <= 64:
+            raise ValueError("Event ID must be a string of 1 to 64 characters.")
+        if not isinstance(reps, int) or isinstance(reps, bool) or reps < 0:
+            raise ValueError("Reps must be a non-negative integer.")
+        if not isinstance(weight, (int, float)) or isinstance(weight, bool):
+            raise ValueError("Weight must be a number.")
+        self.event_id = event_id
+        self.exercise_key = exercise_key
+        self.reps = reps
+        self.weight = weight
+        self.performed_at = performed_at if performed_at else datetime.now()
+
+    def to_dict(self):
+        """
+        Convert the set into a JSON serializable dictionary.
+
+        Returns:
+            dict: The event ID, exercise key, reps, weight and the time the set was done.
+
+        """
+        return {'event_id': self.event_id, 'exercise': self.exercise_key, 'reps': self.reps,
+                'weight': float(self.weight), 'performed_at': self.performed_at.isoformat(' ')}
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Create a set from a dictionary created by `to_dict`, e.g. a set event sent by a client. The time the set
+        was done is optional.
+
+        Args:
+            data (dict): The dictionary.
+
+        Returns:
+            WorkoutSet: The set.
+
+        Raises:
+            ValueError: If a value is missing or invalid.
+
+        """
+        try:
+            performed_at = data.get('performed_at')
+            return cls(data['event_id'], data['exercise'], data['reps'], data['weight'],
+                       datetime.fromisoformat(performed_at) if performed_at else None)
+        except (KeyError, TypeError, AttributeError) as error:
+            raise ValueError("Invalid set.") from error
 
 
 class GymLog(object):
@@ -277,6 +546,36 @@ class GymLog(object):
             return self.workout_plan.create_workout(max(self.workout_list))
         return self.workout_plan.create_workout()
 
+    def to_dict(self):
+        """
+        Convert the GymLog into a JSON serializable dictionary.
+
+        Returns:
+            dict: The IDs, the workout plan and the workouts.
+
+        """
+        return {'id': self.id, 'userid': self.userid,
+                'workout_plan': None if self.workout_plan is None else self.workout_plan.to_dict(),
+                'workouts': [workout.to_dict() for workout in self.workout_list]}
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Create a GymLog from a dictionary created by `to_dict`.
+
+        Args:
+            data (dict): The dictionary.
+
+        Returns:
+            GymLog: The GymLog.
+
+        """
+        gym_log = cls(data['userid'], data['id'])
+        if data['workout_plan'] is not None:
+            gym_log.add_workout_plan(WorkoutPlan.from_dict(data['workout_plan']))
+        gym_log.workout_list = [Workout.from_dict(workout) for workout in data['workouts']]
+        return gym_log
+
     def add_id(self, id):
         """
         Add an ID to the GymLog.
@@ -0,0 +1,374 @@
+import json
+import random
+import sqlite3
+import threading
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+from GymApp.flaskr.src.database import backup, maintenance
+from GymApp.flaskr.src.database.db import ChangeTracker, attach_archive, connect
+from GymApp.flaskr.src.repository.repository import SQLiteRepository, get_file_exercise_cache
+
+# Registered job handlers by job type
+HANDLERS = {}
+
+
+class UnknownJobTypeError(Exception):
+    """Exception raised when a job is enqueued or run for a job type without a handler."""
+
+    pass
+
+
+class Job(object):
+    """A claimed job of the queue.
+
+    Attributes:
+        id (int): The ID of the job.
+        type (str): The job type, selecting the handler.
+        payload (dict): The arguments of the handler.
+        attempts (int): The number of times the job was claimed, including the current attempt.
+        max_attempts (int): The number of attempts after which the job is marked as failed.
+    """
+
+    def __init__(self, id, type, payload, attempts, max_attempts):
+        """Initialize a Job instance.
+
+        Args:
+            id (int): The ID of the job.
+            type (str): The job type.
+            payload (dict): The arguments of the handler.
+            attempts (int): The number of attempts.
+            max_attempts (int): The maximum number of attempts.
+        """
+        self.id = id
+        self.type = type
+        self.payload = payload
+        self.attempts = attempts
+        self.max_attempts = max_attempts
+
+
+def job_handler(job_type):
+    """
+    Decorator registering a function as the handler of a job type. A handler is called with a connection to the
+    application database and the payload of the job. Its changes are committed when it returns, and rolled back
+    and retried later when it raises.
+
+    Args:
+        job_type (str): The job type.
+
+    Returns:
+        function: The decorator.
+    """
+    def decorator(handler):
+        HANDLERS[job_type] = handler
+        return handler
+
+    return decorator
+
+
+def enqueue(connection: sqlite3.Connection, job_type, payload=None, delay=0, max_attempts=5):
+    """
+    Add a job to the queue. The job is part of the current transaction, so it only becomes visible to workers
+    when the caller commits, together with the changes that caused it.
+
+    Args:
+        connection (sqlite3.Connection): A connection to the application database.
+        job_type (str): The job type.
+        payload (dict, optional): The arguments of the handler, must be JSON serializable.
+        delay (float): The seconds before the job becomes visible.
+        max_attempts (int): The number of attempts after which the job is marked as failed.
+
+    Returns:
+        int: The ID of the job.
+
+    Raises:
+        UnknownJobTypeError: If no handler is registered for the job type.
+    """
+    if job_type not in HANDLERS:
+        raise UnknownJobTypeError(job_type)
+    now = time.time()
+    return connection.execute(
+        "INSERT INTO jobs (type, payload, status, max_attempts, run_at, created) VALUES (?, ?, 'queued', ?, ?, ?)",
+        (job_type, json.dumps(payload or {}), max_attempts, now + delay, now)
+    ).lastrowid
+
+
+def claim_job(connection: sqlite3.Connection, visibility_timeout=60):
+    """
+    Claim the next visible job. Queued jobs whose run_at has passed and running jobs whose visibility timeout
+    has expired are visible. The claimed job stays invisible to other workers for `visibility_timeout` seconds.
+
+    Args:
+        connection (sqlite3.Connection): A connection to the application database.
+        visibility_timeout (float): The seconds the job is reserved for the caller.
+
+    Returns:
+        Optional[Job]: The claimed job, or None if no job is visible.
+    """
+    now = time.time()
+    if connection.in_transaction:
+        connection.commit()
+    connection.execute('BEGIN IMMEDIATE')
+    try:
+        row = connection.execute(
+            "SELECT id FROM jobs WHERE status IN ('queued', 'running') AND run_at <= ? ORDER BY run_at LIMIT 1",
+            (now,)
+        ).fetchone()
+        if row is None:
+            connection.commit()
+            return None
+        row = connection.execute(
+            "UPDATE jobs SET status = 'running', attempts = attempts + 1, run_at = ? WHERE id = ? "
+            "RETURNING id, type, payload, attempts, max_attempts",
+            (now + visibility_timeout, row[0])
+        ).fetchone()
+        connection.commit()
+    except sqlite3.Error:
+        connection.rollback()
+        raise
+    return Job(row[0], row[1], json.loads(row[2]), row[3], row[4])
+
+
+def complete_job(connection: sqlite3.Connection, job: Job):
+    """
+    Remove a successfully run job from the queue. Nothing happens if the job was claimed again in the meantime
+    because its visibility timeout expired.
+
+    Args:
+        connection (sqlite3.Connection): A connection to the application database.
+        job (Job): The job.
+    """
+    connection.execute(
+        "DELETE FROM jobs WHERE id = ? AND status = 'running' AND attempts = ?", (job.id, job.attempts)
+    )
+
+
+def fail_job(connection: sqlite3.Connection, job: Job, error, backoff=2.0):
+    """
+    Record a failed attempt of a job. The job is queued again after an exponential backoff with full jitter,
+    or marked as failed once it reached its maximum number of attempts.
+
+    Args:
+        connection (sqlite3.Connection): A connection to the application database.
+        job (Job): The job.
+        error (str): The error of the attempt.
+        backoff (float): The base of the backoff in seconds.
+    """
+    if job.attempts >= job.max_attempts:
+        connection.execute(
+            "UPDATE jobs SET status = 'failed', last_error = ? WHERE id = ? AND attempts = ?",
+            (error, job.id, job.attempts)
+        )
+        return
+    delay = random.uniform(0, backoff * 2 ** (job.attempts - 1))
+    connection.execute(
+        "UPDATE jobs SET status = 'queued', run_at = ?, last_error = ? WHERE id = ? AND attempts = ?",
+        (time.time() + delay, error, job.id, job.attempts)
+    )
+
+
+# Change trackers of the databases jobs run on, one per worker process, keeping its exercise cache coherent with the
+# writes of other processes like the trackers of the application do
+_change_trackers = {}
+_change_trackers_lock = threading.Lock()
+
+
+def poll_job_changes(database):
+    """
+    Evict the in-process caches a job may use whose tables were written since the previous job on `database`.
+
+    Args:
+        database (str): The path of the application database.
+    """
+    with _change_trackers_lock:
+        tracker = _change_trackers.get(database)
+        if tracker is None:
+            tracker = _change_trackers[database] = ChangeTracker(database)
+            tracker.register('exercises', get_file_exercise_cache(database))
+    tracker.poll()
+
+
+def run_job(database, job: Job, backoff=2.0):
+    """
+    Run a claimed job with its own connection and record the outcome. This is the unit of work of the worker
+    pools; it only takes picklable arguments, so it can run in a process pool.
+
+    Args:
+        database (str): The path of the application database.
+        job (Job): The claimed job.
+        backoff (float): The base of the retry backoff in seconds.
+
+    Returns:
+        bool: True if the job succeeded.
+    """
+    poll_job_changes(database)
+    connection = connect(database)
+    try:
+        try:
+            handler = HANDLERS.get(job.type)
+            if handler is None:
+                raise UnknownJobTypeError(job.type)
+            handler(connection, job.payload)
+            complete_job(connection, job)
+            connection.commit()
+            return True
+        except Exception:
+            connection.rollback()
+            fail_job(connection, job, traceback.format_exc(limit=5), backoff)
+            connection.commit()
+            return False
+    finally:
+        connection.close()
+
+
+class Worker(object):
+    """Worker claiming jobs from the queue and running them in a thread or process pool."""
+
+    def __init__(self, database, concurrency=4, pool='thread', visibility_timeout=60, poll_interval=1.0,
+                 backoff=2.0):
+        """Initialize a Worker.
+
+        Args:
+            database (str): The path of the application database.
+            concurrency (int): The number of jobs run at the same time.
+            pool (str): 'thread' or 'process'.
+            visibility_timeout (float): The seconds a claimed job is reserved for this worker.
+            poll_interval (float): The seconds to wait when the queue is empty.
+            backoff (float): The base of the retry backoff in seconds.
+        """
+        self.database = database
+        self.concurrency = concurrency
+        self.pool = pool
+        self.visibility_timeout = visibility_timeout
+        self.poll_interval = poll_interval
+        self.backoff = backoff
+        self.succeeded = 0
+        self.failed = 0
+
+    def run(self, burst=False):
+        """Claim and run jobs until interrupted.
+
+        Args:
+            burst (bool): Stop once the queue has no visible jobs and all running jobs are finished.
+        """
+        executor_class = ProcessPoolExecutor if self.pool == 'process' else ThreadPoolExecutor
+        connection = connect(self.database)
+        running = set()
+        try:
+            with executor_class(max_workers=self.concurrency) as executor:
+                while True:
+                    job = None
+                    if len(running) < self.concurrency:
+                        job = claim_job(connection, self.visibility_timeout)
+                    if job is not None:
+                        running.add(executor.submit(run_job, self.database, job, self.backoff))
+                        continue
+                    if not running:
+                        if burst:
+                            return
+                        time.sleep(self.poll_interval)
+                        continue
+                    done, running = wait(running, timeout=self.poll_interval, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        if future.result():
+                            self.succeeded += 1
+                        else:
+                            self.failed += 1
+        finally:
+            connection.close()
+
+
+@job_handler('purge_orphans')
+def purge_orphans_job(connection, payload):
+    """
+    Job deleting orphaned rows. A job purges at most one batch; if there may be more orphans, the job enqueues
+    its successor, so the write lock is never held for long. If the payload names an `archive`, the orphans of the
+    archive database are purged too.
+    """
+    if payload.get('archive'):
+        attach_archive(connection, payload['archive'])
+    repo = SQLiteRepository(connection)
+    if repo.purge_orphans(payload.get('batch_size', 500)):
+        enqueue(connection, 'purge_orphans', payload)
+
+
+@job_handler('rebuild_leaderboards')
+def rebuild_leaderboards_job(connection, payload):
+    """
+    Job recomputing the leaderboard aggregates from all saved workouts.
+    """
+    SQLiteRepository(connection).rebuild_leaderboards()
+
+
+@job_handler('rebuild_rollups')
+def rebuild_rollups_job(connection, payload):
+    """
+    Job recomputing the progress chart rollups from all saved workouts.
+    """
+    SQLiteRepository(connection).rebuild_rollups()
+
+
+@job_handler('archive_workouts')
+def archive_workouts_job(connection, payload):
+    """
+    Job moving one batch of the workouts older than `older_than_days` into the archive database at `archive`. If
+    the batch was full, the job enqueues its successor, like the purge job.
+    """
+    attach_archive(connection, payload['archive'])
+    batch_size = payload.get('batch_size', 500)
+    before = datetime.now() - timedelta(days=payload['older_than_days'])
+    if SQLiteRepository(connection).archive_workouts(before, batch_size) == batch_size:
+        enqueue(connection, 'archive_workouts', payload)
+
+
+@job_handler('db_maintain')
+def db_maintain_job(connection, payload):
+    """
+    Job running the database maintenance, see `maintenance.maintain`. The payload may set `step_ms` and
+    `max_seconds`.
+    """
+    database = connection.execute('PRAGMA database_list').fetchone()[2]
+    maintenance.maintain(database, payload.get('step_ms', 50), payload.get('max_seconds', 30.0), stats=False)
+
+
+@job_handler('backup')
+def backup_job(connection, payload):
+    """
+    Job writing a snapshot of the database into the directory `directory`, see `backup.backup`. The payload may
+    set `keep_last` and `keep_daily`, and `archive`, the path of the archive database to back up with it.
+    """
+    database = connection.execute('PRAGMA database_list').fetchone()[2]
+    backup.backup(database, payload['directory'], keep_last=payload.get('keep_last', 7),
+                  keep_daily=payload.get('keep_daily', 30), archive=payload.get('archive'))
+
+
+@click.command('worker')
+@click.option('--concurrency', default=4, show_default=True, help='Number of jobs run at the same time.')
+@click.option('--pool', type=click.Choice(['thread', 'process']), default='thread', show_default=True)
+@click.option('--visibility-timeout', default=60.0, show_default=True, help='Seconds a claimed job is reserved.')
+@click.option('--poll-interval', default=1.0, show_default=True, help='Seconds to wait when the queue is empty.')
+@click.option('--burst', is_flag=True, help='Exit once the queue is empty.')
+@with_appcontext
+def worker_command(concurrency, pool, visibility_timeout, poll_interval, burst):
+    """
+    Flask command running a worker for the background job queue.
+    """
+    worker = Worker(current_app.config['DATABASE'], concurrency, pool, visibility_timeout, poll_interval)
+    worker.run(burst=burst)
+    click.echo(f'Worker finished: {worker.succeeded} succeeded, {worker.failed} failed.')
+
+
+def init_app(app):
+    """
+    Initialize the Flask application with the background job queue.
+
+    Args:
+        app: The Flask application instance.
+    """
+    app.cli.add_command(worker_command)
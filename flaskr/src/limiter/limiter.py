@@ -0,0 +1,411 @@
+import abc
+import json
+import math
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+
+
+class TokenBucket(object):
+    """A single token bucket. The bucket holds up to `capacity` tokens and is refilled with `refill_rate`
+    tokens per second. Every admitted request takes one token out of the bucket.
+
+    Attributes:
+        capacity (float): The maximum number of tokens the bucket can hold.
+        refill_rate (float): The number of tokens added per second.
+        tokens (float): The number of tokens currently in the bucket.
+        updated (float): The monotonic time of the last refill.
+    """
+
+    def __init__(self, capacity, refill_rate, tokens=None, updated=None):
+        """Initialize a TokenBucket instance. A new bucket starts full.
+
+        Args:
+            capacity (float): The maximum number of tokens.
+            refill_rate (float): The number of tokens added per second.
+            tokens (Optional[float]): The current number of tokens.
+            updated (Optional[float]): The time of the last refill.
+        """
+        self.capacity = capacity
+        self.refill_rate = refill_rate
+        self.tokens = capacity if tokens is None else tokens
+        self.updated = time.monotonic() if updated is None else updated
+
+    def consume(self, now=None):
+        """Refill the bucket up to `now` and take one token out of it.
+
+        Args:
+            now (Optional[float]): The current time. Defaults to time.monotonic().
+
+        Returns:
+            float: 0 if a token was taken, otherwise the number of seconds until a token is available.
+        """
+        if now is None:
+            now = time.monotonic()
+        elapsed = max(0.0, now - self.updated)
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.refill_rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        if self.refill_rate <= 0:
+            return math.inf
+        return (1 - self.tokens) / self.refill_rate
+
+
+class AbstractLimiter(abc.ABC):
+    """Abstract base class of the admission control for the auth endpoints. A request is admitted if both the
+    bucket of its IP address and the bucket of its username still hold a token."""
+
+    def __init__(self, capacity, refill_rate):
+        """Initialize the limiter.
+
+        Args:
+            capacity (float): The burst size of every bucket.
+            refill_rate (float): The number of tokens added per second to every bucket.
+        """
+        self.capacity = capacity
+        self.refill_rate = refill_rate
+        self._counter_lock = threading.Lock()
+        self.counters = {'allowed': 0, 'rejected_ip': 0, 'rejected_username': 0}
+        self._logged = time.monotonic()
+
+    @abc.abstractmethod
+    def consume(self, key):
+        """Take one token out of the bucket stored under `key`.
+
+        Args:
+            key (str): The bucket key.
+
+        Returns:
+            float: 0 if the request is admitted, otherwise the seconds until the bucket has a token again.
+        """
+        raise NotImplementedError
+
+    def allow_request(self, ip, username=None):
+        """Check whether a request of `ip` for `username` is admitted. The IP bucket is checked first,
+        so a rejected IP does not drain the bucket of the username it is attacking.
+
+        Args:
+            ip (str): The remote address of the request.
+            username (Optional[str]): The username in the submitted form.
+
+        Returns:
+            float: 0 if the request is admitted, otherwise the seconds the client should wait.
+        """
+        retry_after = self.consume('ip:' + str(ip))
+        if retry_after:
+            self._count('rejected_ip')
+            return retry_after
+        if username:
+            retry_after = self.consume('user:' + username)
+            if retry_after:
+                self._count('rejected_username')
+                return retry_after
+        self._count('allowed')
+        return 0.0
+
+    def _count(self, name):
+        """Increment the counter `name`.
+
+        Args:
+            name (str): The name of the counter.
+        """
+        with self._counter_lock:
+            self.counters[name] += 1
+
+    def stats(self):
+        """Return the counters of the limiter.
+
+        Returns:
+            dict: A copy of the counters.
+        """
+        with self._counter_lock:
+            return dict(self.counters)
+
+    def log_stats(self, logger, interval):
+        """Log the counters of the limiter if `interval` seconds passed since they were last logged, so the
+        counters of a serving process can be monitored.
+
+        Args:
+            logger (logging.Logger): The logger.
+            interval (float): The minimum seconds between two log lines. 0 disables the log lines.
+
+        Returns:
+            bool: True if the counters were logged.
+        """
+        now = time.monotonic()
+        with self._counter_lock:
+            if not interval or now - self._logged < interval:
+                return False
+            self._logged = now
+        logger.info('auth rate limiter %s', json.dumps(self.stats()))
+        return True
+
+
+class InMemoryLimiter(AbstractLimiter):
+    """Limiter keeping its buckets in the memory of the current process. The number of buckets is bounded,
+    the least recently used buckets are dropped first, so a flood of spoofed keys cannot exhaust the memory."""
+
+    def __init__(self, capacity, refill_rate, max_keys=100000):
+        """Initialize the InMemoryLimiter.
+
+        Args:
+            capacity (float): The burst size of every bucket.
+            refill_rate (float): The number of tokens added per second to every bucket.
+            max_keys (int): The maximum number of buckets kept in memory.
+        """
+        super().__init__(capacity, refill_rate)
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def consume(self, key):
+        """Take one token out of the in-memory bucket stored under `key`.
+
+        Args:
+            key (str): The bucket key.
+
+        Returns:
+            float: 0 if the request is admitted, otherwise the seconds until the bucket has a token again.
+        """
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = TokenBucket(self.capacity, self.refill_rate)
+                self._buckets[key] = bucket
+                if len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+            return bucket.consume()
+
+
+class SQLiteLimiter(AbstractLimiter):
+    """Limiter keeping its buckets in a local SQLite file, so that all worker processes of one host share
+    the same buckets. The file is separate from the application database, so admission control never waits
+    on the application's write lock. The counters are stored in the same file.
+
+    Every `prune_every` requests the buckets that are full again or were idle for `max_idle` seconds are deleted,
+    so spoofed keys cannot grow the file without bound. A full bucket admits the same requests as a missing one.
+    If the file is busy or unavailable, the buckets of the current process are used instead, so a login is
+    still limited rather than failing."""
+
+    def __init__(self, capacity, refill_rate, database, prune_every=1000, max_idle=86400):
+        """Initialize the SQLiteLimiter and create its tables if needed.
+
+        Args:
+            capacity (float): The burst size of every bucket.
+            refill_rate (float): The number of tokens added per second to every bucket.
+            database (str): The path of the SQLite file shared by the workers.
+            prune_every (int): The number of consumed tokens after which the buckets are pruned.
+            max_idle (float): The seconds after which an unused bucket is deleted, even if it is not full.
+        """
+        super().__init__(capacity, refill_rate)
+        self.database = database
+        self.prune_every = prune_every
+        self.max_idle = max_idle
+        self.fallbacks = 0
+        self._fallback = InMemoryLimiter(capacity, refill_rate)
+        self._consumed = 0
+        self._local = threading.local()
+        connection = self._connection()
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS rate_limit_buckets '
+            '(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL) WITHOUT ROWID'
+        )
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS rate_limit_counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)'
+        )
+
+    def _connection(self):
+        """Return the connection of the current thread to the limiter database.
+
+        Returns:
+            sqlite3.Connection: The connection in autocommit mode.
+        """
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.database, timeout=1.0, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=OFF')
+            self._local.connection = connection
+        return connection
+
+    def consume(self, key):
+        """Take one token out of the shared bucket stored under `key`, or out of the bucket of the current
+        process if the limiter database is busy.
+
+        Args:
+            key (str): The bucket key.
+
+        Returns:
+            float: 0 if the request is admitted, otherwise the seconds until the bucket has a token again.
+        """
+        try:
+            retry_after = self._consume_shared(key)
+        except sqlite3.OperationalError:
+            with self._counter_lock:
+                self.fallbacks += 1
+            return self._fallback.consume(key)
+        with self._counter_lock:
+            self._consumed += 1
+            prune = self._consumed % self.prune_every == 0
+        if prune:
+            try:
+                self.prune()
+            except sqlite3.OperationalError:
+                pass
+        return retry_after
+
+    def _consume_shared(self, key):
+        """Take one token out of the shared bucket stored under `key`. Wall clock time is used, because
+        monotonic clocks are not comparable between processes.
+
+        Args:
+            key (str): The bucket key.
+
+        Returns:
+            float: 0 if the request is admitted, otherwise the seconds until the bucket has a token again.
+
+        Raises:
+            sqlite3.OperationalError: If the limiter database is busy.
+        """
+        connection = self._connection()
+        now = time.time()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = connection.execute(
+                'SELECT tokens, updated FROM rate_limit_buckets WHERE key = ?', (key,)
+            ).fetchone()
+            if row is None:
+                bucket = TokenBucket(self.capacity, self.refill_rate, updated=now)
+            else:
+                bucket = TokenBucket(self.capacity, self.refill_rate, tokens=row[0], updated=row[1])
+            retry_after = bucket.consume(now)
+            connection.execute(
+                'INSERT OR REPLACE INTO rate_limit_buckets (key, tokens, updated) VALUES (?, ?, ?)',
+                (key, bucket.tokens, bucket.updated)
+            )
+            connection.execute('COMMIT')
+        except sqlite3.Error:
+            if connection.in_transaction:
+                connection.execute('ROLLBACK')
+            raise
+        return retry_after
+
+    def prune(self, now=None):
+        """Delete the buckets that are full again or were not used for `max_idle` seconds.
+
+        Args:
+            now (Optional[float]): The current wall clock time. Defaults to time.time().
+
+        Returns:
+            int: The number of deleted buckets.
+        """
+        now = time.time() if now is None else now
+        return self._connection().execute(
+            'DELETE FROM rate_limit_buckets WHERE tokens + (? - updated) * ? >= ? OR updated < ?',
+            (now, self.refill_rate, self.capacity, now - self.max_idle)
+        ).rowcount
+
+    def _count(self, name):
+        """Increment the counter `name` in memory and, unless the limiter database is busy, in the shared
+        database.
+
+        Args:
+            name (str): The name of the counter.
+        """
+        super()._count(name)
+        try:
+            self._connection().execute(
+                'INSERT INTO rate_limit_counters (name, value) VALUES (?, 1) '
+                'ON CONFLICT (name) DO UPDATE SET value = value + 1',
+                (name,)
+            )
+        except sqlite3.OperationalError:
+            pass
+
+    def stats(self):
+        """Return the counters of the limiter in the current process and the number of requests that fell back
+        to the buckets of the process.
+
+        Returns:
+            dict: A copy of the counters.
+        """
+        stats = super().stats()
+        with self._counter_lock:
+            stats['fallbacks'] = self.fallbacks
+        return stats
+
+    def shared_stats(self):
+        """Return the counters summed over all processes sharing the limiter database.
+
+        Returns:
+            dict: The shared counters.
+        """
+        rows = self._connection().execute('SELECT name, value FROM rate_limit_counters').fetchall()
+        stats = {name: 0 for name in self.counters}
+        stats.update({name: value for name, value in rows})
+        return stats
+
+
+def create_limiter(config):
+    """Create the limiter described by the application config.
+
+    Args:
+        config (dict): The Flask application config.
+
+    Returns:
+        Optional[AbstractLimiter]: The limiter, or None if rate limiting is disabled.
+    """
+    if not config.get('AUTH_RATE_LIMIT_ENABLED'):
+        return None
+    capacity = config['AUTH_RATE_LIMIT_CAPACITY']
+    refill_rate = config['AUTH_RATE_LIMIT_REFILL_RATE']
+    if config.get('AUTH_RATE_LIMIT_DATABASE'):
+        return SQLiteLimiter(capacity, refill_rate, config['AUTH_RATE_LIMIT_DATABASE'])
+    return InMemoryLimiter(capacity, refill_rate)
+
+
+def get_limiter():
+    """Get the limiter of the current application.
+
+    Returns:
+        Optional[AbstractLimiter]: The limiter, or None if rate limiting is disabled.
+    """
+    return current_app.extensions.get('auth_limiter')
+
+
+@click.command('limiter-stats')
+@with_appcontext
+def limiter_stats_command():
+    """
+    Flask command printing the counters of the auth rate limiter, summed over all processes sharing
+    AUTH_RATE_LIMIT_DATABASE, as JSON. The counters of an in-memory limiter only live in the serving processes,
+    which log them every AUTH_RATE_LIMIT_LOG_INTERVAL seconds.
+    """
+    limiter = get_limiter()
+    if limiter is None:
+        click.echo('Rate limiting is disabled.')
+    elif isinstance(limiter, SQLiteLimiter):
+        click.echo(json.dumps(limiter.shared_stats()))
+    else:
+        raise click.ClickException('The counters of the in-memory limiter are only logged by the serving '
+                                   'processes. Set AUTH_RATE_LIMIT_DATABASE to share them.')
+
+
+def init_app(app):
+    """
+    Initialize the Flask application with the auth rate limiter.
+
+    Args:
+        app: The Flask application instance.
+    """
+    app.extensions['auth_limiter'] = create_limiter(app.config)
+    app.cli.add_command(limiter_stats_command)
@@ -0,0 +1,102 @@
+import threading
+import tracemalloc
+
+from flask import current_app, g, request
+
+
+class MemoryProfiler(object):
+    """Opt-in per-request memory profiler based on tracemalloc.
+
+    For every request the peak of the traced memory above the memory traced when the request started is measured,
+    reported in the X-Memory-Peak header and the log, and aggregated per endpoint. tracemalloc traces the whole
+    process, so with concurrent requests the peak of a request includes the allocations of the others; profile with
+    a single worker thread for exact numbers. Tracing slows allocations down considerably, so the profiler is only
+    meant for profiling runs.
+
+    Attributes:
+        endpoints (dict): Per endpoint the number of requests and the maximum and total peak in bytes.
+    """
+
+    def __init__(self, frames=1):
+        """Initialize a MemoryProfiler.
+
+        Args:
+            frames (int): The number of frames stored per traced allocation.
+        """
+        self.frames = frames
+        self.endpoints = {}
+        self._lock = threading.Lock()
+
+    def start_request(self):
+        """Start tracing if needed and remember the traced memory at the start of the request."""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+        tracemalloc.reset_peak()
+        g.memory_profile_start = tracemalloc.get_traced_memory()[0]
+
+    def finish_request(self, response):
+        """Measure the peak allocation of the request and report it.
+
+        Args:
+            response: The response of the request.
+
+        Returns:
+            The response with the X-Memory-Peak header.
+        """
+        start = g.pop('memory_profile_start', None)
+        if start is None or not tracemalloc.is_tracing():
+            return response
+        peak = max(0, tracemalloc.get_traced_memory()[1] - start)
+        self.record(request.endpoint or request.path, peak)
+        response.headers['X-Memory-Peak'] = str(peak)
+        current_app.logger.info('%s %s peak allocation %d bytes', request.method, request.path, peak)
+        return response
+
+    def record(self, endpoint, peak):
+        """Add the peak allocation of a request to the statistics of its endpoint.
+
+        Args:
+            endpoint (str): The endpoint of the request.
+            peak (int): The peak allocation in bytes.
+        """
+        with self._lock:
+            stats = self.endpoints.setdefault(endpoint, {'requests': 0, 'max_peak': 0, 'total_peak': 0})
+            stats['requests'] += 1
+            stats['max_peak'] = max(stats['max_peak'], peak)
+            stats['total_peak'] += peak
+
+    def stats(self):
+        """Return the statistics per endpoint.
+
+        Returns:
+            dict: Per endpoint the number of requests and the maximum and mean peak allocation in bytes.
+        """
+        with self._lock:
+            return {endpoint: {'requests': stats['requests'], 'max_peak': stats['max_peak'],
+                               'mean_peak': stats['total_peak'] / stats['requests']}
+                    for endpoint, stats in self.endpoints.items()}
+
+
+def get_profiler():
+    """Get the memory profiler of the current application.
+
+    Returns:
+        Optional[MemoryProfiler]: The profiler, or None if memory profiling is disabled.
+    """
+    return current_app.extensions.get('memory_profiler')
+
+
+def init_app(app):
+    """
+    Initialize the Flask application with the memory profiler, if MEMORY_PROFILER_ENABLED is set.
+
+    Args:
+        app: The Flask application instance.
+    """
+    if not app.config.get('MEMORY_PROFILER_ENABLED'):
+        app.extensions['memory_profiler'] = None
+        return
+    profiler = MemoryProfiler(app.config['MEMORY_PROFILER_FRAMES'])
+    app.extensions['memory_profiler'] = profiler
+    app.before_request(profiler.start_request)
+    app.after_request(profiler.finish_request)
@@ -1,10 +1,22 @@
 import abc
+import bisect
+import difflib
+import heapq
+import json
+import os
+import re
 import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+from itertools import islice
+from typing import Dict, List
 
 from werkzeug.security import generate_password_hash, check_password_hash
 
 from GymApp.flaskr.src.domain.user import User
-from GymApp.flaskr.src.domain.workout import GymLog, WorkoutPlan, ExercisePlan
+from GymApp.flaskr.src.domain.workout import GymLog, WorkoutPlan, ExercisePlan, Workout, WorkoutSet
+from GymApp.flaskr.src.repository.transactions import DEFAULT_RETRY_POLICY, is_busy
 
 
 class IncorrectUsernameError(Exception):
@@ -31,15 +43,275 @@ class UserDoesNotHaveAGymLog(Exception):
     pass
 
 
+class WorkoutNotFoundError(Exception):
+    """Exception raised when a workout does not exist in the gym log it is looked up in."""
+
+    pass
+
+
+class ExerciseNotInWorkoutError(Exception):
+    """Exception raised when a set is recorded for an exercise that is not part of the workout."""
+
+    pass
+
+
+ORPHAN_PURGE_STATEMENTS = (
+    'DELETE FROM gym_logs WHERE id IN ('
+    'SELECT gym_logs.id FROM gym_logs LEFT JOIN user ON user.id = gym_logs.user_id '
+    'WHERE user.id IS NULL LIMIT ?)',
+    'DELETE FROM workout_plans WHERE id IN ('
+    'SELECT workout_plans.id FROM workout_plans LEFT JOIN gym_logs ON gym_logs.id = workout_plans.gym_log_id '
+    'WHERE gym_logs.id IS NULL LIMIT ?)',
+    'DELETE FROM exercise_plans WHERE id IN ('
+    'SELECT exercise_plans.id FROM exercise_plans '
+    'LEFT JOIN workout_plans ON workout_plans.id = exercise_plans.workout_plan_id '
+    'WHERE workout_plans.id IS NULL LIMIT ?)',
+    'DELETE FROM exercise_plan_overrides WHERE rowid IN ('
+    'SELECT overrides.rowid FROM exercise_plan_overrides AS overrides '
+    'LEFT JOIN workout_plans ON workout_plans.id = overrides.workout_plan_id '
+    'WHERE workout_plans.id IS NULL LIMIT ?)',
+    'DELETE FROM workouts WHERE id IN ('
+    'SELECT workouts.id FROM workouts LEFT JOIN gym_logs ON gym_logs.id = workouts.gym_log_id '
+    'WHERE gym_logs.id IS NULL LIMIT ?)',
+    'DELETE FROM workout_exercises WHERE id IN ('
+    'SELECT workout_exercises.id FROM workout_exercises '
+    'LEFT JOIN workouts ON workouts.id = workout_exercises.workout_id '
+    'WHERE workouts.id IS NULL LIMIT ?)',
+    'DELETE FROM workout_sets WHERE id IN ('
+    'SELECT workout_sets.id FROM workout_sets '
+    'LEFT JOIN workouts ON workouts.id = workout_sets.workout_id '
+    'WHERE workouts.id IS NULL LIMIT ?)',
+    'DELETE FROM user_exercise_weekly_stats WHERE rowid IN ('
+    'SELECT stats.rowid FROM user_exercise_weekly_stats AS stats LEFT JOIN user ON user.id = stats.user_id '
+    'WHERE user.id IS NULL LIMIT ?)',
+    'DELETE FROM user_weekly_stats WHERE rowid IN ('
+    'SELECT stats.rowid FROM user_weekly_stats AS stats LEFT JOIN user ON user.id = stats.user_id '
+    'WHERE user.id IS NULL LIMIT ?)',
+    'DELETE FROM user_exercise_stats WHERE rowid IN ('
+    'SELECT stats.rowid FROM user_exercise_stats AS stats LEFT JOIN user ON user.id = stats.user_id '
+    'WHERE user.id IS NULL LIMIT ?)',
+    'DELETE FROM workout_rollups WHERE (user_id, exercise_id, bucket, period_start) IN ('
+    'SELECT rollups.user_id, rollups.exercise_id, rollups.bucket, rollups.period_start '
+    'FROM workout_rollups AS rollups LEFT JOIN user ON user.id = rollups.user_id '
+    'WHERE user.id IS NULL LIMIT ?)',
+    'DELETE FROM next_workouts WHERE user_id IN ('
+    'SELECT next_workouts.user_id FROM next_workouts LEFT JOIN user ON user.id = next_workouts.user_id '
+    'WHERE user.id IS NULL LIMIT ?)',
+    'DELETE FROM gym_log_snapshots WHERE gym_log_id IN ('
+    'SELECT snapshots.gym_log_id FROM gym_log_snapshots AS snapshots '
+    'LEFT JOIN gym_logs ON gym_logs.id = snapshots.gym_log_id WHERE gym_logs.id IS NULL LIMIT ?)',
+)
+
+# Orphans of the archive database, purged when it is attached. Archived workouts belong to gym logs of main.
+ARCHIVE_ORPHAN_PURGE_STATEMENTS = (
+    'DELETE FROM archive.workouts WHERE id IN ('
+    'SELECT workouts.id FROM archive.workouts AS workouts '
+    'LEFT JOIN main.gym_logs AS gym_logs ON gym_logs.id = workouts.gym_log_id WHERE gym_logs.id IS NULL LIMIT ?)',
+    'DELETE FROM archive.workout_exercises WHERE id IN ('
+    'SELECT workout_exercises.id FROM archive.workout_exercises AS workout_exercises '
+    'LEFT JOIN archive.workouts AS workouts ON workouts.id = workout_exercises.workout_id '
+    'WHERE workouts.id IS NULL LIMIT ?)',
+    'DELETE FROM archive.workout_sets WHERE id IN ('
+    'SELECT workout_sets.id FROM archive.workout_sets AS workout_sets '
+    'LEFT JOIN archive.workouts AS workouts ON workouts.id = workout_sets.workout_id '
+    'WHERE workouts.id IS NULL LIMIT ?)',
+)
+
+# The leaderboard aggregates are upserted from the rows of the workouts matching `{filter}`. Rows are processed in
+# date order, so running the statements over all workouts rebuilds the same state the incremental updates produce.
+LEADERBOARD_STATEMENTS = (
+    'INSERT INTO user_exercise_weekly_stats (user_id, exercise_name, week, volume, max_weight, session_count) '
+    "SELECT gym_logs.user_id, exercises.name, date(workouts.date, 'weekday 0', '-6 days'), "
+    'workout_exercises.sets * workout_exercises.reps * workout_exercises.weight, workout_exercises.weight, 1 '
+    'FROM workout_exercises JOIN workouts ON workouts.id = workout_exercises.workout_id '
+    'JOIN exercises ON exercises.id = workout_exercises.exercise_id '
+    'JOIN gym_logs ON gym_logs.id = workouts.gym_log_id '
+    'WHERE {filter} ORDER BY workouts.date '
+    'ON CONFLICT (user_id, exercise_name, week) DO UPDATE SET '
+    'volume = volume + excluded.volume, max_weight = MAX(max_weight, excluded.max_weight), '
+    'session_count = session_count + excluded.session_count',
+    'INSERT INTO user_weekly_stats (user_id, week, volume, session_count) '
+    "SELECT gym_logs.user_id, date(workouts.date, 'weekday 0', '-6 days'), "
+    '(SELECT COALESCE(SUM(sets * reps * weight), 0) FROM workout_exercises '
+    'WHERE workout_exercises.workout_id = workouts.id), 1 '
+    'FROM workouts JOIN gym_logs ON gym_logs.id = workouts.gym_log_id '
+    'WHERE {filter} ORDER BY workouts.date '
+    'ON CONFLICT (user_id, week) DO UPDATE SET '
+    'volume = volume + excluded.volume, session_count = session_count + excluded.session_count',
+    'INSERT INTO user_exercise_stats (user_id, exercise_name, first_date, first_weight, max_weight, session_count) '
+    'SELECT gym_logs.user_id, exercises.name, workouts.date, workout_exercises.weight, '
+    'workout_exercises.weight, 1 '
+    'FROM workout_exercises JOIN workouts ON workouts.id = workout_exercises.workout_id '
+    'JOIN exercises ON exercises.id = workout_exercises.exercise_id '
+    'JOIN gym_logs ON gym_logs.id = workouts.gym_log_id '
+    'WHERE {filter} ORDER BY workouts.date '
+    'ON CONFLICT (user_id, exercise_name) DO UPDATE SET '
+    'first_weight = CASE WHEN excluded.first_date < first_date THEN excluded.first_weight ELSE first_weight END, '
+    'first_date = MIN(first_date, excluded.first_date), max_weight = MAX(max_weight, excluded.max_weight), '
+    'session_count = session_count + excluded.session_count',
+)
+
+LEADERBOARD_TABLES = ('user_exercise_weekly_stats', 'user_weekly_stats', 'user_exercise_stats')
+
+# The rollups of the progress charts are maintained like the leaderboards, with one row per user, exercise and
+# day, week and month.
+ROLLUP_STATEMENTS = (
+    'INSERT INTO workout_rollups (user_id, exercise_id, bucket, period_start, min_weight, max_weight, '
+    'last_weight, last_date, volume, count) '
+    'SELECT gym_logs.user_id, workout_exercises.exercise_id, buckets.bucket, '
+    "CASE buckets.bucket WHEN 'day' THEN date(workouts.date) "
+    "WHEN 'week' THEN date(workouts.date, 'weekday 0', '-6 days') "
+    "ELSE date(workouts.date, 'start of month') END, "
+    'workout_exercises.weight, workout_exercises.weight, workout_exercises.weight, workouts.date, '
+    'workout_exercises.sets * workout_exercises.reps * workout_exercises.weight, 1 '
+    'FROM workout_exercises JOIN workouts ON workouts.id = workout_exercises.workout_id '
+    'JOIN gym_logs ON gym_logs.id = workouts.gym_log_id '
+    "JOIN (SELECT 'day' AS bucket UNION ALL SELECT 'week' UNION ALL SELECT 'month') AS buckets "
+    'WHERE {filter} ORDER BY workouts.date '
+    'ON CONFLICT (user_id, exercise_id, bucket, period_start) DO UPDATE SET '
+    'min_weight = MIN(min_weight, excluded.min_weight), max_weight = MAX(max_weight, excluded.max_weight), '
+    'last_weight = CASE WHEN excluded.last_date >= last_date THEN excluded.last_weight ELSE last_weight END, '
+    'last_date = MAX(last_date, excluded.last_date), volume = volume + excluded.volume, '
+    'count = count + excluded.count',
+)
+
+ROLLUP_TABLES = ('workout_rollups',)
+
+# The tables of workouts that have a copy in the archive database
+ARCHIVED_TABLES = re.compile(r'\b(workouts|workout_exercises)\b')
+
+# Rollup buckets from the finest to the coarsest, with their approximate length in days
+ROLLUP_BUCKETS = (('day', 1), ('week', 7), ('month', 30.44))
+
+# The number of most recent workouts stored in the snapshot of a gym log
+SNAPSHOT_WORKOUTS = 50
+
+# Words of a search query; every word is matched as a prefix of a word in the indexed names
+SEARCH_TOKEN = re.compile(r'\w+')
+
+# The fields of an exercise plan a user can override when adopting a plan template
+OVERRIDABLE_FIELDS = ('sets', 'reps', 'initial_weight', 'progression')
+
+
+def week_start(date):
+    """Return the Monday of the week of `date` in the format used as key of the weekly leaderboards.
+
+    Args:
+        date (datetime or date): A day in the week.
+
+    Returns:
+        str: The Monday of the week as 'YYYY-MM-DD'.
+    """
+    return (date - timedelta(days=date.weekday())).strftime('%Y-%m-%d')
+
+
+def parse_date(value):
+    """Convert a date read from a TIMESTAMP column into a datetime. Connections opened with
+    `detect_types=sqlite3.PARSE_DECLTYPES` already return datetimes, other connections return strings.
+
+    Args:
+        value (datetime or str): The stored date.
+
+    Returns:
+        datetime: The date.
+    """
+    if isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(value)
+
+
+def workout_order(workout: Workout):
+    """Return the sort key of a workout, ordering workouts by date and then by ID like the queries do."""
+    return workout.date, workout.id
+
+
+class ExerciseCache(object):
+    """In-process cache of the exercise dictionary, mapping (exercise key, name) pairs to exercise IDs and back.
+    The repository never updates or deletes rows of the dictionary, but another process may recreate or restore
+    the database. The cache therefore depends on the `exercises` table like a TableCache and is registered with the
+    ChangeTracker of the application and of the job worker, which clear it when that table changes.
+    """
+
+    tables = frozenset({'exercises'})
+
+    def __init__(self):
+        """Initialize an empty ExerciseCache."""
+        self._ids = {}
+        self._exercises = {}
+        self._lock = threading.Lock()
+
+    def get_id(self, exercise_key, name):
+        """Return the cached ID of an exercise, or None."""
+        return self._ids.get((exercise_key, name))
+
+    def get_exercise(self, exercise_id):
+        """Return the cached (exercise key, name) pair of an exercise ID, or None."""
+        return self._exercises.get(exercise_id)
+
+    def add(self, exercise_id, exercise_key, name):
+        """Add an exercise to the cache."""
+        with self._lock:
+            self._ids[(exercise_key, name)] = exercise_id
+            self._exercises[exercise_id] = (exercise_key, name)
+
+    def clear(self):
+        """Remove all entries from the cache."""
+        with self._lock:
+            self._ids.clear()
+            self._exercises.clear()
+
+
+# One exercise cache per database file, shared by all repositories of the process
+_exercise_caches: Dict[str, ExerciseCache] = {}
+_exercise_caches_lock = threading.Lock()
+
+
+def get_exercise_cache(connection: sqlite3.Connection):
+    """Return the exercise cache shared by all connections to the database file of `connection`. In-memory and
+    temporary databases get a cache of their own.
+
+    Args:
+        connection (sqlite3.Connection): A connection to the database.
+
+    Returns:
+        ExerciseCache: The exercise cache of the database.
+    """
+    path = connection.execute('PRAGMA database_list').fetchone()[2]
+    if not path:
+        return ExerciseCache()
+    return get_file_exercise_cache(path)
+
+
+def get_file_exercise_cache(path):
+    """Return the exercise cache shared by all connections to the database file at `path`.
+
+    Args:
+        path (str): The path of the database file.
+
+    Returns:
+        ExerciseCache: The exercise cache of the database.
+    """
+    with _exercise_caches_lock:
+        return _exercise_caches.setdefault(os.path.realpath(path), ExerciseCache())
+
+
+def clear_exercise_caches():
+    """Clear the exercise caches of all databases, e.g. after a database was recreated."""
+    with _exercise_caches_lock:
+        for exercise_cache in _exercise_caches.values():
+            exercise_cache.clear()
+
+
 class AbstractRepository(abc.ABC):
     """Abstract base class defining the interface for a repository."""
 
     @abc.abstractmethod
-    def register_user(self, user: User):
+    def register_user(self, user: User, password_hash=None):
         """Register a new user.
 
         Args:
             user (User): The user object containing username and password.
+            password_hash (Optional[str]): The hash of the password, if it was already computed.
 
         Raises:
             UserAlreadyExistsError: If a user with the same username already exists.
@@ -61,7 +333,7 @@ class AbstractRepository(abc.ABC):
 
     @abc.abstractmethod
     def delete_user(self, user: User):
-        """Delete a user.
+        """Delete a user together with all data belonging to the user.
 
         Args:
             user (User): The user object to be deleted.
@@ -111,24 +383,140 @@ class AbstractRepository(abc.ABC):
 class SQLiteRepository(AbstractRepository):
     """Concrete implementation of the repository using SQLite as the underlying database."""
 
-    def __init__(self, connection: sqlite3.Connection):
+    def __init__(self, connection: sqlite3.Connection, exercise_cache: ExerciseCache = None):
         """Initialize the SQLiteRepository with a SQLite connection.
 
         Args:
             connection (sqlite3.Connection): The SQLite database connection.
+            exercise_cache (ExerciseCache, optional): The cache of the exercise dictionary. Defaults to the cache
+                shared by all repositories of the database.
         """
         self.connection = connection
         self.connection.row_factory = sqlite3.Row
+        self.exercise_cache = exercise_cache if exercise_cache is not None else get_exercise_cache(connection)
+        self._has_archive = None
+        # Exercises inserted in the current transaction, only shared through the cache once they are committed
+        self._uncommitted_exercises = {}
 
     def commit(self):
         """Commit changes to the database."""
         self.connection.commit()
+        for (exercise_key, name), exercise_id in self._uncommitted_exercises.items():
+            self.exercise_cache.add(exercise_id, exercise_key, name)
+        self._uncommitted_exercises.clear()
+
+    def rollback(self):
+        """Roll back the current transaction."""
+        self.connection.rollback()
+        self._uncommitted_exercises.clear()
+
+    def run_transaction(self, unit, write=True, retry_policy=None):
+        """Run a unit of work in one explicit transaction and commit it.
+
+        Write transactions are opened with BEGIN IMMEDIATE and take the write lock up front. A read-then-write
+        sequence inside them never has to upgrade a read lock, which fails at once with SQLITE_BUSY when another
+        connection writes at the same time. Read transactions are opened with BEGIN DEFERRED, take no lock until
+        their first read and see one consistent state of the database. A transaction that fails because the
+        database is busy is rolled back and run again after a jittered backoff, so the unit must not have side
+        effects outside the database.
+
+        Args:
+            unit (Callable[[SQLiteRepository], Any]): The unit of work, taking this repository; it must not commit.
+            write (bool): Open a write transaction instead of a read transaction.
+            retry_policy (Optional[RetryPolicy]): The retry policy. Defaults to DEFAULT_RETRY_POLICY.
+
+        Returns:
+            Any: The return value of the unit.
+
+        Raises:
+            sqlite3.OperationalError: If the database stayed busy after the last retry.
+        """
+        policy = retry_policy or DEFAULT_RETRY_POLICY
+        retries = 0
+        while True:
+            try:
+                self.connection.execute('BEGIN IMMEDIATE' if write else 'BEGIN DEFERRED')
+                result = unit(self)
+                self.commit()
+            except Exception as error:
+                if self.connection.in_transaction:
+                    self.rollback()
+                self._uncommitted_exercises.clear()
+                busy = is_busy(error)
+                if not busy or retries >= policy.attempts:
+                    policy.record(retries, busy)
+                    raise
+                time.sleep(policy.delay(retries))
+                retries += 1
+            else:
+                policy.record(retries, False)
+                return result
+
+    def exercise_id(self, exercise_key, name, create=True):
+        """Return the ID of an exercise in the exercise dictionary, adding the exercise if it is new.
+
+        Args:
+            exercise_key (str): The key of the exercise in the exercise plan dictionary.
+            name (str): The name of the exercise.
+            create (bool): Add the exercise if it is new. If False, None is returned for new exercises.
+
+        Returns:
+            Optional[int]: The ID of the exercise.
+        """
+        exercise_id = self.exercise_cache.get_id(exercise_key, name)
+        if exercise_id is None:
+            exercise_id = self._uncommitted_exercises.get((exercise_key, name))
+        if exercise_id is not None:
+            return exercise_id
+        row = self.connection.execute(
+            'SELECT id FROM exercises WHERE exercise_key = ? AND name = ?', (exercise_key, name)
+        ).fetchone()
+        if row is not None:
+            self.exercise_cache.add(row['id'], exercise_key, name)
+            return row['id']
+        if not create:
+            return None
+        exercise_id = self.connection.execute(
+            'INSERT INTO exercises (exercise_key, name) VALUES (?, ?)', (exercise_key, name)
+        ).lastrowid
+        self._uncommitted_exercises[(exercise_key, name)] = exercise_id
+        return exercise_id
+
+    def exercises(self, exercise_ids):
+        """Return the exercise key and name of several exercise IDs, reading only the IDs missing in the cache.
+
+        Args:
+            exercise_ids (Iterable[int]): The IDs of the exercises.
 
-    def register_user(self, user: User):
+        Returns:
+            dict: A dictionary mapping exercise IDs to (exercise key, name) pairs.
+        """
+        exercises = {}
+        missing = []
+        for exercise_id in set(exercise_ids):
+            exercise = self.exercise_cache.get_exercise(exercise_id)
+            if exercise is None:
+                missing.append(exercise_id)
+            else:
+                exercises[exercise_id] = exercise
+        if missing:
+            rows = self.connection.execute(
+                f'SELECT id, exercise_key, name FROM exercises WHERE id IN ({",".join("?" * len(missing))})',
+                missing
+            ).fetchall()
+            for row in rows:
+                exercises[row['id']] = (row['exercise_key'], row['name'])
+                if row['id'] not in self._uncommitted_exercises.values():
+                    self.exercise_cache.add(row['id'], row['exercise_key'], row['name'])
+        return exercises
+
+    def register_user(self, user: User, password_hash=None):
         """Register a new user by inserting their username and hashed password into the database.
 
         Args:
             user (User): The user object containing username and password.
+            password_hash (Optional[str]): The hash of the password. Hashing is slow on purpose, so callers inside
+                a write transaction hash the password before it starts. Defaults to hashing `user.password`.
 
         Raises:
             UserAlreadyExistsError: If a user with the same username already exists.
@@ -136,7 +524,7 @@ class SQLiteRepository(AbstractRepository):
         try:
             self.connection.execute(
                 "INSERT INTO user (username, password) VALUES (?, ?)",
-                (user.username, generate_password_hash(user.password)),
+                (user.username, password_hash or generate_password_hash(user.password)),
             )
         except sqlite3.IntegrityError:
             raise UserAlreadyExistsError
@@ -168,15 +556,79 @@ class SQLiteRepository(AbstractRepository):
         user.add_id(user_db['id'])
 
     def delete_user(self, user: User):
-        """Delete a user from the database based on their username.
+        """Delete a user and the whole graph of their gym log, workout plan, exercise plans and overrides, hot and
+        archived workouts and sets, leaderboard aggregates, rollups, next workout and snapshot from the database
+        based on their username. Shared plan templates and the exercise dictionary are kept. Every table is cleared
+        with one set-based delete, children first, and all deletes run in the same transaction, which is completed
+        by `commit`.
 
         Args:
             user (User): The user object to be deleted.
         """
+        user_ids = 'SELECT id FROM user WHERE username = ?'
+        gym_log_ids = f'SELECT id FROM gym_logs WHERE user_id IN ({user_ids})'
+        workout_plan_ids = f'SELECT id FROM workout_plans WHERE gym_log_id IN ({gym_log_ids})'
+        workout_ids = f'SELECT id FROM workouts WHERE gym_log_id IN ({gym_log_ids})'
+        for table in LEADERBOARD_TABLES + ROLLUP_TABLES + ('next_workouts',):
+            self.connection.execute(
+                f'DELETE FROM {table} WHERE user_id IN ({user_ids})', (user.username,)
+            )
+        self.connection.execute(
+            f'DELETE FROM gym_log_snapshots WHERE gym_log_id IN ({gym_log_ids})', (user.username,)
+        )
+        if self.has_archive():
+            archived_workout_ids = f'SELECT id FROM archive.workouts WHERE gym_log_id IN ({gym_log_ids})'
+            self.connection.execute(
+                f'DELETE FROM archive.workout_exercises WHERE workout_id IN ({archived_workout_ids})', (user.username,)
+            )
+            self.connection.execute(
+                f'DELETE FROM archive.workout_sets WHERE workout_id IN ({archived_workout_ids})', (user.username,)
+            )
+            self.connection.execute(
+                f'DELETE FROM archive.workouts WHERE id IN ({archived_workout_ids})', (user.username,)
+            )
+        self.connection.execute(
+            f'DELETE FROM workout_exercises WHERE workout_id IN ({workout_ids})', (user.username,)
+        )
+        self.connection.execute(
+            f'DELETE FROM workout_sets WHERE workout_id IN ({workout_ids})', (user.username,)
+        )
+        self.connection.execute(
+            f'DELETE FROM workouts WHERE id IN ({workout_ids})', (user.username,)
+        )
+        self.connection.execute(
+            f'DELETE FROM exercise_plans WHERE workout_plan_id IN ({workout_plan_ids})', (user.username,)
+        )
+        self.connection.execute(
+            f'DELETE FROM exercise_plan_overrides WHERE workout_plan_id IN ({workout_plan_ids})', (user.username,)
+        )
+        self.connection.execute(
+            f'DELETE FROM workout_plans WHERE id IN ({workout_plan_ids})', (user.username,)
+        )
+        self.connection.execute(
+            f'DELETE FROM gym_logs WHERE id IN ({gym_log_ids})', (user.username,)
+        )
         self.connection.execute(
             'DELETE FROM user WHERE username = ?', (user.username,)
         )
 
+    def purge_orphans(self, batch_size=500):
+        """Delete one batch of orphaned rows, i.e. rows whose parent row no longer exists, from every table.
+        Parents are purged before their children, so the children of a purged parent are picked up by the
+        next batch.
+
+        Args:
+            batch_size (int): The maximum number of rows deleted per table.
+
+        Returns:
+            int: The number of deleted rows.
+        """
+        deleted = 0
+        statements = ORPHAN_PURGE_STATEMENTS + (ARCHIVE_ORPHAN_PURGE_STATEMENTS if self.has_archive() else ())
+        for statement in statements:
+            deleted += self.connection.execute(statement, (batch_size,)).rowcount
+        return deleted
+
     def get_user(self, id):
         """Retrieve a user from the database based on their ID.
 
@@ -195,7 +647,7 @@ class SQLiteRepository(AbstractRepository):
 
     def save_gym_log(self, gym_log: GymLog):
         """Save a gym log for a user by inserting the user ID into the `gym_logs` table and
-         saving associated workout and exercise plans.
+         saving associated workout and exercise plans and workouts.
 
         Args:
             gym_log (GymLog): The gym log object to be saved.
@@ -212,6 +664,11 @@ class SQLiteRepository(AbstractRepository):
         if gym_log.workout_plan:
             self.save_workout_plan(gym_log.workout_plan, gym_log.id)
 
+        for workout in gym_log.workout_list:
+            self.save_workout(workout, gym_log, refresh_next_workout=False)
+        self.refresh_next_workout(gym_log.id)
+        self.refresh_gym_log_snapshot(gym_log.id)
+
     def save_workout_plan(self, workout_plan: WorkoutPlan, gym_log_id):
         """Save a workout plan for a gym log by inserting the plan's name and
         associated gym log ID into the `workout_plans` table.
@@ -238,22 +695,26 @@ class SQLiteRepository(AbstractRepository):
         """
         for key in workout_plan.exercise_plan_dict.keys():
             self.connection.execute(
-                "INSERT INTO exercise_plans (workout_plan_id, exercise_key, name, sets, reps, initial_weight, "
+                "INSERT INTO exercise_plans (workout_plan_id, exercise_id, sets, reps, initial_weight, "
                 "progression)"
-                " VALUES (?,?,?,?,?,?,?)",
-                (workout_plan.id, key,
-                 workout_plan.exercise_plan_dict[key].name,
+                " VALUES (?,?,?,?,?,?)",
+                (workout_plan.id,
+                 self.exercise_id(key, workout_plan.exercise_plan_dict[key].name),
                  workout_plan.exercise_plan_dict[key].sets,
                  workout_plan.exercise_plan_dict[key].reps,
                  workout_plan.exercise_plan_dict[key].initial_weight,
                  workout_plan.exercise_plan_dict[key].progression)
             )
 
-    def load_gym_log(self, user: User):
+    def load_gym_log(self, user: User, recent_workouts=None):
         """Load a gym log for a user based on their ID.
 
+        The gym log is deserialized from its snapshot if the snapshot is current and holds the requested workouts,
+        so the common case is one read. Otherwise it is built from the relational tables.
+
         Args:
             user (User): The user object for which to load the gym log.
+            recent_workouts (Optional[int]): Only load this many of the most recent workouts. Defaults to all.
 
         Returns:
             GymLog: The loaded gym log object.
@@ -262,20 +723,118 @@ class SQLiteRepository(AbstractRepository):
             UserDoesNotHaveAGymLog: If the user does not have a gym log.
         """
         gym_log_db = self.connection.execute(
-            'SELECT * FROM gym_logs WHERE user_id = ?', (user.id,)
+            'SELECT gym_logs.id, gym_logs.user_id, gym_logs.version, snapshots.version AS snapshot_version, '
+            'snapshots.snapshot FROM gym_logs LEFT JOIN gym_log_snapshots AS snapshots '
+            'ON snapshots.gym_log_id = gym_logs.id WHERE gym_logs.user_id = ?', (user.id,)
         ).fetchone()
 
         if gym_log_db is None:
             raise UserDoesNotHaveAGymLog
 
+        if gym_log_db['snapshot_version'] == gym_log_db['version']:
+            snapshot = json.loads(gym_log_db['snapshot'])
+            workouts = snapshot['gym_log']['workouts']
+            if snapshot['complete'] or (recent_workouts is not None and recent_workouts <= len(workouts)):
+                if recent_workouts is not None:
+                    del workouts[:max(0, len(workouts) - recent_workouts)]
+                return GymLog.from_dict(snapshot['gym_log'])
+
         gym_log = GymLog(gym_log_db['user_id'], gym_log_db['id'])
 
-        if self.workout_plan_exist(gym_log.id):
-            workout_plan = self.load_workout_plan(gym_log.id)
+        workout_plan = self.load_workout_plan(gym_log.id)
+        if workout_plan is not None:
             gym_log.add_workout_plan(workout_plan)
 
+        if recent_workouts is None:
+            gym_log.workout_list = self.load_workouts(gym_log.id)
+        elif recent_workouts > 0:
+            gym_log.workout_list = list(islice(self.iter_workouts(gym_log.id, recent_workouts), recent_workouts))
+            gym_log.workout_list.reverse()
+
         return gym_log
 
+    def refresh_gym_log_snapshot(self, gym_log_id):
+        """Serialize the workout plan and the SNAPSHOT_WORKOUTS most recent workouts of a gym log into its snapshot,
+        stamped with the current version of the gym log. The snapshot is removed if the gym log does not exist.
+
+        Args:
+            gym_log_id: The ID of the gym log.
+        """
+        gym_log_db = self.connection.execute(
+            'SELECT user_id FROM gym_logs WHERE id = ?', (gym_log_id,)
+        ).fetchone()
+        if gym_log_db is None:
+            self.connection.execute('DELETE FROM gym_log_snapshots WHERE gym_log_id = ?', (gym_log_id,))
+            return
+        gym_log = GymLog(gym_log_db['user_id'], gym_log_id)
+        workout_plan = self.load_workout_plan(gym_log_id)
+        if workout_plan is not None:
+            gym_log.add_workout_plan(workout_plan)
+        # One workout more than is stored tells whether the snapshot holds the whole history
+        workouts = list(islice(self.iter_workouts(gym_log_id, SNAPSHOT_WORKOUTS + 1), SNAPSHOT_WORKOUTS + 1))
+        gym_log.workout_list = workouts[SNAPSHOT_WORKOUTS - 1::-1]
+        self._write_gym_log_snapshot(gym_log_id, {'complete': len(workouts) <= SNAPSHOT_WORKOUTS,
+                                                  'gym_log': gym_log.to_dict()})
+
+    def _current_gym_log_snapshot(self, gym_log_id):
+        """Return the deserialized snapshot of a gym log if it is current, otherwise None."""
+        row = self.connection.execute(
+            'SELECT gym_logs.version, snapshots.version AS snapshot_version, snapshots.snapshot FROM gym_logs '
+            'JOIN gym_log_snapshots AS snapshots ON snapshots.gym_log_id = gym_logs.id WHERE gym_logs.id = ?',
+            (gym_log_id,)
+        ).fetchone()
+        if row is None or row['version'] != row['snapshot_version']:
+            return None
+        return json.loads(row['snapshot'])
+
+    def _add_workout_to_gym_log_snapshot(self, gym_log_id, snapshot, workout: Workout):
+        """Add a saved workout to a snapshot that was current before the workout was saved, instead of rebuilding
+        the snapshot from the tables. The oldest workout is dropped once the snapshot holds more than
+        SNAPSHOT_WORKOUTS workouts.
+
+        Args:
+            gym_log_id: The ID of the gym log.
+            snapshot (dict): The snapshot.
+            workout (Workout): The saved workout.
+        """
+        workouts = snapshot['gym_log']['workouts']
+        entry = {'id': workout.id, 'date': workout.date.isoformat(' '),
+                 'exercises': {key: {'name': exercise['name'], 'weight': float(exercise['weight'])}
+                               for key, exercise in workout.exercise_session_dict.items()}}
+        position = bisect.bisect([(stored['date'], stored['id']) for stored in workouts], (entry['date'], entry['id']))
+        # A workout older than all stored workouts of an incomplete snapshot is not one of the most recent
+        if position > 0 or snapshot['complete']:
+            workouts.insert(position, entry)
+            if len(workouts) > SNAPSHOT_WORKOUTS:
+                del workouts[0]
+                snapshot['complete'] = False
+        self._write_gym_log_snapshot(gym_log_id, snapshot)
+
+    def _write_gym_log_snapshot(self, gym_log_id, snapshot):
+        """Store a snapshot, stamped with the current version of the gym log."""
+        self.connection.execute(
+            'INSERT OR REPLACE INTO gym_log_snapshots (gym_log_id, version, snapshot) '
+            'SELECT id, version, ? FROM gym_logs WHERE id = ?',
+            (json.dumps(snapshot, separators=(',', ':')), gym_log_id)
+        )
+
+    def rebuild_gym_log_snapshots(self):
+        """Rewrite the snapshots of all gym logs."""
+        for row in self.connection.execute('SELECT id FROM gym_logs').fetchall():
+            self.refresh_gym_log_snapshot(row['id'])
+
+    def gym_log_id(self, user: User):
+        """Return the ID of the gym log of a user.
+
+        Args:
+            user (User): The user.
+
+        Returns:
+            Optional[int]: The ID of the gym log, or None if the user does not have one.
+        """
+        row = self.connection.execute('SELECT id FROM gym_logs WHERE user_id = ?', (user.id,)).fetchone()
+        return None if row is None else row['id']
+
     def workout_plan_exist(self, gym_log_id):
         """Check if a workout plan exists for a given gym log ID.
 
@@ -293,7 +852,8 @@ class SQLiteRepository(AbstractRepository):
         return False
 
     def load_workout_plan(self, gym_log_id):
-        """Load a workout plan for a gym log based on the gym log ID.
+        """Load a workout plan for a gym log based on the gym log ID. If the plan was adopted from a plan template,
+        the exercise plans of the template are merged with the overrides of the user.
 
         Args:
             gym_log_id: The ID of the gym log.
@@ -306,8 +866,12 @@ class SQLiteRepository(AbstractRepository):
         ).fetchone()
         if workout_plan_db is None:
             return None
-        exercise_plan_dict = self.load_exercise_plan_dict(workout_plan_db['id'])
-        return WorkoutPlan(workout_plan_db['name'], exercise_plan_dict)
+        if workout_plan_db['template_id'] is not None:
+            exercise_plan_dict = self.load_template_exercise_plan_dict(workout_plan_db['template_id'],
+                                                                       workout_plan_db['id'])
+        else:
+            exercise_plan_dict = self.load_exercise_plan_dict(workout_plan_db['id'])
+        return WorkoutPlan(workout_plan_db['name'], exercise_plan_dict, workout_plan_db['id'])
 
     def load_exercise_plan_dict(self, workout_plan_id):
         """Load the exercise plans associated with a workout plan.
@@ -321,16 +885,30 @@ class SQLiteRepository(AbstractRepository):
         exercise_plan_dict_db = self.connection.execute(
             'SELECT * FROM exercise_plans WHERE workout_plan_id = ?', (workout_plan_id,)
         ).fetchall()
+        return self._exercise_plan_dict(exercise_plan_dict_db)
+
+    def _exercise_plan_dict(self, rows):
+        """Build an exercise plan dictionary from rows referencing the exercise dictionary.
+
+        Args:
+            rows (List[sqlite3.Row]): Rows with exercise_id, sets, reps, initial_weight and progression columns.
+
+        Returns:
+            dict: A dictionary mapping exercise keys to exercise plan objects.
+        """
+        exercises = self.exercises(row['exercise_id'] for row in rows)
         exercise_plan_dict = {}
-        for row in exercise_plan_dict_db:
-            exercise_plan_dict[row['exercise_key']] = \
-                ExercisePlan(name=row['name'], sets=row['sets'], reps=row['reps'],
+        for row in rows:
+            exercise_key, name = exercises[row['exercise_id']]
+            exercise_plan_dict[exercise_key] = \
+                ExercisePlan(name=name, sets=row['sets'], reps=row['reps'],
                              initial_weight=row['initial_weight'],
                              progression=row['progression'])
         return exercise_plan_dict
 
     def update_gym_log(self, gym_log: GymLog, user: User):
-        """Update a gym log for a user based on the provided gym log object.
+        """Update a gym log for a user based on the provided gym log object. Workouts that were added to the
+        gym log since it was loaded are saved.
 
         Args:
             gym_log (GymLog): The updated gym log object.
@@ -342,9 +920,15 @@ class SQLiteRepository(AbstractRepository):
         )
         if gym_log.workout_plan:
             self.update_workout_plan(gym_log.workout_plan, gym_log.id)
+        for workout in gym_log.workout_list:
+            if workout.id is None:
+                self.save_workout(workout, gym_log, refresh_next_workout=False)
+        self.refresh_next_workout(gym_log.id)
+        self.refresh_gym_log_snapshot(gym_log.id)
 
     def update_workout_plan(self, workout_plan: WorkoutPlan, gym_log_id):
-        """Update a workout plan for a gym log based on the provided workout plan object.
+        """Update a workout plan for a gym log based on the provided workout plan object. For a plan adopted from
+        a plan template only the differences to the template are written.
 
         Args:
             workout_plan (WorkoutPlan): The updated workout plan object.
@@ -354,7 +938,13 @@ class SQLiteRepository(AbstractRepository):
             'UPDATE workout_plans SET name = ? WHERE gym_log_id = ?',
             (workout_plan.name, gym_log_id)
         )
-        self.update_exercise_plan(workout_plan)
+        workout_plan_db = self.connection.execute(
+            'SELECT id, template_id FROM workout_plans WHERE gym_log_id = ?', (gym_log_id,)
+        ).fetchone()
+        if workout_plan_db is not None and workout_plan_db['template_id'] is not None:
+            self.update_exercise_plan_overrides(workout_plan, workout_plan_db['template_id'], workout_plan_db['id'])
+        else:
+            self.update_exercise_plan(workout_plan)
 
     def update_exercise_plan(self, workout_plan: WorkoutPlan):
         """Update individual exercise plans for a workout plan based on the provided workout plan object.
@@ -364,9 +954,9 @@ class SQLiteRepository(AbstractRepository):
         """
         for key in workout_plan.exercise_plan_dict.keys():
             self.connection.execute(
-                'UPDATE exercise_plans SET name = ?, sets = ?, reps = ?, initial_weight = ?, progression = ? '
-                'WHERE workout_plan_id = ? AND exercise_key = ?',
-                (workout_plan.exercise_plan_dict[key].name,
+                'UPDATE exercise_plans SET exercise_id = ?, sets = ?, reps = ?, initial_weight = ?, progression = ? '
+                'WHERE workout_plan_id = ? AND exercise_id IN (SELECT id FROM exercises WHERE exercise_key = ?)',
+                (self.exercise_id(key, workout_plan.exercise_plan_dict[key].name),
                  workout_plan.exercise_plan_dict[key].sets,
                  workout_plan.exercise_plan_dict[key].reps,
                  workout_plan.exercise_plan_dict[key].initial_weight,
@@ -374,3 +964,858 @@ class SQLiteRepository(AbstractRepository):
                  workout_plan.id, key)
             )
 
+    def publish_plan_template(self, workout_plan: WorkoutPlan):
+        """Publish a workout plan into the shared catalog of plan templates. Templates are immutable and identified
+        by the content hash of the plan, so publishing the same plan twice returns the existing template.
+
+        Args:
+            workout_plan (WorkoutPlan): The workout plan to be published.
+
+        Returns:
+            int: The ID of the plan template.
+        """
+        content_hash = workout_plan.content_hash()
+        cursor = self.connection.execute(
+            'INSERT OR IGNORE INTO plan_templates (content_hash, name) VALUES (?, ?)',
+            (content_hash, workout_plan.name)
+        )
+        if cursor.rowcount == 0:
+            return self.connection.execute(
+                'SELECT id FROM plan_templates WHERE content_hash = ?', (content_hash,)
+            ).fetchone()['id']
+        template_id = cursor.lastrowid
+        self.connection.executemany(
+            'INSERT INTO plan_template_exercises (template_id, exercise_id, sets, reps, initial_weight, '
+            'progression) VALUES (?, ?, ?, ?, ?, ?)',
+            [(template_id, self.exercise_id(key, exercise.name), exercise.sets, exercise.reps,
+              exercise.initial_weight, exercise.progression)
+             for key, exercise in workout_plan.exercise_plan_dict.items()]
+        )
+        return template_id
+
+    def load_plan_template(self, template_id):
+        """Load a plan template from the catalog.
+
+        Args:
+            template_id: The ID of the plan template.
+
+        Returns:
+            WorkoutPlan: The plan template, or None if not found.
+        """
+        template_db = self.connection.execute(
+            'SELECT * FROM plan_templates WHERE id = ?', (template_id,)
+        ).fetchone()
+        if template_db is None:
+            return None
+        return WorkoutPlan(template_db['name'], self.load_template_exercise_plan_dict(template_id))
+
+    def load_template_exercise_plan_dict(self, template_id, workout_plan_id=None):
+        """Load the exercise plans of a plan template, merged with the overrides of a workout plan.
+
+        Args:
+            template_id: The ID of the plan template.
+            workout_plan_id (optional): The ID of the workout plan whose overrides are applied.
+
+        Returns:
+            dict: A dictionary mapping exercise keys to exercise plan objects.
+        """
+        rows = self.connection.execute(
+            'SELECT template.exercise_id, '
+            'COALESCE(overrides.sets, template.sets) AS sets, '
+            'COALESCE(overrides.reps, template.reps) AS reps, '
+            'COALESCE(overrides.initial_weight, template.initial_weight) AS initial_weight, '
+            'COALESCE(overrides.progression, template.progression) AS progression '
+            'FROM plan_template_exercises AS template '
+            'LEFT JOIN exercise_plan_overrides AS overrides '
+            'ON overrides.workout_plan_id = ? AND overrides.exercise_id = template.exercise_id '
+            'WHERE template.template_id = ?',
+            (workout_plan_id, template_id)
+        ).fetchall()
+        return self._exercise_plan_dict(rows)
+
+    def adopt_plan_template(self, gym_log: GymLog, template_id):
+        """Make a plan template the workout plan of a gym log. Only a reference to the template is stored, so the
+        cost of adopting does not depend on the size of the plan. A previous workout plan of the gym log is
+        replaced.
+
+        Args:
+            gym_log (GymLog): The gym log adopting the template.
+            template_id: The ID of the plan template.
+        """
+        self.delete_workout_plan(gym_log.id)
+        workout_plan = self.load_plan_template(template_id)
+        cursor = self.connection.execute(
+            'INSERT INTO workout_plans (name, gym_log_id, template_id) VALUES (?, ?, ?)',
+            (workout_plan.name, gym_log.id, template_id)
+        )
+        workout_plan.add_id(cursor.lastrowid)
+        gym_log.add_workout_plan(workout_plan)
+        self.refresh_next_workout(gym_log.id)
+        self.refresh_gym_log_snapshot(gym_log.id)
+
+    def replace_workout_plan(self, gym_log: GymLog, workout_plan: WorkoutPlan):
+        """Make a new workout plan the workout plan of a gym log, replacing its previous workout plan. Unlike
+        `update_workout_plan`, exercises may be added and removed.
+
+        Args:
+            gym_log (GymLog): The gym log.
+            workout_plan (WorkoutPlan): The new workout plan.
+        """
+        self.delete_workout_plan(gym_log.id)
+        self.save_workout_plan(workout_plan, gym_log.id)
+        gym_log.add_workout_plan(workout_plan)
+        self.refresh_next_workout(gym_log.id)
+        self.refresh_gym_log_snapshot(gym_log.id)
+
+    def delete_workout_plan(self, gym_log_id):
+        """Delete the workout plan of a gym log together with its exercise plans and overrides.
+
+        Args:
+            gym_log_id: The ID of the gym log.
+        """
+        workout_plan_ids = 'SELECT id FROM workout_plans WHERE gym_log_id = ?'
+        self.connection.execute(
+            f'DELETE FROM exercise_plans WHERE workout_plan_id IN ({workout_plan_ids})', (gym_log_id,)
+        )
+        self.connection.execute(
+            f'DELETE FROM exercise_plan_overrides WHERE workout_plan_id IN ({workout_plan_ids})', (gym_log_id,)
+        )
+        self.connection.execute('DELETE FROM workout_plans WHERE gym_log_id = ?', (gym_log_id,))
+
+    def update_exercise_plan_overrides(self, workout_plan: WorkoutPlan, template_id, workout_plan_id):
+        """Store the fields in which the exercise plans of a workout plan differ from its plan template.
+        Exercises equal to the template have no override row. Overrides cannot express added or removed exercises
+        or changed exercise names, as templates are immutable, so such an edit detaches the workout plan from the
+        template instead, see `detach_plan_template`.
+
+        Args:
+            workout_plan (WorkoutPlan): The workout plan object containing the updated exercise plans.
+            template_id: The ID of the plan template the workout plan was adopted from.
+            workout_plan_id: The ID of the workout plan.
+        """
+        template_exercise_plan_dict = self.load_template_exercise_plan_dict(template_id)
+        if workout_plan.exercise_plan_dict.keys() != template_exercise_plan_dict.keys() or any(
+                exercise_plan.name != template_exercise_plan_dict[key].name
+                for key, exercise_plan in workout_plan.exercise_plan_dict.items()):
+            self.detach_plan_template(workout_plan, workout_plan_id)
+            return
+        for key, exercise_plan in workout_plan.exercise_plan_dict.items():
+            template_exercise_plan = template_exercise_plan_dict[key]
+            exercise_id = self.exercise_id(key, template_exercise_plan.name)
+            values = [getattr(exercise_plan, field)
+                      if getattr(exercise_plan, field) != getattr(template_exercise_plan, field) else None
+                      for field in OVERRIDABLE_FIELDS]
+            if all(value is None for value in values):
+                self.connection.execute(
+                    'DELETE FROM exercise_plan_overrides WHERE workout_plan_id = ? AND exercise_id = ?',
+                    (workout_plan_id, exercise_id)
+                )
+            else:
+                self.connection.execute(
+                    'INSERT OR REPLACE INTO exercise_plan_overrides (workout_plan_id, exercise_id, sets, reps, '
+                    'initial_weight, progression) VALUES (?, ?, ?, ?, ?, ?)',
+                    (workout_plan_id, exercise_id, *values)
+                )
+
+    def detach_plan_template(self, workout_plan: WorkoutPlan, workout_plan_id):
+        """Turn a workout plan adopted from a plan template into a plan of its own. The reference to the template
+        and the overrides are removed and all exercise plans of `workout_plan` are written to `exercise_plans`.
+
+        Args:
+            workout_plan (WorkoutPlan): The workout plan object containing the exercise plans.
+            workout_plan_id: The ID of the workout plan.
+        """
+        self.connection.execute('DELETE FROM exercise_plan_overrides WHERE workout_plan_id = ?', (workout_plan_id,))
+        self.connection.execute('UPDATE workout_plans SET template_id = NULL WHERE id = ?', (workout_plan_id,))
+        workout_plan.add_id(workout_plan_id)
+        self.save_exercise_plan(workout_plan)
+
+    def save_workout(self, workout: Workout, gym_log: GymLog, refresh_next_workout=True, duplicate_window=None):
+        """Save a workout of a gym log into the `workouts` and `workout_exercises` tables and update the
+        leaderboard aggregates, the rollups, the next workout and the snapshot of the gym log. The sets and reps of
+        every exercise are taken from the workout plan of the gym log, so the volume of the workout stays correct
+        when the plan changes later.
+
+        Args:
+            workout (Workout): The workout to be saved.
+            gym_log (GymLog): The gym log the workout belongs to.
+            refresh_next_workout (bool): Recompute the next workout and the snapshot. Callers saving many workouts
+                at once refresh them once at the end instead.
+            duplicate_window (Optional[timedelta]): If set, the workout is not saved when the gym log has a workout
+                with the same exercises dated at most this far from it, e.g. a form that was submitted twice. The
+                workout then gets the ID of that workout.
+
+        Returns:
+            bool: True if the workout was saved, False if it was a duplicate.
+        """
+        content_hash = workout.content_hash()
+        if duplicate_window is not None:
+            duplicate_id = self.find_duplicate_workout(gym_log.id, workout, duplicate_window, content_hash)
+            if duplicate_id is not None:
+                workout.add_id(duplicate_id)
+                return False
+        snapshot = self._current_gym_log_snapshot(gym_log.id) if refresh_next_workout else None
+        cursor = self.connection.execute(
+            'INSERT INTO workouts (gym_log_id, date, content_hash) VALUES (?, ?, ?)',
+            (gym_log.id, workout.date.isoformat(' '), content_hash)
+        )
+        workout.add_id(cursor.lastrowid)
+        exercise_plan_dict = gym_log.workout_plan.exercise_plan_dict if gym_log.workout_plan else {}
+        rows = []
+        for key, exercise in workout.exercise_session_dict.items():
+            exercise_plan = exercise_plan_dict.get(key)
+            rows.append((workout.id, self.exercise_id(key, exercise['name']),
+                         exercise_plan.sets if exercise_plan else 0,
+                         exercise_plan.reps if exercise_plan else 0,
+                         exercise['weight']))
+        self.connection.executemany(
+            'INSERT INTO workout_exercises (workout_id, exercise_id, sets, reps, weight) '
+            'VALUES (?, ?, ?, ?, ?)',
+            rows
+        )
+        self.update_leaderboards(workout.id)
+        self.update_rollups(workout.id)
+        if refresh_next_workout:
+            self.refresh_next_workout(gym_log.id)
+            if snapshot is None:
+                self.refresh_gym_log_snapshot(gym_log.id)
+            else:
+                self._add_workout_to_gym_log_snapshot(gym_log.id, snapshot, workout)
+        return True
+
+    def find_duplicate_workout(self, gym_log_id, workout: Workout, window=timedelta(0), content_hash=None):
+        """Find a saved or archived workout of a gym log with the same exercises as a workout, dated at most
+        `window` before or after it. Every schema is searched with one range scan of the content hash index.
+
+        Args:
+            gym_log_id: The ID of the gym log.
+            workout (Workout): The workout.
+            window (timedelta): The maximum distance of the dates. Zero only finds workouts of the same date.
+            content_hash (Optional[int]): The content hash of the workout, if it was already computed.
+
+        Returns:
+            Optional[int]: The ID of the earliest duplicate, or None.
+        """
+        parameters = (gym_log_id, workout.content_hash() if content_hash is None else content_hash,
+                      (workout.date - window).isoformat(' '), (workout.date + window).isoformat(' '))
+        for schema in self._workout_schemas():
+            row = self.connection.execute(
+                f'SELECT id FROM {schema}.workouts WHERE gym_log_id = ? AND content_hash = ? '
+                'AND date BETWEEN ? AND ? ORDER BY date, id LIMIT 1',
+                parameters
+            ).fetchone()
+            if row is not None:
+                return row['id']
+        return None
+
+    def import_workouts(self, workouts: List[Workout], gym_log: GymLog):
+        """Save a batch of past workouts of a gym log, e.g. an exported history, skipping every workout that has
+        the same date and exercises as a saved workout or an earlier workout of the batch. Re-importing a history
+        therefore saves nothing. The next workout and the snapshot are refreshed once at the end.
+
+        Args:
+            workouts (List[Workout]): The workouts.
+            gym_log (GymLog): The gym log the workouts belong to.
+
+        Returns:
+            int: The number of saved workouts.
+        """
+        saved = sum(self.save_workout(workout, gym_log, refresh_next_workout=False, duplicate_window=timedelta(0))
+                    for workout in workouts)
+        if saved:
+            self.refresh_next_workout(gym_log.id)
+            self.refresh_gym_log_snapshot(gym_log.id)
+        return saved
+
+    def hash_workouts(self, batch_size=500):
+        """Compute the content hash of one batch of saved workouts that do not have one yet, i.e. workouts that
+        were migrated or copied from databases without the column.
+
+        Args:
+            batch_size (int): The maximum number of workouts hashed.
+
+        Returns:
+            int: The number of hashed workouts.
+        """
+        hashed = 0
+        for schema in self._workout_schemas():
+            rows = self.connection.execute(
+                'SELECT workouts.id, workout_exercises.exercise_id, workout_exercises.weight '
+                f'FROM (SELECT id FROM {schema}.workouts WHERE content_hash IS NULL LIMIT ?) AS workouts '
+                f'LEFT JOIN {schema}.workout_exercises AS workout_exercises '
+                'ON workout_exercises.workout_id = workouts.id',
+                (batch_size - hashed,)
+            ).fetchall()
+            exercises = self.exercises(row['exercise_id'] for row in rows if row['exercise_id'] is not None)
+            workouts = {}
+            for row in rows:
+                workout = workouts.setdefault(row['id'], Workout({}, id=row['id']))
+                if row['exercise_id'] is not None:
+                    exercise_key, name = exercises[row['exercise_id']]
+                    workout.exercise_session_dict[exercise_key] = {'name': name, 'weight': row['weight']}
+            self.connection.executemany(
+                f'UPDATE {schema}.workouts SET content_hash = ? WHERE id = ?',
+                [(workout.content_hash(), workout.id) for workout in workouts.values()]
+            )
+            hashed += len(workouts)
+            if hashed == batch_size:
+                break
+        return hashed
+
+    def collapse_duplicate_workouts(self, window=timedelta(0), batch_size=500, after=None):
+        """Delete the duplicates among the saved workouts of one batch of groups of workouts with the same gym log
+        and content hash. In every group, a workout dated at most `window` after the workout it duplicates is
+        deleted and its sets are moved to that workout. Groups are visited in index order, so the batches resume
+        after the last group of the previous batch. The next workouts and snapshots of the affected gym logs are
+        refreshed; the leaderboard aggregates and rollups have to be rebuilt once all batches are done.
+
+        Args:
+            window (timedelta): The maximum distance of the dates of duplicates.
+            batch_size (int): The maximum number of groups visited.
+            after (Optional[Tuple[int, int]]): The gym log ID and content hash of the last group of the previous
+                batch.
+
+        Returns:
+            Tuple[int, Optional[Tuple[int, int]]]: The number of deleted workouts and the last group of the batch,
+            which is None once all groups were visited.
+        """
+        groups = self.connection.execute(
+            'SELECT gym_log_id, content_hash FROM main.workouts WHERE content_hash IS NOT NULL '
+            f'{"AND (gym_log_id, content_hash) > (?, ?) " if after else ""}'
+            'GROUP BY gym_log_id, content_hash HAVING COUNT(*) > 1 ORDER BY gym_log_id, content_hash LIMIT ?',
+            (*(after or ()), batch_size)
+        ).fetchall()
+        duplicates = {}
+        for group in groups:
+            kept = None
+            for row in self.connection.execute(
+                    'SELECT id, date FROM main.workouts WHERE gym_log_id = ? AND content_hash = ? ORDER BY date, id',
+                    (group['gym_log_id'], group['content_hash'])):
+                date = parse_date(row['date'])
+                if kept is not None and date - kept[1] <= window:
+                    duplicates[row['id']] = kept[0]
+                else:
+                    kept = (row['id'], date)
+        if duplicates:
+            self.connection.executemany(
+                'UPDATE OR IGNORE main.workout_sets SET workout_id = ? WHERE workout_id = ?',
+                [(kept_id, duplicate_id) for duplicate_id, kept_id in duplicates.items()]
+            )
+            workout_ids = ', '.join(str(workout_id) for workout_id in duplicates)
+            self.connection.execute(f'DELETE FROM main.workout_sets WHERE workout_id IN ({workout_ids})')
+            self.connection.execute(f'DELETE FROM main.workout_exercises WHERE workout_id IN ({workout_ids})')
+            self.connection.execute(f'DELETE FROM main.workouts WHERE id IN ({workout_ids})')
+            for gym_log_id in {group['gym_log_id'] for group in groups}:
+                self.refresh_next_workout(gym_log_id)
+                self.refresh_gym_log_snapshot(gym_log_id)
+        last = (groups[-1]['gym_log_id'], groups[-1]['content_hash']) if len(groups) == batch_size else None
+        return len(duplicates), last
+
+    def has_archive(self):
+        """Return whether the archive database of old workouts is attached to the connection as `archive`."""
+        if self._has_archive is None:
+            self._has_archive = any(row[1] == 'archive' for row in self.connection.execute('PRAGMA database_list'))
+        return self._has_archive
+
+    def _workout_schemas(self):
+        """Return the schemas holding workouts: `main` and, if it is attached, `archive`."""
+        return ('main', 'archive') if self.has_archive() else ('main',)
+
+    def load_workouts(self, gym_log_id):
+        """Load all workouts of a gym log ordered by date, including the archived workouts.
+
+        Args:
+            gym_log_id: The ID of the gym log.
+
+        Returns:
+            List[Workout]: The loaded workouts.
+        """
+        return list(heapq.merge(*(self._load_workouts(gym_log_id, schema) for schema in self._workout_schemas()),
+                                key=workout_order))
+
+    def _load_workouts(self, gym_log_id, schema):
+        """Load the workouts of a gym log stored in `schema`, ordered by date."""
+        rows = self.connection.execute(
+            'SELECT workouts.id, workouts.date, workout_exercises.exercise_id, workout_exercises.weight '
+            f'FROM {schema}.workouts AS workouts '
+            f'LEFT JOIN {schema}.workout_exercises AS workout_exercises ON workout_exercises.workout_id = workouts.id '
+            'WHERE workouts.gym_log_id = ? ORDER BY workouts.date, workouts.id',
+            (gym_log_id,)
+        ).fetchall()
+        exercises = self.exercises(row['exercise_id'] for row in rows if row['exercise_id'] is not None)
+        workouts = {}
+        for row in rows:
+            workout = workouts.get(row['id'])
+            if workout is None:
+                workout = Workout({}, date=parse_date(row['date']), id=row['id'])
+                workouts[row['id']] = workout
+            if row['exercise_id'] is not None:
+                exercise_key, name = exercises[row['exercise_id']]
+                workout.exercise_session_dict[exercise_key] = {'name': name, 'weight': row['weight']}
+        return list(workouts.values())
+
+    def iter_workouts(self, gym_log_id, page_size=100):
+        """Iterate over the workouts of a gym log, newest first, reading them one page at a time.
+
+        Pages are selected by keyset pagination on (date, id), so every page is an index range scan and only one
+        page of workouts is held in memory and no statement is left open between pages. The hot and the archived
+        workouts are merged, so the archive is read from its first page on, but a reader that stops early only
+        reads one page of it.
+
+        Args:
+            gym_log_id: The ID of the gym log.
+            page_size (int): The number of workouts read per query.
+
+        Yields:
+            Workout: The workouts of the gym log ordered by date, newest first.
+        """
+        yield from heapq.merge(*(self._iter_workouts(gym_log_id, page_size, schema)
+                                 for schema in self._workout_schemas()), key=workout_order, reverse=True)
+
+    def _iter_workouts(self, gym_log_id, page_size, schema):
+        """Iterate over the workouts of a gym log stored in `schema`, newest first, see `iter_workouts`."""
+        query = ('SELECT page.id, page.date, page.date_key, workout_exercises.exercise_id, workout_exercises.weight '
+                 'FROM (SELECT id, date, CAST(date AS TEXT) AS date_key '
+                 f'      FROM {schema}.workouts WHERE gym_log_id = ? {{after}} '
+                 '      ORDER BY date DESC, id DESC LIMIT ?) AS page '
+                 f'LEFT JOIN {schema}.workout_exercises AS workout_exercises '
+                 'ON workout_exercises.workout_id = page.id '
+                 'ORDER BY page.date DESC, page.id DESC, workout_exercises.id')
+        rows = self.connection.execute(query.format(after=''), (gym_log_id, page_size)).fetchall()
+        while rows:
+            exercises = self.exercises(row['exercise_id'] for row in rows if row['exercise_id'] is not None)
+            workout = None
+            for row in rows:
+                if workout is None or workout.id != row['id']:
+                    if workout is not None:
+                        yield workout
+                    workout = Workout({}, date=parse_date(row['date']), id=row['id'])
+                if row['exercise_id'] is not None:
+                    exercise_key, name = exercises[row['exercise_id']]
+                    workout.exercise_session_dict[exercise_key] = {'name': name, 'weight': row['weight']}
+            yield workout
+            rows = self.connection.execute(
+                query.format(after='AND (date, id) < (?, ?)'),
+                (gym_log_id, rows[-1]['date_key'], rows[-1]['id'], page_size)
+            ).fetchall()
+
+    def archive_workouts(self, before, batch_size=500):
+        """Move one batch of workouts dated before `before` with their exercises and sets from the hot tables into the
+        archive database, keeping their IDs. The latest workout of every gym log stays in the hot tables, since the
+        next workout is computed from it. The next workouts and snapshots of the affected gym logs are refreshed.
+        The leaderboard aggregates and rollups are kept, and their rebuilds include the archive.
+
+        Args:
+            before (datetime): The date before which workouts are archived.
+            batch_size (int): The maximum number of workouts moved.
+
+        Returns:
+            int: The number of archived workouts.
+        """
+        rows = self.connection.execute(
+            'SELECT id, gym_log_id FROM main.workouts AS workouts WHERE date < ? AND EXISTS ('
+            '  SELECT 1 FROM main.workouts AS newer WHERE newer.gym_log_id = workouts.gym_log_id '
+            '  AND (newer.date, newer.id) > (workouts.date, workouts.id)) '
+            'LIMIT ?',
+            (before.isoformat(' '), batch_size)
+        ).fetchall()
+        if not rows:
+            return 0
+        workout_ids = ', '.join(str(row['id']) for row in rows)
+        self.connection.execute(
+            'INSERT INTO archive.workouts (id, gym_log_id, date, content_hash) '
+            f'SELECT id, gym_log_id, date, content_hash FROM main.workouts WHERE id IN ({workout_ids})'
+        )
+        self.connection.execute(
+            'INSERT INTO archive.workout_exercises (id, workout_id, exercise_id, sets, reps, weight) '
+            'SELECT id, workout_id, exercise_id, sets, reps, weight FROM main.workout_exercises '
+            f'WHERE workout_id IN ({workout_ids})'
+        )
+        self.connection.execute(
+            'INSERT INTO archive.workout_sets (id, workout_id, exercise_id, event_id, reps, weight, performed_at) '
+            'SELECT id, workout_id, exercise_id, event_id, reps, weight, performed_at FROM main.workout_sets '
+            f'WHERE workout_id IN ({workout_ids})'
+        )
+        self.connection.execute(f'DELETE FROM main.workout_exercises WHERE workout_id IN ({workout_ids})')
+        self.connection.execute(f'DELETE FROM main.workout_sets WHERE workout_id IN ({workout_ids})')
+        self.connection.execute(f'DELETE FROM main.workouts WHERE id IN ({workout_ids})')
+        for gym_log_id in {row['gym_log_id'] for row in rows}:
+            self.refresh_next_workout(gym_log_id)
+            self.refresh_gym_log_snapshot(gym_log_id)
+        return len(rows)
+
+    def clear_archive(self):
+        """Delete all archived workouts, e.g. after the database was recreated."""
+        if self.has_archive():
+            self.connection.execute('DELETE FROM archive.workout_sets')
+            self.connection.execute('DELETE FROM archive.workout_exercises')
+            self.connection.execute('DELETE FROM archive.workouts')
+
+    def _workout_schema(self, gym_log_id, workout_id):
+        """Return the schema holding a workout of a gym log.
+
+        Raises:
+            WorkoutNotFoundError: If the gym log has no workout with the ID.
+        """
+        for schema in self._workout_schemas():
+            if self.connection.execute(f'SELECT 1 FROM {schema}.workouts WHERE id = ? AND gym_log_id = ?',
+                                       (workout_id, gym_log_id)).fetchone():
+                return schema
+        raise WorkoutNotFoundError
+
+    def append_workout_sets(self, gym_log_id, workout_id, workout_sets: List[WorkoutSet]):
+        """Append a batch of sets to a workout with one `executemany`. Sets whose event ID was already stored for
+        the workout are skipped, so a batch can be sent again safely.
+
+        Args:
+            gym_log_id: The ID of the gym log the workout belongs to.
+            workout_id: The ID of the workout.
+            workout_sets (List[WorkoutSet]): The sets.
+
+        Returns:
+            int: The number of sets that were stored, leaving out the duplicates.
+
+        Raises:
+            WorkoutNotFoundError: If the gym log has no workout with the ID.
+            ExerciseNotInWorkoutError: If a set is of an exercise that is not part of the workout.
+        """
+        schema = self._workout_schema(gym_log_id, workout_id)
+        exercise_ids = self._workout_exercise_ids(schema, workout_id)
+        rows = []
+        for workout_set in workout_sets:
+            if workout_set.exercise_key not in exercise_ids:
+                raise ExerciseNotInWorkoutError(workout_set.exercise_key)
+            rows.append((workout_id, exercise_ids[workout_set.exercise_key], workout_set.event_id, workout_set.reps,
+                         workout_set.weight, workout_set.performed_at.isoformat(' ')))
+        changes = self.connection.total_changes
+        self.connection.executemany(
+            f'INSERT INTO {schema}.workout_sets (workout_id, exercise_id, event_id, reps, weight, performed_at) '
+            'VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (workout_id, event_id) DO NOTHING',
+            rows
+        )
+        return self.connection.total_changes - changes
+
+    def load_workout_sets(self, gym_log_id, workout_id):
+        """Load the sets of a workout in the order they were done.
+
+        Args:
+            gym_log_id: The ID of the gym log the workout belongs to.
+            workout_id: The ID of the workout.
+
+        Returns:
+            List[WorkoutSet]: The sets.
+
+        Raises:
+            WorkoutNotFoundError: If the gym log has no workout with the ID.
+        """
+        schema = self._workout_schema(gym_log_id, workout_id)
+        rows = self.connection.execute(
+            f'SELECT exercise_id, event_id, reps, weight, performed_at FROM {schema}.workout_sets '
+            'WHERE workout_id = ? ORDER BY performed_at, id',
+            (workout_id,)
+        ).fetchall()
+        exercises = self.exercises(row['exercise_id'] for row in rows)
+        return [WorkoutSet(row['event_id'], exercises[row['exercise_id']][0], row['reps'], row['weight'],
+                           parse_date(row['performed_at'])) for row in rows]
+
+    def _workout_exercise_ids(self, schema, workout_id):
+        """Return the exercise IDs of the exercises of a workout by exercise key."""
+        rows = self.connection.execute(
+            f'SELECT exercise_id FROM {schema}.workout_exercises WHERE workout_id = ?', (workout_id,)
+        ).fetchall()
+        exercises = self.exercises(row['exercise_id'] for row in rows)
+        return {exercises[row['exercise_id']][0]: row['exercise_id'] for row in rows}
+
+    def load_latest_workout(self, gym_log_id):
+        """Load the most recent workout of a gym log.
+
+        Args:
+            gym_log_id: The ID of the gym log.
+
+        Returns:
+            Optional[Workout]: The latest workout, or None if the gym log has no workouts.
+        """
+        rows = self.connection.execute(
+            'SELECT workouts.id, workouts.date, workout_exercises.exercise_id, workout_exercises.weight '
+            'FROM workouts LEFT JOIN workout_exercises ON workout_exercises.workout_id = workouts.id '
+            'WHERE workouts.id = (SELECT id FROM workouts WHERE gym_log_id = ? ORDER BY date DESC, id DESC LIMIT 1)',
+            (gym_log_id,)
+        ).fetchall()
+        if not rows:
+            return None
+        exercises = self.exercises(row['exercise_id'] for row in rows if row['exercise_id'] is not None)
+        workout = Workout({}, date=parse_date(rows[0]['date']), id=rows[0]['id'])
+        for row in rows:
+            if row['exercise_id'] is not None:
+                exercise_key, name = exercises[row['exercise_id']]
+                workout.exercise_session_dict[exercise_key] = {'name': name, 'weight': row['weight']}
+        return workout
+
+    def refresh_next_workout(self, gym_log_id):
+        """Compute the next workout of a gym log from its workout plan and latest workout and store it in the
+        `next_workouts` table. The stored row is removed if the gym log has no workout plan.
+
+        Args:
+            gym_log_id: The ID of the gym log.
+
+        Returns:
+            Optional[Tuple[GymLog, Workout]]: See `load_next_workout`.
+        """
+        gym_log_db = self.connection.execute('SELECT user_id FROM gym_logs WHERE id = ?', (gym_log_id,)).fetchone()
+        workout_plan = self.load_workout_plan(gym_log_id)
+        if gym_log_db is None or workout_plan is None:
+            self.connection.execute('DELETE FROM next_workouts WHERE gym_log_id = ?', (gym_log_id,))
+            return None
+        workout = workout_plan.create_workout(self.load_latest_workout(gym_log_id))
+        content = {
+            'plan': {'id': workout_plan.id, 'name': workout_plan.name,
+                     'exercises': {key: [exercise.name, exercise.sets, exercise.reps, exercise.initial_weight,
+                                         exercise.progression]
+                                   for key, exercise in workout_plan.exercise_plan_dict.items()}},
+            'weights': {key: exercise['weight'] for key, exercise in workout.exercise_session_dict.items()},
+        }
+        self.connection.execute(
+            'INSERT OR REPLACE INTO next_workouts (user_id, gym_log_id, workout) VALUES (?, ?, ?)',
+            (gym_log_db['user_id'], gym_log_id, json.dumps(content))
+        )
+        gym_log = GymLog(gym_log_db['user_id'], gym_log_id)
+        gym_log.add_workout_plan(workout_plan)
+        return gym_log, workout
+
+    def load_next_workout(self, user: User):
+        """Load the stored next workout of a user with one primary key read.
+
+        Args:
+            user (User): The user.
+
+        Returns:
+            Optional[Tuple[GymLog, Workout]]: The gym log, holding the workout plan but no workouts, and the next
+            workout, or None if no next workout is stored, e.g. because it was invalidated. Use
+            `refresh_next_workout` to compute it then.
+        """
+        row = self.connection.execute(
+            'SELECT gym_log_id, workout FROM next_workouts WHERE user_id = ?', (user.id,)
+        ).fetchone()
+        if row is None:
+            return None
+        content = json.loads(row['workout'])
+        plan = content['plan']
+        exercise_plan_dict = {key: ExercisePlan(*values) for key, values in plan['exercises'].items()}
+        gym_log = GymLog(user.id, row['gym_log_id'])
+        gym_log.add_workout_plan(WorkoutPlan(plan['name'], exercise_plan_dict, plan['id']))
+        workout = Workout({key: {'name': exercise_plan_dict[key].name, 'weight': weight}
+                           for key, weight in content['weights'].items()})
+        return gym_log, workout
+
+    def update_leaderboards(self, workout_id):
+        """Add a saved workout to the leaderboard aggregates of its user.
+
+        Args:
+            workout_id: The ID of the workout.
+        """
+        for statement in LEADERBOARD_STATEMENTS:
+            self.connection.execute(statement.format(filter='workouts.id = ?'), (workout_id,))
+
+    def rebuild_leaderboards(self):
+        """Recompute all leaderboard aggregates from the saved and archived workouts, e.g. after a backfill."""
+        for table in LEADERBOARD_TABLES:
+            self.connection.execute(f'DELETE FROM {table}')
+        for statement in self._with_archive(LEADERBOARD_STATEMENTS):
+            self.connection.execute(statement.format(filter='true'))
+
+    def update_rollups(self, workout_id):
+        """Add a saved workout to the daily, weekly and monthly rollups of its user.
+
+        Args:
+            workout_id: The ID of the workout.
+        """
+        for statement in ROLLUP_STATEMENTS:
+            self.connection.execute(statement.format(filter='workouts.id = ?'), (workout_id,))
+
+    def rebuild_rollups(self):
+        """Recompute all rollups from the saved and archived workouts, e.g. after a backfill."""
+        for table in ROLLUP_TABLES:
+            self.connection.execute(f'DELETE FROM {table}')
+        for statement in self._with_archive(ROLLUP_STATEMENTS):
+            self.connection.execute(statement.format(filter='true'))
+
+    def _with_archive(self, statements):
+        """Return aggregate statements over the archived workouts followed by `statements` over the hot ones. The
+        archived workouts are older, so the aggregates are still built in date order."""
+        if not self.has_archive():
+            return statements
+        archived = tuple(ARCHIVED_TABLES.sub(r'archive.\1', statement) for statement in statements)
+        return archived + tuple(statements)
+
+    def load_progress(self, user: User, exercise_key, name, start, end, max_points=300):
+        """Load the progress of a user on an exercise between two dates for a chart. The finest rollup bucket
+        with at most `max_points` periods in the range is read, e.g. weeks for a range of five years, so the
+        number of rows read does not grow with the number of workouts.
+
+        Args:
+            user (User): The user.
+            exercise_key (str): The key of the exercise in the exercise plan dictionary.
+            name (str): The name of the exercise.
+            start (datetime or date): The first day of the range.
+            end (datetime or date): The last day of the range.
+            max_points (int): The maximum number of periods of the chart.
+
+        Returns:
+            Tuple[str, List[dict]]: The chosen bucket and one dictionary per period with workouts, holding the
+            period start, the minimum, maximum and last weight, the volume and the number of workouts.
+        """
+        days = (end - start).days + 1
+        bucket = ROLLUP_BUCKETS[-1][0]
+        for candidate, length in ROLLUP_BUCKETS:
+            if days / length <= max_points:
+                bucket = candidate
+                break
+        exercise_id = self.exercise_id(exercise_key, name, create=False)
+        if exercise_id is None:
+            return bucket, []
+        # A range starting mid-period includes the period containing its start
+        first_period = {'day': start, 'week': start - timedelta(days=start.weekday()),
+                        'month': start.replace(day=1)}[bucket].strftime('%Y-%m-%d')
+        rows = self.connection.execute(
+            'SELECT period_start, min_weight, max_weight, last_weight, volume, count FROM workout_rollups '
+            'WHERE user_id = ? AND exercise_id = ? AND bucket = ? AND period_start BETWEEN ? AND ? '
+            'ORDER BY period_start',
+            (user.id, exercise_id, bucket, first_period, end.strftime('%Y-%m-%d'))
+        ).fetchall()
+        return bucket, [dict(row) for row in rows]
+
+    def top_weekly_volume(self, date, exercise_name=None, limit=10):
+        """Return the users with the most volume in the week of `date`, either in total or for one exercise.
+        The query walks the volume index of the aggregate table and stops after `limit` rows.
+
+        Args:
+            date (datetime or date): A day in the week.
+            exercise_name (Optional[str]): The name of the exercise, or None for the total volume.
+            limit (int): The number of users to return.
+
+        Returns:
+            List[dict]: The username and volume of the top users, highest volume first.
+        """
+        if exercise_name is None:
+            rows = self.connection.execute(
+                'SELECT user.username, stats.volume FROM user_weekly_stats AS stats '
+                'JOIN user ON user.id = stats.user_id '
+                'WHERE stats.week = ? ORDER BY stats.volume DESC LIMIT ?',
+                (week_start(date), limit)
+            ).fetchall()
+        else:
+            rows = self.connection.execute(
+                'SELECT user.username, stats.volume FROM user_exercise_weekly_stats AS stats '
+                'JOIN user ON user.id = stats.user_id '
+                'WHERE stats.exercise_name = ? AND stats.week = ? ORDER BY stats.volume DESC LIMIT ?',
+                (exercise_name, week_start(date), limit)
+            ).fetchall()
+        return [{'username': row['username'], 'volume': row['volume']} for row in rows]
+
+    def top_progression(self, exercise_name, limit=10):
+        """Return the users with the biggest weight progression on an exercise, i.e. the difference between
+        their maximum weight and the weight of their first session.
+
+        Args:
+            exercise_name (str): The name of the exercise.
+            limit (int): The number of users to return.
+
+        Returns:
+            List[dict]: The username, progression and maximum weight of the top users, biggest progression first.
+        """
+        rows = self.connection.execute(
+            'SELECT user.username, stats.progression, stats.max_weight FROM user_exercise_stats AS stats '
+            'JOIN user ON user.id = stats.user_id '
+            'WHERE stats.exercise_name = ? ORDER BY stats.progression DESC LIMIT ?',
+            (exercise_name, limit)
+        ).fetchall()
+        return [{'username': row['username'], 'progression': row['progression'], 'max_weight': row['max_weight']}
+                for row in rows]
+
+    def search(self, query, kind=None, limit=20, budget_ms=50):
+        """Search exercises and plan templates by name. Every word of the query matches words of the name starting
+        with it, results are ranked by BM25. If nothing matches, the query is retried with the closest words of the
+        index vocabulary, which tolerates typos after the first letter of a word. The search stops when the time
+        budget is spent and returns the results found so far.
+
+        Args:
+            query (str): The search query, e.g. "bench pre".
+            kind (Optional[str]): Restrict the results to 'exercise' or 'plan'.
+            limit (int): The maximum number of results.
+            budget_ms (float): The time budget of the search in milliseconds.
+
+        Returns:
+            List[dict]: The kind, reference and name of the results, best match first.
+        """
+        tokens = [token.lower() for token in SEARCH_TOKEN.findall(query)]
+        if not tokens:
+            return []
+        deadline = time.monotonic() + budget_ms / 1000
+        results = self._match(' AND '.join(f'"{token}"*' for token in tokens), kind, limit, deadline)
+        if results or time.monotonic() >= deadline:
+            return results
+        corrected = []
+        for token in tokens:
+            similar_prefixes = self._similar_prefixes(token, deadline)
+            if not similar_prefixes:
+                return []
+            corrected.append('(' + ' OR '.join(f'"{prefix}"*' for prefix in similar_prefixes) + ')')
+        return self._match(' AND '.join(corrected), kind, limit, deadline)
+
+    def _match(self, expression, kind, limit, deadline):
+        """Run a full text query against the search index, aborting it when the deadline has passed. The kind is
+        filtered inside the index query and the matches are ordered by their BM25 rank before the limit, so the
+        best matches of the kind are returned. The deadline bounds the cost of very common words.
+
+        Args:
+            expression (str): The FTS5 query expression.
+            kind (Optional[str]): Restrict the results to this kind.
+            limit (int): The maximum number of results.
+            deadline (float): The monotonic time at which the query is aborted.
+
+        Returns:
+            List[dict]: The results read before the deadline, best match first.
+        """
+        kind_filter = 'AND rowid IN (SELECT id FROM search_documents WHERE kind = ?) ' if kind is not None else ''
+        sql = ('SELECT documents.kind, documents.ref, documents.name FROM '
+               f'(SELECT rowid, rank FROM search_index WHERE search_index MATCH ? {kind_filter}'
+               'ORDER BY rank LIMIT ?) AS candidates '
+               'JOIN search_documents AS documents ON documents.id = candidates.rowid '
+               'ORDER BY candidates.rank')
+        parameters = [expression, *([kind] if kind is not None else []), limit]
+        results = []
+        self.connection.set_progress_handler(lambda: time.monotonic() > deadline, 1000)
+        try:
+            for row in self.connection.execute(sql, parameters):
+                results.append({'kind': row['kind'], 'ref': row['ref'], 'name': row['name']})
+        except sqlite3.OperationalError as error:
+            if str(error) != 'interrupted':
+                raise
+        finally:
+            self.connection.set_progress_handler(None, 0)
+        return results
+
+    def _similar_prefixes(self, token, deadline, max_results=3, max_terms=5000):
+        """Find the word prefixes of the index vocabulary closest to a misspelled word. Only words with the same
+        first letter are considered, so the vocabulary is read through a range scan. The scan stops after
+        `max_terms` words or when the deadline has passed, and the closest prefixes among the words read so far
+        are returned.
+
+        Args:
+            token (str): The misspelled word.
+            deadline (float): The monotonic time at which the scan stops.
+            max_results (int): The maximum number of prefixes.
+            max_terms (int): The maximum number of vocabulary words read.
+
+        Returns:
+            List[str]: The closest prefixes, closest first.
+        """
+        prefixes = set()
+        for row in self.connection.execute(
+                'SELECT term FROM search_vocabulary WHERE term >= ? AND term < ? LIMIT ?',
+                (token[0], token[0] + '\U0010ffff', max_terms)):
+            if time.monotonic() > deadline:
+                break
+            if len(row['term']) >= len(token) - 1:
+                prefixes.add(row['term'][:len(token)])
+        return difflib.get_close_matches(token, prefixes, n=max_results, cutoff=0.7)
@@ -0,0 +1,293 @@
+import sqlite3
+from typing import List
+
+from werkzeug.security import generate_password_hash
+
+from GymApp.flaskr.src.domain.user import User
+from GymApp.flaskr.src.domain.workout import GymLog
+from GymApp.flaskr.src.repository.repository import AbstractRepository, SQLiteRepository, IncorrectUsernameError, \
+    UserAlreadyExistsError
+
+# The directory maps every username to its global user ID and to the shard holding the data of the user. User IDs
+# are allocated by the directory, so they are unique across all shards.
+DIRECTORY_SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS users ('
+    'id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT UNIQUE NOT NULL, shard INTEGER NOT NULL)'
+)
+
+
+class ShardedRepository(AbstractRepository):
+    """Repository spreading the users over several SQLite files, so that writes of users on different shards do not
+    wait on the same write lock. Every shard has the full schema and is accessed through a SQLiteRepository.
+    New users are placed on shard `user_id % number of shards`; the shard stored in the directory is
+    authoritative, so users stay reachable while a rebalance after a change of the number of shards is running.
+
+    Data shared by all users, e.g. the plan template catalog and the exercise dictionary, exists per shard.
+    """
+
+    def __init__(self, directory: sqlite3.Connection, shards: List[sqlite3.Connection]):
+        """Initialize the ShardedRepository and create the directory table if needed.
+
+        Args:
+            directory (sqlite3.Connection): The connection to the directory database.
+            shards (List[sqlite3.Connection]): The connections to the shards, in shard order.
+        """
+        self.directory = directory
+        self.directory.row_factory = sqlite3.Row
+        self.directory.execute(DIRECTORY_SCHEMA)
+        self.shards = [SQLiteRepository(connection) for connection in shards]
+
+    def route(self, user_id):
+        """Return the shard a user belongs on with the current number of shards.
+
+        Args:
+            user_id (int): The ID of the user.
+
+        Returns:
+            int: The index of the shard.
+        """
+        return user_id % len(self.shards)
+
+    def shard_of(self, user_id):
+        """Return the repository of the shard holding the data of a user.
+
+        Args:
+            user_id (int): The ID of the user.
+
+        Returns:
+            SQLiteRepository: The repository of the shard.
+
+        Raises:
+            IncorrectUsernameError: If the user is not in the directory.
+        """
+        row = self.directory.execute('SELECT shard FROM users WHERE id = ?', (user_id,)).fetchone()
+        if row is None:
+            raise IncorrectUsernameError
+        return self.shards[row['shard']]
+
+    def commit(self):
+        """Commit the changes of all shards, then the directory. A directory entry is therefore never committed
+        before the data it points to."""
+        for shard in self.shards:
+            shard.commit()
+        self.directory.commit()
+
+    def register_user(self, user: User, password_hash=None):
+        """Register a new user in the directory and on the shard of their new user ID.
+
+        Args:
+            user (User): The user object containing username and password.
+            password_hash (Optional[str]): The hash of the password. Defaults to hashing `user.password`.
+
+        Raises:
+            UserAlreadyExistsError: If a user with the same username already exists.
+        """
+        try:
+            user_id = self.directory.execute(
+                'INSERT INTO users (username, shard) VALUES (?, 0)', (user.username,)
+            ).lastrowid
+        except sqlite3.IntegrityError:
+            raise UserAlreadyExistsError
+        shard = self.route(user_id)
+        self.directory.execute('UPDATE users SET shard = ? WHERE id = ?', (shard, user_id))
+        self.shards[shard].connection.execute(
+            'INSERT INTO user (id, username, password) VALUES (?, ?, ?)',
+            (user_id, user.username, password_hash or generate_password_hash(user.password))
+        )
+        user.add_id(user_id)
+
+    def login_user(self, user: User):
+        """Log in a user by looking up their shard in the directory and checking the password on the shard.
+
+        Args:
+            user (User): The user object containing username and password.
+
+        Raises:
+            IncorrectUsernameError: If the username is incorrect.
+            IncorrectPasswordError: If the password is incorrect.
+        """
+        row = self.directory.execute('SELECT shard FROM users WHERE username = ?', (user.username,)).fetchone()
+        if row is None:
+            raise IncorrectUsernameError
+        self.shards[row['shard']].login_user(user)
+
+    def delete_user(self, user: User):
+        """Delete a user and all their data from their shard and from the directory.
+
+        Args:
+            user (User): The user object to be deleted.
+        """
+        row = self.directory.execute('SELECT id FROM users WHERE username = ?', (user.username,)).fetchone()
+        if row is None:
+            return
+        self.shard_of(row['id']).delete_user(user)
+        self.directory.execute('DELETE FROM users WHERE id = ?', (row['id'],))
+
+    def get_user(self, id):
+        """Retrieve a user from their shard based on their ID.
+
+        Args:
+            id: The ID of the user to retrieve.
+
+        Returns:
+            User: The retrieved user object, or None if not found.
+        """
+        try:
+            return self.shard_of(id).get_user(id)
+        except IncorrectUsernameError:
+            return None
+
+    def save_gym_log(self, gym_log: GymLog):
+        """Save a gym log on the shard of its user.
+
+        Args:
+            gym_log (GymLog): The gym log object to be saved.
+        """
+        self.shard_of(gym_log.userid).save_gym_log(gym_log)
+
+    def load_gym_log(self, user: User, recent_workouts=None):
+        """Load the gym log of a user from their shard.
+
+        Args:
+            user (User): The user object for which to load the gym log.
+            recent_workouts (Optional[int]): Only load this many of the most recent workouts. Defaults to all.
+
+        Returns:
+            GymLog: The loaded gym log object.
+
+        Raises:
+            UserDoesNotHaveAGymLog: If the user does not have a gym log.
+        """
+        return self.shard_of(user.id).load_gym_log(user, recent_workouts)
+
+    def update_gym_log(self, gym_log: GymLog, user: User):
+        """Update the gym log of a user on their shard.
+
+        Args:
+            gym_log (GymLog): The updated gym log object.
+            user (User): The user object for which to update the gym log.
+        """
+        self.shard_of(user.id).update_gym_log(gym_log, user)
+
+    def move_user(self, user_id, target):
+        """Move a user and all their data to another shard. The copy is committed on the target before the
+        directory is switched over, and the source rows are only deleted afterwards, so an interrupted move leaves
+        the user readable and can simply be repeated.
+
+        Args:
+            user_id (int): The ID of the user.
+            target (int): The index of the target shard.
+        """
+        source = self.shard_of(user_id)
+        destination = self.shards[target]
+        if source is destination:
+            return
+        user_db = source.connection.execute('SELECT * FROM user WHERE id = ?', (user_id,)).fetchone()
+        user = User(username=user_db['username'], password=None, id=user_id)
+        # Remove the leftovers of an earlier interrupted move
+        destination.delete_user(user)
+        destination.connection.execute(
+            'INSERT INTO user (id, username, password) VALUES (?, ?, ?)',
+            (user_id, user_db['username'], user_db['password'])
+        )
+        copy_user_data(source, destination, user_id)
+        destination.commit()
+        self.directory.execute('UPDATE users SET shard = ? WHERE id = ?', (target, user_id))
+        self.directory.commit()
+        source.delete_user(user)
+        source.commit()
+
+    def rebalance(self, limit=None):
+        """Move the users that are not on the shard they belong on with the current number of shards, e.g. after
+        shards were added.
+
+        Args:
+            limit (Optional[int]): The maximum number of users to move.
+
+        Returns:
+            int: The number of moved users.
+        """
+        rows = self.directory.execute(
+            'SELECT id, shard FROM users WHERE shard != id % ? ORDER BY id', (len(self.shards),)
+        ).fetchall()
+        if limit is not None:
+            rows = rows[:limit]
+        for row in rows:
+            self.move_user(row['id'], self.route(row['id']))
+        return len(rows)
+
+
+def copy_user_data(source: SQLiteRepository, destination: SQLiteRepository, user_id):
+    """Copy the gym log, workout plan, exercise plans, overrides, workouts and sets of a user to another database.
+    Row IDs and exercise IDs are local to every database, so they are remapped on the way, and a referenced plan
+    template is published into the catalog of the destination. The leaderboards and rollups of the copied
+    workouts and the snapshot of the gym log are updated on the destination.
+
+    Args:
+        source (SQLiteRepository): The repository of the source database.
+        destination (SQLiteRepository): The repository of the destination database.
+        user_id (int): The ID of the user.
+    """
+    def exercise_ids(rows):
+        exercises = source.exercises(row['exercise_id'] for row in rows)
+        return {exercise_id: destination.exercise_id(exercise_key, name)
+                for exercise_id, (exercise_key, name) in exercises.items()}
+
+    gym_log_db = source.connection.execute('SELECT id FROM gym_logs WHERE user_id = ?', (user_id,)).fetchone()
+    if gym_log_db is None:
+        return
+    gym_log_id = destination.connection.execute(
+        'INSERT INTO gym_logs (user_id) VALUES (?)', (user_id,)
+    ).lastrowid
+
+    for plan_db in source.connection.execute(
+            'SELECT * FROM workout_plans WHERE gym_log_id = ?', (gym_log_db['id'],)).fetchall():
+        template_id = None
+        if plan_db['template_id'] is not None:
+            template_id = destination.publish_plan_template(source.load_plan_template(plan_db['template_id']))
+        workout_plan_id = destination.connection.execute(
+            'INSERT INTO workout_plans (name, gym_log_id, template_id) VALUES (?, ?, ?)',
+            (plan_db['name'], gym_log_id, template_id)
+        ).lastrowid
+        for table in ('exercise_plans', 'exercise_plan_overrides'):
+            rows = source.connection.execute(
+                f'SELECT exercise_id, sets, reps, initial_weight, progression FROM {table} WHERE workout_plan_id = ?',
+                (plan_db['id'],)
+            ).fetchall()
+            mapping = exercise_ids(rows)
+            destination.connection.executemany(
+                f'INSERT INTO {table} (workout_plan_id, exercise_id, sets, reps, initial_weight, progression) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                [(workout_plan_id, mapping[row['exercise_id']], row['sets'], row['reps'], row['initial_weight'],
+                  row['progression']) for row in rows]
+            )
+
+    for workout_db in source.connection.execute(
+            'SELECT id, date, content_hash FROM workouts WHERE gym_log_id = ? ORDER BY date, id',
+            (gym_log_db['id'],)).fetchall():
+        workout_id = destination.connection.execute(
+            'INSERT INTO workouts (gym_log_id, date, content_hash) VALUES (?, ?, ?)',
+            (gym_log_id, str(workout_db['date']), workout_db['content_hash'])
+        ).lastrowid
+        rows = source.connection.execute(
+            'SELECT exercise_id, sets, reps, weight FROM workout_exercises WHERE workout_id = ?', (workout_db['id'],)
+        ).fetchall()
+        mapping = exercise_ids(rows)
+        destination.connection.executemany(
+            'INSERT INTO workout_exercises (workout_id, exercise_id, sets, reps, weight) VALUES (?, ?, ?, ?, ?)',
+            [(workout_id, mapping[row['exercise_id']], row['sets'], row['reps'], row['weight']) for row in rows]
+        )
+        rows = source.connection.execute(
+            'SELECT exercise_id, event_id, reps, weight, performed_at FROM workout_sets WHERE workout_id = ? '
+            'ORDER BY id', (workout_db['id'],)
+        ).fetchall()
+        mapping = exercise_ids(rows)
+        destination.connection.executemany(
+            'INSERT INTO workout_sets (workout_id, exercise_id, event_id, reps, weight, performed_at) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            [(workout_id, mapping[row['exercise_id']], row['event_id'], row['reps'], row['weight'],
+              str(row['performed_at'])) for row in rows]
+        )
+        destination.update_leaderboards(workout_id)
+        destination.update_rollups(workout_id)
+    destination.refresh_gym_log_snapshot(gym_log_id)
@@ -0,0 +1,82 @@
+import random
+import sqlite3
+import threading
+
+# Primary result codes SQLITE_BUSY and SQLITE_LOCKED of a database locked by another connection. Extended codes such
+# as SQLITE_BUSY_SNAPSHOT carry the primary code in their low byte.
+BUSY_ERROR_CODES = (5, 6)
+
+
+def is_busy(error):
+    """
+    Check whether an error means that the database was locked by another connection, so the transaction can be
+    retried.
+
+    Args:
+        error (Exception): The error.
+
+    Returns:
+        bool: True for SQLITE_BUSY and SQLITE_LOCKED errors.
+    """
+    if not isinstance(error, sqlite3.OperationalError):
+        return False
+    code = getattr(error, 'sqlite_errorcode', None)
+    if code is not None:
+        return code & 0xff in BUSY_ERROR_CODES
+    message = str(error)
+    return 'database is locked' in message or 'database table is locked' in message
+
+
+class RetryPolicy(object):
+    """Retry policy of transactions that failed because the database was busy.
+
+    A busy transaction is rolled back and retried up to `attempts` times. Before retry `n` (counted from 0) the
+    caller sleeps a random time between 0 and `min(max_delay, base_delay * 2 ** n)` seconds, so transactions that
+    collided do not collide again in lockstep. The counters are shared by all threads using the policy.
+
+    Attributes:
+        counters (dict): The number of transactions, of transactions that hit a busy database at least once, of
+            retries and of transactions that failed because the retries were exhausted.
+    """
+
+    def __init__(self, attempts=5, base_delay=0.01, max_delay=0.5):
+        """Initialize a RetryPolicy.
+
+        Args:
+            attempts (int): The maximum number of retries of a transaction.
+            base_delay (float): The upper bound in seconds of the delay before the first retry.
+            max_delay (float): The upper bound in seconds of the delay before any retry.
+        """
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.counters = {'transactions': 0, 'contended': 0, 'retries': 0, 'failures': 0}
+        self._lock = threading.Lock()
+
+    def delay(self, attempt):
+        """Return the jittered delay in seconds before retry `attempt`."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def record(self, retries, failed):
+        """Record a finished transaction.
+
+        Args:
+            retries (int): The number of retries of the transaction.
+            failed (bool): Whether the transaction failed because the database stayed busy.
+        """
+        with self._lock:
+            self.counters['transactions'] += 1
+            self.counters['retries'] += retries
+            if retries or failed:
+                self.counters['contended'] += 1
+            if failed:
+                self.counters['failures'] += 1
+
+    def stats(self):
+        """Return a copy of the counters."""
+        with self._lock:
+            return dict(self.counters)
+
+
+# Policy of repositories that are not given one, e.g. in scripts and CLI commands
+DEFAULT_RETRY_POLICY = RetryPolicy()
@@ -1,9 +1,14 @@
 import functools
+import math
+from werkzeug.security import generate_password_hash
 from flask import (
-    Blueprint, flash, g, redirect, render_template, request, session, url_for
+    Blueprint, current_app, flash, g, redirect, render_template, request, session, url_for
 )
 
-from GymApp.flaskr.src.database.db import get_db
+from GymApp.flaskr.src.database.db import get_cache, get_db, used_archive_path
+from GymApp.flaskr.src.database.group_commit import run_write
+from GymApp.flaskr.src.jobs.jobs import enqueue
+from GymApp.flaskr.src.limiter.limiter import get_limiter
 from GymApp.flaskr.src.domain.user import User
 from GymApp.flaskr.src.repository.repository import SQLiteRepository, UserAlreadyExistsError,\
                                         IncorrectUsernameError, IncorrectPasswordError
@@ -33,6 +38,28 @@ def login_required(view):
     return wrapped_view
 
 
+@bp.before_request
+def limit_auth_requests():
+    """
+    Admission control for the auth blueprint.
+    Login and registration hash passwords, which is expensive. POST requests are therefore checked against
+    the token buckets of the client IP and of the submitted username before the view runs, and answered
+    with 429 if either bucket is empty. The counters of the limiter are logged periodically.
+    """
+    if request.method != 'POST' or request.endpoint not in ('auth.login', 'auth.register'):
+        return None
+    limiter = get_limiter()
+    if limiter is None:
+        return None
+    retry_after = limiter.allow_request(request.remote_addr, request.form.get('username'))
+    limiter.log_stats(current_app.logger, current_app.config['AUTH_RATE_LIMIT_LOG_INTERVAL'])
+    if retry_after:
+        return 'Too many requests, please try again later.', 429, {
+            'Retry-After': str(max(1, math.ceil(min(retry_after, 3600))))
+        }
+    return None
+
+
 @bp.route('/register', methods=('GET', 'POST'))
 def register():
     """
@@ -44,7 +71,6 @@ def register():
     if request.method == 'POST':
         username = request.form['username']
         password = request.form['password']
-        db = get_db()
         error = None
 
         if not username:
@@ -53,12 +79,12 @@ def register():
             error = 'Password is required.'
 
         new_user = User(username, password)
-        repo = SQLiteRepository(db)
 
         if error is None:
+            # Hash before the write transaction, so the slow hash never holds the write lock or the writer thread
+            password_hash = generate_password_hash(password)
             try:
-                repo.register_user(new_user)
-                repo.connection.commit()
+                run_write(lambda repo: repo.register_user(new_user, password_hash))
             except UserAlreadyExistsError:
                 error = f"User {username} is already registered."
             else:
@@ -106,11 +132,17 @@ def login():
 def delete_user():
     """
     Delete the logged-in user.
-    If the request method is POST, delete the user from the database.
+    The user and their whole data graph are deleted in one transaction. A purge job sweeping the orphans the delete
+    could not reach, e.g. rows of an archive that was not attached, is enqueued in the same transaction.
     """
-    repo = SQLiteRepository(get_db())
-    repo.delete_user(g.user)
-    repo.commit()
+    user = g.user
+    payload = {'archive': used_archive_path(current_app.config)}
+
+    def delete(repo):
+        repo.delete_user(user)
+        enqueue(repo.connection, 'purge_orphans', payload)
+
+    run_write(delete)
 
     return redirect(url_for('auth.logout'))
 
@@ -121,14 +153,20 @@ def load_logged_in_user():
     Load the logged-in user based on the user ID stored in the session.
     If a user is logged in, store the user data in g.user for access during the request.
     If no user is logged in, set g.user to None.
+    Users are cached until the user table is written.
     """
     user_id = session.get('user_id')
 
     if user_id is None:
         g.user = None
     else:
-        repo = SQLiteRepository(get_db())
-        g.user = repo.get_user(user_id)
+        users = get_cache('users', ('user',))
+        g.user = users.get(user_id)
+        if g.user is None:
+            repo = SQLiteRepository(get_db())
+            g.user = repo.get_user(user_id)
+            if g.user is not None:
+                users.set(user_id, g.user)
 
 
 @bp.route('/logout')
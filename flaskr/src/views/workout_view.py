@@ -1,30 +1,353 @@
+from datetime import datetime, timedelta
+
+from GymApp.flaskr.src.database.db import get_db
+from GymApp.flaskr.src.database.group_commit import run_read, run_write
+from GymApp.flaskr.src.domain.workout import ExercisePlan, GymLog, Workout, WorkoutPlan, WorkoutSet
+from GymApp.flaskr.src.repository.repository import ExerciseNotInWorkoutError, SQLiteRepository, \
+    UserDoesNotHaveAGymLog, WorkoutNotFoundError
 from GymApp.flaskr.src.views.auth import login_required
-from flask import Blueprint, render_template
+from flask import Blueprint, current_app, g, jsonify, redirect, render_template, request, stream_template, url_for
 
 bp = Blueprint('workout_view', __name__)
 
 
+def wants_json():
+    """
+    Check whether the client sent JSON or prefers a JSON response over HTML.
+
+    Returns:
+        bool: True if the response should be JSON.
+    """
+    return request.is_json or request.accept_mimetypes.best == 'application/json'
+
+
+def load_gym_log(repo, user):
+    """
+    Load the gym log of a user.
+
+    Args:
+        repo (SQLiteRepository): The repository.
+        user (User): The user.
+
+    Returns:
+        Optional[GymLog]: The gym log, or None if the user does not have one yet.
+    """
+    try:
+        return repo.load_gym_log(user)
+    except UserDoesNotHaveAGymLog:
+        return None
+
+
+def load_next_workout(user):
+    """
+    Load the next workout of a user. It is normally read from its stored row and only computed, and stored again,
+    if the row is missing because its inputs changed.
+
+    Args:
+        user (User): The user.
+
+    Returns:
+        Optional[Tuple[GymLog, Workout]]: The gym log with the workout plan and the next workout, or None if the
+        user does not have a workout plan.
+    """
+    repo = SQLiteRepository(get_db())
+    next_workout = repo.load_next_workout(user)
+    if next_workout is not None:
+        return next_workout
+    gym_log_id = repo.gym_log_id(user)
+    if gym_log_id is None:
+        return None
+    return run_write(lambda repo: repo.refresh_next_workout(gym_log_id))
+
+
+def iter_history(user, page_size):
+    """
+    Iterate over the workouts of a user, newest first.
+
+    The connection is only opened once the iteration starts. A streamed response is rendered after the view
+    returned and the connection of the view was closed, and the connection opened here is closed when the stream
+    ends.
+
+    Args:
+        user (User): The user.
+        page_size (int): The number of workouts read per query.
+
+    Yields:
+        Workout: The workouts of the user.
+    """
+    repo = SQLiteRepository(get_db())
+    gym_log_id = repo.gym_log_id(user)
+    if gym_log_id is not None:
+        yield from repo.iter_workouts(gym_log_id, page_size)
+
+
 @bp.route('/workout', methods=('GET', 'POST'))
 @login_required
 def workout():
-    """Render the Workout page.
+    """Show or log the next workout of the user.
 
-    This route is responsible for rendering the Workout page template.
+    The next workout is created from the workout plan of the user and their last workout and stored whenever
+    either changes, so it is served by a single read. A POST logs it as a session; the weights lifted can be passed
+    per exercise key, as form fields or as an `exercises` object in a JSON body, and default to the proposed
+    weights. A POST repeating a workout logged less than WORKOUT_DUPLICATE_WINDOW seconds before is not saved again.
 
     Returns:
-        The rendered Workout page template.
+        The rendered Workout page template, or the workout as JSON for JSON clients. Users without a workout plan
+        are redirected to the Create Workout Plan page.
     """
-    return render_template('workout/Workout.html')
+    loaded = load_next_workout(g.user)
+    if loaded is None:
+        if wants_json():
+            return jsonify(error='No workout plan.'), 404
+        return redirect(url_for('workout_view.create_workout_plan'))
+    gym_log, next_workout = loaded
+
+    if request.method == 'POST':
+        weights = (request.get_json(silent=True) or {}).get('exercises', {}) if request.is_json else request.form
+        try:
+            for key, exercise in next_workout.exercise_session_dict.items():
+                if key in weights:
+                    exercise['weight'] = float(weights[key])
+        except (TypeError, ValueError):
+            return jsonify(error='Weights must be numbers.'), 400
+        # A form submitted twice within the window is saved once
+        window = timedelta(seconds=current_app.config['WORKOUT_DUPLICATE_WINDOW'])
+        saved = run_write(lambda repo: repo.save_workout(next_workout, gym_log, duplicate_window=window))
+        if wants_json():
+            return jsonify(next_workout.to_dict()), 201 if saved else 200
+        return redirect(url_for('workout_view.workout'))
+
+    if wants_json():
+        return jsonify(next_workout.to_dict())
+    return render_template('workout/Workout.html', workout=next_workout, workout_plan=gym_log.workout_plan)
+
+
+@bp.route('/workout/<int:workout_id>/sets', methods=('GET', 'POST'))
+@login_required
+def workout_sets(workout_id):
+    """List or record the sets of a logged workout.
+
+    A POST takes a batch of set events of the form `{"sets": [{"event_id", "exercise", "reps", "weight",
+    "performed_at"}]}`, with at most WORKOUT_SETS_MAX_BATCH sets, and appends them in one transaction. The event IDs
+    are generated by the client; events that were already stored are skipped, so a batch can be retried safely.
+
+    Args:
+        workout_id (int): The ID of the workout.
+
+    Returns:
+        The sets of the workout as JSON, or the number of stored and skipped sets of the batch.
+    """
+    user = g.user
+    if request.method == 'POST':
+        try:
+            batch = parse_workout_sets(request.get_json(silent=True), current_app.config['WORKOUT_SETS_MAX_BATCH'])
+        except ValueError:
+            return jsonify(error='Invalid sets.'), 400
+
+        def append(repo):
+            return repo.append_workout_sets(repo.gym_log_id(user), workout_id, batch)
+
+        try:
+            stored = run_write(append)
+        except WorkoutNotFoundError:
+            return jsonify(error='No such workout.'), 404
+        except ExerciseNotInWorkoutError as error:
+            return jsonify(error=f'Exercise {error} is not part of the workout.'), 400
+        return jsonify(stored=stored, duplicates=len(batch) - stored)
+
+    try:
+        sets = run_read(lambda repo: repo.load_workout_sets(repo.gym_log_id(user), workout_id))
+    except WorkoutNotFoundError:
+        return jsonify(error='No such workout.'), 404
+    return jsonify(sets=[workout_set.to_dict() for workout_set in sets])
+
+
+def parse_workout_sets(data, max_batch):
+    """
+    Create the sets of a batch of the form `{"sets": [{"event_id", "exercise", "reps", "weight", "performed_at"}]}`.
+
+    Args:
+        data (Optional[dict]): The batch.
+        max_batch (int): The maximum number of sets of a batch.
+
+    Returns:
+        List[WorkoutSet]: The sets.
+
+    Raises:
+        ValueError: If the batch is not a list of valid sets or holds more than `max_batch` sets.
+    """
+    events = data.get('sets') if isinstance(data, dict) else None
+    if not isinstance(events, list) or len(events) > max_batch:
+        raise ValueError('Invalid sets.')
+    return [WorkoutSet.from_dict(event) for event in events]
+
+
+def parse_imported_workout(data):
+    """
+    Create a workout from an imported dictionary of the form `{"date", "exercises": {key: {"name", "weight"}}}`.
+
+    Args:
+        data (dict): The dictionary.
+
+    Returns:
+        Workout: The workout.
+
+    Raises:
+        ValueError: If the dictionary is not a valid workout.
+    """
+    try:
+        exercises = {key: {'name': exercise['name'], 'weight': exercise['weight']}
+                     for key, exercise in data['exercises'].items()}
+        date = datetime.fromisoformat(data['date'])
+    except (KeyError, TypeError, AttributeError):
+        raise ValueError('Invalid workout.')
+    if not all(isinstance(key, str) and isinstance(exercise['name'], str) and
+               isinstance(exercise['weight'], (int, float)) and not isinstance(exercise['weight'], bool)
+               for key, exercise in exercises.items()):
+        raise ValueError('Invalid workout.')
+    return Workout(exercises, date)
+
+
+@bp.route('/workouts/import', methods=('POST',))
+@login_required
+def import_workouts():
+    """Import a batch of past workouts of the form `{"workouts": [{"date", "exercises"}]}`, with at most
+    WORKOUT_IMPORT_MAX_BATCH workouts. Workouts with the same date and exercises as a logged workout are skipped,
+    so an exported history can be imported again safely.
+
+    Returns:
+        The number of imported and skipped workouts as JSON.
+    """
+    data = (request.get_json(silent=True) or {}).get('workouts')
+    if not isinstance(data, list) or len(data) > current_app.config['WORKOUT_IMPORT_MAX_BATCH']:
+        return jsonify(error='Invalid workouts.'), 400
+    try:
+        workouts = [parse_imported_workout(workout) for workout in data]
+    except ValueError:
+        return jsonify(error='Invalid workouts.'), 400
+    user = g.user
+
+    def import_batch(repo):
+        try:
+            gym_log = repo.load_gym_log(user, recent_workouts=0)
+        except UserDoesNotHaveAGymLog:
+            return None
+        return repo.import_workouts(workouts, gym_log)
+
+    imported = run_write(import_batch)
+    if imported is None:
+        return jsonify(error='No gym log.'), 404
+    return jsonify(imported=imported, duplicates=len(workouts) - imported)
 
 
 @bp.route('/create_workout_plan', methods=('GET', 'POST'))
 @login_required
 def create_workout_plan():
-    """Render the Create Workout Plan page.
+    """Render the Create Workout Plan page, or create a workout plan.
 
-    This route is responsible for rendering the Create Workout Plan page template.
+    A POST with a JSON body of the form `{"name": ..., "exercises": {key: {"name", "sets", "reps",
+    "initial_weight", "progression"}}}` makes the plan the workout plan of the user, replacing a previous plan.
 
     Returns:
-        The rendered Create Workout Plan page template.
+        The rendered Create Workout Plan page template, or the created plan as JSON.
     """
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        try:
+            workout_plan = WorkoutPlan(data['name'], {
+                key: ExercisePlan(exercise['name'], exercise['sets'], exercise['reps'], exercise['initial_weight'],
+                                  exercise['progression'])
+                for key, exercise in data['exercises'].items()
+            })
+        except (KeyError, TypeError, AttributeError, ValueError):
+            return jsonify(error='Invalid workout plan.'), 400
+        user = g.user
+
+        def save_workout_plan(repo):
+            gym_log = load_gym_log(repo, user)
+            if gym_log is None:
+                gym_log = GymLog(user.id)
+                gym_log.add_workout_plan(workout_plan)
+                repo.save_gym_log(gym_log)
+            else:
+                repo.replace_workout_plan(gym_log, workout_plan)
+
+        run_write(save_workout_plan)
+        return jsonify(id=workout_plan.id, name=workout_plan.name), 201
     return render_template('workout/Workout_Plan.html')
+
+
+@bp.route('/history')
+@login_required
+def history():
+    """Show the workout history of the user, newest first.
+
+    The page is streamed: the workouts are read from the repository one page at a time while the template is
+    rendered, so the first bytes go out right away and memory use does not grow with the length of the history.
+
+    Returns:
+        The streamed History page template.
+    """
+    return stream_template('workout/History.html',
+                           workouts=iter_history(g.user, current_app.config['HISTORY_PAGE_SIZE']))
+
+
+@bp.route('/forecast')
+@login_required
+def forecast():
+    """Forecast the weights of the next sessions of every exercise of the workout plan, e.g. for a progression chart.
+
+    The forecast starts from the last workout of the user and is computed in one pass, without creating the
+    workouts one by one. The `sessions` parameter sets the number of sessions, up to FORECAST_MAX_SESSIONS. The
+    optional `deload_every`, `deload_ratio` and `max_weight` parameters add a deload session at `deload_ratio` of the
+    weight every `deload_every` sessions and cap the weights.
+
+    Returns:
+        The forecast as JSON of the form `{"plan": ..., "sessions": ..., "exercises": {key: {"name", "weights"}}}`.
+    """
+    args = request.args
+    try:
+        sessions = int(args.get('sessions', 10))
+        deload_every = int(args['deload_every']) if 'deload_every' in args else None
+        deload_ratio = float(args.get('deload_ratio', 0.9))
+        max_weight = float(args['max_weight']) if 'max_weight' in args else None
+    except ValueError:
+        return jsonify(error='Invalid forecast parameters.'), 400
+    if not 0 < sessions <= current_app.config['FORECAST_MAX_SESSIONS'] or not 0 < deload_ratio <= 1 \
+            or (deload_every is not None and deload_every < 1):
+        return jsonify(error='Invalid forecast parameters.'), 400
+
+    user = g.user
+
+    def load(repo):
+        try:
+            return repo.load_gym_log(user, recent_workouts=1)
+        except UserDoesNotHaveAGymLog:
+            return None
+
+    gym_log = run_read(load)
+    if gym_log is None or gym_log.workout_plan is None:
+        return jsonify(error='No workout plan.'), 404
+    workout_plan = gym_log.workout_plan
+    last_workout = max(gym_log.workout_list) if gym_log.workout_list else None
+    weights = workout_plan.forecast(sessions, last_workout, deload_every, deload_ratio, max_weight)
+    return jsonify(plan=workout_plan.name, sessions=sessions, exercises={
+        key: {'name': workout_plan.exercise_plan_dict[key].name, 'weights': exercise_weights}
+        for key, exercise_weights in weights.items()
+    })
+
+
+@bp.route('/search')
+@login_required
+def search():
+    """Search exercises and plan templates by name.
+
+    This route is used while building a workout plan. The query is passed in the `q` parameter, the optional
+    `kind` parameter restricts the results to exercises or plans.
+
+    Returns:
+        The ranked search results as JSON.
+    """
+    query, kind = request.args.get('q', ''), request.args.get('kind')
+    results = run_read(lambda repo: repo.search(query, kind=kind))
+    return jsonify(results)
@@ -1,6 +1,8 @@
 import sqlite3
 from datetime import timedelta
 import pytest
+from GymApp.flaskr import create_app
+from GymApp.flaskr.src.database.db import clone_database, init_db
 from GymApp.flaskr.src.repository.repository import SQLiteRepository
 from GymApp.flaskr.src.domain.user import User
 from GymApp.flaskr.src.domain.workout import GymLog, Workout, WorkoutPlan, ExercisePlan
@@ -17,10 +19,10 @@ def sqlite_repo():
     conn = sqlite3.connect(':memory:')
     conn.row_factory = sqlite3.Row
 
-    # Initialize the database using schema.sql
+    # Initialize the database as a copy of the template database of schema.sql
     with open(schema_path) as schema_file:
         schema_sql = schema_file.read()
-        conn.executescript(schema_sql)
+        clone_database(conn, schema_sql)
 
     repo = SQLiteRepository(conn)
 
@@ -30,6 +32,26 @@ def sqlite_repo():
     conn.close()
 
 
+@pytest.fixture
+def app(tmp_path):
+    # Create the application with a temporary database
+    app = create_app({
+        'TESTING': True,
+        'DATABASE': str(tmp_path / 'flaskr.sqlite'),
+        'ASSETS_FOLDER': str(tmp_path / 'assets'),
+    })
+
+    with app.app_context():
+        init_db()
+
+    yield app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
 @pytest.fixture
 def login_user(sqlite_repo):
     user = User(username='testuser', password='password')
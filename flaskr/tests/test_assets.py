@@ -0,0 +1,83 @@
+import gzip
+import os
+
+from GymApp.flaskr import create_app
+from GymApp.flaskr.src.assets.assets import IMMUTABLE_CACHE_CONTROL, build_assets, load_manifest
+
+
+def test_build_assets_hashes_and_compresses(tmp_path):
+    static = tmp_path / 'static'
+    (static / 'js').mkdir(parents=True)
+    (static / 'style.css').write_text('body { color: red; }\n' * 50)
+    (static / 'js' / 'app.js').write_text('console.log(1);\n' * 50)
+    (static / 'logo.png').write_bytes(b'\x89PNG' + bytes(100))
+
+    manifest = build_assets(str(static), str(tmp_path / 'assets'))
+
+    assert set(manifest) == {'style.css', 'js/app.js', 'logo.png'}
+    css = manifest['style.css']
+    assert css['path'].startswith('style.') and css['path'].endswith('.css')
+    assert 'gzip' in css['encodings']
+    assert gzip.decompress((tmp_path / 'assets' / (css['path'] + '.gz')).read_bytes()) == \
+        (static / 'style.css').read_bytes()
+    assert manifest['js/app.js']['path'].startswith('js/app.')
+    # Binary files are not compressed
+    assert manifest['logo.png']['encodings'] == []
+    assert load_manifest(str(tmp_path / 'assets')) == manifest
+
+
+def test_build_assets_changes_hash_with_content(tmp_path):
+    static = tmp_path / 'static'
+    static.mkdir()
+    (static / 'style.css').write_text('body { color: red; }')
+    first = build_assets(str(static), str(tmp_path / 'assets'))['style.css']['path']
+    (static / 'style.css').write_text('body { color: blue; }')
+    second = build_assets(str(static), str(tmp_path / 'assets'))['style.css']['path']
+
+    assert first != second
+    # The files of the previous build are kept for pages still referring to them
+    assert os.path.exists(tmp_path / 'assets' / first)
+
+
+def test_url_for_static_uses_hashed_name(client):
+    response = client.get('/auth/login')
+
+    path = client.application.extensions['assets'].hashed_path('style.css')
+    assert path != 'style.css'
+    assert f'/static/{path}'.encode() in response.data
+
+
+def test_hashed_asset_is_served_compressed_and_immutable(client, app):
+    path = app.extensions['assets'].hashed_path('style.css')
+    with open(os.path.join(app.static_folder, 'style.css'), 'rb') as file:
+        original = file.read()
+
+    response = client.get(f'/static/{path}', headers={'Accept-Encoding': 'gzip, deflate'})
+    assert response.status_code == 200
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert response.headers['Cache-Control'] == IMMUTABLE_CACHE_CONTROL
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert response.mimetype == 'text/css'
+    assert gzip.decompress(response.data) == original
+
+    response = client.get(f'/static/{path}')
+    assert 'Content-Encoding' not in response.headers
+    assert response.data == original
+
+
+def test_unhashed_static_file_is_still_served(client):
+    response = client.get('/static/style.css')
+
+    assert response.status_code == 200
+    assert 'immutable' not in response.headers.get('Cache-Control', '')
+
+
+def test_build_assets_command(tmp_path):
+    app = create_app({'TESTING': True, 'DATABASE': str(tmp_path / 'flaskr.sqlite'),
+                      'ASSETS_FOLDER': str(tmp_path / 'assets'), 'ASSETS_BUILD_ON_START': False})
+    assert app.extensions['assets'].files == {}
+
+    result = app.test_cli_runner().invoke(args=['build-assets'])
+
+    assert 'Built 1 assets.' in result.output
+    assert 'style.css' in app.extensions['assets'].files
@@ -0,0 +1,240 @@
+import gzip
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from GymApp.flaskr.src.database import backup
+from GymApp.flaskr.src.database.db import archive_path, archive_workouts, connect, get_db
+from GymApp.flaskr.src.domain.user import User
+from GymApp.flaskr.src.domain.workout import GymLog, Workout
+from GymApp.flaskr.src.jobs.jobs import Worker, enqueue
+from GymApp.flaskr.src.repository.repository import SQLiteRepository
+
+
+def add_users(database, names):
+    connection = connect(database)
+    connection.executemany("INSERT INTO user (username, password) VALUES (?, 'x')", [(name,) for name in names])
+    connection.commit()
+    connection.close()
+
+
+def usernames(database):
+    connection = connect(database)
+    names = [row['username'] for row in connection.execute('SELECT username FROM user ORDER BY username')]
+    connection.close()
+    return names
+
+
+def test_backup_and_restore_commands_round_trip(app, tmp_path):
+    database = app.config['DATABASE']
+    add_users(database, ['alice', 'bob'])
+    runner = app.test_cli_runner()
+
+    report = json.loads(runner.invoke(args=['backup', '--directory', str(tmp_path / 'backups')]).output)
+
+    assert os.path.exists(report['snapshot'])
+    assert backup.read_checksum(report['snapshot']) == report['checksum'] == backup.file_checksum(report['snapshot'])
+    assert len(gzip.decompress(open(report['snapshot'], 'rb').read())) == report['database_bytes']
+    assert report['snapshot_bytes'] < report['database_bytes']
+    assert report['mb_per_s'] > 0
+    add_users(database, ['carol'])
+
+    result = runner.invoke(args=['restore', '--directory', str(tmp_path / 'backups'), '--yes'])
+
+    assert json.loads(result.output)['mb_per_s'] > 0
+    assert usernames(database) == ['alice', 'bob']
+
+
+def test_restore_rejects_corrupted_snapshot(app, tmp_path):
+    database = app.config['DATABASE']
+    add_users(database, ['alice'])
+    snapshot = backup.backup(database, str(tmp_path))['snapshot']
+    with open(snapshot, 'r+b') as file:
+        file.seek(20)
+        file.write(b'\x00\x01')
+    add_users(database, ['bob'])
+
+    with pytest.raises(backup.SnapshotError):
+        backup.restore(snapshot, database)
+    result = app.test_cli_runner().invoke(args=['restore', snapshot, '--yes'])
+
+    assert result.exit_code != 0 and 'Checksum mismatch' in result.output
+    assert usernames(database) == ['alice', 'bob']
+
+
+def save_workouts(app, workout_plan, days):
+    with app.app_context():
+        repo = SQLiteRepository(get_db())
+        user = User('testuser', 'password')
+        if get_db().execute("SELECT 1 FROM user WHERE username = 'testuser'").fetchone() is None:
+            repo.register_user(user)
+            gym_log = GymLog(user.id)
+            gym_log.add_workout_plan(workout_plan)
+            repo.save_gym_log(gym_log)
+        repo.login_user(user)
+        gym_log = repo.load_gym_log(user)
+        for day in days:
+            repo.save_workout(Workout({'exercise1': {'name': 'Exercise 1', 'weight': 20}},
+                                      date=datetime.now() - timedelta(days=day)), gym_log)
+        repo.commit()
+
+
+def workout_counts(app):
+    with app.app_context():
+        db = get_db()
+        return tuple(db.execute(f'SELECT COUNT(*) FROM {schema}.workouts').fetchone()[0]
+                     for schema in ('main', 'archive'))
+
+
+def test_backup_and_restore_include_the_archive(app, tmp_path, workout_plan):
+    save_workouts(app, workout_plan, [400, 300, 1])
+    with app.app_context():
+        archive_workouts(180)
+    assert workout_counts(app) == (1, 2)
+
+    report = backup.backup(app.config['DATABASE'], str(tmp_path), archive=archive_path(app.config))
+    assert backup.read_checksum(report['archive_snapshot']) == report['archive_checksum']
+    # The snapshot of the archive is not listed as a snapshot of its own
+    assert [path for _, path in backup.list_snapshots(str(tmp_path), app.config['DATABASE'])] == [report['snapshot']]
+    save_workouts(app, workout_plan, [250])
+    with app.app_context():
+        archive_workouts(180)
+    assert workout_counts(app) == (1, 3)
+
+    backup.restore(report['snapshot'], app.config['DATABASE'], archive=archive_path(app.config))
+
+    assert workout_counts(app) == (1, 2)
+    with app.app_context():
+        repo = SQLiteRepository(get_db())
+        user = User('testuser', 'password')
+        repo.login_user(user)
+        workouts = repo.load_gym_log(user).workout_list
+    assert len(workouts) == len({workout.id for workout in workouts}) == 3
+
+
+def test_restore_refuses_snapshot_without_archive_over_archived_workouts(app, tmp_path, workout_plan):
+    save_workouts(app, workout_plan, [400, 1])
+    snapshot = backup.backup(app.config['DATABASE'], str(tmp_path))['snapshot']
+    with app.app_context():
+        archive_workouts(180)
+
+    with pytest.raises(backup.SnapshotError, match='archive'):
+        backup.restore(snapshot, app.config['DATABASE'], archive=archive_path(app.config))
+    assert workout_counts(app) == (1, 1)
+
+
+def test_restore_renews_the_generation(app, tmp_path):
+    database = app.config['DATABASE']
+    snapshot = backup.backup(database, str(tmp_path))['snapshot']
+    connection = connect(database)
+    generation = "SELECT counter FROM table_changes WHERE table_name = 'generation'"
+    before = connection.execute(generation).fetchone()[0]
+
+    backup.restore(snapshot, database)
+
+    assert connection.execute(generation).fetchone()[0] != before
+    connection.close()
+
+
+def test_backup_lets_writers_progress(app, tmp_path):
+    database = app.config['DATABASE']
+    add_users(database, [f'user{index}' for index in range(3000)])
+    stop = threading.Event()
+    written = []
+
+    def writer():
+        connection = connect(database)
+        while not stop.is_set():
+            connection.execute("INSERT INTO user (username, password) VALUES (?, 'x')", (f'writer{len(written)}',))
+            connection.commit()
+            written.append(1)
+        connection.close()
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    try:
+        report = backup.backup(database, str(tmp_path), pages=4, pause=0.001)
+    finally:
+        stop.set()
+        thread.join()
+
+    assert report['steps'] > 1
+    assert written
+    connection = connect(database)
+    assert connection.execute('PRAGMA integrity_check').fetchone()[0] == 'ok'
+    connection.close()
+
+
+class RestartingSource(object):
+    """Source connection whose stepped backups report a restart on every other step, like under steady writes."""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.calls = []
+
+    def backup(self, target, **kwargs):
+        self.calls.append(kwargs)
+        if 'progress' in kwargs:
+            for remaining in (5, 4, 5, 4, 5, 4):
+                kwargs['progress'](sqlite3.SQLITE_OK, remaining, 5)
+        self.connection.backup(target, **kwargs)
+
+
+def test_copy_database_falls_back_to_read_transaction_after_restarts(app, tmp_path):
+    database = app.config['DATABASE']
+    add_users(database, ['alice', 'bob'])
+    connection = connect(database)
+    source = RestartingSource(connection)
+    target = sqlite3.connect(str(tmp_path / 'copy.sqlite'))
+    try:
+        progress = backup.copy_database(source, target, pages=1, pause=0, max_restarts=1)
+        names = [row[0] for row in target.execute('SELECT username FROM user ORDER BY username')]
+    finally:
+        target.close()
+        connection.close()
+
+    assert progress['method'] == 'read_transaction'
+    assert progress['restarts'] == 2
+    assert source.calls[-1] == {}
+    assert names == ['alice', 'bob']
+
+
+def test_backup_copies_in_steps_without_writers(app, tmp_path):
+    report = backup.backup(app.config['DATABASE'], str(tmp_path), pages=1, pause=0)
+
+    assert report['copy_method'] == 'stepped'
+    assert report['restarts'] == 0
+
+
+def test_prune_snapshots_keeps_last_and_daily(tmp_path):
+    now = datetime(2024, 6, 30, 12, tzinfo=timezone.utc)
+    database = 'flaskr.sqlite'
+    for created in [now - timedelta(hours=hours) for hours in range(0, 24 * 10, 6)]:
+        path = tmp_path / backup.snapshot_name(database, created)
+        path.write_bytes(b'')
+        (tmp_path / (path.name + backup.CHECKSUM_SUFFIX)).write_text('')
+
+    pruned = backup.prune_snapshots(str(tmp_path), database, keep_last=3, keep_daily=5, now=now)
+
+    kept = [created for created, _ in backup.list_snapshots(str(tmp_path), database)]
+    assert kept[:3] == [now, now - timedelta(hours=6), now - timedelta(hours=12)]
+    assert [created.date() for created in kept[3:]] == [(now - timedelta(days=days)).date() for days in range(1, 5)]
+    assert len(pruned) == 40 - len(kept)
+    assert len(os.listdir(tmp_path)) == 2 * len(kept)
+
+
+def test_backup_job(app, tmp_path):
+    with app.app_context():
+        db = get_db()
+        enqueue(db, 'backup', {'directory': str(tmp_path / 'backups')})
+        db.commit()
+
+        worker = Worker(app.config['DATABASE'], concurrency=1)
+        worker.run(burst=True)
+
+    assert (worker.succeeded, worker.failed) == (1, 0)
+    assert len(backup.list_snapshots(str(tmp_path / 'backups'), app.config['DATABASE'])) == 1
@@ -0,0 +1,39 @@
+import gzip
+import zlib
+
+from werkzeug.test import Client
+from werkzeug.wrappers import Response
+
+from GymApp.flaskr.src.compression.compression import GzipMiddleware
+
+
+def streaming_app(chunks, mimetype='text/html'):
+    def app(environ, start_response):
+        return Response(iter(chunks), mimetype=mimetype)(environ, start_response)
+    return app
+
+
+def test_gzip_middleware_flushes_streamed_chunks():
+    chunks = [b'<p>first</p>'] + [b'x' * 1000] * 20
+    client = Client(GzipMiddleware(streaming_app(chunks), flush_size=4096))
+
+    response = client.get('/', headers={'Accept-Encoding': 'gzip'}, buffered=False)
+    compressed = list(response.response)
+
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Content-Length' not in response.headers
+    assert gzip.decompress(b''.join(compressed)) == b''.join(chunks)
+    # The first chunk is flushed on its own, the rest in pieces of about `flush_size` bytes
+    assert zlib.decompressobj(zlib.MAX_WBITS | 16).decompress(compressed[0]) == b'<p>first</p>'
+    assert 3 <= len(compressed) <= 8
+
+
+def test_gzip_middleware_skips_unaccepted_binary_and_small_responses():
+    body = [b'x' * 1000]
+
+    assert 'Content-Encoding' not in Client(GzipMiddleware(streaming_app(body))).get('/').headers
+    response = Client(GzipMiddleware(streaming_app(body, 'image/png'))).get('/', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in response.headers
+    response = Client(GzipMiddleware(Response(b'small', mimetype='text/plain'))).get(
+        '/', headers={'Accept-Encoding': 'gzip'})
+    assert response.data == b'small'
@@ -0,0 +1,186 @@
+import json
+import os
+
+from GymApp.flaskr.src.database import migrations
+from GymApp.flaskr.src.database.db import ChangeTracker, archive_path, archive_workouts, connect, get_db
+from GymApp.flaskr.src.domain.user import User
+from GymApp.flaskr.src.repository.repository import SQLiteRepository
+
+
+def test_purge_orphans_command(app):
+    with app.app_context():
+        db = get_db()
+        db.execute('INSERT INTO gym_logs (user_id) VALUES (42)')
+        db.commit()
+
+    result = app.test_cli_runner().invoke(args=['purge-orphans', '--pause', '0'])
+
+    assert 'Purged 1 orphaned rows.' in result.output
+    with app.app_context():
+        assert get_db().execute('SELECT COUNT(*) FROM gym_logs').fetchone()[0] == 0
+
+
+def test_archive_workouts_command(app):
+    result = app.test_cli_runner().invoke(args=['archive-workouts', '--pause', '0'])
+
+    assert 'Archived 0 workouts.' in result.output
+
+
+def test_dedupe_workouts_command(app):
+    client = app.test_client()
+    client.post('/auth/register', data={'username': 'testuser', 'password': 'password'})
+    client.post('/auth/login', data={'username': 'testuser', 'password': 'password'})
+    client.post('/create_workout_plan', json={'name': 'Workout', 'exercises': {'exercise1': {
+        'name': 'Exercise 1', 'sets': 3, 'reps': 10, 'initial_weight': 20, 'progression': 5}}})
+    workout = {'date': '2024-01-01 10:00:00', 'exercises': {'exercise1': {'name': 'Exercise 1', 'weight': 20}}}
+    client.post('/workouts/import', json={'workouts': [workout]})
+    with app.app_context():
+        db = get_db()
+        # A double submit saved before duplicates were detected
+        workout_id = db.execute("INSERT INTO workouts (gym_log_id, date) VALUES (1, '2024-01-01 10:00:30')").lastrowid
+        db.execute('INSERT INTO workout_exercises (workout_id, exercise_id, sets, reps, weight) '
+                   'SELECT ?, exercise_id, sets, reps, weight FROM workout_exercises', (workout_id,))
+        SQLiteRepository(db).update_leaderboards(workout_id)
+        db.commit()
+        assert db.execute('SELECT session_count FROM user_exercise_stats').fetchone()[0] == 2
+
+    result = app.test_cli_runner().invoke(args=['dedupe-workouts', '--pause', '0'])
+
+    assert 'Collapsed 1 duplicate workouts.' in result.output
+    with app.app_context():
+        assert get_db().execute('SELECT COUNT(*) FROM workouts').fetchone()[0] == 1
+        assert get_db().execute('SELECT session_count FROM user_exercise_stats').fetchone()[0] == 1
+
+
+def test_rebuild_leaderboards_command(app):
+    result = app.test_cli_runner().invoke(args=['rebuild-leaderboards'])
+
+    assert 'Rebuilt the leaderboards.' in result.output
+
+
+def test_rebuild_rollups_command(app):
+    result = app.test_cli_runner().invoke(args=['rebuild-rollups'])
+
+    assert 'Rebuilt the rollups.' in result.output
+
+
+def test_transaction_stats_command(app):
+    app.test_client().post('/auth/register', data={'username': 'testuser', 'password': 'password'})
+
+    result = app.test_cli_runner().invoke(args=['transaction-stats'])
+
+    assert json.loads(result.output) == {'transactions': 1, 'contended': 0, 'retries': 0, 'failures': 0}
+
+
+def test_init_db_command_seeds_synthetic_data(app):
+    result = app.test_cli_runner().invoke(args=['init-db', '--seed-users', '2', '--seed-workouts', '3'])
+
+    assert 'Initialized the database.' in result.output
+    with app.app_context():
+        db = get_db()
+        assert db.execute('PRAGMA user_version').fetchone()[0] == migrations.SCHEMA_VERSION
+        assert [row[0] for row in db.execute('SELECT username FROM user ORDER BY id')] == ['user0', 'user1']
+        assert db.execute('SELECT COUNT(*) FROM workouts').fetchone()[0] == 6
+        assert db.execute('SELECT COUNT(*) FROM next_workouts').fetchone()[0] == 2
+        repo = SQLiteRepository(db)
+        user = User('user1', 'password')
+        repo.login_user(user)
+        assert len(repo.load_gym_log(user).workout_list) == 3
+
+
+def test_change_tracker_evicts_caches_of_written_tables(app):
+    tracker = ChangeTracker(app.config['DATABASE'])
+    users = tracker.cache('users', ('user',))
+    plans = tracker.cache('plans', ('workout_plans', 'exercise_plans'))
+    tracker.poll()
+    users.set(1, 'user')
+    plans.set(1, 'plan')
+
+    assert tracker.poll() == set()
+
+    # A write by another connection, e.g. of another worker process
+    connection = connect(app.config['DATABASE'])
+    connection.execute("INSERT INTO user (username, password) VALUES ('other', 'password')")
+    connection.commit()
+    connection.close()
+
+    assert tracker.poll() == {'user'}
+    assert len(users) == 0
+    assert plans.get(1) == 'plan'
+    assert tracker.stats() == {'polls': 3, 'changes': 2, 'evictions': 3}
+
+
+def test_logged_in_user_cache_sees_writes_of_other_connections(app):
+    client = app.test_client()
+    client.post('/auth/register', data={'username': 'testuser', 'password': 'password'})
+    client.post('/auth/login', data={'username': 'testuser', 'password': 'password'})
+    assert b'testuser' in client.get('/').data
+
+    connection = connect(app.config['DATABASE'])
+    connection.execute("UPDATE user SET username = 'renamed'")
+    connection.commit()
+    connection.close()
+
+    assert b'renamed' in client.get('/').data
+
+
+def test_init_and_rebalance_shards_commands(app, tmp_path):
+    app.config['SHARD_DIRECTORY'] = str(tmp_path / 'directory.sqlite')
+    app.config['SHARD_DATABASES'] = [str(tmp_path / 'shard0.sqlite'), str(tmp_path / 'shard1.sqlite')]
+    runner = app.test_cli_runner()
+
+    assert 'Initialized 2 shards.' in runner.invoke(args=['init-shards']).output
+    assert 'Moved 0 users.' in runner.invoke(args=['rebalance-shards']).output
+
+
+def test_exercise_cache_is_cleared_when_another_process_recreates_the_database(app):
+    with app.app_context():
+        app.test_client().get('/')
+        repo = SQLiteRepository(get_db())
+        squat_id = repo.exercise_id('squat', 'Squat')
+        repo.commit()
+        assert repo.exercise_cache.get_id('squat', 'Squat') == squat_id
+
+    # init-db of another process, which cannot clear the caches of this one
+    connection = connect(app.config['DATABASE'])
+    with app.open_resource('src/database/schema.sql') as f:
+        connection.executescript(f.read().decode('utf8'))
+    connection.close()
+    app.test_client().get('/')
+
+    with app.app_context():
+        repo = SQLiteRepository(get_db())
+        assert repo.exercise_cache.get_id('squat', 'Squat') is None
+        bench_id = repo.exercise_id('bench', 'Bench')
+        assert repo.exercises([bench_id]) == {bench_id: ('bench', 'Bench')}
+
+
+def test_change_tracker_clears_every_cache_when_counters_go_backwards(app):
+    tracker = ChangeTracker(app.config['DATABASE'])
+    plans = tracker.cache('plans', ('workout_plans',))
+    connection = connect(app.config['DATABASE'])
+    connection.execute("INSERT INTO user (username, password) VALUES ('other', 'password')")
+    connection.commit()
+    tracker.poll()
+    plans.set(1, 'plan')
+
+    # A restored snapshot taken before the write
+    connection.execute("UPDATE table_changes SET counter = 0 WHERE table_name = 'user'")
+    connection.commit()
+    connection.close()
+
+    assert 'workout_plans' in tracker.poll()
+    assert len(plans) == 0
+
+
+def test_request_connections_attach_the_archive_only_once_it_exists(app):
+    with app.app_context():
+        assert SQLiteRepository(get_db()).has_archive() is False
+    assert not os.path.exists(archive_path(app.config))
+
+    with app.app_context():
+        archive_workouts(180)
+
+    assert os.path.exists(archive_path(app.config))
+    with app.app_context():
+        assert SQLiteRepository(get_db()).has_archive() is True
@@ -0,0 +1,86 @@
+import threading
+
+import pytest
+
+from GymApp.flaskr import create_app
+from GymApp.flaskr.src.database.db import get_db, init_db
+from GymApp.flaskr.src.database.group_commit import GroupCommitWriter
+from GymApp.flaskr.src.domain.user import User
+from GymApp.flaskr.src.repository import repository
+from GymApp.flaskr.src.repository.repository import UserAlreadyExistsError
+
+
+@pytest.fixture
+def writer(app):
+    writer = GroupCommitWriter(app.config['DATABASE'], max_batch=8, max_delay=0.05)
+    yield writer
+    writer.close()
+
+
+def count_users(app):
+    with app.app_context():
+        return get_db().execute('SELECT COUNT(*) FROM user').fetchone()[0]
+
+
+def test_concurrent_writes_share_transactions(app, writer):
+    threads = [threading.Thread(target=writer.submit,
+                                args=(lambda repo, index=index: repo.register_user(User(f'user{index}', 'pw')),))
+               for index in range(16)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert writer.operations == 16
+    assert writer.batches < 16
+    assert count_users(app) == 16
+
+
+def test_failing_unit_is_rolled_back_alone(app, writer):
+    writer.submit(lambda repo: repo.register_user(User('testuser', 'pw')))
+    results = {}
+
+    def register(username):
+        try:
+            writer.submit(lambda repo: repo.register_user(User(username, 'pw')))
+            results[username] = 'ok'
+        except UserAlreadyExistsError:
+            results[username] = 'exists'
+
+    threads = [threading.Thread(target=register, args=(username,)) for username in ('testuser', 'other')]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == {'testuser': 'exists', 'other': 'ok'}
+    assert count_users(app) == 2
+
+
+def test_register_view_with_group_commit(tmp_path):
+    app = create_app({
+        'TESTING': True,
+        'DATABASE': str(tmp_path / 'flaskr.sqlite'),
+        'GROUP_COMMIT_ENABLED': True,
+        'AUTH_RATE_LIMIT_ENABLED': False,
+    })
+    with app.app_context():
+        init_db()
+
+    response = app.test_client().post('/auth/register', data={'username': 'testuser', 'password': 'pw'})
+
+    assert response.status_code == 302
+    assert app.extensions['group_commit'].operations == 1
+    assert count_users(app) == 1
+    app.extensions['group_commit'].close()
+
+
+def test_register_view_hashes_outside_the_write_unit(app, monkeypatch):
+    def fail(password):
+        raise AssertionError('Password hashed inside the write unit')
+
+    monkeypatch.setattr(repository, 'generate_password_hash', fail)
+    client = app.test_client()
+
+    assert client.post('/auth/register', data={'username': 'testuser', 'password': 'pw'}).status_code == 302
+    assert client.post('/auth/login', data={'username': 'testuser', 'password': 'pw'}).headers['Location'] == '/'
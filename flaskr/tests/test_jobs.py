@@ -0,0 +1,181 @@
+from datetime import datetime, timedelta
+
+import pytest
+from GymApp.flaskr.src.database.db import archive_path, attach_archive, connect, get_db, renew_generation
+from GymApp.flaskr.src.domain.user import User
+from GymApp.flaskr.src.domain.workout import GymLog, Workout
+from GymApp.flaskr.src.repository.repository import SQLiteRepository
+from GymApp.flaskr.src.jobs.jobs import job_handler, enqueue, claim_job, complete_job, fail_job, Worker, \
+    UnknownJobTypeError, poll_job_changes
+
+calls = []
+
+
+@job_handler('test_record')
+def record_job(connection, payload):
+    calls.append(payload)
+
+
+@job_handler('test_fail')
+def failing_job(connection, payload):
+    raise RuntimeError('boom')
+
+
+@pytest.fixture
+def db(app):
+    with app.app_context():
+        yield get_db()
+
+
+def test_enqueue_unknown_job_type(db):
+    with pytest.raises(UnknownJobTypeError):
+        enqueue(db, 'unknown')
+
+
+def test_claim_and_complete_job(db):
+    job_id = enqueue(db, 'test_record', {'value': 1})
+    db.commit()
+
+    job = claim_job(db)
+
+    assert job.id == job_id
+    assert job.payload == {'value': 1}
+    assert job.attempts == 1
+    # A claimed job is invisible to other workers
+    assert claim_job(db) is None
+    complete_job(db, job)
+    db.commit()
+    assert db.execute('SELECT COUNT(*) FROM jobs').fetchone()[0] == 0
+
+
+def test_expired_visibility_timeout_makes_job_visible_again(db):
+    enqueue(db, 'test_record')
+    db.commit()
+
+    first = claim_job(db, visibility_timeout=0)
+    second = claim_job(db)
+
+    assert second.id == first.id
+    assert second.attempts == 2
+    # The first worker can no longer complete the job
+    complete_job(db, first)
+    assert db.execute('SELECT COUNT(*) FROM jobs').fetchone()[0] == 1
+
+
+def test_failed_job_is_retried_then_marked_failed(db):
+    enqueue(db, 'test_fail', max_attempts=2)
+    db.commit()
+
+    job = claim_job(db)
+    fail_job(db, job, 'error', backoff=0)
+    db.commit()
+    job = claim_job(db)
+    fail_job(db, job, 'error', backoff=0)
+    db.commit()
+
+    row = db.execute('SELECT status, attempts, last_error FROM jobs').fetchone()
+    assert tuple(row) == ('failed', 2, 'error')
+    assert claim_job(db) is None
+
+
+def test_delayed_job_is_not_visible(db):
+    enqueue(db, 'test_record', delay=60)
+    db.commit()
+
+    assert claim_job(db) is None
+
+
+def test_worker_runs_jobs(app, db):
+    calls.clear()
+    for value in range(5):
+        enqueue(db, 'test_record', {'value': value})
+    enqueue(db, 'test_fail', max_attempts=1)
+    db.commit()
+
+    worker = Worker(app.config['DATABASE'], concurrency=2, backoff=0)
+    worker.run(burst=True)
+
+    assert sorted(payload['value'] for payload in calls) == [0, 1, 2, 3, 4]
+    assert (worker.succeeded, worker.failed) == (5, 1)
+    assert db.execute("SELECT status FROM jobs").fetchall()[0][0] == 'failed'
+
+
+def test_worker_command(app, db):
+    enqueue(db, 'purge_orphans')
+    db.execute('INSERT INTO gym_logs (user_id) VALUES (42)')
+    db.commit()
+
+    result = app.test_cli_runner().invoke(args=['worker', '--burst'])
+
+    assert 'Worker finished: 2 succeeded, 0 failed.' in result.output
+    assert db.execute('SELECT COUNT(*) FROM gym_logs').fetchone()[0] == 0
+
+
+def test_archive_workouts_job_moves_old_workouts(app, db, workout_plan):
+    repo = SQLiteRepository(db)
+    user = User('testuser', 'password')
+    repo.register_user(user)
+    gym_log = GymLog(user.id)
+    gym_log.add_workout_plan(workout_plan)
+    repo.save_gym_log(gym_log)
+    for days in (400, 300, 200, 1):
+        repo.save_workout(Workout({'exercise1': {'name': 'Exercise 1', 'weight': 20}},
+                                  date=datetime.now() - timedelta(days=days)), gym_log)
+    enqueue(db, 'archive_workouts', {'archive': archive_path(app.config), 'older_than_days': 180, 'batch_size': 2})
+    db.commit()
+
+    Worker(app.config['DATABASE'], concurrency=1).run(burst=True)
+
+    # The job created the archive, which connections opened from now on attach
+    connection = connect(app.config['DATABASE'], archive=archive_path(app.config))
+    assert connection.execute('SELECT COUNT(*) FROM main.workouts').fetchone()[0] == 1
+    assert connection.execute('SELECT COUNT(*) FROM archive.workouts').fetchone()[0] == 3
+    assert connection.execute('SELECT COUNT(*) FROM jobs').fetchone()[0] == 0
+    assert len(SQLiteRepository(connection).load_gym_log(user).workout_list) == 4
+    connection.close()
+
+
+def test_delete_user_view_deletes_the_graph_and_enqueues_a_sweep(app, db, workout_plan):
+    client = app.test_client()
+    client.post('/auth/register', data={'username': 'testuser', 'password': 'password'})
+    client.post('/auth/login', data={'username': 'testuser', 'password': 'password'})
+    client.post('/create_workout_plan', json={'name': 'Workout', 'exercises': {'exercise1': {
+        'name': 'Exercise 1', 'sets': 3, 'reps': 10, 'initial_weight': 20, 'progression': 5}}})
+    client.post('/workout', json={'exercises': {'exercise1': 20}})
+    db.execute('UPDATE workouts SET date = ?', (datetime(2020, 1, 1),))
+    db.commit()
+    client.post('/workout', json={'exercises': {'exercise1': 25}})
+    attach_archive(db, archive_path(app.config))
+    SQLiteRepository(db).archive_workouts(datetime(2021, 1, 1))
+    db.commit()
+
+    response = client.post('/auth/delete_user')
+
+    assert response.status_code == 302
+    # The whole graph is gone when the response comes back, without a worker
+    for table in ('user', 'main.workouts', 'archive.workouts', 'workout_exercises', 'archive.workout_exercises',
+                  'workout_plans', 'exercise_plans', 'user_exercise_stats', 'workout_rollups', 'next_workouts'):
+        assert db.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0] == 0, table
+    assert [tuple(row) for row in db.execute('SELECT type, status FROM jobs')] == [('purge_orphans', 'queued')]
+
+    worker = Worker(app.config['DATABASE'], concurrency=1)
+    worker.run(burst=True)
+
+    assert (worker.succeeded, worker.failed) == (1, 0)
+    assert db.execute('SELECT COUNT(*) FROM jobs').fetchone()[0] == 0
+
+
+def test_jobs_see_a_recreated_database(app, db):
+    repo = SQLiteRepository(db)
+    poll_job_changes(app.config['DATABASE'])
+    repo.exercise_id('squat', 'Squat')
+    repo.commit()
+    assert repo.exercise_cache.get_id('squat', 'Squat') is not None
+
+    connection = connect(app.config['DATABASE'])
+    renew_generation(connection)
+    connection.commit()
+    connection.close()
+    poll_job_changes(app.config['DATABASE'])
+
+    assert repo.exercise_cache.get_id('squat', 'Squat') is None
@@ -0,0 +1,142 @@
+import json
+import logging
+import sqlite3
+import time
+
+from GymApp.flaskr import create_app
+from GymApp.flaskr.src.database.db import init_db
+from GymApp.flaskr.src.limiter.limiter import TokenBucket, InMemoryLimiter, SQLiteLimiter
+
+
+def test_token_bucket_allows_burst_then_rejects():
+    bucket = TokenBucket(capacity=2, refill_rate=1, updated=0)
+
+    assert bucket.consume(now=0) == 0
+    assert bucket.consume(now=0) == 0
+    assert bucket.consume(now=0) == 1
+
+
+def test_token_bucket_refills_over_time():
+    bucket = TokenBucket(capacity=1, refill_rate=2, updated=0)
+
+    assert bucket.consume(now=0) == 0
+    assert bucket.consume(now=0.1) > 0
+    assert bucket.consume(now=1) == 0
+
+
+def test_in_memory_limiter_keys_by_ip_and_username():
+    limiter = InMemoryLimiter(capacity=1, refill_rate=0)
+
+    assert limiter.allow_request('1.1.1.1', 'testuser') == 0
+    # Same IP, different username
+    assert limiter.allow_request('1.1.1.1', 'other') > 0
+    # Different IP, same username
+    assert limiter.allow_request('2.2.2.2', 'testuser') > 0
+    assert limiter.stats() == {'allowed': 1, 'rejected_ip': 1, 'rejected_username': 1}
+
+
+def test_in_memory_limiter_bounds_number_of_buckets():
+    limiter = InMemoryLimiter(capacity=1, refill_rate=0, max_keys=2)
+
+    for ip in ('1', '2', '3'):
+        limiter.allow_request(ip)
+
+    assert len(limiter._buckets) == 2
+
+
+def test_sqlite_limiter_is_shared_between_instances(tmp_path):
+    database = str(tmp_path / 'limiter.sqlite')
+    first = SQLiteLimiter(capacity=1, refill_rate=0, database=database)
+    second = SQLiteLimiter(capacity=1, refill_rate=0, database=database)
+
+    assert first.allow_request('1.1.1.1') == 0
+    assert second.allow_request('1.1.1.1') > 0
+    assert second.shared_stats() == {'allowed': 1, 'rejected_ip': 1, 'rejected_username': 0}
+
+
+def test_login_is_rejected_with_429(tmp_path):
+    app = create_app({
+        'TESTING': True,
+        'DATABASE': str(tmp_path / 'flaskr.sqlite'),
+        'AUTH_RATE_LIMIT_CAPACITY': 1,
+        'AUTH_RATE_LIMIT_REFILL_RATE': 0,
+    })
+    with app.app_context():
+        init_db()
+    client = app.test_client()
+    data = {'username': 'testuser', 'password': 'password'}
+
+    assert client.post('/auth/register', data=data).status_code == 302
+    response = client.post('/auth/login', data=data)
+
+    assert response.status_code == 429
+    assert 'Retry-After' in response.headers
+    # GET requests are not limited
+    assert client.get('/auth/login').status_code == 200
+
+
+def test_limiter_stats_command_reads_the_shared_counters(tmp_path):
+    app = create_app({
+        'TESTING': True,
+        'DATABASE': str(tmp_path / 'flaskr.sqlite'),
+        'AUTH_RATE_LIMIT_DATABASE': str(tmp_path / 'limiter.sqlite'),
+    })
+    SQLiteLimiter(capacity=1, refill_rate=0, database=str(tmp_path / 'limiter.sqlite')).allow_request('1.1.1.1')
+
+    result = app.test_cli_runner().invoke(args=['limiter-stats'])
+
+    assert json.loads(result.output) == {'allowed': 1, 'rejected_ip': 0, 'rejected_username': 0}
+
+
+def test_limiter_stats_command_refuses_the_in_memory_limiter(tmp_path):
+    app = create_app({'TESTING': True, 'DATABASE': str(tmp_path / 'flaskr.sqlite')})
+
+    result = app.test_cli_runner().invoke(args=['limiter-stats'])
+
+    assert result.exit_code != 0 and 'AUTH_RATE_LIMIT_DATABASE' in result.output
+
+
+def test_limiter_logs_its_counters_periodically(caplog):
+    limiter = InMemoryLimiter(capacity=1, refill_rate=0)
+    logger = logging.getLogger('test_limiter')
+    limiter.allow_request('1.1.1.1')
+
+    with caplog.at_level(logging.INFO, logger='test_limiter'):
+        assert not limiter.log_stats(logger, interval=3600)
+        limiter._logged -= 3600
+        assert limiter.log_stats(logger, interval=3600)
+
+    assert caplog.messages == ['auth rate limiter {"allowed": 1, "rejected_ip": 0, "rejected_username": 0}']
+
+
+def test_sqlite_limiter_prunes_full_and_idle_buckets(tmp_path):
+    limiter = SQLiteLimiter(capacity=1, refill_rate=1, database=str(tmp_path / 'limiter.sqlite'))
+    for ip in ('1', '2', '3'):
+        limiter.allow_request(ip)
+    limiter._connection().execute("UPDATE rate_limit_buckets SET updated = updated - 10 WHERE key = 'ip:1'")
+
+    # Only the bucket of 1 refilled completely
+    assert limiter.prune() == 1
+    assert limiter.prune(now=time.time() + 10) == 2
+
+    idle = SQLiteLimiter(capacity=1, refill_rate=0, database=str(tmp_path / 'idle.sqlite'), max_idle=60)
+    idle.allow_request('1')
+    assert idle.prune() == 0
+    assert idle.prune(now=time.time() + 61) == 1
+
+
+def test_sqlite_limiter_falls_back_to_process_buckets_when_busy(tmp_path):
+    database = str(tmp_path / 'limiter.sqlite')
+    limiter = SQLiteLimiter(capacity=1, refill_rate=0, database=database)
+    blocker = sqlite3.connect(database, isolation_level=None)
+    blocker.execute('BEGIN IMMEDIATE')
+    limiter._connection().execute('PRAGMA busy_timeout = 0')
+
+    try:
+        assert limiter.allow_request('1.1.1.1') == 0
+        assert limiter.allow_request('1.1.1.1') > 0
+    finally:
+        blocker.execute('ROLLBACK')
+        blocker.close()
+
+    assert limiter.stats()['fallbacks'] == 2
@@ -0,0 +1,147 @@
+import json
+import sqlite3
+
+from GymApp.flaskr.src.database import maintenance
+from GymApp.flaskr.src.database.db import connect, get_db
+from GymApp.flaskr.src.jobs.jobs import Worker, enqueue
+
+
+def fill_and_delete(database, rows=2000):
+    # Leave free pages behind, like deleted users do
+    connection = connect(database)
+    connection.executemany("INSERT INTO user (username, password) VALUES (?, ?)",
+                           [(f'user{index}', 'x' * 200) for index in range(rows)])
+    connection.commit()
+    connection.execute('DELETE FROM user')
+    connection.commit()
+    free = connection.execute('PRAGMA freelist_count').fetchone()[0]
+    connection.close()
+    return free
+
+
+def test_db_maintain_command_vacuums_and_reports_stats(app):
+    free = fill_and_delete(app.config['DATABASE'])
+    assert free > 0
+
+    result = app.test_cli_runner().invoke(args=['db-maintain', '--step-ms', '20'])
+
+    report = json.loads(result.output)
+    assert report['vacuum']['pages'] == free
+    assert report['stats']['freelist_pages'] == 0
+    assert report['stats']['auto_vacuum'] == 'incremental'
+    assert 'workouts' in report['stats']['tables']
+    assert 'workouts_gym_log_id_date' in report['stats']['indexes']
+    assert 0 <= report['stats']['fragmentation'] < 1
+    with app.app_context():
+        assert get_db().execute('PRAGMA freelist_count').fetchone()[0] == 0
+
+
+def test_incremental_vacuum_stops_at_deadline(app):
+    fill_and_delete(app.config['DATABASE'])
+    connection = connect(app.config['DATABASE'])
+
+    report = maintenance.incremental_vacuum(connection, step_ms=20, deadline=0)
+
+    assert report == {'pages': 0, 'steps': 0, 'max_step_ms': 0.0}
+    connection.close()
+
+
+def test_checkpoint_truncates_wal(app):
+    connection = connect(app.config['DATABASE'])
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.execute("INSERT INTO user (username, password) VALUES ('testuser', 'x')")
+    connection.commit()
+
+    result = maintenance.checkpoint(connection)
+
+    assert result == {'busy': False, 'log_frames': 0, 'checkpointed_frames': 0}
+    assert maintenance.database_stats(connection, app.config['DATABASE'])['wal_bytes'] == 0
+    connection.close()
+
+
+def test_db_maintain_job(app):
+    free = fill_and_delete(app.config['DATABASE'])
+    with app.app_context():
+        db = get_db()
+        enqueue(db, 'db_maintain', {'step_ms': 20})
+        db.commit()
+
+        worker = Worker(app.config['DATABASE'], concurrency=1)
+        worker.run(burst=True)
+
+        assert free > 0
+        assert (worker.succeeded, worker.failed) == (1, 0)
+        assert db.execute('PRAGMA freelist_count').fetchone()[0] == 0
+
+
+def test_db_maintain_command_analyzes_table_by_table(app):
+    connection = connect(app.config['DATABASE'])
+    connection.execute("INSERT INTO user (username, password) VALUES ('testuser', 'x')")
+    connection.commit()
+    connection.close()
+
+    result = app.test_cli_runner().invoke(args=['db-maintain', '--analyze'])
+
+    report = json.loads(result.output)
+    assert report['analyze']['tables'] > 0
+    assert report['analyze']['skipped'] == []
+    with app.app_context():
+        analyzed = {row['tbl'] for row in get_db().execute('SELECT tbl FROM sqlite_stat1')}
+    assert 'user' in analyzed
+
+
+def test_analyze_tables_skips_tables_over_the_step_budget(app):
+    connection = connect(app.config['DATABASE'])
+    connection.executemany("INSERT INTO user (username, password) VALUES (?, 'x')",
+                           [(f'user{index}',) for index in range(20000)])
+    connection.commit()
+
+    report = maintenance.analyze_tables(connection, step_ms=0, deadline=float('inf'))
+
+    assert 'user' in report['skipped']
+    assert connection.execute("SELECT COUNT(*) FROM sqlite_stat1 WHERE tbl = 'user'").fetchone()[0] == 0
+    connection.close()
+
+
+class WithoutDbstat(object):
+    """Connection of an SQLite build without the dbstat virtual table."""
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def execute(self, sql, *args):
+        if 'dbstat' in sql:
+            raise sqlite3.OperationalError('no such table: dbstat')
+        return self.connection.execute(sql, *args)
+
+
+def test_database_stats_without_dbstat(app):
+    connection = connect(app.config['DATABASE'])
+
+    stats = maintenance.database_stats(WithoutDbstat(connection))
+
+    assert stats['dbstat'] is False
+    assert stats['tables'] is None and stats['fragmentation'] is None
+    assert stats['page_count'] > 0
+    connection.close()
+
+
+def test_db_maintain_command_converts_old_databases(app):
+    database = app.config['DATABASE']
+    connection = connect(database)
+    connection.execute('PRAGMA auto_vacuum = NONE')
+    connection.execute('VACUUM')
+    connection.close()
+    free = fill_and_delete(database)
+    runner = app.test_cli_runner()
+
+    report = json.loads(runner.invoke(args=['db-maintain']).output)
+
+    assert report['vacuum'] == {'conversion_needed': True, 'auto_vacuum': 'none', 'freelist_pages': free}
+    assert report['conversion'] is None
+
+    report = json.loads(runner.invoke(args=['db-maintain', '--convert']).output)
+
+    assert report['conversion']['pages'] == free
+    assert report['stats']['auto_vacuum'] == 'incremental'
+    assert report['stats']['freelist_pages'] == 0
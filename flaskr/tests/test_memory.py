@@ -0,0 +1,30 @@
+from GymApp.flaskr import create_app
+from GymApp.flaskr.benchmarks.bench_memory import MAX_BYTES_PER_EXERCISE, MAX_BYTES_PER_WORKOUT, bytes_per_workout
+from GymApp.flaskr.src.database.db import init_db
+
+
+def test_gym_log_bytes_per_workout_within_threshold():
+    assert bytes_per_workout(5) <= MAX_BYTES_PER_WORKOUT
+
+
+def test_gym_log_bytes_per_exercise_within_threshold():
+    assert (bytes_per_workout(10) - bytes_per_workout(5)) / 5 <= MAX_BYTES_PER_EXERCISE
+
+
+def test_memory_profiler_reports_peak_per_request(tmp_path):
+    app = create_app({
+        'TESTING': True,
+        'DATABASE': str(tmp_path / 'flaskr.sqlite'),
+        'MEMORY_PROFILER_ENABLED': True,
+    })
+    with app.app_context():
+        init_db()
+
+    response = app.test_client().get('/auth/login')
+
+    assert int(response.headers['X-Memory-Peak']) > 0
+    assert app.extensions['memory_profiler'].stats()['auth.login']['requests'] == 1
+
+
+def test_memory_profiler_is_off_by_default(client):
+    assert 'X-Memory-Peak' not in client.get('/auth/login').headers
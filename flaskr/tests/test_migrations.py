@@ -0,0 +1,81 @@
+import sqlite3
+import os
+import pytest
+from GymApp.flaskr.src.database import migrations
+from GymApp.flaskr.src.repository.repository import SQLiteRepository
+from GymApp.flaskr.src.domain.user import User
+
+# The layout of the tables before the exercise dictionary was introduced
+LEGACY_SCHEMA = """
+CREATE TABLE user (id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT UNIQUE NOT NULL, password TEXT NOT NULL);
+CREATE TABLE gym_logs (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL);
+CREATE INDEX gym_logs_user_id ON gym_logs (user_id);
+CREATE TABLE workout_plans (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, gym_log_id INTEGER NOT NULL);
+CREATE TABLE exercise_plans (
+  id INTEGER PRIMARY KEY AUTOINCREMENT, workout_plan_id INTEGER NOT NULL, exercise_key TEXT Not NULL,
+  name TEXT NOT NULL, sets INTEGER Not NULL, reps INTEGER Not NULL, initial_weight INTEGER Not NULL,
+  progression INTEGER NOT NULL
+);
+CREATE TABLE workouts (id INTEGER PRIMARY KEY AUTOINCREMENT, gym_log_id INTEGER NOT NULL, date TIMESTAMP NOT NULL);
+CREATE TABLE workout_exercises (
+  id INTEGER PRIMARY KEY AUTOINCREMENT, workout_id INTEGER NOT NULL, exercise_key TEXT NOT NULL, name TEXT NOT NULL,
+  sets INTEGER NOT NULL, reps INTEGER NOT NULL, weight REAL NOT NULL
+);
+"""
+
+
+@pytest.fixture
+def schema_script():
+    parent_dir = os.path.dirname(os.path.abspath(__file__))
+    with open(os.path.join(parent_dir, '../src/database/schema.sql')) as schema_file:
+        return schema_file.read()
+
+
+@pytest.fixture
+def legacy_connection():
+    conn = sqlite3.connect(':memory:')
+    conn.executescript(LEGACY_SCHEMA)
+    conn.execute("INSERT INTO user (id, username, password) VALUES (3, 'testuser', 'x')")
+    conn.execute("INSERT INTO gym_logs (id, user_id) VALUES (1, 3)")
+    conn.execute("INSERT INTO workout_plans (id, name, gym_log_id) VALUES (1, 'Workout', 1)")
+    conn.executemany(
+        "INSERT INTO exercise_plans (workout_plan_id, exercise_key, name, sets, reps, initial_weight, progression) "
+        "VALUES (1, ?, ?, 3, 10, 20, 5)",
+        [('exercise1', 'Squat'), ('exercise2', 'Bench Press')]
+    )
+    conn.execute("INSERT INTO workouts (id, gym_log_id, date) VALUES (1, 1, '2024-01-01 10:00:00')")
+    conn.executemany(
+        "INSERT INTO workout_exercises (workout_id, exercise_key, name, sets, reps, weight) VALUES (1, ?, ?, 3, 10, ?)",
+        [('exercise1', 'Squat', 20), ('exercise2', 'Bench Press', 30)]
+    )
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+def test_split_script_keeps_triggers_together(schema_script):
+    statements = migrations.split_script(schema_script)
+    assert statements[0] == f'PRAGMA user_version = {migrations.SCHEMA_VERSION};'
+    assert all(sqlite3.complete_statement(statement) for statement in statements)
+    assert any(statement.startswith('CREATE TRIGGER') and statement.endswith('END;') for statement in statements)
+
+
+def test_migrate_converts_legacy_exercises(legacy_connection, schema_script):
+    assert migrations.migrate(legacy_connection, schema_script) is True
+
+    assert migrations.schema_version(legacy_connection) == migrations.SCHEMA_VERSION
+    repo = SQLiteRepository(legacy_connection)
+    gym_log = repo.load_gym_log(User('testuser', None, id=3))
+    assert gym_log.workout_plan.exercise_plan_dict['exercise1'].name == 'Squat'
+    assert gym_log.workout_list[0].exercise_session_dict == {
+        'exercise1': {'name': 'Squat', 'weight': 20},
+        'exercise2': {'name': 'Bench Press', 'weight': 30},
+    }
+    assert legacy_connection.execute('SELECT COUNT(*) FROM exercises').fetchone()[0] == 2
+    assert legacy_connection.execute('SELECT content_hash FROM workouts').fetchone()[0] == \
+        gym_log.workout_list[0].content_hash()
+    # Derived tables are rebuilt
+    assert repo.top_progression('Squat') == [{'username': 'testuser', 'progression': 0, 'max_weight': 20}]
+    assert [result['name'] for result in repo.search('squ')] == ['Squat']
+    # Running the migration again does nothing
+    assert migrations.migrate(legacy_connection, schema_script) is False
@@ -1,10 +1,14 @@
+import time
 
+from datetime import datetime, timedelta
 from werkzeug.security import check_password_hash
 import pytest
 from GymApp.flaskr.src.repository.repository import IncorrectUsernameError, IncorrectPasswordError,\
                             UserAlreadyExistsError, UserDoesNotHaveAGymLog
+from GymApp.flaskr.src.database.db import attach_archive
 from GymApp.flaskr.src.domain.user import User
-from GymApp.flaskr.src.domain.workout import GymLog
+from GymApp.flaskr.src.repository import repository
+from GymApp.flaskr.src.domain.workout import GymLog, WorkoutPlan, Workout, ExercisePlan, WorkoutSet
 
 
 def test_register_user(sqlite_repo):
@@ -187,3 +191,490 @@ def test_load_workout_plan(sqlite_repo, workout_plan):
     # Assert that the gym Log workout plan is not None and has the correct properties
     assert loaded_workout_plan is not None
     assert loaded_workout_plan == workout_plan
+
+
+def test_delete_user_deletes_gym_log_and_plans(sqlite_repo, login_user, workout_plan):
+    # Create a second user whose data must survive
+    other_user = User(username='otheruser', password='password')
+    sqlite_repo.register_user(other_user)
+    for user in (login_user, other_user):
+        gym_log = GymLog(user.id)
+        gym_log.add_workout_plan(WorkoutPlan(workout_plan.name, workout_plan.exercise_plan_dict))
+        sqlite_repo.save_gym_log(gym_log)
+
+    # Delete the first user
+    sqlite_repo.delete_user(login_user)
+
+    # Verify that only the data of the second user is left
+    assert sqlite_repo.connection.execute('SELECT COUNT(*) FROM gym_logs').fetchone()[0] == 1
+    assert sqlite_repo.connection.execute('SELECT COUNT(*) FROM workout_plans').fetchone()[0] == 1
+    assert sqlite_repo.connection.execute('SELECT COUNT(*) FROM exercise_plans').fetchone()[0] == 2
+    assert sqlite_repo.load_gym_log(other_user).workout_plan == workout_plan
+
+
+def test_purge_orphans(sqlite_repo, login_user, gym_log, workout_plan):
+    gym_log.add_workout_plan(workout_plan)
+    sqlite_repo.save_gym_log(gym_log)
+
+    # Delete only the user row, leaving the gym log graph behind
+    sqlite_repo.connection.execute('DELETE FROM user')
+
+    # Parents are purged before their children, at most one row per table and batch
+    # The first batch deletes the gym log, the workout plan, the next workout and the snapshot of the gym log
+    assert sqlite_repo.purge_orphans(batch_size=1) == 4
+    assert sqlite_repo.purge_orphans(batch_size=1) == 1
+    assert sqlite_repo.purge_orphans(batch_size=1) == 0
+
+
+def save_workouts(sqlite_repo, username, workout_plan, weights):
+    # Register a user with a gym log and one workout per weight, one day apart
+    user = User(username=username, password='password')
+    sqlite_repo.register_user(user)
+    gym_log = GymLog(user.id)
+    gym_log.add_workout_plan(WorkoutPlan(workout_plan.name, workout_plan.exercise_plan_dict))
+    sqlite_repo.save_gym_log(gym_log)
+    for day, weight in enumerate(weights):
+        workout = Workout({"exercise1": {'name': "Exercise 1", 'weight': weight}},
+                          date=datetime(2024, 1, 1) + timedelta(days=day))
+        gym_log.add_workout(workout)
+    sqlite_repo.update_gym_log(gym_log, user)
+    return user, gym_log
+
+
+def test_save_and_load_workouts(sqlite_repo, workout_plan):
+    user, gym_log = save_workouts(sqlite_repo, 'testuser', workout_plan, [20, 25])
+
+    loaded_gym_log = sqlite_repo.load_gym_log(user)
+
+    assert len(loaded_gym_log.workout_list) == 2
+    assert all(workout.id is not None for workout in loaded_gym_log.workout_list)
+    assert max(loaded_gym_log.workout_list).is_equal(gym_log.workout_list[1])
+    assert max(loaded_gym_log.workout_list).date == datetime(2024, 1, 2)
+
+
+def test_iter_workouts_pages_newest_first(sqlite_repo, workout_plan):
+    user, gym_log = save_workouts(sqlite_repo, 'testuser', workout_plan, [20, 25, 30, 35, 40])
+
+    workouts = list(sqlite_repo.iter_workouts(gym_log.id, page_size=2))
+
+    assert [workout.exercise_session_dict['exercise1']['weight'] for workout in workouts] == [40, 35, 30, 25, 20]
+    assert workouts[0].date == datetime(2024, 1, 5)
+    assert list(sqlite_repo.iter_workouts(gym_log.id + 1)) == []
+
+
+def test_load_gym_log_reads_current_snapshot(sqlite_repo, workout_plan):
+    user, gym_log = save_workouts(sqlite_repo, 'testuser', workout_plan, [20, 25])
+    statements = []
+    sqlite_repo.connection.set_trace_callback(statements.append)
+
+    loaded_gym_log = sqlite_repo.load_gym_log(user)
+
+    sqlite_repo.connection.set_trace_callback(None)
+    assert len(statements) == 1
+    assert loaded_gym_log == gym_log
+    assert loaded_gym_log.workout_plan.id == gym_log.workout_plan.id
+    assert [workout.id for workout in loaded_gym_log.workout_list] == [workout.id for workout in gym_log.workout_list]
+    assert loaded_gym_log.workout_list[1].date == datetime(2024, 1, 2)
+
+
+def test_load_gym_log_falls_back_when_snapshot_is_stale(sqlite_repo, workout_plan):
+    user, gym_log = save_workouts(sqlite_repo, 'testuser', workout_plan, [20, 25])
+
+    # A change behind the back of the repository bumps the version of the gym log
+    sqlite_repo.connection.execute('UPDATE workout_exercises SET weight = 30')
+
+    assert [workout.exercise_session_dict['exercise1']['weight']
+            for workout in sqlite_repo.load_gym_log(user).workout_list] == [30, 30]
+
+
+def test_snapshot_holds_only_recent_workouts(sqlite_repo, workout_plan, monkeypatch):
+    monkeypatch.setattr(repository, 'SNAPSHOT_WORKOUTS', 2)
+    user, gym_log = save_workouts(sqlite_repo, 'testuser', workout_plan, [20, 25, 30])
+    statements = []
+    sqlite_repo.connection.set_trace_callback(statements.append)
+
+    recent = sqlite_repo.load_gym_log(user, recent_workouts=2)
+
+    assert len(statements) == 1
+    assert [workout.exercise_session_dict['exercise1']['weight'] for workout in recent.workout_list] == [25, 30]
+    # The whole history is not part of the snapshot and is read from the relational tables
+    assert len(sqlite_repo.load_gym_log(user).workout_list) == 3
+    assert len(statements) > 2
+
+
+def test_save_workout_adds_workout_to_snapshot(sqlite_repo, workout_plan, monkeypatch):
+    monkeypatch.setattr(repository, 'SNAPSHOT_WORKOUTS', 2)
+    user, gym_log = save_workouts(sqlite_repo, 'testuser', workout_plan, [20, 25])
+
+    sqlite_repo.save_workout(Workout({"exercise1": {'name': "Exercise 1", 'weight': 30}},
+                                     date=datetime(2024, 2, 1)), gym_log)
+    from_snapshot = sqlite_repo.load_gym_log(user, recent_workouts=2)
+    sqlite_repo.connection.execute('UPDATE gym_logs SET version = version + 1')
+    from_tables = sqlite_repo.load_gym_log(user, recent_workouts=2)
+
+    assert [workout.to_dict() for workout in from_snapshot.workout_list] == \
+        [workout.to_dict() for workout in from_tables.workout_list]
+    assert from_snapshot.workout_list[-1].exercise_session_dict['exercise1']['weight'] == 30
+
+
+def test_leaderboards(sqlite_repo, workout_plan):
+    save_workouts(sqlite_repo, 'testuser', workout_plan, [20, 25, 40])
+    save_workouts(sqlite_repo, 'otheruser', workout_plan, [50, 55])
+
+    # Exercise 1 has 3 sets of 10 reps
+    assert sqlite_repo.top_weekly_volume(datetime(2024, 1, 3)) == [
+        {'username': 'otheruser', 'volume': 3150},
+        {'username': 'testuser', 'volume': 2550},
+    ]
+    assert sqlite_repo.top_weekly_volume(datetime(2024, 1, 3), "Exercise 1", limit=1) == [
+        {'username': 'otheruser', 'volume': 3150},
+    ]
+    assert sqlite_repo.top_progression("Exercise 1") == [
+        {'username': 'testuser', 'progression': 20, 'max_weight': 40},
+        {'username': 'otheruser', 'progression': 5, 'max_weight': 55},
+    ]
+
+
+def test_rebuild_leaderboards_matches_incremental_updates(sqlite_repo, workout_plan):
+    save_workouts(sqlite_repo, 'testuser', workout_plan, [20, 25, 40, 30, 45, 50, 55, 60])
+    tables = ('user_exercise_weekly_stats', 'user_weekly_stats', 'user_exercise_stats')
+    incremental = [sqlite_repo.connection.execute(f'SELECT * FROM {table} ORDER BY 1, 2, 3').fetchall()
+                   for table in tables]
+
+    sqlite_repo.rebuild_leaderboards()
+
+    rebuilt = [sqlite_repo.connection.execute(f'SELECT * FROM {table} ORDER BY 1, 2, 3').fetchall()
+               for table in tables]
+    assert [list(map(tuple, rows)) for rows in rebuilt] == [list(map(tuple, rows)) for rows in incremental]
+
+
+def test_delete_user_deletes_workouts_and_leaderboards(sqlite_repo, workout_plan):
+    user, _ = save_workouts(sqlite_repo, 'testuser', workout_plan, [20, 25])
+
+    sqlite_repo.delete_user(user)
+
+    for table in ('workouts', 'workout_exercises', 'user_exercise_weekly_stats', 'user_weekly_stats',
+                  'user_exercise_stats', 'workout_rollups', 'next_workouts', 'gym_log_snapshots'):
+        assert sqlite_repo.connection.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0] == 0
+
+
+def test_archive_workouts_keeps_history_reads_complete(sqlite_repo, workout_plan):
+    attach_archive(sqlite_repo.connection, ':memory:')
+    user, gym_log = save_workouts(sqlite_repo, 'testuser', workout_plan, [20, 25, 30, 35, 40])
+    sqlite_repo.commit()
+    tables = ('user_exercise_weekly_stats', 'user_weekly_stats', 'user_exercise_stats', 'workout_rollups')
+    aggregates = [sqlite_repo.connection.execute(f'SELECT * FROM {table} ORDER BY 1, 2, 3, 4').fetchall()
+                  for table in tables]
+    history = [workout.id for workout in sqlite_repo.iter_workouts(gym_log.id, page_size=2)]
+
+    assert sqlite_repo.archive_workouts(datetime(2024, 1, 4), batch_size=2) == 2
+    assert sqlite_repo.archive_workouts(datetime(2024, 1, 4), batch_size=2) == 1
+    assert sqlite_repo.archive_workouts(datetime(2024, 1, 4), batch_size=2) == 0
+
+    assert sqlite_repo.connection.execute('SELECT COUNT(*) FROM main.workouts').fetchone()[0] == 2
+    assert sqlite_repo.connection.execute('SELECT COUNT(*) FROM archive.workout_exercises').fetchone()[0] == 3
+    assert [workout.id for workout in sqlite_repo.iter_workouts(gym_log.id, page_size=2)] == history
+    assert [workout.id for workout in sqlite_repo.load_workouts(gym_log.id)] == history[::-1]
+    assert sqlite_repo.load_next_workout(user)[1].exercise_session_dict['exercise1']['weight'] == 45
+    sqlite_repo.rebuild_leaderboards()
+    sqlite_repo.rebuild_rollups()
+    assert [sqlite_repo.connection.execute(f'SELECT * FROM {table} ORDER BY 1, 2, 3, 4').fetchall()
+            for table in tables] == aggregates
+
+    sqlite_repo.delete_user(user)
+
+    assert sqlite_repo.connection.execute('SELECT COUNT(*) FROM archive.workouts').fetchone()[0] == 0
+
+
+def test_archive_workouts_keeps_latest_workout_hot(sqlite_repo, workout_plan):
+    attach_archive(sqlite_repo.connection, ':memory:')
+    user, gym_log = save_workouts(sqlite_repo, 'testuser', workout_plan, [20, 25])
+
+    assert sqlite_repo.archive_workouts(datetime(2025, 1, 1)) == 1
+
+    assert sqlite_repo.load_latest_workout(gym_log.id).exercise_session_dict['exercise1']['weight'] == 25
+
+
+def test_append_workout_sets_is_idempotent(sqlite_repo, workout_plan):
+    user, gym_log = save_workouts(sqlite_repo, 'testuser', workout_plan, [20])
+    workout = gym_log.workout_list[0]
+    batch = [WorkoutSet(f'event{index}', 'exercise1', 8, 20 + index, datetime(2024, 1, 1, 10, index))
+             for index in range(3)]
+    statements = []
+    sqlite_repo.connection.set_trace_callback(statements.append)
+
+    assert sqlite_repo.append_workout_sets(gym_log.id, workout.id, batch) == 3
+
+    sqlite_repo.connection.set_trace_callback(None)
+    assert sum(statement.startswith('INSERT INTO main.workout_sets') for statement in statements) == 3
+    assert sqlite_repo.append_workout_sets(gym_log.id, workout.id, batch[1:] + [
+        WorkoutSet('event3', 'exercise1', 6, 25, datetime(2024, 1, 1, 10, 3))]) == 1
+    assert [workout_set.to_dict() for workout_set in sqlite_repo.load_workout_sets(gym_log.id, workout.id)] == \
+        [workout_set.to_dict() for workout_set in batch] + [
+            {'event_id': 'event3', 'exercise': 'exercise1', 'reps': 6, 'weight': 25.0,
+             'performed_at': '2024-01-01 10:03:00'}]
+
+
+def test_append_workout_sets_checks_workout_and_exercise(sqlite_repo, workout_plan):
+    user, gym_log = save_workouts(sqlite_repo, 'testuser', workout_plan, [20])
+    other_user, other_gym_log = save_workouts(sqlite_repo, 'otheruser', workout_plan, [20])
+    workout_set = WorkoutSet('event', 'exercise1', 8, 20)
+
+    with pytest.raises(repository.WorkoutNotFoundError):
+        sqlite_repo.append_workout_sets(gym_log.id, other_gym_log.workout_list[0].id, [workout_set])
+    with pytest.raises(repository.ExerciseNotInWorkoutError):
+        sqlite_repo.append_workout_sets(gym_log.id, gym_log.workout_list[0].id,
+                                        [WorkoutSet('event', 'exercise9', 8, 20)])
+
+
+def test_save_workout_skips_duplicates_within_window(sqlite_repo, workout_plan):
+    user, gym_log = save_workouts(sqlite_repo, 'testuser', workout_plan, [20])
+    first = gym_log.workout_list[0]
+    resubmitted = Workout({'exercise1': {'name': 'Exercise 1', 'weight': 20.0}}, date=first.date + timedelta(seconds=5))
+    statements = []
+    sqlite_repo.connection.set_trace_callback(statements.append)
+
+    assert sqlite_repo.save_workout(resubmitted, gym_log, duplicate_window=timedelta(seconds=60)) is False
+
+    sqlite_repo.connection.set_trace_callback(None)
+    assert resubmitted.id == first.id
+    assert not any(statement.startswith('INSERT') for statement in statements)
+    plan = sqlite_repo.connection.execute(
+        'EXPLAIN QUERY PLAN SELECT id FROM main.workouts WHERE gym_log_id = ? AND content_hash = ? '
+        'AND date BETWEEN ? AND ? ORDER BY date, id LIMIT 1', (1, 1, '', '')).fetchall()
+    assert 'workouts_gym_log_id_content_hash' in plan[0]['detail']
+    assert sqlite_repo.save_workout(resubmitted, gym_log, duplicate_window=timedelta(seconds=1)) is True
+    assert sqlite_repo.connection.execute('SELECT COUNT(*) FROM workouts').fetchone()[0] == 2
+
+
+def test_import_workouts_skips_known_workouts(sqlite_repo, workout_plan):
+    user, gym_log = save_workouts(sqlite_repo, 'testuser', workout_plan, [20, 25])
+    history = [Workout({'exercise1': {'name': 'Exercise 1', 'weight': weight}},
+                       date=datetime(2024, 1, 1) + timedelta(days=day)) for day, weight in enumerate([20, 25, 30, 30])]
+    history.append(Workout({'exercise1': {'name': 'Exercise 1', 'weight': 30}}, date=datetime(2024, 1, 3)))
+
+    assert sqlite_repo.import_workouts(history, gym_log) == 2
+    assert sqlite_repo.import_workouts(history, gym_log) == 0
+    assert [workout.exercise_session_dict['exercise1']['weight']
+            for workout in sqlite_repo.load_gym_log(user).workout_list] == [20, 25, 30, 30]
+    assert sqlite_repo.load_next_workout(user)[1].exercise_session_dict['exercise1']['weight'] == 35
+
+
+def test_collapse_duplicate_workouts(sqlite_repo, workout_plan):
+    user, gym_log = save_workouts(sqlite_repo, 'testuser', workout_plan, [20, 20, 25])
+    other_user, other_gym_log = save_workouts(sqlite_repo, 'otheruser', workout_plan, [20])
+    first = gym_log.workout_list[0]
+    for seconds, event_id in ((10, 'a'), (20, 'b')):
+        duplicate = Workout({'exercise1': {'name': 'Exercise 1', 'weight': 20}},
+                            date=first.date + timedelta(seconds=seconds))
+        sqlite_repo.save_workout(duplicate, gym_log)
+        sqlite_repo.append_workout_sets(gym_log.id, duplicate.id, [WorkoutSet(event_id, 'exercise1', 8, 20)])
+    # Workouts copied from databases without the column are hashed first
+    sqlite_repo.connection.execute('UPDATE workouts SET content_hash = NULL')
+    assert sqlite_repo.hash_workouts(batch_size=4) == 4
+    assert sqlite_repo.hash_workouts() == 2
+    assert sqlite_repo.hash_workouts() == 0
+
+    group = (gym_log.id, first.content_hash())
+    assert sqlite_repo.collapse_duplicate_workouts(timedelta(seconds=60), batch_size=1) == (2, group)
+    assert sqlite_repo.collapse_duplicate_workouts(timedelta(seconds=60), 1, group) == (0, None)
+
+    assert [workout.id for workout in sqlite_repo.load_gym_log(user).workout_list] == \
+        [first.id, gym_log.workout_list[1].id, gym_log.workout_list[2].id]
+    assert [workout_set.event_id for workout_set in sqlite_repo.load_workout_sets(gym_log.id, first.id)] == ['a', 'b']
+    assert len(sqlite_repo.load_gym_log(other_user).workout_list) == 1
+
+
+def test_save_workout_updates_rollups(sqlite_repo, workout_plan):
+    # 2024-01-01 is a Monday, so the workouts span two weeks and one month
+    user, _ = save_workouts(sqlite_repo, 'testuser', workout_plan, [20, 25, 40, 30, 45, 50, 55, 60, 35])
+
+    bucket, points = sqlite_repo.load_progress(user, 'exercise1', 'Exercise 1', datetime(2024, 1, 1),
+                                               datetime(2024, 1, 31), max_points=5)
+
+    assert bucket == 'week'
+    assert [point['period_start'] for point in points] == ['2024-01-01', '2024-01-08']
+    assert (points[0]['min_weight'], points[0]['max_weight'], points[0]['last_weight']) == (20, 55, 55)
+    assert (points[1]['min_weight'], points[1]['max_weight'], points[1]['last_weight']) == (35, 60, 35)
+    assert points[0]['count'] == 7
+    assert points[0]['volume'] == 3 * 10 * (20 + 25 + 40 + 30 + 45 + 50 + 55)
+
+
+def test_load_progress_picks_coarsest_fitting_bucket(sqlite_repo, workout_plan):
+    user, _ = save_workouts(sqlite_repo, 'testuser', workout_plan, [20, 25])
+    start = datetime(2020, 1, 1)
+
+    assert sqlite_repo.load_progress(user, 'exercise1', 'Exercise 1', start, datetime(2020, 6, 1))[0] == 'day'
+    assert sqlite_repo.load_progress(user, 'exercise1', 'Exercise 1', start, datetime(2024, 12, 31))[0] == 'week'
+    assert sqlite_repo.load_progress(user, 'exercise1', 'Exercise 1', start, datetime(2040, 1, 1))[0] == 'month'
+    bucket, points = sqlite_repo.load_progress(user, 'exercise1', 'Exercise 1', start, datetime(2024, 12, 31))
+    assert len(points) == 1
+    assert sqlite_repo.load_progress(user, 'unknown', 'Unknown', start, datetime(2024, 12, 31)) == ('week', [])
+
+
+def test_rebuild_rollups_matches_incremental_updates(sqlite_repo, workout_plan):
+    save_workouts(sqlite_repo, 'testuser', workout_plan, [20, 25, 40, 30, 45, 50, 55, 60])
+    incremental = sqlite_repo.connection.execute('SELECT * FROM workout_rollups ORDER BY 1, 2, 3, 4').fetchall()
+
+    sqlite_repo.rebuild_rollups()
+
+    rebuilt = sqlite_repo.connection.execute('SELECT * FROM workout_rollups ORDER BY 1, 2, 3, 4').fetchall()
+    assert list(map(tuple, rebuilt)) == list(map(tuple, incremental))
+
+
+def test_next_workout_is_stored_when_workouts_are_logged(sqlite_repo, workout_plan):
+    user, gym_log = save_workouts(sqlite_repo, 'testuser', workout_plan, [20, 25])
+    statements = []
+    sqlite_repo.connection.set_trace_callback(statements.append)
+
+    loaded_gym_log, workout = sqlite_repo.load_next_workout(user)
+
+    sqlite_repo.connection.set_trace_callback(None)
+    assert len(statements) == 1
+    assert loaded_gym_log.id == gym_log.id
+    assert loaded_gym_log.workout_plan == gym_log.workout_plan
+    assert workout.exercise_session_dict['exercise1'] == {'name': 'Exercise 1', 'weight': 30}
+
+    sqlite_repo.save_workout(workout, loaded_gym_log)
+
+    assert sqlite_repo.load_next_workout(user)[1].exercise_session_dict['exercise1']['weight'] == 35
+
+
+def test_next_workout_is_invalidated_by_plan_changes(sqlite_repo, workout_plan):
+    user, gym_log = save_workouts(sqlite_repo, 'testuser', workout_plan, [20])
+
+    sqlite_repo.connection.execute('UPDATE exercise_plans SET progression = 1')
+
+    assert sqlite_repo.load_next_workout(user) is None
+    _, workout = sqlite_repo.refresh_next_workout(gym_log.id)
+    assert workout.exercise_session_dict['exercise1']['weight'] == 21
+    assert sqlite_repo.load_next_workout(user)[1].exercise_session_dict['exercise1']['weight'] == 21
+
+
+def test_next_workout_is_invalidated_by_workout_changes(sqlite_repo, workout_plan):
+    user, gym_log = save_workouts(sqlite_repo, 'testuser', workout_plan, [20, 25])
+    first_id = sqlite_repo.connection.execute('SELECT id FROM workouts ORDER BY date').fetchone()[0]
+
+    # Moving the first workout after the latest one makes it the latest workout
+    sqlite_repo.connection.execute("UPDATE workouts SET date = '2099-01-01 00:00:00' WHERE id = ?", (first_id,))
+
+    assert sqlite_repo.load_next_workout(user) is None
+    _, workout = sqlite_repo.refresh_next_workout(gym_log.id)
+    assert workout.exercise_session_dict['exercise1']['weight'] == 25
+
+    exercise_id = sqlite_repo.connection.execute('SELECT exercise_id FROM workout_exercises').fetchone()[0]
+    sqlite_repo.connection.execute('DELETE FROM workout_exercises WHERE workout_id = ?', (first_id,))
+    assert sqlite_repo.load_next_workout(user) is None
+    sqlite_repo.refresh_next_workout(gym_log.id)
+
+    sqlite_repo.connection.execute(
+        'INSERT INTO workout_exercises (workout_id, exercise_id, sets, reps, weight) VALUES (?, ?, 3, 10, 50)',
+        (first_id, exercise_id)
+    )
+    assert sqlite_repo.load_next_workout(user) is None
+
+
+def test_publish_plan_template_is_content_addressed(sqlite_repo, workout_plan, exercise_plan_dict):
+    template_id = sqlite_repo.publish_plan_template(workout_plan)
+
+    # Publishing the same content again returns the same template
+    assert sqlite_repo.publish_plan_template(WorkoutPlan("Workout", dict(exercise_plan_dict))) == template_id
+    assert sqlite_repo.load_plan_template(template_id) == workout_plan
+    assert sqlite_repo.connection.execute('SELECT COUNT(*) FROM plan_template_exercises').fetchone()[0] == 2
+
+
+def test_adopt_plan_template_stores_only_overrides(sqlite_repo, workout_plan):
+    template_id = sqlite_repo.publish_plan_template(workout_plan)
+    users = []
+    for username in ('testuser', 'otheruser'):
+        user = User(username=username, password='password')
+        sqlite_repo.register_user(user)
+        gym_log = GymLog(user.id)
+        sqlite_repo.save_gym_log(gym_log)
+        sqlite_repo.adopt_plan_template(gym_log, template_id)
+        users.append((user, gym_log))
+
+    # Override the initial weight of one exercise for the first user
+    user, gym_log = users[0]
+    gym_log.workout_plan.exercise_plan_dict["exercise1"].initial_weight = 40
+    sqlite_repo.update_gym_log(gym_log, user)
+
+    assert sqlite_repo.connection.execute('SELECT COUNT(*) FROM exercise_plans').fetchone()[0] == 0
+    assert sqlite_repo.connection.execute('SELECT COUNT(*) FROM exercise_plan_overrides').fetchone()[0] == 1
+    loaded_plan = sqlite_repo.load_gym_log(user).workout_plan
+    assert loaded_plan.exercise_plan_dict["exercise1"].initial_weight == 40
+    assert loaded_plan.exercise_plan_dict["exercise2"] == workout_plan.exercise_plan_dict["exercise2"]
+    assert sqlite_repo.load_gym_log(users[1][0]).workout_plan == workout_plan
+
+    # Deleting the user removes the overrides but keeps the template
+    sqlite_repo.delete_user(user)
+    assert sqlite_repo.connection.execute('SELECT COUNT(*) FROM exercise_plan_overrides').fetchone()[0] == 0
+    assert sqlite_repo.load_plan_template(template_id) == workout_plan
+
+
+def test_adopted_plan_edit_with_added_exercise_detaches_from_template(sqlite_repo, workout_plan):
+    template_id = sqlite_repo.publish_plan_template(workout_plan)
+    user = User(username='testuser', password='password')
+    sqlite_repo.register_user(user)
+    gym_log = GymLog(user.id)
+    sqlite_repo.save_gym_log(gym_log)
+    sqlite_repo.adopt_plan_template(gym_log, template_id)
+
+    gym_log.workout_plan.exercise_plan_dict["exercise1"].initial_weight = 40
+    gym_log.workout_plan.exercise_plan_dict["exercise3"] = ExercisePlan("Deadlift", 1, 5, 100, 5)
+    sqlite_repo.update_gym_log(gym_log, user)
+
+    loaded_plan = sqlite_repo.load_gym_log(user).workout_plan
+    assert loaded_plan.exercise_plan_dict.keys() == {"exercise1", "exercise2", "exercise3"}
+    assert loaded_plan.exercise_plan_dict["exercise1"].initial_weight == 40
+    assert loaded_plan.exercise_plan_dict["exercise3"] == ExercisePlan("Deadlift", 1, 5, 100, 5)
+    assert sqlite_repo.connection.execute('SELECT template_id FROM workout_plans').fetchone()[0] is None
+    assert sqlite_repo.connection.execute('SELECT COUNT(*) FROM exercise_plan_overrides').fetchone()[0] == 0
+    assert sqlite_repo.load_plan_template(template_id) == workout_plan
+    assert sqlite_repo.load_next_workout(user)[1].exercise_session_dict["exercise3"]["weight"] == 100
+
+
+def test_search_exercises_and_plans(sqlite_repo, exercise_plan_dict):
+    exercise_plan_dict["exercise3"] = ExercisePlan("Bench Press", 3, 5, 60, 2.5)
+    exercise_plan_dict["exercise4"] = ExercisePlan("Incline Bench Press", 3, 8, 40, 2.5)
+    sqlite_repo.publish_plan_template(WorkoutPlan("Bench Program", exercise_plan_dict))
+    sqlite_repo.save_workout_plan(WorkoutPlan("Own plan", {"a": ExercisePlan("bench press", 3, 5, 60, 2.5)}), 1)
+
+    # Prefix search, names are indexed once and shorter matches rank first
+    names = [result['name'] for result in sqlite_repo.search("bench pr")]
+    assert sorted(names[:2]) == ["Bench Press", "Bench Program"]
+    assert names[2:] == ["Incline Bench Press"]
+    assert [result['name'] for result in sqlite_repo.search("bench", kind='plan')] == ["Bench Program"]
+    # Typo tolerant search
+    assert "Incline Bench Press" in [result['name'] for result in sqlite_repo.search("inclnie")]
+    assert sqlite_repo.search("") == []
+    assert sqlite_repo.search("squat") == []
+
+
+def test_search_filters_kind_and_ranks_before_the_limit(sqlite_repo):
+    # Many exercise matches in front of the only plan match
+    sqlite_repo.save_workout_plan(WorkoutPlan("Own plan", {
+        f"exercise{index}": ExercisePlan(f"Bench Press Variation Number {index}", 3, 5, 60, 2.5) for index in range(30)
+    }), 1)
+    sqlite_repo.save_workout_plan(WorkoutPlan("Short", {"a": ExercisePlan("Bench", 3, 5, 60, 2.5)}), 2)
+    sqlite_repo.publish_plan_template(WorkoutPlan("Bench Program", {"a": ExercisePlan("Squat", 3, 5, 60, 2.5)}))
+
+    assert [result['name'] for result in sqlite_repo.search("bench", kind='plan', limit=1)] == ["Bench Program"]
+    assert [result['name'] for result in sqlite_repo.search("bench", kind='exercise', limit=1)] == ["Bench"]
+    assert len(sqlite_repo.search("bench", limit=100)) == 32
+    # The typo correction stops reading the vocabulary once the budget is spent
+    assert sqlite_repo._similar_prefixes("bnech", deadline=0) == []
+    assert sqlite_repo._similar_prefixes("bnech", deadline=time.monotonic() + 1) == ["bench"]
+
+
+def test_exercise_dictionary_interns_exercises(sqlite_repo, workout_plan):
+    sqlite_repo.save_workout_plan(workout_plan, gym_log_id=1)
+    sqlite_repo.save_workout_plan(WorkoutPlan("Copy", dict(workout_plan.exercise_plan_dict)), gym_log_id=2)
+
+    assert sqlite_repo.connection.execute('SELECT COUNT(*) FROM exercises').fetchone()[0] == 2
+    exercise_id = sqlite_repo.exercise_id("exercise1", "Exercise 1")
+    # New exercises are only shared through the cache once they are committed
+    assert sqlite_repo.exercise_cache.get_id("exercise1", "Exercise 1") is None
+    sqlite_repo.commit()
+    assert sqlite_repo.exercise_cache.get_id("exercise1", "Exercise 1") == exercise_id
+    assert sqlite_repo.exercises([exercise_id]) == {exercise_id: ("exercise1", "Exercise 1")}
@@ -0,0 +1,147 @@
+import os
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+
+from GymApp.flaskr.src.domain.user import User
+from GymApp.flaskr.src.domain.workout import GymLog, Workout, WorkoutPlan, WorkoutSet
+from GymApp.flaskr.src.repository.repository import IncorrectPasswordError, IncorrectUsernameError, \
+    UserAlreadyExistsError
+from GymApp.flaskr.src.repository.sharded_repository import ShardedRepository
+
+SCHEMA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '../src/database/schema.sql')
+
+
+def connect_shards(tmp_path, count):
+    # Create the shards that do not exist yet and return a repository over the first `count` shards
+    with open(SCHEMA_PATH) as schema_file:
+        schema_sql = schema_file.read()
+    shards = []
+    for index in range(count):
+        path = tmp_path / f'shard{index}.sqlite'
+        exists = path.exists()
+        connection = sqlite3.connect(path, detect_types=sqlite3.PARSE_DECLTYPES)
+        if not exists:
+            connection.executescript(schema_sql)
+        shards.append(connection)
+    return ShardedRepository(sqlite3.connect(tmp_path / 'directory.sqlite'), shards)
+
+
+@pytest.fixture
+def sharded_repo(tmp_path):
+    repo = connect_shards(tmp_path, 2)
+    yield repo
+    repo.directory.close()
+    for shard in repo.shards:
+        shard.connection.close()
+
+
+def register_with_workouts(repo, username, workout_plan, weights):
+    user = User(username=username, password='password')
+    repo.register_user(user)
+    gym_log = GymLog(user.id)
+    gym_log.add_workout_plan(WorkoutPlan(workout_plan.name, workout_plan.exercise_plan_dict))
+    for day, weight in enumerate(weights):
+        gym_log.add_workout(Workout({"exercise1": {'name': "Exercise 1", 'weight': weight}},
+                                    date=datetime(2024, 1, 1) + timedelta(days=day)))
+    repo.save_gym_log(gym_log)
+    repo.commit()
+    return user
+
+
+def test_users_are_spread_over_shards(sharded_repo):
+    users = [User(username=f'user{index}', password='password') for index in range(4)]
+    for user in users:
+        sharded_repo.register_user(user)
+    sharded_repo.commit()
+
+    assert len({user.id for user in users}) == 4
+    for shard in sharded_repo.shards:
+        assert shard.connection.execute('SELECT COUNT(*) FROM user').fetchone()[0] == 2
+    for user in users:
+        assert sharded_repo.shard_of(user.id) is sharded_repo.shards[user.id % 2]
+
+
+def test_login_and_register_errors(sharded_repo):
+    sharded_repo.register_user(User(username='testuser', password='password'))
+    sharded_repo.commit()
+
+    user = User(username='testuser', password='password')
+    sharded_repo.login_user(user)
+    assert user.id is not None
+    with pytest.raises(UserAlreadyExistsError):
+        sharded_repo.register_user(User(username='testuser', password='other'))
+    with pytest.raises(IncorrectUsernameError):
+        sharded_repo.login_user(User(username='unknown', password='password'))
+    with pytest.raises(IncorrectPasswordError):
+        sharded_repo.login_user(User(username='testuser', password='wrong'))
+
+
+def test_gym_log_is_stored_on_the_shard_of_the_user(sharded_repo, workout_plan):
+    user = register_with_workouts(sharded_repo, 'testuser', workout_plan, [20, 25])
+
+    gym_log = sharded_repo.load_gym_log(user)
+
+    assert len(gym_log.workout_list) == 2
+    other_shard = sharded_repo.shards[(user.id + 1) % 2]
+    assert other_shard.connection.execute('SELECT COUNT(*) FROM workouts').fetchone()[0] == 0
+
+
+def test_delete_user_removes_directory_entry(sharded_repo, workout_plan):
+    user = register_with_workouts(sharded_repo, 'testuser', workout_plan, [20])
+
+    sharded_repo.delete_user(user)
+    sharded_repo.commit()
+
+    assert sharded_repo.get_user(user.id) is None
+    with pytest.raises(IncorrectUsernameError):
+        sharded_repo.login_user(User(username='testuser', password='password'))
+
+
+def test_rebalance_moves_users_with_their_data(tmp_path, workout_plan):
+    repo = connect_shards(tmp_path, 2)
+    users = [register_with_workouts(repo, f'user{index}', workout_plan, [20 + index, 30]) for index in range(6)]
+    expected = {user.id: [(workout.date, workout.exercise_session_dict) for workout in
+                          repo.load_gym_log(user).workout_list] for user in users}
+
+    repo = connect_shards(tmp_path, 3)
+    moved = repo.rebalance()
+
+    assert moved == sum(1 for user in users if user.id % 2 != user.id % 3)
+    assert repo.rebalance() == 0
+    for user in users:
+        shard = repo.shard_of(user.id)
+        assert shard is repo.shards[user.id % 3]
+        gym_log = repo.load_gym_log(user)
+        assert [(workout.date, workout.exercise_session_dict) for workout in gym_log.workout_list] \
+            == expected[user.id]
+        assert gym_log.workout_plan.exercise_plan_dict.keys() == workout_plan.exercise_plan_dict.keys()
+        assert shard.connection.execute(
+            'SELECT COUNT(*) FROM workout_rollups WHERE user_id = ?', (user.id,)
+        ).fetchone()[0] > 0
+        repo.login_user(User(username=user.username, password='password'))
+    assert sum(shard.connection.execute('SELECT COUNT(*) FROM user').fetchone()[0] for shard in repo.shards) == 6
+
+
+def test_rebalance_moves_logged_sets(tmp_path, workout_plan):
+    repo = connect_shards(tmp_path, 2)
+    users = [register_with_workouts(repo, f'user{index}', workout_plan, [20, 25]) for index in range(3)]
+    user = next(user for user in users if user.id % 2 != user.id % 3)
+    source = repo.shard_of(user.id)
+    gym_log = source.load_gym_log(user)
+    workout = gym_log.workout_list[-1]
+    workout_sets = [WorkoutSet(f'event{index}', 'exercise1', 10, 25, datetime(2024, 1, 2, 10, index))
+                    for index in range(3)]
+    source.append_workout_sets(gym_log.id, workout.id, workout_sets)
+    source.commit()
+
+    repo = connect_shards(tmp_path, 3)
+    repo.rebalance()
+
+    destination = repo.shard_of(user.id)
+    assert destination is not source
+    gym_log = destination.load_gym_log(user)
+    moved = destination.load_workout_sets(gym_log.id, gym_log.workout_list[-1].id)
+    assert [workout_set.to_dict() for workout_set in moved] == [workout_set.to_dict() for workout_set in workout_sets]
+    assert source.connection.execute('SELECT COUNT(*) FROM workout_sets').fetchone()[0] == 0
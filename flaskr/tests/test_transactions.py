@@ -0,0 +1,110 @@
+import os
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+from GymApp.flaskr.src.database.db import clone_database, connect
+from GymApp.flaskr.src.domain.user import User
+from GymApp.flaskr.src.domain.workout import GymLog, Workout, WorkoutPlan
+from GymApp.flaskr.src.repository.repository import SQLiteRepository
+from GymApp.flaskr.src.repository.transactions import RetryPolicy, is_busy
+
+SCHEMA_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '../src/database/schema.sql')
+
+
+def test_is_busy():
+    assert is_busy(sqlite3.OperationalError('database is locked'))
+    assert not is_busy(sqlite3.OperationalError('no such table: user'))
+    assert not is_busy(sqlite3.IntegrityError('UNIQUE constraint failed'))
+
+
+def test_retry_delay_is_jittered_and_bounded():
+    policy = RetryPolicy(base_delay=0.01, max_delay=0.05)
+
+    delays = [policy.delay(attempt) for attempt in range(10) for _ in range(20)]
+
+    assert all(0 <= delay <= 0.05 for delay in delays)
+    assert len(set(delays)) > 1
+
+
+def test_run_transaction_retries_busy_database(sqlite_repo):
+    policy = RetryPolicy(attempts=3, base_delay=0)
+    calls = []
+
+    def unit(repo):
+        calls.append(repo.connection.in_transaction)
+        repo.register_user(User('testuser', 'password'))
+        if len(calls) < 3:
+            raise sqlite3.OperationalError('database is locked')
+        return 'done'
+
+    assert sqlite_repo.run_transaction(unit, retry_policy=policy) == 'done'
+    assert calls == [True, True, True]
+    assert sqlite_repo.connection.execute('SELECT COUNT(*) FROM user').fetchone()[0] == 1
+    assert policy.stats() == {'transactions': 1, 'contended': 1, 'retries': 2, 'failures': 0}
+
+
+def test_run_transaction_gives_up_and_rolls_back(sqlite_repo):
+    policy = RetryPolicy(attempts=1, base_delay=0)
+
+    def unit(repo):
+        repo.register_user(User('testuser', 'password'))
+        raise sqlite3.OperationalError('database is locked')
+
+    with pytest.raises(sqlite3.OperationalError):
+        sqlite_repo.run_transaction(unit, retry_policy=policy)
+
+    assert not sqlite_repo.connection.in_transaction
+    assert sqlite_repo.connection.execute('SELECT COUNT(*) FROM user').fetchone()[0] == 0
+    assert policy.stats()['failures'] == 1
+
+
+def test_concurrent_writers_do_not_fail(tmp_path, workout_plan):
+    database = str(tmp_path / 'stress.sqlite')
+    with open(SCHEMA_PATH) as schema_file:
+        connection = connect(database)
+        clone_database(connection, schema_file.read())
+        connection.close()
+    # A short busy timeout makes the writers hit SQLITE_BUSY, so the retries have to carry them through
+    policy = RetryPolicy(attempts=100, base_delay=0.002, max_delay=0.05)
+    threads, workouts = 12, 5
+    errors = []
+
+    def writer(index):
+        repo = SQLiteRepository(connect(database, timeout=0.001))
+        try:
+            user = User(f'user{index}', 'password')
+
+            def register(repo):
+                repo.register_user(user)
+                gym_log = GymLog(user.id)
+                gym_log.add_workout_plan(WorkoutPlan(workout_plan.name, workout_plan.exercise_plan_dict))
+                repo.save_gym_log(gym_log)
+                return gym_log
+
+            gym_log = repo.run_transaction(register, retry_policy=policy)
+            for day in range(workouts):
+                workout = Workout({'exercise1': {'name': 'Exercise 1', 'weight': 20 + day}},
+                                  date=datetime(2024, 1, 1) + timedelta(days=day))
+                repo.run_transaction(lambda repo: repo.save_workout(workout, gym_log), retry_policy=policy)
+        except Exception as error:
+            errors.append(error)
+        finally:
+            repo.connection.close()
+
+    workers = [threading.Thread(target=writer, args=(index,)) for index in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    assert errors == []
+    connection = connect(database)
+    assert connection.execute('SELECT COUNT(*) FROM user').fetchone()[0] == threads
+    assert connection.execute('SELECT COUNT(*) FROM workouts').fetchone()[0] == threads * workouts
+    connection.close()
+    stats = policy.stats()
+    assert stats['transactions'] == threads * (workouts + 1)
+    assert stats['failures'] == 0
@@ -1,5 +1,8 @@
+import json
+from datetime import datetime
 import pytest
-from GymApp.flaskr.src.domain.workout import Workout, MissingWorkoutPlanException, WorkoutPlan, ExercisePlan
+from GymApp.flaskr.src.domain.workout import GymLog, Workout, MissingWorkoutPlanException, WorkoutPlan, ExercisePlan, \
+    WorkoutSet
 
 
 def test_exercise_plan_valid_numbers():
@@ -31,6 +34,23 @@ def test_workout_plan_create_workout_from_prior_workout(exercise_plan_dict, prio
     assert workout.exercise_session_dict["exercise2"]['weight'] == 40
 
 
+def test_workout_plan_forecast_matches_created_workouts(workout_plan, prior_workout):
+    forecast = workout_plan.forecast(5, prior_workout)
+
+    workout = prior_workout
+    for session in range(5):
+        workout = workout_plan.create_workout(workout)
+        for key, exercise in workout.exercise_session_dict.items():
+            assert forecast[key][session] == exercise['weight']
+
+
+def test_workout_plan_forecast_deload_and_cap(workout_plan, prior_workout):
+    forecast = workout_plan.forecast(4, prior_workout, deload_every=3, deload_ratio=0.9, max_weight=40)
+
+    assert forecast == {'exercise1': [25, 30, 31.5, 40], 'exercise2': [40, 40, 36, 40]}
+    assert workout_plan.forecast(2) == {'exercise1': [20, 25], 'exercise2': [30, 40]}
+
+
 def test_workout_new_is_greater_than_old_workout(exercise_plan_dict, prior_workout):
     workout_plan = WorkoutPlan("Workout", exercise_plan_dict)
     new_workout = workout_plan.create_workout(prior_workout)
@@ -54,3 +74,50 @@ def test_gym_log_creating_workout_from_prior(gym_log, workout_plan, prior_workou
     gym_log.add_workout(prior_workout)
     next_workout = gym_log.create_next_workout()
     assert next_workout.is_equal(workout_plan.create_workout(prior_workout)) is True
+
+
+def test_workout_plan_content_hash(exercise_plan_dict):
+    workout_plan = WorkoutPlan("Workout", exercise_plan_dict)
+    reordered_plan = WorkoutPlan("Workout", dict(reversed(list(exercise_plan_dict.items()))), id=5)
+    changed_plan = WorkoutPlan("Workout", {"exercise1": ExercisePlan("Exercise 1", 3, 10, 25, 5)})
+    assert workout_plan.content_hash() == reordered_plan.content_hash()
+    assert workout_plan.content_hash() != changed_plan.content_hash()
+
+
+def test_gym_log_dict_round_trip(gym_log, workout_plan, prior_workout):
+    workout_plan.add_id(3)
+    gym_log.add_workout_plan(workout_plan)
+    prior_workout.add_id(7)
+    gym_log.add_workout(prior_workout)
+
+    loaded = GymLog.from_dict(json.loads(json.dumps(gym_log.to_dict())))
+
+    assert loaded == gym_log
+    assert loaded.workout_plan.id == 3
+    assert loaded.workout_list[0].id == 7
+    assert loaded.workout_list[0].date == prior_workout.date
+    assert loaded.workout_list[0].is_equal(prior_workout)
+
+
+def test_workout_set_from_dict_validates_events():
+    workout_set = WorkoutSet.from_dict({'event_id': 'a1', 'exercise': 'exercise1', 'reps': 8, 'weight': 20,
+                                        'performed_at': '2024-01-01 10:00:00'})
+
+    assert WorkoutSet.from_dict(workout_set.to_dict()).to_dict() == workout_set.to_dict()
+    for event in ({'event_id': '', 'exercise': 'exercise1', 'reps': 8, 'weight': 20},
+                  {'event_id': 'a1', 'exercise': 'exercise1', 'reps': '8', 'weight': 20},
+                  {'event_id': 'a1', 'exercise': 'exercise1', 'reps': 8},
+                  {'event_id': 'a1', 'exercise': 'exercise1', 'reps': 8, 'weight': 20, 'performed_at': 'x'}):
+        with pytest.raises(ValueError):
+            WorkoutSet.from_dict(event)
+
+
+def test_workout_content_hash_is_stable():
+    workout = Workout({'exercise1': {'name': 'Squat', 'weight': 20}, 'exercise2': {'name': 'Bench', 'weight': 30.5}})
+    reordered = Workout({'exercise2': {'name': 'Bench', 'weight': 30.5},
+                         'exercise1': {'name': 'Squat', 'weight': 20.0}}, date=datetime(2020, 1, 1))
+
+    assert workout.content_hash() == reordered.content_hash() == -3764528318449274625
+    assert workout.is_equal(reordered)
+    reordered.exercise_session_dict['exercise1']['weight'] = 22.5
+    assert not workout.is_equal(reordered)
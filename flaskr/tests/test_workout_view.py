@@ -0,0 +1,145 @@
+import gzip
+
+from GymApp.flaskr.benchmarks.bench_load import run_load_test, serve_app
+
+WORKOUT_PLAN = {
+    'name': 'Workout',
+    'exercises': {
+        'exercise1': {'name': 'Exercise 1', 'sets': 3, 'reps': 10, 'initial_weight': 20, 'progression': 5},
+    },
+}
+
+
+def login(client, username='testuser'):
+    client.post('/auth/register', data={'username': username, 'password': 'password'})
+    client.post('/auth/login', data={'username': username, 'password': 'password'})
+
+
+def test_workout_without_plan_redirects(client):
+    login(client)
+
+    assert client.get('/workout').headers['Location'].endswith('/create_workout_plan')
+    assert client.get('/workout', headers={'Accept': 'application/json'}).status_code == 404
+
+
+def test_create_plan_and_log_workouts(client):
+    login(client)
+
+    assert client.post('/create_workout_plan', json=WORKOUT_PLAN).status_code == 201
+    assert client.get('/workout').status_code == 200
+    first = client.get('/workout', headers={'Accept': 'application/json'}).get_json()
+    assert first['exercises']['exercise1']['weight'] == 20
+
+    response = client.post('/workout', json={'exercises': {'exercise1': 22.5}})
+
+    assert response.status_code == 201
+    assert response.get_json()['id'] is not None
+    second = client.get('/workout', headers={'Accept': 'application/json'}).get_json()
+    assert second['exercises']['exercise1']['weight'] == 27.5
+
+
+def test_invalid_plan_is_rejected(client):
+    login(client)
+
+    response = client.post('/create_workout_plan', json={'name': 'Workout', 'exercises': {'e': {'name': 'E'}}})
+
+    assert response.status_code == 400
+
+
+def test_forecast(client):
+    login(client)
+
+    assert client.get('/forecast').status_code == 404
+    client.post('/create_workout_plan', json=WORKOUT_PLAN)
+    client.post('/workout', json={'exercises': {'exercise1': 30}})
+
+    response = client.get('/forecast?sessions=4&deload_every=4&deload_ratio=0.5&max_weight=45')
+
+    assert response.status_code == 200
+    assert response.get_json() == {'plan': 'Workout', 'sessions': 4, 'exercises': {
+        'exercise1': {'name': 'Exercise 1', 'weights': [35, 40, 45, 22.5]},
+    }}
+    assert client.get('/forecast?sessions=0').status_code == 400
+    assert client.get('/forecast?sessions=1000').status_code == 400
+    assert client.get('/forecast?deload_ratio=x').status_code == 400
+
+
+def test_workout_sets_are_appended_idempotently(client):
+    login(client)
+    client.post('/create_workout_plan', json=WORKOUT_PLAN)
+    workout_id = client.post('/workout', json={}).get_json()['id']
+    batch = {'sets': [{'event_id': f'event{index}', 'exercise': 'exercise1', 'reps': 10, 'weight': 20}
+                      for index in range(3)]}
+
+    assert client.post(f'/workout/{workout_id}/sets', json=batch).get_json() == {'stored': 3, 'duplicates': 0}
+    # A retry of the batch after a lost response
+    assert client.post(f'/workout/{workout_id}/sets', json=batch).get_json() == {'stored': 0, 'duplicates': 3}
+    sets = client.get(f'/workout/{workout_id}/sets').get_json()['sets']
+    assert [workout_set['event_id'] for workout_set in sets] == ['event0', 'event1', 'event2']
+    assert client.post(f'/workout/{workout_id}/sets', json={'sets': [{'event_id': 'x'}]}).status_code == 400
+    assert client.post(f'/workout/{workout_id}/sets', json={'sets': [
+        {'event_id': 'x', 'exercise': 'exercise9', 'reps': 1, 'weight': 1}]}).status_code == 400
+    assert client.get(f'/workout/{workout_id + 1}/sets').status_code == 404
+
+
+def test_resubmitted_workout_is_saved_once(client):
+    login(client)
+    client.post('/create_workout_plan', json=WORKOUT_PLAN)
+
+    first = client.post('/workout', json={'exercises': {'exercise1': 20}})
+    second = client.post('/workout', json={'exercises': {'exercise1': 20}})
+
+    assert (first.status_code, second.status_code) == (201, 200)
+    assert first.get_json()['id'] == second.get_json()['id']
+
+
+def test_import_workouts_skips_duplicates(client):
+    login(client)
+    client.post('/create_workout_plan', json=WORKOUT_PLAN)
+    history = {'workouts': [{'date': f'2024-01-0{day} 10:00:00',
+                             'exercises': {'exercise1': {'name': 'Exercise 1', 'weight': 20 + 5 * day}}}
+                            for day in range(1, 4)]}
+
+    assert client.post('/workouts/import', json=history).get_json() == {'imported': 3, 'duplicates': 0}
+    assert client.post('/workouts/import', json=history).get_json() == {'imported': 0, 'duplicates': 3}
+    assert client.get('/workout', headers={'Accept': 'application/json'}).get_json()['exercises'] == {
+        'exercise1': {'name': 'Exercise 1', 'weight': 40}}
+    assert client.post('/workouts/import', json={'workouts': [{'date': 'x', 'exercises': {}}]}).status_code == 400
+
+
+def test_load_test_runs_journeys(tmp_path):
+    base_url, server = serve_app({'TESTING': True, 'DATABASE': str(tmp_path / 'flaskr.sqlite'),
+                                  'AUTH_RATE_LIMIT_ENABLED': False})
+    try:
+        report = run_load_test(base_url, vus=2, iterations=1, sessions=2)
+    finally:
+        server.shutdown()
+
+    assert report['errors'] == 0
+    assert report['endpoints']['POST /workout']['requests'] == 4
+    assert set(report['endpoints']) == {'POST /auth/register', 'POST /auth/login', 'POST /create_workout_plan',
+                                        'GET /workout', 'POST /workout'}
+
+
+def test_history_is_streamed_newest_first(client):
+    login(client)
+    client.post('/create_workout_plan', json=WORKOUT_PLAN)
+    for weight in (20, 22.5, 25):
+        client.post('/workout', json={'exercises': {'exercise1': weight}})
+
+    response = client.get('/history')
+
+    assert response.status_code == 200
+    assert response.is_streamed
+    body = response.get_data(as_text=True)
+    assert body.index('Exercise 1: 25.0') < body.index('Exercise 1: 22.5') < body.index('Exercise 1: 20.0')
+
+
+def test_history_is_compressed_for_gzip_clients(client):
+    login(client)
+
+    response = client.get('/history', headers={'Accept-Encoding': 'gzip'})
+
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert 'No workouts logged yet.' in gzip.decompress(response.data).decode()